@@ -1,53 +1,162 @@
-# /duracion_bloque_hr.py    
+# /duracion_bloque_hr.py
 
 '''
-Script que calcular la duración de cada bloque horario por mes a partir del archivo blocks
-que corresponde a una entrada del modelo de simulación ejecutado en AMEBA para la determinación del plan
-indicativo de obras 
+Script que calcula la duración (horas) de cada bloque horario por stage (mes) a partir del
+archivo blocks de uno o varios casos AMEBA (entradas del modelo de simulación para la
+determinación del plan indicativo de obras), para comparar estructuras de bloques entre casos.
+
+- sólo se leen las columnas enteras stage / block (sin parsear 'time'): cada fila es una hora
+- horas por (stage, bloque) con un único np.bincount sobre el índice stage * n_bloques + bloque
+- participación = horas del bloque / horas del stage
+- los casos se procesan en paralelo (un proceso por caso) y el resumen largo
+  (caso, stage, block, horas, participacion) se guarda en Parquet
+- opcional (EXPORTA_EXCEL): las cuatro hojas por caso (bloques 1-12 día hábil, 13-24 inhábil,
+  en horas y en %) con openpyxl en modo streaming (write_only)
+Casos: la carpeta data del repositorio y cada subcarpeta de RUTA_CASOS que tenga un blocks.csv.
 '''
-import pandas as pd 
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent / "simula_ameba"))
+from lector_caso import lee_tabla
+
+try:
+    from openpyxl import Workbook
+    HAY_OPENPYXL = True
+except ImportError:
+    HAY_OPENPYXL = False
+
+ruta_base = Path(__file__).parent.parent
+ruta_resultados = ruta_base / "resultados"
+
+RUTA_CASOS     = ruta_resultados / "casos_sinteticos"     # carpeta con un caso AMEBA por subcarpeta
+SALIDA         = ruta_resultados / "duracion_bloques" / "duracion_bloques.parquet"
+EXPORTA_EXCEL  = False
+WORKERS        = None                                      # procesos (None: núcleos)
+BLOQUES_HABIL  = 12                                        # bloques 1..12 día hábil, 13.. inhábil
+
+
+def busca_blocks(carpeta: Path) -> Optional[Path]:
+    """blocks.csv del caso: demanda/blocks.csv o el primero que aparezca bajo la carpeta."""
+    directo = carpeta / "demanda" / "blocks.csv"
+    if directo.exists():
+        return directo
+    return next(iter(sorted(carpeta.rglob("blocks.csv"))), None)
+
+
+def horas_por_bloque(ruta_blocks: Path):
+    """(stages, bloques, H) con H[i, j] = horas del stage stages[i] en el bloque bloques[j]."""
+    b = lee_tabla(ruta_blocks, "blocks", columnas=["stage", "block"])
+    st = b["stage"].to_numpy(np.int64)
+    bl = b["block"].to_numpy(np.int64)
+    stages, i_st = np.unique(st, return_inverse=True)
+    bloques, i_bl = np.unique(bl, return_inverse=True)
+    nb = len(bloques)
+    H = np.bincount(i_st * nb + i_bl, minlength=len(stages) * nb).reshape(len(stages), nb)
+    return stages, bloques, H
+
+
+def resumen_caso(carpeta: Path) -> pd.DataFrame:
+    """Tabla larga (caso, stage, block, horas, participacion) de un caso."""
+    carpeta = Path(carpeta)
+    ruta = busca_blocks(carpeta)
+    if ruta is None:
+        raise FileNotFoundError(f"{carpeta}: no se encontró blocks.csv")
+    stages, bloques, H = horas_por_bloque(ruta)
+    total = H.sum(axis=1, keepdims=True)
+    part = np.divide(H, total, out=np.zeros(H.shape), where=total > 0)
+    ns, nb = H.shape
+    return pd.DataFrame({
+        "caso": carpeta.name,
+        "stage": np.repeat(stages, nb).astype(np.int32),
+        "block": np.tile(bloques, ns).astype(np.int16),
+        "horas": H.ravel().astype(np.int32),
+        "participacion": part.ravel().astype(np.float32),
+    })
+
+
+def resumen_casos(carpetas: List[Path], workers: Optional[int] = WORKERS) -> pd.DataFrame:
+    """Resumen de varios casos en paralelo (un proceso por caso)."""
+    carpetas = [Path(c) for c in carpetas]
+    if len(carpetas) <= 1 or workers == 1:
+        partes = [resumen_caso(c) for c in carpetas]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            partes = list(ex.map(resumen_caso, carpetas))
+    df = pd.concat(partes, ignore_index=True) if partes else resumen_vacio()
+    df["caso"] = df["caso"].astype("category")
+    return df
+
+
+def resumen_vacio() -> pd.DataFrame:
+    return pd.DataFrame({"caso": pd.Series(dtype=str), "stage": pd.Series(dtype=np.int32),
+                         "block": pd.Series(dtype=np.int16), "horas": pd.Series(dtype=np.int32),
+                         "participacion": pd.Series(dtype=np.float32)})
+
+
+def diferencias(df: pd.DataFrame, referencia: str) -> pd.DataFrame:
+    """Máxima diferencia absoluta de participación por caso respecto del caso de referencia
+    (sobre los (stage, bloque) presentes en ambos)."""
+    ancho = df.pivot_table(index=["stage", "block"], columns="caso", values="participacion", observed=True)
+    dif = ancho.sub(ancho[referencia], axis=0).abs()
+    return pd.DataFrame({"max_dif_participacion": dif.max(axis=0),
+                         "stages": df.groupby("caso", observed=True)["stage"].nunique()})
+
+
+def exporta_excel(df: pd.DataFrame, carpeta: Path, bloques_habil: int = BLOQUES_HABIL) -> List[Path]:
+    """Un libro por caso con las cuatro hojas (horas y %, día hábil / inhábil), en streaming."""
+    if not HAY_OPENPYXL:
+        raise ImportError("duracion_bloque_hr: la exportación a Excel requiere openpyxl.")
+    carpeta.mkdir(parents=True, exist_ok=True)
+    salidas = []
+    for caso, d in df.groupby("caso", observed=True):
+        bloques = np.sort(d["block"].unique())
+        habil, inhabil = bloques[:bloques_habil], bloques[bloques_habil:]
+        horas = d.pivot(index="stage", columns="block", values="horas")
+        part = d.pivot(index="stage", columns="block", values="participacion")
+        wb = Workbook(write_only=True)
+        for nombre, tabla, cols in (("% bloques por día hábil", part, habil),
+                                    ("% bloques por día inhábil", part, inhabil),
+                                    ("Total de bloques por día hábil", horas, habil),
+                                    ("Total de bloques por inhabil", horas, inhabil)):
+            ws = wb.create_sheet(nombre)
+            ws.append(["stage(mes)"] + [int(b) for b in cols])
+            valores = tabla[cols].to_numpy()
+            for s, fila in zip(tabla.index, valores.tolist()):
+                ws.append([int(s)] + fila)
+        salida = carpeta / f"duracion_bloque_hr_{caso}.xlsx"
+        wb.save(salida)
+        salidas.append(salida)
+    return salidas
+
+
+def casos_disponibles() -> List[Path]:
+    casos = [ruta_base / "data"] if busca_blocks(ruta_base / "data") is not None else []
+    if RUTA_CASOS.exists():
+        casos += [c for c in sorted(RUTA_CASOS.iterdir()) if c.is_dir() and busca_blocks(c) is not None]
+    return casos
+
+
+def main():
+    t0 = time.perf_counter()
+    casos = casos_disponibles()
+    df = resumen_casos(casos)
+    SALIDA.parent.mkdir(parents=True, exist_ok=True)
+    df.to_parquet(SALIDA, index=False)
+    print(f"{len(casos)} casos, {len(df)} filas -> {SALIDA} ({time.perf_counter() - t0:.2f} s)")
+    if len(casos) > 1:
+        print(diferencias(df, casos[0].name))
+    if EXPORTA_EXCEL:
+        for f in exporta_excel(df, SALIDA.parent):
+            print(f"- {f}")
+    print("Ejecución de código finalizada")
+
 
-ruta_base= Path(__file__).parent.parent.parent
-ruta_blocks= ruta_base /"data"/ "demanda"/ "blocks.csv"
-ruta_resultados= ruta_base / "resultados"
-nombre_resultado= "duracion_bloque_hr_ameba.xlsx"
-ruta_archivo_salida= ruta_resultados/nombre_resultado 
-
-
-blocks=pd.read_csv(ruta_blocks, sep=",", encoding= "utf-8")
-# convertir la columna 'time' a datetime con el formato AAAA-MM-DD-HH:MM
-blocks['time'] = pd.to_datetime(blocks['time'], format='%Y-%m-%d-%H:%M', errors='raise')
-renombrar_columnas= {
-    "stage": "stage(mes)",
-    "block": "block(bloque_hr)"
-}
-blocks=blocks.rename(columns=renombrar_columnas)
-#meses_interes=range(1,13)
-#blocks=blocks[blocks["stage(mes)"].isin(meses_interes)]
-# Calcular la duración de cada stage-block
-blocks['duration'] = blocks['time'].diff().dt.total_seconds().fillna(0)
-
-# Crear la tabla de doble entrada
-tabla_doble_entrada = blocks.pivot_table(index='stage(mes)', columns='block(bloque_hr)', values='duration', aggfunc='count', fill_value=0)
-
-# Filtrar los bloques en dos rangos|    
-tabla_1_12 = tabla_doble_entrada.loc[:, tabla_doble_entrada.columns[0:12]]
-tabla_13_24 = tabla_doble_entrada.loc[:, tabla_doble_entrada.columns[12:24]]
-# Calcular el factor por fila (suma de todos los bloques)
-duracion_anual_bloque = tabla_doble_entrada.sum(axis=1)
-
-# Dividir cada celda por el factor correspondiente a su fila
-tabla_1_12_porcentual = tabla_1_12.div(duracion_anual_bloque, axis=0)
-tabla_13_24_porcentual = tabla_13_24.div(duracion_anual_bloque, axis=0)
-
-
-# Guardar las tablas en diferentes hojas del archivo Excel
-with pd.ExcelWriter(ruta_archivo_salida) as writer:
-    tabla_1_12_porcentual.to_excel(writer, sheet_name='% bloques por día hábil')
-    tabla_13_24_porcentual.to_excel(writer, sheet_name='% bloques por día inhábil')
-    tabla_1_12.to_excel(writer, sheet_name='Total de bloques por día hábil')
-    tabla_13_24.to_excel(writer, sheet_name='Total de bloques por inhabil')
-    
-
-print("Ejecución de código finalizada")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,598 @@
+# -*- coding: utf-8 -*-
+"""
+Backend matricial del LP de expansión (sin expansión de reglas Pyomo)
+----------------------------------------------------------------------
+Arma la MISMA formulación que mvp_expansion.build_model directamente como bloques
+dispersos (COO -> CSR) con aritmética de índices vectorizada y la pasa a HiGHS (highspy):
+  - CapEvol, InvestCap, GenCap/GenAvail
+  - HydroConv, VolBalance, VolMin/VolMax, VolTerminal, SlackAllow
+  - ROR_Capacity, ROR_Water, ROR_MinHG/ROR_MaxHG
+  - Balance y objetivo
+Variables y restricciones se ordenan por familia; dentro de cada familia el índice es
+(entidad, bloque) con bloque en el orden de TY (stage ascendente, block ascendente).
+El path Pyomo (build_model) queda disponible para depurar; compara_backends verifica
+que ambos den el mismo costo total. depura_formulacion pasa las filas de una variable a
+cotas y elimina GenCap (dominada por GenAvail) antes de enviar el LP a HiGHS.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+try:
+    import highspy
+    HAY_HIGHSPY = True
+except ImportError:
+    HAY_HIGHSPY = False
+
+# mismos valores por defecto que la CONFIG de mvp_expansion
+BIGM_SLACK    = 1e9
+KAPPA_DEFAULT = 1.0
+C_ENS         = 4000.0
+
+
+@dataclass
+class ModeloLP:
+    """LP en forma  min c'x  s.a.  row_lo <= A x <= row_up,  col_lo <= x <= col_up."""
+    c: np.ndarray
+    A: sparse.csr_matrix
+    row_lo: np.ndarray
+    row_up: np.ndarray
+    col_lo: np.ndarray
+    col_up: np.ndarray
+    var: Dict[str, Tuple[int, tuple]]      # familia -> (offset, shape)
+    fila: Dict[str, Tuple[int, tuple]]     # familia -> (offset, shape)
+    Y_list: List[int]
+    TY: List[Tuple[int, int]]
+    techs: List[str]
+    R: List[str]
+    ROR: List[str]
+    param: Dict[str, np.ndarray] = field(default_factory=dict)   # df, alpha, iy, af, k0, vini...
+
+    @property
+    def n_var(self) -> int:
+        return int(self.c.shape[0])
+
+    @property
+    def n_fil(self) -> int:
+        return int(self.A.shape[0])
+
+    def cols(self, familia: str) -> np.ndarray:
+        off, shape = self.var[familia]
+        return off + np.arange(int(np.prod(shape))).reshape(shape)
+
+    def filas(self, familia: str) -> np.ndarray:
+        off, shape = self.fila[familia]
+        return off + np.arange(int(np.prod(shape))).reshape(shape)
+
+
+@dataclass
+class ResultadoLP:
+    estado: str
+    objetivo: float
+    x: np.ndarray
+    dual_fila: np.ndarray
+    dual_col: np.ndarray
+    lp: ModeloLP = field(repr=False)
+    info: Dict[str, float] = field(default_factory=dict)
+
+    def valor(self, familia: str) -> np.ndarray:
+        off, shape = self.lp.var[familia]
+        return self.x[off: off + int(np.prod(shape))].reshape(shape)
+
+    def dual(self, familia: str) -> np.ndarray:
+        off, shape = self.lp.fila[familia]
+        return self.dual_fila[off: off + int(np.prod(shape))].reshape(shape)
+
+
+class _Ensamble:
+    """Acumula variables, filas y tripletas (fila, col, coef) por familia."""
+
+    def __init__(self):
+        self.n_var = 0
+        self.n_fil = 0
+        self.var: Dict[str, Tuple[int, tuple]] = {}
+        self.fila: Dict[str, Tuple[int, tuple]] = {}
+        self.lo_partes: List[np.ndarray] = []
+        self.up_partes: List[np.ndarray] = []
+        self.I: List[np.ndarray] = []
+        self.J: List[np.ndarray] = []
+        self.V: List[np.ndarray] = []
+
+    def variable(self, nombre: str, shape: tuple) -> np.ndarray:
+        n = int(np.prod(shape))
+        self.var[nombre] = (self.n_var, shape)
+        idx = self.n_var + np.arange(n).reshape(shape)
+        self.n_var += n
+        return idx
+
+    def filas(self, nombre: str, shape: tuple, lo, up) -> np.ndarray:
+        n = int(np.prod(shape))
+        self.fila[nombre] = (self.n_fil, shape)
+        idx = self.n_fil + np.arange(n).reshape(shape)
+        self.n_fil += n
+        self.lo_partes.append(np.broadcast_to(np.asarray(lo, dtype=np.float64), shape).ravel())
+        self.up_partes.append(np.broadcast_to(np.asarray(up, dtype=np.float64), shape).ravel())
+        return idx
+
+    def coef(self, filas, cols, valores=1.0):
+        filas, cols, valores = np.broadcast_arrays(np.asarray(filas), np.asarray(cols),
+                                                   np.asarray(valores, dtype=np.float64))
+        self.I.append(filas.ravel())
+        self.J.append(cols.ravel())
+        self.V.append(valores.ravel().astype(np.float64))
+
+    def matriz(self) -> sparse.csr_matrix:
+        I = np.concatenate(self.I) if self.I else np.empty(0, dtype=np.int64)
+        J = np.concatenate(self.J) if self.J else np.empty(0, dtype=np.int64)
+        V = np.concatenate(self.V) if self.V else np.empty(0)
+        keep = V != 0.0
+        A = sparse.coo_matrix((V[keep], (I[keep], J[keep])), shape=(self.n_fil, self.n_var)).tocsr()
+        A.sum_duplicates()
+        return A
+
+
+def _arr_ty(d, TY, default=0.0) -> np.ndarray:
+    """{(y,t): v} -> array en orden TY (un ndarray ya alineado con TY se usa tal cual)."""
+    if isinstance(d, np.ndarray):
+        return d.astype(np.float64, copy=False)
+    return np.fromiter((d.get(k, default) for k in TY), dtype=np.float64, count=len(TY))
+
+
+def _arr_ety(d, entidades, TY, default=0.0) -> np.ndarray:
+    """{(e,y,t): v} -> array (entidad, TY) (un ndarray ya alineado se usa tal cual)."""
+    if isinstance(d, np.ndarray):
+        return d.astype(np.float64, copy=False).reshape(len(entidades), len(TY))
+    return np.array([[d.get((e, y, t), default) for (y, t) in TY] for e in entidades],
+                    dtype=np.float64).reshape(len(entidades), len(TY))
+
+
+def _arcos(arcos, origen: List[str], destino: List[str]):
+    """Arcos únicos (como Set de Pyomo) con ambos extremos en los catálogos -> índices."""
+    io, id_ = {n: i for i, n in enumerate(origen)}, {n: i for i, n in enumerate(destino)}
+    vistos = list(dict.fromkeys((u, d) for (u, d) in arcos if u in io and d in id_))
+    return (np.array([io[u] for u, _ in vistos], dtype=np.int64),
+            np.array([id_[d] for _, d in vistos], dtype=np.int64))
+
+
+def arcos_con_retardo(hydro: dict, fam: str, n_bloques: int):
+    """
+    Arcos de una familia agrupados por retardo: [(arcos [(u, d)], T)] con T None para retardo 0
+    (mismo bloque) o la matriz de transferencia hydro["retardos"][retardo] (n_bloques x n_bloques).
+    Usa la lista con retardo f"{fam}_d" [(u, d, h_delay)] si está en hydro; si no, la lista sin retardo.
+    """
+    if f"{fam}_d" not in hydro:
+        return [(list(hydro.get(fam, [])), None)]
+    por_retardo: Dict[float, list] = {}
+    for (u, d, h) in hydro[f"{fam}_d"]:
+        por_retardo.setdefault(float(h or 0.0), []).append((u, d))
+    grupos = []
+    for h, arcos in sorted(por_retardo.items()):
+        if h <= 0.0:
+            grupos.append((arcos, None))
+            continue
+        T = hydro.get("retardos", {}).get(h)
+        if T is None:
+            raise ValueError(f"{fam}: falta la matriz de transferencia del retardo {h} h (hydro['retardos']).")
+        if T.shape != (n_bloques, n_bloques):
+            raise ValueError(f"{fam}: transferencia del retardo {h} h es {T.shape} y el LP tiene {n_bloques} "
+                             "bloques (los retardos requieren el calendario completo).")
+        grupos.append((arcos, T))
+    return grupos
+
+
+def _coef_arcos(E: _Ensamble, f: np.ndarray, var: np.ndarray, u: np.ndarray, d: np.ndarray,
+                T, peso) -> None:
+    """Entradas por arcos: -peso * var[u] en f[d], en el mismo bloque (T None) o repartidas por T."""
+    peso = np.broadcast_to(np.asarray(peso, dtype=np.float64), (len(u),))[:, None]
+    if T is None:
+        E.coef(f[d], var[u], -peso)
+        return
+    Tc = T.tocoo()
+    E.coef(f[d][:, Tc.row], var[u][:, Tc.col], -peso * Tc.data[None, :])
+
+
+def _costo_p(c_var: np.ndarray, iy: np.ndarray, techs, TY, cvar_ty=None) -> np.ndarray:
+    """(techs, TY) costo variable de p sin descontar: cvar del stage o, si está, el del bloque."""
+    c = c_var[:, iy].copy()
+    for i, g in enumerate(techs):
+        if cvar_ty is not None and g in cvar_ty:
+            c[i] = _arr_ty(cvar_ty[g], TY)
+    return c
+
+
+def build_lp(Y_list, T_by_Y, alpha, D, techs, AF, K0,
+             cinv, cfix, cvar, Knew_bar, hydro, r: float = 0.08, c_ens: float = C_ENS,
+             bigm_slack: float = BIGM_SLACK, kappa_default: float = KAPPA_DEFAULT,
+             cvar_ty: Optional[Dict[str, np.ndarray]] = None) -> ModeloLP:
+    """
+    Misma firma y formulación que mvp_expansion.build_model, ensamblada como CSR.
+    alpha, D, hydro["I_nat"] y hydro["I_nat_ror"] aceptan también arrays ya alineados
+    (TY,) / (R, TY) / (ROR, TY), p.ej. desde Calendario o memoria compartida.
+    cvar_ty: {g: costo variable por bloque (TY,)} (costos_combustible); reemplaza cvar[(g, y)]
+    en el costo de p de esas tecnologías.
+    """
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    nTY, nY, nG = len(TY), len(Y_list), len(techs)
+    pos_y = {y: i for i, y in enumerate(Y_list)}
+    iy = np.array([pos_y[y] for (y, _) in TY], dtype=np.int64)       # stage de cada bloque
+
+    R   = list(hydro["R"])
+    ROR = list(hydro.get("ROR", []))
+    nR, nH = len(R), len(ROR)
+
+    a_ty = _arr_ty(alpha, TY)
+    d_ty = _arr_ty(D, TY)
+    df   = np.array([1.0 / ((1.0 + r) ** (y - 1)) for y in Y_list])
+    af   = np.array([_arr_ty(AF[g], TY) for g in techs]).reshape(nG, nTY)
+    c_inv = np.array([[cinv[(g, y)] for y in Y_list] for g in techs]).reshape(nG, nY)
+    c_fix = np.array([[cfix[(g, y)] for y in Y_list] for g in techs]).reshape(nG, nY)
+    c_var = np.array([[cvar[(g, y)] for y in Y_list] for g in techs]).reshape(nG, nY)
+    kbar  = np.array([[Knew_bar[(g, y)] for y in Y_list] for g in techs]).reshape(nG, nY)
+    k0    = np.array([K0[g] for g in techs], dtype=np.float64)
+
+    hp = lambda key, default: np.array([float(hydro[key].get(e, default)) for e in R])
+    vmax, vmin, vini, vend = hp("vmax", 0.0), hp("vmin", 0.0), hp("vini", 0.0), hp("vend", 0.0)
+    kappa, val_ovf, pen = hp("kappa", kappa_default), hp("val_ovf", 0.0), hp("non_phys_pen", 0.0)
+    allow = np.array([1.0 if hydro["non_phys"].get(e, False) else 0.0 for e in R])
+    I_nat = _arr_ety(hydro["I_nat"], R, TY)
+
+    g_ = lambda key, default: np.array([float(hydro.get(key, {}).get(g, default)) for g in ROR])
+    pmax_ror, kap_ror = g_("PmaxROR", 0.0), g_("kappa_ror", kappa_default)
+    hg_min, hg_max = g_("hg_sp_min", 0.0), g_("hg_sp_max", 99999.0)
+    I_ror = _arr_ety(hydro.get("I_nat_ror", {}), ROR, TY)
+
+    # ---------------- variables ----------------
+    E = _Ensamble()
+    x     = E.variable("x", (nG, nY))
+    K     = E.variable("K", (nG, nY))
+    p     = E.variable("p", (nG, nTY))
+    ens   = E.variable("ens", (nTY,))
+    V     = E.variable("V", (nR, nTY))
+    Turb  = E.variable("Turb", (nR, nTY))
+    Spill = E.variable("Spill", (nR, nTY))
+    Slack = E.variable("Slack", (nR, nTY))
+    Ph    = E.variable("Ph", (nR, nTY))
+    Pror  = E.variable("P_ror", (nH, nTY))
+
+    c = np.zeros(E.n_var)
+    c[x] = df[None, :] * c_inv
+    c[K] = df[None, :] * c_fix
+    c[p] = df[iy][None, :] * _costo_p(c_var, iy, techs, TY, cvar_ty)
+    c[ens] = df[iy] * c_ens
+    c[Spill] = df[iy][None, :] * val_ovf[:, None]
+    c[Slack] = df[iy][None, :] * pen[:, None]
+
+    # ---------------- restricciones ----------------
+    # CapEvol: K[g,y] - K[g,y-1] - x[g,y] = K0 (primer stage) / 0
+    f = E.filas("CapEvol", (nG, nY), np.where(np.arange(nY) == 0, k0[:, None], 0.0),
+                np.where(np.arange(nY) == 0, k0[:, None], 0.0))
+    E.coef(f, K, 1.0)
+    E.coef(f, x, -1.0)
+    E.coef(f[:, 1:], K[:, :-1], -1.0)
+
+    # InvestCap: x <= kbar
+    f = E.filas("InvestCap", (nG, nY), -np.inf, kbar)
+    E.coef(f, x, 1.0)
+
+    # GenCap / GenAvail: p - (af) alpha K <= 0
+    f = E.filas("GenCap", (nG, nTY), -np.inf, 0.0)
+    E.coef(f, p, 1.0)
+    E.coef(f, K[:, iy], -a_ty[None, :])
+    f = E.filas("GenAvail", (nG, nTY), -np.inf, 0.0)
+    E.coef(f, p, 1.0)
+    E.coef(f, K[:, iy], -af * a_ty[None, :])
+
+    # HydroConv: Ph - kappa Turb = 0
+    f = E.filas("HydroConv", (nR, nTY), 0.0, 0.0)
+    E.coef(f, Ph, 1.0)
+    E.coef(f, Turb, -kappa[:, None])
+
+    # VolBalance: V - Vprev - entradas + Turb + Spill - Slack = I_nat (+ vini en el 1er bloque)
+    rhs = I_nat.copy()
+    if nTY:
+        rhs[:, 0] += vini
+    f = E.filas("VolBalance", (nR, nTY), rhs, rhs)
+    E.coef(f, V, 1.0)
+    E.coef(f[:, 1:], V[:, :-1], -1.0)
+    E.coef(f, Turb, 1.0)
+    E.coef(f, Spill, 1.0)
+    E.coef(f, Slack, -1.0)
+    for fam, var in (("arcs_spill_res", Spill), ("arcs_turb_res", Turb)):
+        for arcos, T in arcos_con_retardo(hydro, fam, nTY):
+            u, d = _arcos(arcos, R, R)
+            _coef_arcos(E, f, var, u, d, T, 1.0)
+
+    # VolMin / VolMax
+    f = E.filas("VolMin", (nR, nTY), vmin[:, None], np.inf)
+    E.coef(f, V, 1.0)
+    f = E.filas("VolMax", (nR, nTY), -np.inf, vmax[:, None])
+    E.coef(f, V, 1.0)
+
+    # VolTerminal
+    f = E.filas("VolTerminal", (nR,), vend, vend)
+    if nTY:
+        E.coef(f, V[:, -1], 1.0)
+
+    # SlackAllow: Slack <= allow * BIGM
+    f = E.filas("SlackAllow", (nR, nTY), -np.inf, (allow * bigm_slack)[:, None])
+    E.coef(f, Slack, 1.0)
+
+    # ROR
+    f = E.filas("ROR_Capacity", (nH, nTY), -np.inf, pmax_ror[:, None] * a_ty[None, :])
+    E.coef(f, Pror, 1.0)
+
+    f = E.filas("ROR_Water", (nH, nTY), -np.inf, kap_ror[:, None] * I_ror)
+    E.coef(f, Pror, 1.0)
+    for fam, var in (("arcs_turb_to_hg", Turb), ("arcs_spill_to_hg", Spill)):
+        for arcos, T in arcos_con_retardo(hydro, fam, nTY):
+            u, g = _arcos(arcos, R, ROR)
+            _coef_arcos(E, f, var, u, g, T, kap_ror[g])
+
+    f = E.filas("ROR_MinHG", (nH, nTY), hg_min[:, None] * a_ty[None, :], np.inf)
+    E.coef(f, Pror, 1.0)
+    f = E.filas("ROR_MaxHG", (nH, nTY), -np.inf, hg_max[:, None] * a_ty[None, :])
+    E.coef(f, Pror, 1.0)
+
+    # Balance: sum p + sum Ph + sum P_ror + ens = D
+    f = E.filas("Balance", (nTY,), d_ty, d_ty)
+    E.coef(np.broadcast_to(f, (nG, nTY)), p, 1.0)
+    E.coef(np.broadcast_to(f, (nR, nTY)), Ph, 1.0)
+    E.coef(np.broadcast_to(f, (nH, nTY)), Pror, 1.0)
+    E.coef(f, ens, 1.0)
+
+    return ModeloLP(
+        c=c, A=E.matriz(),
+        row_lo=np.concatenate(E.lo_partes), row_up=np.concatenate(E.up_partes),
+        col_lo=np.zeros(E.n_var), col_up=np.full(E.n_var, np.inf),
+        var=E.var, fila=E.fila, Y_list=list(Y_list), TY=TY, techs=list(techs), R=R, ROR=ROR,
+        param={"df": df, "alpha": a_ty, "iy": iy, "af": af, "k0": k0, "vini": vini, "kappa": kappa,
+               "kappa_ror": kap_ror, "pmax_ror": pmax_ror, "hg_min": hg_min, "hg_max": hg_max,
+               "c_ens": np.array([c_ens])},
+    )
+
+
+def agrega_columnas(lp: ModeloLP, familia: str, costo, lo, up, filas=None, coef=None) -> ModeloLP:
+    """
+    Copia del LP con una familia de columnas nueva al final (p.ej. desvíos o costo futuro).
+    costo/lo/up: (n,); filas/coef: tripletas opcionales (fila, columna relativa 0..n-1, coef).
+    """
+    costo = np.atleast_1d(np.asarray(costo, dtype=np.float64))
+    n, off = costo.shape[0], lp.n_var
+    if filas is not None:
+        f, j, v = (np.asarray(a).ravel() for a in (filas[0], filas[1], coef))
+        B = sparse.csr_matrix((v.astype(np.float64), (f, j)), shape=(lp.n_fil, n))
+    else:
+        B = sparse.csr_matrix((lp.n_fil, n))
+    return replace(
+        lp, A=sparse.hstack([lp.A, B], format="csr"), c=np.r_[lp.c, costo],
+        col_lo=np.r_[lp.col_lo, np.broadcast_to(np.asarray(lo, dtype=np.float64), (n,))],
+        col_up=np.r_[lp.col_up, np.broadcast_to(np.asarray(up, dtype=np.float64), (n,))],
+        var={**lp.var, familia: (off, (n,))},
+    )
+
+
+def quita_coef_fijas(lp: ModeloLP, cols: np.ndarray) -> ModeloLP:
+    """
+    Copia del LP sin los coeficientes de las columnas cols, que deben estar fijas en 0: la columna
+    queda (los índices de las familias no cambian) pero deja de ocupar la matriz. Quedan anotadas
+    en param["cols_sin_coef"] (SesionExpansion no permite volver a abrirlas).
+    """
+    cols = np.unique(np.asarray(cols, dtype=np.int64))
+    if np.any(lp.col_lo[cols] != 0.0) or np.any(lp.col_up[cols] != 0.0):
+        raise ValueError("quita_coef_fijas: sólo columnas fijas en 0.")
+    A = lp.A.tocsr(copy=True)
+    quita = np.zeros(lp.n_var, dtype=bool)
+    quita[cols] = True
+    A.data[quita[A.indices]] = 0.0
+    A.eliminate_zeros()
+    previas = lp.param.get("cols_sin_coef", np.zeros(0, dtype=np.int64))
+    return replace(lp, A=A, param=dict(lp.param, cols_sin_coef=np.union1d(previas, cols)))
+
+
+# ===== Pasada de cotas =====
+# familias de una sola variable por fila (se convierten en cotas de columna)
+FAMILIAS_COTA = ("InvestCap", "VolMin", "VolMax", "SlackAllow", "ROR_Capacity", "ROR_MinHG", "ROR_MaxHG")
+
+
+def depura_formulacion(lp: ModeloLP, familias=FAMILIAS_COTA, dominadas: bool = True,
+                       bigm: float = 1e8, tol: float = 1e-9) -> Tuple[ModeloLP, Dict[str, object]]:
+    """
+    Copia del LP con las filas de una sola variable pasadas a cotas de columna y sin filas dominadas:
+      - familias: cada fila  lo <= a x_j <= up  queda como cota de x_j (se combina con la más
+        ajustada si hay varias); una familia con alguna fila de más de una variable se deja igual
+      - cotas >= bigm se tratan como infinitas (SlackAllow con allow = 1); allow = 0 fija Slack = 0
+      - dominadas: GenCap se elimina si GenAvail existe y af <= 1 en todo el horizonte
+    Las familias eliminadas desaparecen de lp.fila (sus duales quedan en dual_col de la columna).
+    Devuelve (lp, reporte) con filas / no-ceros eliminados por familia.
+    """
+    A = lp.A.tocsr()
+    nnz_fila = np.diff(A.indptr)
+    col_lo, col_up = lp.col_lo.copy(), lp.col_up.copy()
+    quitar: Dict[str, str] = {}
+
+    filas_cota: Dict[str, dict] = {}
+
+    for fam in familias:
+        if fam not in lp.fila:
+            continue
+        f = lp.filas(fam).ravel()
+        if np.any(nnz_fila[f] > 1):
+            continue
+        vacias = f[nnz_fila[f] == 0]
+        if np.any(lp.row_lo[vacias] > tol) or np.any(lp.row_up[vacias] < -tol):
+            raise ValueError(f"depura_formulacion: fila vacía infactible en {fam}.")
+        uno = nnz_fila[f] == 1
+        j = np.full(len(f), -1, dtype=np.int64)
+        a = np.ones(len(f))
+        j[uno] = A.indices[A.indptr[f[uno]]]
+        a[uno] = A.data[A.indptr[f[uno]]]
+        fc = {"forma": lp.fila[fam][1], "col": j, "coef": a,
+              "lo": lp.row_lo[f].copy(), "up": lp.row_up[f].copy()}
+        _aplica_filas_cota(fc, np.flatnonzero(uno), col_lo, col_up, bigm)
+        filas_cota[fam] = fc
+        quitar[fam] = "cota"
+
+    if dominadas and "GenCap" in lp.fila and "GenAvail" in lp.fila \
+            and np.all(np.asarray(lp.param.get("af", np.inf)) <= 1.0 + tol):
+        quitar["GenCap"] = "dominada"
+
+    malas = np.flatnonzero(col_lo > col_up + tol)
+    if len(malas):
+        raise ValueError(f"depura_formulacion: {len(malas)} columnas con cota inferior > superior.")
+    col_up = np.maximum(col_up, col_lo)          # cruces por redondeo (<= tol)
+
+    keep = np.ones(lp.n_fil, dtype=bool)
+    reporte: Dict[str, object] = {"familias": {}}
+    for fam, motivo in quitar.items():
+        f = lp.filas(fam).ravel()
+        keep[f] = False
+        reporte["familias"][fam] = {"motivo": motivo, "filas": int(len(f)), "nnz": int(nnz_fila[f].sum())}
+    fila, off = {}, 0
+    for fam, (_, shape) in sorted(lp.fila.items(), key=lambda kv: kv[1][0]):
+        if fam not in quitar:
+            fila[fam] = (off, shape)
+            off += int(np.prod(shape))
+
+    A2 = A[keep]
+    fijas_antes = int(np.sum(lp.col_lo == lp.col_up))
+    reporte.update(
+        filas_antes=lp.n_fil, filas_despues=int(A2.shape[0]), filas_eliminadas=int(lp.n_fil - A2.shape[0]),
+        nnz_antes=int(A.nnz), nnz_despues=int(A2.nnz), nnz_eliminados=int(A.nnz - A2.nnz),
+        columnas_fijas=int(np.sum(col_lo == col_up)) - fijas_antes,
+    )
+    # lo necesario para que SesionExpansion siga actualizando las familias convertidas
+    param = dict(lp.param, filas_cota=filas_cota, cota_base=(lp.col_lo.copy(), lp.col_up.copy()),
+                 cota_bigm=bigm)
+    return replace(lp, A=A2, row_lo=lp.row_lo[keep], row_up=lp.row_up[keep],
+                   col_lo=col_lo, col_up=col_up, fila=fila, param=param), reporte
+
+
+def _aplica_filas_cota(fc: dict, i: np.ndarray, col_lo: np.ndarray, col_up: np.ndarray, bigm: float,
+                       pos=None):
+    """Filas i de una familia convertida (lo <= a x_j <= up) sobre las cotas de sus columnas x_j."""
+    j, a = fc["col"][i], fc["coef"][i]
+    lo, up = fc["lo"][i] / a, fc["up"][i] / a
+    lo, up = np.where(a > 0, lo, up), np.where(a > 0, up, lo)
+    lo[lo <= -bigm], up[up >= bigm] = -np.inf, np.inf
+    j = j if pos is None else pos(j)
+    np.maximum.at(col_lo, j, lo)
+    np.minimum.at(col_up, j, up)
+
+
+def cotas_columnas(lp: ModeloLP, cols: np.ndarray, tol: float = 1e-9) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cotas (lo, up) de las columnas cols (únicas, ordenadas) de un LP depurado: las cotas base
+    de la columna combinadas con todas las filas que depura_formulacion convirtió sobre ellas.
+    """
+    base_lo, base_up = lp.param["cota_base"]
+    lo, up = base_lo[cols].copy(), base_up[cols].copy()
+    for fc in lp.param["filas_cota"].values():
+        i = np.flatnonzero(np.isin(fc["col"], cols))
+        if len(i):
+            _aplica_filas_cota(fc, i, lo, up, lp.param["cota_bigm"], pos=lambda j: np.searchsorted(cols, j))
+    return lo, np.where((up < lo) & (lo - up <= tol), lo, up)      # cruces por redondeo (<= tol)
+
+
+# ===== Solver =====
+def _highs_lp(lp: ModeloLP):
+    A = lp.A.tocsc()
+    h = highspy.HighsLp()
+    h.num_col_ = lp.n_var
+    h.num_row_ = lp.n_fil
+    h.col_cost_ = lp.c
+    h.col_lower_ = lp.col_lo
+    h.col_upper_ = lp.col_up
+    h.row_lower_ = lp.row_lo
+    h.row_upper_ = lp.row_up
+    h.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    h.a_matrix_.start_ = A.indptr
+    h.a_matrix_.index_ = A.indices
+    h.a_matrix_.value_ = A.data
+    return h
+
+
+def solver_highs(lp: ModeloLP, threads: Optional[int] = None, tee: bool = False):
+    """Instancia highspy.Highs con el LP cargado (para resolver o re-resolver)."""
+    if not HAY_HIGHSPY:
+        raise ImportError("El backend matricial requiere highspy (HiGHS).")
+    h = highspy.Highs()
+    h.setOptionValue("output_flag", bool(tee))
+    if threads is not None:
+        h.setOptionValue("threads", int(threads))
+    h.passModel(_highs_lp(lp))
+    return h
+
+
+def resultado_highs(h, lp: ModeloLP) -> ResultadoLP:
+    sol = h.getSolution()
+    info = h.getInfo()
+    return ResultadoLP(
+        estado=h.modelStatusToString(h.getModelStatus()),
+        objetivo=float(info.objective_function_value),
+        x=np.asarray(sol.col_value, dtype=np.float64),
+        dual_fila=np.asarray(sol.row_dual, dtype=np.float64),
+        dual_col=np.asarray(sol.col_dual, dtype=np.float64),
+        lp=lp,
+        info={"iteraciones_simplex": float(info.simplex_iteration_count),
+              "iteraciones_ipm": float(info.ipm_iteration_count)},
+    )
+
+
+def resuelve_lp(lp: ModeloLP, solver_name: str = "appsi_highs", threads: Optional[int] = None,
+                tee: bool = False) -> ResultadoLP:
+    """Resuelve el LP con HiGHS (el backend matricial sólo soporta solvers HiGHS)."""
+    if "highs" not in solver_name.lower():
+        raise ValueError(f"Backend matricial: solver '{solver_name}' no soportado (sólo HiGHS).")
+    h = solver_highs(lp, threads=threads, tee=tee)
+    h.run()
+    return resultado_highs(h, lp)
+
+
+def compara_backends(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew, hydro,
+                     solver_name: str = "appsi_highs", rtol: float = 1e-6) -> Tuple[float, float]:
+    """Resuelve con Pyomo y con el backend matricial; falla si los costos totales difieren."""
+    from pyomo.environ import value
+    from pyomo.opt import SolverFactory
+    from mvp_expansion import build_model
+
+    m = build_model(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew, hydro)
+    SolverFactory(solver_name).solve(m, tee=False)
+    obj_pyomo = float(value(m.TotalCost))
+
+    res = resuelve_lp(build_lp(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew, hydro),
+                      solver_name)
+    if not np.isclose(obj_pyomo, res.objetivo, rtol=rtol):
+        raise AssertionError(f"Costos distintos: Pyomo={obj_pyomo:,.2f} matricial={res.objetivo:,.2f}")
+    return obj_pyomo, res.objetivo
+
+
+def recorta_stages(Y_list, T_by_Y, alpha, D, n_stages: Optional[int]):
+    """Primeros n_stages del horizonte (None: todos) para comparar backends en un tramo del caso."""
+    if n_stages is None:
+        return Y_list, T_by_Y, alpha, D
+    Y_list = list(Y_list)[:n_stages]
+    S = set(Y_list)
+    return (Y_list, {y: T_by_Y[y] for y in Y_list}, {k: v for k, v in alpha.items() if k[0] in S},
+            {k: v for k, v in D.items() if k[0] in S})
+
+
+if __name__ == "__main__":
+    import sys
+    from mvp_expansion import HIDROLOGIA, RUTA_INFLOWS_QM3, TECHS, aggregate_stage_block, build_costs, load_inputs
+
+    # python backend_matricial.py [n_stages]: el modelo Pyomo del horizonte completo (204 stages)
+    # necesita bastante más memoria que el matricial; con 12 stages del caso entregado y sin
+    # hidrología ambos dan 96,929,681,466.47 $ (~30 s)
+    n_stages = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    # sin el archivo de inflows el caso se corre sin hidrología (HIDROLOGIA = None)
+    escenario = HIDROLOGIA if RUTA_INFLOWS_QM3.exists() else None
+    print(f"[compara_backends] hidrología: {escenario} | stages: {n_stages or 'todos'}")
+    inputs, ex = load_inputs(False, escenario=escenario)
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro = aggregate_stage_block(inputs, TECHS, ex)
+    Y_list, T_by_Y, alpha, D = recorta_stages(Y_list, T_by_Y, alpha, D, n_stages)
+    cinv, cfix, cvar, knew = build_costs(TECHS, Y_list)
+    obj_p, obj_m = compara_backends(Y_list, T_by_Y, alpha, D, TECHS, AF, K0, cinv, cfix, cvar, knew, hydro)
+    print(f"[OK] Pyomo={obj_p:,.2f} | matricial={obj_m:,.2f}")
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Barrido de sensibilidad en paralelo sobre parámetros económicos
+----------------------------------------------------------------
+Parámetros (PARAMETROS, valores base de mvp_expansion):
+  r, c_ens                           -> argumentos de build_lp
+  kappa_default                      -> conversión MWh/hm3: hydro["kappa"] de todos los embalses y
+                                        hydro["kappa_ror"] (eff de cada unidad * kappa_default)
+  esc_cinv, esc_cvar                 -> escala de toda la trayectoria de costos de inversión / variables
+  pend_cinv, pend_cvar               -> escala de la variación respecto del primer stage (pendiente):
+                                        c'(g, y) = esc * (c(g, y1) + pend * (c(g, y) - c(g, y1)))
+Puntos: rejilla (producto de listas) o hipercubo latino (rangos, n, semilla) con EspecBarrido.
+1) Las entradas se cargan y agregan UNA vez (opcionalmente reducidas a periodos representativos);
+   alpha y demanda van a memoria compartida y el resto se entrega una vez por worker.
+2) Los puntos se ordenan como cadena de vecinos (vecino más cercano en el cubo normalizado) y la
+   cadena se parte en un tramo contiguo por worker. De cada tramo hay un solo caso en vuelo: al
+   terminar se envía el siguiente con la base del anterior (su vecino), que HiGHS usa como arranque
+   si el LP tiene la misma forma. La base viaja como arreglos de estados (HighsBasis no es picklable).
+3) Cada caso terminado agrega su fila al CSV común (resultados/sensibilidad/<estudio>.csv).
+   El id del caso es el hash de sus parámetros y del montaje (columna 'setup': periodos, escenario,
+   METODO_REP, TECHS y contenido de las entradas agregadas). Al reanudar se omiten los casos cuyo
+   id ya está en la tabla; las filas de otro montaje no cuentan como hechas (se avisa).
+4) Se informa el rendimiento (casos por hora) y el tiempo restante estimado.
+Ejecutar:
+    python barrido_sensibilidad.py
+"""
+from __future__ import annotations
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backend_matricial import build_lp, depura_formulacion, resultado_highs, solver_highs
+from cache_etapas import hash_valor
+from escenarios_hidrologicos import adjunta, libera, publica
+from perfiles_generacion import hash_archivo
+
+RUTA_BASE = Path(__file__).parent.parent.parent
+RUTA_SENS = RUTA_BASE / "resultados" / "sensibilidad"
+
+PARAMETROS = ("r", "c_ens", "kappa_default", "esc_cinv", "esc_cvar", "pend_cinv", "pend_cvar")
+
+
+@dataclass
+class EspecBarrido:
+    rejilla: Dict[str, Sequence[float]] = field(default_factory=dict)           # producto cartesiano
+    rangos: Dict[str, Tuple[float, float]] = field(default_factory=dict)        # hipercubo latino
+    n_lhs: int = 0
+    semilla: int = 0
+
+    def puntos(self, base: Dict[str, float], setup: str = "") -> pd.DataFrame:
+        """Una fila por caso con todos los PARAMETROS (los no barridos quedan en su valor base)."""
+        desconocidos = (set(self.rejilla) | set(self.rangos)) - set(PARAMETROS)
+        if desconocidos:
+            raise ValueError(f"EspecBarrido: parámetros desconocidos {sorted(desconocidos)}.")
+        if self.rejilla and self.rangos:
+            raise ValueError("EspecBarrido: use rejilla o rangos (hipercubo latino), no ambos.")
+        if self.rangos:
+            from scipy.stats import qmc
+            lo, hi = np.array(list(self.rangos.values()), dtype=np.float64).T
+            U = qmc.LatinHypercube(d=len(self.rangos), seed=self.semilla).random(self.n_lhs)
+            df = pd.DataFrame(qmc.scale(U, lo, hi), columns=list(self.rangos))
+        elif self.rejilla:
+            malla = np.meshgrid(*[np.asarray(v, dtype=np.float64) for v in self.rejilla.values()], indexing="ij")
+            df = pd.DataFrame({k: m.ravel() for k, m in zip(self.rejilla, malla)})
+        else:
+            df = pd.DataFrame(index=[0])
+        for k in PARAMETROS:
+            if k not in df:
+                df[k] = float(base[k])
+        df = df[list(PARAMETROS)]
+        df.insert(0, "caso", [hash_valor((setup, [round(float(v), 12) for v in fila]))[:16]
+                              for fila in df.to_numpy()])
+        df.insert(1, "setup", setup)
+        return df
+
+
+def ordena_vecinos(X: np.ndarray) -> np.ndarray:
+    """Orden de visita: cadena de vecino más cercano (cubo normalizado) desde el primer punto."""
+    n = len(X)
+    if n <= 2:
+        return np.arange(n)
+    rango = X.max(axis=0) - X.min(axis=0)
+    Z = (X - X.min(axis=0)) / np.where(rango > 0, rango, 1.0)
+    libre = np.ones(n, dtype=bool)
+    orden = np.empty(n, dtype=np.int64)
+    i = 0
+    for k in range(n):
+        orden[k] = i
+        libre[i] = False
+        if k == n - 1:
+            break
+        d = np.where(libre, ((Z - Z[i]) ** 2).sum(axis=1), np.inf)
+        i = int(np.argmin(d))
+    return orden
+
+
+def aplica_kappa(hydro: dict, kappa: float, kappa_base: float) -> dict:
+    """
+    hydro con kappa = kappa_default en todos los embalses (como aggregate_stage_block) y kappa_ror
+    reescalado por kappa / kappa_base (load_hydro_generator los arma como kappa_base * eff).
+    """
+    if kappa == kappa_base:
+        return hydro
+    if kappa_base <= 0:
+        raise ValueError("aplica_kappa: kappa_base debe ser > 0 para reescalar kappa_ror.")
+    return dict(hydro, kappa={e: float(kappa) for e in hydro["R"]},
+                kappa_ror={g: v * kappa / kappa_base for g, v in hydro.get("kappa_ror", {}).items()})
+
+
+def escala_costos(c: Dict[tuple, float], Y_list: List[int], esc: float, pend: float) -> Dict[tuple, float]:
+    """c'(g, y) = esc * (c(g, y1) + pend * (c(g, y) - c(g, y1)))."""
+    if esc == 1.0 and pend == 1.0:
+        return c
+    y1 = Y_list[0]
+    return {(g, y): esc * (c[(g, y1)] + pend * (v - c[(g, y1)])) for (g, y), v in c.items()}
+
+
+# ===== Worker =====
+_W: dict = {}
+
+
+def _init_worker(meta, base, threads_solver, tibio):
+    bloques, arrays = adjunta(meta)
+    _W.update(bloques=bloques, arrays=arrays, base=base, threads=threads_solver, tibio=tibio)
+
+
+def _base_a_arreglos(b) -> Tuple[np.ndarray, np.ndarray]:
+    return (np.fromiter((int(s) for s in b.col_status), np.int8, count=len(b.col_status)),
+            np.fromiter((int(s) for s in b.row_status), np.int8, count=len(b.row_status)))
+
+
+def _arreglos_a_base(col: np.ndarray, fil: np.ndarray):
+    import highspy
+    b = highspy.HighsBasis()
+    b.col_status = [highspy.HighsBasisStatus(int(v)) for v in col]
+    b.row_status = [highspy.HighsBasisStatus(int(v)) for v in fil]
+    b.valid = True
+    return b
+
+
+def _resuelve_caso(punto: Dict[str, float], basis: Optional[tuple] = None) -> Tuple[dict, Optional[tuple]]:
+    """
+    Resuelve un punto. basis: (forma, estados de columnas, estados de filas) del caso anterior de la
+    cadena. Devuelve (fila resumen, base de este caso para el siguiente; None sin tibio o si no es óptimo).
+    """
+    a, base = _W["arrays"], _W["base"]
+    (Y_list, T_by_Y, AF, K0, techs, cinv, cfix, cvar, knew, hydro, per, kw) = base
+    t0 = time.perf_counter()
+    ci = escala_costos(cinv, Y_list, punto["esc_cinv"], punto["pend_cinv"])
+    cv = escala_costos(cvar, Y_list, punto["esc_cvar"], punto["pend_cvar"])
+    # kw["kappa_default"]: el valor con que se armó hydro
+    hyd = aplica_kappa(hydro, punto["kappa_default"], kw["kappa_default"])
+    args = (Y_list, T_by_Y, a["alpha"], a["D"], techs, AF, K0, ci, cfix, cv, knew, hyd)
+    kw = dict(kw, r=punto["r"], c_ens=punto["c_ens"], kappa_default=punto["kappa_default"])
+    if per is None:
+        lp = build_lp(*args, **kw)
+    else:
+        from periodos_representativos import build_lp_reducido
+        lp = build_lp_reducido(per, *args, **kw)
+    lp, _ = depura_formulacion(lp)
+    t1 = time.perf_counter()
+    h = solver_highs(lp, threads=_W["threads"])
+    forma = (lp.n_var, lp.n_fil)
+    tibio = _W["tibio"] and basis is not None and basis[0] == forma
+    if tibio:
+        h.setBasis(_arreglos_a_base(basis[1], basis[2]))
+    h.run()
+    res = resultado_highs(h, lp)
+    sig = (forma, *_base_a_arreglos(h.getBasis())) if _W["tibio"] and res.estado == "Optimal" else None
+    t2 = time.perf_counter()
+    fila = dict(punto, **resumen_caso(res), tibio=tibio, build_s=round(t1 - t0, 3),
+                solve_s=round(t2 - t1, 3), pid=os.getpid(), fin=time.strftime("%Y-%m-%dT%H:%M:%S"))
+    return fila, sig
+
+
+def resumen_caso(res) -> dict:
+    """Fila resumen: estado, costo total, ENS total (MWh), inversión nueva y capacidad final por tecnología."""
+    lp = res.lp
+    ens = res.valor("ens")
+    out = {"estado": res.estado, "costo_total": res.objetivo, "ens_MWh": float(ens.sum()),
+           "iteraciones": int(res.info["iteraciones_simplex"] + res.info["iteraciones_ipm"])}
+    x, K = res.valor("x"), res.valor("K")
+    for j, g in enumerate(lp.techs):
+        out[f"x_{g}"] = float(x[j].sum())
+        out[f"K_{g}"] = float(K[j, -1])
+    return out
+
+
+# ===== Orquestador =====
+def prepara_base(periodos: Optional[int] = None, escenario: Optional[str] = None):
+    """
+    Entradas comunes cargadas y agregadas una vez: (arrays compartidos, base por worker, valores base,
+    setup). setup: hash del montaje (periodos, escenario, METODO_REP, TECHS y entradas agregadas).
+    """
+    import mvp_expansion as mx
+
+    inputs, ex = mx.load_inputs(False, escenario=escenario)
+    cal = inputs.calendario
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro = mx.aggregate_stage_block(inputs, mx.TECHS, ex)
+    cinv, cfix, cvar, knew = mx.build_costs(mx.TECHS, Y_list)
+    per = None
+    if periodos:
+        from periodos_representativos import reduce_periodos
+        per = reduce_periodos(Y_list, T_by_Y, alpha, D, mx.TECHS, AF, hydro, periodos, mx.METODO_REP)
+    arrays = {"alpha": cal.alpha, "D": np.fromiter((D[k] for k in cal.TY), float, count=cal.n_bloques)}
+    kw = dict(bigm_slack=mx.BIGM_SLACK, kappa_default=mx.KAPPA_DEFAULT)
+    base = (Y_list, T_by_Y, AF, K0, list(mx.TECHS), cinv, cfix, cvar, knew, hydro, per, kw)
+    valores = dict(r=mx.DISCOUNT_R, c_ens=mx.C_ENS, kappa_default=mx.KAPPA_DEFAULT,
+                   esc_cinv=1.0, esc_cvar=1.0, pend_cinv=1.0, pend_cvar=1.0)
+    # afluentes: por el hash del archivo de inflows (recorrer los dicts I_nat es lento)
+    hydro_base = {k: v for k, v in hydro.items() if k not in ("I_nat", "I_nat_ror")}
+    inflows = hash_archivo(mx.RUTA_INFLOWS_QM3) if escenario is not None else None
+    setup = hash_valor(("barrido", periodos, escenario, mx.METODO_REP, list(mx.TECHS), arrays,
+                        base[:9], hydro_base, inflows, kw))[:16]
+    return arrays, base, valores, setup
+
+
+def casos_hechos(ruta: Path, setup: Optional[str] = None) -> set:
+    """Ids ya en la tabla; con setup, sólo los de ese montaje (avisa si hay filas de otros)."""
+    if not ruta.exists():
+        return set()
+    df = pd.read_csv(ruta, dtype={"caso": str, "setup": str})
+    if setup is None or "setup" not in df:
+        if setup is not None:
+            print(f"[barrido] aviso: {ruta.name} no tiene columna setup; sus filas no se reutilizan")
+            return set()
+        return set(df["caso"])
+    otros = df["setup"] != setup
+    if otros.any():
+        print(f"[barrido] aviso: {int(otros.sum())} filas de {ruta.name} son de otro montaje "
+              f"({', '.join(sorted(df.loc[otros, 'setup'].unique()))}); no cuentan como hechas")
+    return set(df.loc[~otros, "caso"])
+
+
+def agrega_fila(ruta: Path, fila: dict):
+    """Agrega una fila al CSV común (cabecera sólo al crearlo)."""
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    nuevo = not ruta.exists()
+    pd.DataFrame([fila]).to_csv(ruta, mode="a", header=nuevo, index=False, encoding="utf-8")
+
+
+def corre_barrido(espec: EspecBarrido, estudio: str = "barrido", periodos: Optional[int] = None,
+                  escenario: Optional[str] = None, max_workers: Optional[int] = None, threads_solver: int = 1,
+                  tibio: bool = True) -> pd.DataFrame:
+    """
+    Corre (o reanuda) el barrido y devuelve la tabla completa del estudio.
+      - periodos: n° de periodos representativos (None: calendario completo)
+      - escenario: hidrología del archivo de inflows (None: sin inflows)
+      - max_workers: procesos (por defecto núcleos // threads_solver); threads_solver: hilos de HiGHS por worker
+      - tibio: arranque de cada caso desde la base del caso anterior de su tramo de la cadena
+    """
+    ruta = RUTA_SENS / f"{estudio}.csv"
+    arrays, base, valores, setup = prepara_base(periodos, escenario)
+    puntos = espec.puntos(valores, setup)
+    puntos = puntos.iloc[ordena_vecinos(puntos[list(PARAMETROS)].to_numpy())]
+    hechos = casos_hechos(ruta, setup)
+    pendientes = puntos[~puntos["caso"].isin(hechos)]
+    print(f"[barrido] {estudio}: {len(puntos)} casos, {len(puntos) - len(pendientes)} ya en {ruta.name}, "
+          f"{len(pendientes)} por correr")
+
+    max_workers = max_workers or max(1, (os.cpu_count() or 1) // max(1, threads_solver))
+    bloques, meta = publica(arrays)
+    t0, n = time.perf_counter(), 0
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(meta, base, threads_solver, tibio)) as pool:
+            # un tramo contiguo de la cadena por worker; cada tramo avanza de a un caso
+            tramos = [list(t) for t in np.array_split(np.arange(len(pendientes)), max_workers) if len(t)]
+            registros = pendientes.to_dict("records")
+            vuelo = {pool.submit(_resuelve_caso, registros[t.pop(0)]): t for t in tramos}
+            while vuelo:
+                listos, _ = wait(vuelo, return_when=FIRST_COMPLETED)
+                for fut in listos:
+                    tramo = vuelo.pop(fut)
+                    fila, basis = fut.result()
+                    if tramo:
+                        vuelo[pool.submit(_resuelve_caso, registros[tramo.pop(0)], basis)] = tramo
+                    agrega_fila(ruta, fila)
+                    n += 1
+                    tasa = n / max(time.perf_counter() - t0, 1e-9) * 3600.0
+                    resta = (len(pendientes) - n) / tasa if tasa > 0 else float("nan")
+                    print(f"[barrido] {n}/{len(pendientes)} caso {fila['caso']} {fila['estado']} "
+                          f"costo={fila['costo_total']:,.0f} $ ({'tibio' if fila['tibio'] else 'frío'}, "
+                          f"{fila['solve_s']:.2f} s) | {tasa:,.0f} casos/h | resta {resta:.2f} h")
+    finally:
+        libera(bloques)
+    if n:
+        print(f"[barrido] {n} casos en {time.perf_counter() - t0:,.1f} s "
+              f"({n / max(time.perf_counter() - t0, 1e-9) * 3600.0:,.0f} casos/h, {max_workers} workers)")
+    return pd.read_csv(ruta, dtype={"caso": str, "setup": str}) if ruta.exists() else puntos.iloc[:0]
+
+
+if __name__ == "__main__":
+    espec = EspecBarrido(rejilla={"r": [0.06, 0.08, 0.10], "c_ens": [2000.0, 4000.0, 8000.0],
+                                  "esc_cinv": [0.8, 1.0, 1.2]})
+    from mvp_expansion import HIDROLOGIA
+    tabla = corre_barrido(espec, estudio="r_cens_cinv", periodos=6, escenario=HIDROLOGIA)
+    print(tabla.groupby("r")["costo_total"].describe())
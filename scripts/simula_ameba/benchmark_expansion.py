@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark de escalamiento del pipeline de expansión sobre casos sintéticos
+---------------------------------------------------------------------------
+Para cada caso de la malla (caso_sintetico.ParametrosCaso):
+  - genera el caso (o reutiliza el existente) y corre en un proceso nuevo (RSS limpio):
+    load_inputs, aggregate_stage_block, build_costs, build_lp, cotas, traducción a HiGHS y solve
+    (y build_model de Pyomo si INCLUYE_PYOMO)
+  - registra por fase tiempo de pared, CPU y RSS pico (perfilador), el mínimo de REPETICIONES
+  - registra el tamaño del LP (variables, filas, no-ceros)
+Compara contra la línea base guardada (resultados/benchmark/linea_base.json): una fase
+regresiona si su tiempo supera base * (1 + UMBRAL) y la diferencia es mayor a PISO_S.
+Con regresiones el proceso termina con código 1.
+Ejecutar:
+    python benchmark_expansion.py            (GUARDA_BASE = True para fijar la línea base)
+"""
+from __future__ import annotations
+import json
+import multiprocessing as mp
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+from typing import Dict, List
+
+from caso_sintetico import ParametrosCaso, genera_caso, usa_caso
+
+RUTA_BASE = Path(__file__).parent.parent.parent
+RUTA_BENCH = RUTA_BASE / "resultados" / "benchmark"
+LINEA_BASE = RUTA_BENCH / "linea_base.json"
+
+MALLAS: Dict[str, List[ParametrosCaso]] = {
+    "chica": [ParametrosCaso(n_stages=s, n_embalses=e, n_ror=r)
+              for s, e, r in ((3, 3, 5), (6, 6, 10), (12, 6, 10))],
+    "media": [ParametrosCaso(n_stages=s, n_embalses=e, profundidad=3, n_ror=r, n_barras=8)
+              for s, e, r in ((12, 12, 30), (24, 12, 30), (24, 24, 60), (48, 24, 60))],
+    "grande": [ParametrosCaso(n_stages=s, n_embalses=e, profundidad=4, n_ror=r, n_barras=16)
+               for s, e, r in ((60, 24, 100), (120, 24, 100), (204, 24, 190))],
+}
+MALLA         = "chica"
+REPETICIONES  = 1
+INCLUYE_PYOMO = False
+UMBRAL        = 0.25        # regresión relativa admitida por fase
+PISO_S        = 0.05        # diferencias menores (s) se consideran ruido
+GUARDA_BASE   = False
+
+
+def _corre_una(par: ParametrosCaso, pyomo: bool) -> dict:
+    """Una corrida del pipeline en el proceso actual (caso ya generado)."""
+    import mvp_expansion as mx
+    from perfilador import PERFIL, tamano_lp
+
+    rutas = genera_caso(par)
+    PERFIL.reinicia(activo=True, caso=par.nombre)
+    with usa_caso(mx, rutas, hidrologia=par.hidrologias[0]):
+        with PERFIL.fase("load_inputs"):
+            inputs, ex = mx.load_inputs(False, escenario=par.hidrologias[0])
+        with PERFIL.fase("aggregate_stage_block"):
+            Y_list, T_by_Y, alpha, D, AF, K0, hydro = mx.aggregate_stage_block(inputs, mx.TECHS, ex)
+        with PERFIL.fase("build_costs"):
+            cinv, cfix, cvar, knew = mx.build_costs(mx.TECHS, Y_list)
+        args = (Y_list, T_by_Y, alpha, D, list(mx.TECHS), AF, K0, cinv, cfix, cvar, knew, hydro)
+        with PERFIL.fase("build_lp"):
+            lp = mx.build_lp(*args, r=mx.DISCOUNT_R, c_ens=mx.C_ENS, bigm_slack=mx.BIGM_SLACK,
+                             kappa_default=mx.KAPPA_DEFAULT)
+        lp = mx.depura_lp(lp)
+        res = mx.resuelve_lp_perfilado(lp)
+        if pyomo:
+            with PERFIL.fase("build_model"):
+                mx.build_model(*args, cotas=mx.COTAS_PRIMERO)
+    rep = PERFIL.reporte()
+    PERFIL.reinicia(activo=False)
+    return {"fases": {f["fase"]: f for f in rep["fases"]}, "tamano": tamano_lp(lp)["total"],
+            "objetivo": res.objetivo, "estado": res.estado, "rss_pico_mb": rep["rss_pico_mb"]}
+
+
+def corre_caso(par: ParametrosCaso, repeticiones: int = REPETICIONES, pyomo: bool = INCLUYE_PYOMO) -> dict:
+    """Genera el caso y lo corre `repeticiones` veces, cada una en un proceso nuevo."""
+    t0 = time.perf_counter()
+    genera_caso(par)
+    t_gen = time.perf_counter() - t0
+    corridas = []
+    for _ in range(max(repeticiones, 1)):
+        with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as ex:
+            corridas.append(ex.submit(_corre_una, par, pyomo).result())
+    fases = {}
+    for nombre in corridas[0]["fases"]:
+        mejor = min((c["fases"][nombre] for c in corridas), key=lambda f: f["pared_s"])
+        fases[nombre] = {k: mejor[k] for k in ("pared_s", "cpu_s", "rss_pico_mb", "aumento_pico_mb")}
+    return {"caso": par.nombre, "parametros": asdict(par), "genera_s": round(t_gen, 3), "fases": fases,
+            "tamano": corridas[0]["tamano"], "estado": corridas[0]["estado"],
+            "objetivo": corridas[0]["objetivo"], "rss_pico_mb": max(c["rss_pico_mb"] or 0.0 for c in corridas)}
+
+
+def compara_con_base(actual: List[dict], base: List[dict], umbral: float = UMBRAL,
+                     piso_s: float = PISO_S) -> List[dict]:
+    """Fases cuyo tiempo de pared supera base * (1 + umbral) por más de piso_s segundos."""
+    por_caso = {b["caso"]: b for b in base}
+    regresiones = []
+    for a in actual:
+        b = por_caso.get(a["caso"])
+        if b is None:
+            continue
+        for fase, fa in a["fases"].items():
+            fb = b["fases"].get(fase)
+            if fb is None:
+                continue
+            t_a, t_b = fa["pared_s"], fb["pared_s"]
+            if t_a > t_b * (1.0 + umbral) and t_a - t_b > piso_s:
+                regresiones.append({"caso": a["caso"], "fase": fase, "base_s": t_b, "actual_s": t_a,
+                                    "razon": t_a / max(t_b, 1e-12)})
+    return regresiones
+
+
+def imprime_tabla(resultados: List[dict]):
+    fases = list(dict.fromkeys(f for r in resultados for f in r["fases"]))
+    print(f"{'caso':<34}{'nnz':>10}" + "".join(f"{f.rsplit('/', 1)[-1][:12]:>14}" for f in fases) + f"{'pico MB':>10}")
+    for r in resultados:
+        print(f"{r['caso']:<34}{r['tamano']['nnz']:>10}"
+              + "".join(f"{r['fases'].get(f, {}).get('pared_s', float('nan')):>14.3f}" for f in fases)
+              + f"{r['rss_pico_mb']:>10.0f}")
+
+
+def main(malla: str = MALLA, guarda_base: bool = GUARDA_BASE) -> int:
+    resultados = [corre_caso(par) for par in MALLAS[malla]]
+    imprime_tabla(resultados)
+    RUTA_BENCH.mkdir(parents=True, exist_ok=True)
+    salida = RUTA_BENCH / f"bench_{malla}_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    salida.write_text(json.dumps({"malla": malla, "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                                  "resultados": resultados}, indent=2), encoding="utf-8")
+    print(f"\n[benchmark] resultados -> {salida}")
+
+    if guarda_base:
+        previa = json.loads(LINEA_BASE.read_text(encoding="utf-8"))["resultados"] if LINEA_BASE.exists() else []
+        nuevos = {r["caso"] for r in resultados}
+        LINEA_BASE.write_text(json.dumps({"resultados": [b for b in previa if b["caso"] not in nuevos] + resultados},
+                                         indent=2), encoding="utf-8")
+        print(f"[benchmark] línea base actualizada -> {LINEA_BASE}")
+        return 0
+    if not LINEA_BASE.exists():
+        print("[benchmark] sin línea base (GUARDA_BASE = True para crearla)")
+        return 0
+    regresiones = compara_con_base(resultados, json.loads(LINEA_BASE.read_text(encoding="utf-8"))["resultados"])
+    for r in regresiones:
+        print(f"[regresión] {r['caso']} / {r['fase']}: {r['base_s']:.3f} s -> {r['actual_s']:.3f} s "
+              f"(x{r['razon']:.2f})")
+    print(f"[benchmark] {len(regresiones)} regresiones (umbral {100 * UMBRAL:.0f}%, piso {PISO_S} s)")
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
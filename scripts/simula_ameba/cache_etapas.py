@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+Caché de artefactos por etapa del pipeline (DAG con claves por contenido)
+--------------------------------------------------------------------------
+Cada etapa declara sus archivos de entrada, su configuración relevante, los módulos de
+código de los que depende, las funciones auxiliares que llama y sus etapas previas. La clave es
+    hash(nombre, hash de cada archivo y módulo, código fuente de la función de la etapa y de
+         sus auxiliares, hash de la configuración, claves de las etapas previas)
+(editar la función de una etapa, p.ej. build_costs, invalida esa etapa y las posteriores sin
+tocar el resto; un módulo completo en `codigo` invalida ante cualquier cambio del archivo)
+y se calcula SIN ejecutar nada: si la clave de una etapa está en disco, ni ella ni sus
+etapas previas se recalculan (ni se leen). Un cambio de DISCOUNT_R sólo invalida las
+etapas que lo declaran (y las posteriores).
+Almacén (resultados/cache_etapas/<etapa>/<clave>/):
+  - cada parte del resultado por tipo: ndarray -> .npy, DataFrame -> .parquet (pyarrow),
+    matriz dispersa -> .npz, el resto -> .pkl
+  - meta.json con bytes y partes; su mtime marca el último uso (LRU)
+  - tras cada escritura se eliminan las entradas menos usadas hasta quedar bajo limite_mb
+Los hashes de archivo se memorizan por (ruta, tamaño, mtime) en hashes.json.
+Uso:
+    g = GrafoEtapas(AlmacenArtefactos())
+    g.etapa("demanda", lambda: ..., archivos=[DEMANDA_BASE])
+    g.etapa("lp", lambda dem: ..., deps=["demanda"], config={"r": DISCOUNT_R})
+    lp = g.valor("lp")
+"""
+from __future__ import annotations
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from perfiles_generacion import hash_archivo
+
+try:
+    import pyarrow  # noqa: F401  (to_parquet / read_parquet)
+    HAY_ARROW = True
+except ImportError:
+    HAY_ARROW = False
+
+RUTA_BASE = Path(__file__).parent.parent.parent
+RUTA_CACHE = RUTA_BASE / "resultados" / "cache_etapas"
+VERSION = 1                 # subir si cambia el formato del almacén
+
+
+def hash_valor(v) -> str:
+    """Hash estable de configuración: escalares, rutas, listas/dicts anidados y arreglos numpy."""
+    h = hashlib.blake2b(digest_size=16)
+
+    def _agrega(x):
+        if isinstance(x, np.ndarray):
+            h.update(f"nd{x.dtype.str}{x.shape}".encode())
+            h.update(np.ascontiguousarray(x).tobytes())
+        elif isinstance(x, dict):
+            h.update(b"{")
+            for k in sorted(x, key=repr):
+                _agrega(k)
+                _agrega(x[k])
+            h.update(b"}")
+        elif isinstance(x, (list, tuple)):
+            h.update(b"[" if isinstance(x, list) else b"(")
+            for e in x:
+                _agrega(e)
+            h.update(b"]")
+        else:
+            h.update(f"{type(x).__name__}:{x!r};".encode())
+
+    _agrega(v)
+    return h.hexdigest()
+
+
+# ===== Almacén en disco =====
+class AlmacenArtefactos:
+    def __init__(self, ruta: Path = RUTA_CACHE, limite_mb: Optional[float] = 2048.0):
+        self.ruta = Path(ruta)
+        self.limite_mb = limite_mb
+        self._f_hashes = self.ruta / "hashes.json"
+        self._hashes: Optional[Dict[str, dict]] = None
+
+    # --- hashes de archivos (memorizados por tamaño y mtime) ---
+    def hash_archivo(self, path: Path) -> str:
+        path = Path(path).resolve()
+        if self._hashes is None:
+            self._hashes = json.loads(self._f_hashes.read_text()) if self._f_hashes.exists() else {}
+        st = path.stat()
+        e = self._hashes.get(str(path))
+        if e is None or e["bytes"] != st.st_size or e["mtime_ns"] != st.st_mtime_ns:
+            e = {"bytes": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": hash_archivo(path)}
+            self._hashes[str(path)] = e
+            self.ruta.mkdir(parents=True, exist_ok=True)
+            self._f_hashes.write_text(json.dumps(self._hashes))
+        return e["hash"]
+
+    def _dir(self, etapa: str, clave: str) -> Path:
+        return self.ruta / etapa / clave
+
+    def contiene(self, etapa: str, clave: str) -> bool:
+        return (self._dir(etapa, clave) / "meta.json").exists()
+
+    # --- lectura / escritura ---
+    def lee(self, etapa: str, clave: str):
+        d = self._dir(etapa, clave)
+        meta = json.loads((d / "meta.json").read_text())
+        partes = [_lee_parte(d / p) for p in meta["partes"]]
+        os.utime(d / "meta.json")                      # último uso (LRU)
+        return tuple(partes) if meta["tupla"] else partes[0]
+
+    def guarda(self, etapa: str, clave: str, valor) -> Path:
+        d = self._dir(etapa, clave)
+        tmp = d.with_name(f".{clave}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        tupla = isinstance(valor, tuple) and type(valor) is tuple
+        partes = [_escribe_parte(x, tmp / f"parte_{i}") for i, x in enumerate(valor if tupla else (valor,))]
+        n_bytes = sum(f.stat().st_size for f in tmp.iterdir())
+        (tmp / "meta.json").write_text(json.dumps({"etapa": etapa, "clave": clave, "tupla": tupla,
+                                                   "partes": partes, "bytes": n_bytes,
+                                                   "creado": time.strftime("%Y-%m-%dT%H:%M:%S")}))
+        shutil.rmtree(d, ignore_errors=True)
+        os.replace(tmp, d)
+        self.poda(conserva=d)
+        return d
+
+    # --- tamaño y desalojo LRU ---
+    def entradas(self) -> pd.DataFrame:
+        filas = []
+        for m in self.ruta.glob("*/*/meta.json"):
+            meta = json.loads(m.read_text())
+            filas.append({"etapa": meta["etapa"], "clave": meta["clave"], "bytes": meta["bytes"],
+                          "ultimo_uso": m.stat().st_mtime, "ruta": m.parent})
+        cols = ["etapa", "clave", "bytes", "ultimo_uso", "ruta"]
+        return pd.DataFrame(filas, columns=cols).sort_values("ultimo_uso", kind="stable").reset_index(drop=True)
+
+    def poda(self, limite_mb: Optional[float] = None, conserva: Optional[Path] = None) -> int:
+        """Elimina las entradas menos usadas hasta que el total quede bajo el límite; devuelve cuántas."""
+        limite_mb = self.limite_mb if limite_mb is None else limite_mb
+        if limite_mb is None:
+            return 0
+        ent = self.entradas()
+        total, limite, n = int(ent["bytes"].sum()), limite_mb * 2**20, 0
+        for _, e in ent.iterrows():
+            if total <= limite:
+                break
+            if conserva is not None and Path(e["ruta"]) == Path(conserva):
+                continue
+            shutil.rmtree(e["ruta"], ignore_errors=True)
+            total -= int(e["bytes"])
+            n += 1
+        return n
+
+    def limpia(self):
+        shutil.rmtree(self.ruta, ignore_errors=True)
+        self._hashes = None
+
+
+def _escribe_parte(x, base: Path) -> str:
+    if isinstance(x, np.ndarray) and x.dtype != object:
+        f = base.with_suffix(".npy")
+        np.save(f, x)
+    elif isinstance(x, pd.DataFrame) and HAY_ARROW:
+        f = base.with_suffix(".parquet")
+        x.to_parquet(f)
+    elif sparse.issparse(x):
+        f = base.with_suffix(".npz")
+        sparse.save_npz(f, x.tocsr())
+    else:
+        f = base.with_suffix(".pkl")
+        with open(f, "wb") as fh:
+            pickle.dump(x, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    return f.name
+
+
+def _lee_parte(f: Path):
+    if f.suffix == ".npy":
+        return np.load(f)
+    if f.suffix == ".parquet":
+        return pd.read_parquet(f)
+    if f.suffix == ".npz":
+        return sparse.load_npz(f).tocsr()
+    with open(f, "rb") as fh:
+        return pickle.load(fh)
+
+
+def _fuente(f: Callable) -> str:
+    """Código fuente de la función (una lambda trae la sentencia que la contiene)."""
+    try:
+        return inspect.getsource(f)
+    except (OSError, TypeError):
+        return f"{getattr(f, '__module__', '')}.{getattr(f, '__qualname__', repr(f))}"
+
+
+# ===== Grafo de etapas =====
+@dataclass
+class Etapa:
+    nombre: str
+    funcion: Callable                      # recibe los valores de deps en orden
+    archivos: Sequence[Path] = ()
+    config: Dict[str, object] = field(default_factory=dict)
+    deps: Sequence[str] = ()
+    codigo: Sequence[Path] = ()            # módulos cuya modificación invalida la etapa
+    fuentes: Sequence[Callable] = ()       # funciones auxiliares cuyo código fuente entra en la clave
+    persiste: bool = True                  # False: sólo en memoria (p.ej. ensamblar objetos ya cacheados)
+
+
+class GrafoEtapas:
+    def __init__(self, almacen: Optional[AlmacenArtefactos] = None):
+        self.almacen = almacen or AlmacenArtefactos()
+        self.etapas: Dict[str, Etapa] = {}
+        self._claves: Dict[str, str] = {}
+        self._valores: Dict[str, object] = {}
+        self.registro: List[dict] = []     # (etapa, "memoria" | "cache" | "calculo", segundos)
+
+    def etapa(self, nombre: str, funcion: Callable, archivos: Sequence[Path] = (), config=None,
+              deps: Sequence[str] = (), codigo: Sequence[Path] = (), fuentes: Sequence[Callable] = (),
+              persiste: bool = True) -> "GrafoEtapas":
+        faltan = [d for d in deps if d not in self.etapas]
+        if faltan:
+            raise ValueError(f"GrafoEtapas: la etapa '{nombre}' depende de etapas no declaradas {faltan}.")
+        self.etapas[nombre] = Etapa(nombre, funcion, tuple(archivos), dict(config or {}), tuple(deps),
+                                    tuple(codigo), tuple(fuentes), persiste)
+        self._claves.pop(nombre, None)
+        self._valores.pop(nombre, None)
+        return self
+
+    def clave(self, nombre: str) -> str:
+        if nombre not in self._claves:
+            e = self.etapas[nombre]
+            hashes = lambda rutas: [self.almacen.hash_archivo(p) if Path(p).exists() else f"sin:{Path(p).name}"
+                                    for p in rutas]
+            self._claves[nombre] = hash_valor({
+                "version": VERSION, "etapa": nombre, "archivos": hashes(e.archivos),
+                "codigo": hashes(e.codigo), "fuente": [_fuente(f) for f in (e.funcion, *e.fuentes)],
+                "config": e.config,
+                "deps": [self.clave(d) for d in e.deps],
+            })
+        return self._claves[nombre]
+
+    def valor(self, nombre: str):
+        """Valor de la etapa: memoria, caché en disco o cálculo (y persistencia)."""
+        if nombre in self._valores:
+            self.registro.append({"etapa": nombre, "origen": "memoria", "s": 0.0})
+            return self._valores[nombre]
+        e, clave = self.etapas[nombre], self.clave(nombre)
+        t0 = time.perf_counter()
+        if e.persiste and self.almacen.contiene(nombre, clave):
+            v, origen = self.almacen.lee(nombre, clave), "cache"
+        else:
+            v, origen = e.funcion(*[self.valor(d) for d in e.deps]), "calculo"
+            if e.persiste:
+                self.almacen.guarda(nombre, clave, v)
+        self.registro.append({"etapa": nombre, "origen": origen, "s": round(time.perf_counter() - t0, 6)})
+        self._valores[nombre] = v
+        return v
+
+    def invalida(self, nombre: str):
+        """Olvida la clave y el valor en memoria de la etapa y de las que dependen de ella."""
+        self._claves.pop(nombre, None)
+        self._valores.pop(nombre, None)
+        for e in self.etapas.values():
+            if nombre in e.deps:
+                self.invalida(e.nombre)
+
+    def resumen(self) -> str:
+        return " | ".join(f"{r['etapa']}:{r['origen']}" for r in self.registro if r["origen"] != "memoria")
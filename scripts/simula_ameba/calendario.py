@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Calendario compacto hora -> (stage, block)
+-------------------------------------------
+Se construye una sola vez desde stages.csv / blocks.csv:
+  - bloques densos: id 0..n-1 en el orden de TY (stage ascendente, block ascendente)
+  - stage[id], block[id], alpha[id] (horas por bloque)
+  - tiempo[h] (horas del calendario ordenadas) e idx[h] -> id de bloque
+Cualquier serie horaria (demanda, inflows, perfiles, precios) se agrega a bloques
+con un único np.bincount sobre idx (suma segmentada), sin merges ni groupby.
+Los retardos de la red hidro se traducen a una matriz de transferencia bloque -> bloque
+(transferencia), también desde las horas del calendario.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+@dataclass
+class Calendario:
+    Y_list: List[int]
+    T_by_Y: Dict[int, List[int]]
+    stage: np.ndarray    # int32 (n_bloques,)
+    block: np.ndarray    # int32 (n_bloques,)
+    alpha: np.ndarray    # float64 (n_bloques,) horas por bloque
+    tiempo: np.ndarray   # datetime64[ns] (n_horas,) ordenado
+    idx: np.ndarray      # int32 (n_horas,) hora -> id de bloque
+
+    @classmethod
+    def desde_tablas(cls, stages: pd.DataFrame, blocks: pd.DataFrame) -> "Calendario":
+        """stages/blocks tipados (ver lector_caso.lee_calendario)."""
+        s_id = np.sort(stages["s_id"].to_numpy(dtype=np.int64))
+        nb = dict(zip(stages["s_id"].astype(int), stages["num_blocks"].astype(int)))
+        h_stage = blocks["stage"].to_numpy(dtype=np.int64)
+        h_block = blocks["block"].to_numpy(dtype=np.int64)
+        h_time = np.asarray(blocks["time"].to_numpy(), dtype="datetime64[ns]")
+
+        # TY: bloques presentes en blocks.csv; si un stage no tiene horas, 1..num_blocks
+        base = int(max(h_block.max(initial=0), max(nb.values(), default=0))) + 1
+        codigos = np.unique(h_stage * base + h_block)
+        presentes = set(np.unique(h_stage).tolist())
+        extra = [y * base + t for y in s_id.tolist() if y not in presentes
+                 for t in range(1, nb[y] + 1)]
+        if extra:
+            codigos = np.union1d(codigos, np.asarray(extra, dtype=np.int64))
+        codigos = codigos[np.isin(codigos // base, s_id)]
+
+        stage = (codigos // base).astype(np.int32)
+        block = (codigos % base).astype(np.int32)
+
+        # horas ordenadas y su id de bloque
+        orden = np.argsort(h_time, kind="stable")
+        tiempo = h_time[orden]
+        cod_h = (h_stage * base + h_block)[orden]
+        pos = np.searchsorted(codigos, cod_h)
+        pos = np.minimum(pos, len(codigos) - 1)
+        en_cal = codigos[pos] == cod_h
+        tiempo, idx = tiempo[en_cal], pos[en_cal].astype(np.int32)
+
+        alpha = np.bincount(idx, minlength=len(codigos)).astype(np.float64)
+
+        Y_list = [int(y) for y in s_id]
+        T_by_Y: Dict[int, List[int]] = {y: [] for y in Y_list}
+        for y, t in zip(stage.tolist(), block.tolist()):
+            T_by_Y[y].append(t)
+        return cls(Y_list=Y_list, T_by_Y=T_by_Y, stage=stage, block=block,
+                   alpha=alpha, tiempo=tiempo, idx=idx)
+
+    # ---- tamaños / índices ----
+    @property
+    def n_bloques(self) -> int:
+        return int(self.stage.shape[0])
+
+    @property
+    def n_horas(self) -> int:
+        return int(self.tiempo.shape[0])
+
+    @property
+    def TY(self) -> List[Tuple[int, int]]:
+        return list(zip(self.stage.tolist(), self.block.tolist()))
+
+    def posicion_horas(self, times) -> np.ndarray:
+        """Posición de cada timestamp en self.tiempo (-1 si la hora no está en el calendario)."""
+        t = np.asarray(times, dtype="datetime64[ns]")
+        if self.n_horas == 0:
+            return np.full(t.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.tiempo, t), self.n_horas - 1)
+        return np.where(self.tiempo[pos] == t, pos, -1)
+
+    def bloque_de(self, times) -> np.ndarray:
+        """Id de bloque de cada timestamp (-1 si la hora no está en el calendario)."""
+        pos = self.posicion_horas(times)
+        return np.where(pos >= 0, self.idx[np.maximum(pos, 0)], -1)
+
+    # ---- agregación ----
+    def agrega(self, times, valores, grupo: Optional[np.ndarray] = None,
+               n_grupos: Optional[int] = None) -> np.ndarray:
+        """
+        Suma a bloques una serie horaria con un único bincount.
+          - valores (n,)  -> (n_bloques,)
+          - valores (n,k) -> (k, n_bloques)   (serie ancha: una columna por entidad)
+          - grupo (n,) con códigos 0..n_grupos-1 (serie larga) -> (n_grupos, n_bloques);
+            códigos negativos se descartan
+        Horas fuera del calendario y valores NaN no suman (igual que merge + groupby.sum).
+        """
+        b = self.bloque_de(times)
+        v = np.asarray(valores, dtype=np.float64)
+        nb = self.n_bloques
+
+        if v.ndim == 2:
+            k = v.shape[1]
+            ok = b >= 0
+            ids = (np.arange(k)[None, :] * nb + b[ok, None]).ravel()
+            w = np.nan_to_num(v[ok]).ravel()
+            return np.bincount(ids, weights=w, minlength=k * nb).reshape(k, nb)
+
+        if grupo is not None:
+            g = np.asarray(grupo, dtype=np.int64)
+            n_grupos = int(n_grupos if n_grupos is not None else g.max(initial=-1) + 1)
+            ok = (b >= 0) & (g >= 0)
+            ids = g[ok] * nb + b[ok]
+            return np.bincount(ids, weights=np.nan_to_num(v[ok]),
+                               minlength=n_grupos * nb).reshape(n_grupos, nb)
+
+        ok = b >= 0
+        return np.bincount(b[ok], weights=np.nan_to_num(v[ok]), minlength=nb)
+
+    def promedia(self, times, valores) -> np.ndarray:
+        """Promedio por bloque (p.ej. factores de planta o precios): suma / horas del bloque."""
+        tot = self.agrega(times, valores)
+        return np.divide(tot, self.alpha, out=np.zeros_like(tot), where=self.alpha > 0)
+
+    def promedia_escalonada(self, times, valores) -> np.ndarray:
+        """
+        Promedio por bloque de una serie escalonada (precios mensuales, factores anuales...):
+        cada hora del calendario toma el último valor con timestamp <= hora.
+        valores (n,) -> (n_bloques,); (n,k) -> (k, n_bloques).
+        """
+        t = np.asarray(times, dtype="datetime64[ns]")
+        orden = np.argsort(t, kind="stable")
+        t = t[orden]
+        v = np.asarray(valores, dtype=np.float64)[orden]
+        pos = np.searchsorted(t, self.tiempo, side="right") - 1
+        ok = pos >= 0                          # horas previas al primer dato no suman
+        horas = np.bincount(self.idx[ok], minlength=self.n_bloques).astype(np.float64)
+        if v.ndim == 2:
+            k = v.shape[1]
+            ids = (np.arange(k)[None, :] * self.n_bloques + self.idx[ok, None]).ravel()
+            tot = np.bincount(ids, weights=np.nan_to_num(v[pos[ok]]).ravel(),
+                              minlength=k * self.n_bloques).reshape(k, self.n_bloques)
+        else:
+            tot = np.bincount(self.idx[ok], weights=np.nan_to_num(v[pos[ok]]), minlength=self.n_bloques)
+        return np.divide(tot, horas, out=np.zeros_like(tot), where=horas > 0)
+
+    def transferencia(self, retardo_h: float, tol: float = 0.0) -> sparse.csr_matrix:
+        """
+        Matriz (n_bloques x n_bloques) T[b_destino, b_origen]: fracción del volumen de un bloque
+        de origen (repartido uniforme en sus horas) que llega a cada bloque tras retardo_h horas.
+          - retardo fraccionario: cada hora reparte entre floor(retardo) y floor(retardo) + 1
+          - lo que llega a horas fuera del calendario (fin del horizonte) se pierde
+          - tol > 0 poda las entradas menores que tol * (masa de la columna) y reescala la
+            columna para conservar su masa (acota los no-ceros por columna a ~1/tol)
+        """
+        nb = self.n_bloques
+        if retardo_h < 0:
+            raise ValueError(f"transferencia: retardo negativo ({retardo_h}).")
+        base = int(np.floor(retardo_h))
+        frac = float(retardo_h - base)
+        w_h = 1.0 / np.maximum(self.alpha[self.idx], 1.0)          # peso de cada hora en su bloque
+        I, J, V = [], [], []
+        for k, peso in ((base, 1.0 - frac), (base + 1, frac)):
+            if peso <= 0.0:
+                continue
+            dst = self.bloque_de(self.tiempo + np.timedelta64(k, "h"))
+            ok = dst >= 0
+            I.append(dst[ok])
+            J.append(self.idx[ok])
+            V.append(w_h[ok] * peso)
+        T = sparse.coo_matrix((np.concatenate(V), (np.concatenate(I), np.concatenate(J))),
+                              shape=(nb, nb)).tocsc()
+        T.sum_duplicates()
+        if tol > 0.0 and T.nnz:
+            masa = np.asarray(T.sum(axis=0)).ravel()
+            col = np.repeat(np.arange(nb), np.diff(T.indptr))
+            T.data[T.data < tol * masa[col]] = 0.0
+            T.eliminate_zeros()
+            queda = np.asarray(T.sum(axis=0)).ravel()
+            esc = np.divide(masa, queda, out=np.zeros(nb), where=queda > 0)
+            T = T @ sparse.diags(esc)
+        return sparse.csr_matrix(T)
+
+    def a_dict(self, arr: np.ndarray, claves: Optional[List] = None) -> Dict[tuple, float]:
+        """(n_bloques,) -> {(y,t): v}; (k, n_bloques) + claves -> {(clave,y,t): v}."""
+        TY = self.TY
+        a = np.asarray(arr, dtype=np.float64)
+        if a.ndim == 1:
+            return dict(zip(TY, a.tolist()))
+        keys = [(c, y, t) for c in claves for (y, t) in TY]
+        return dict(zip(keys, a.ravel().tolist()))
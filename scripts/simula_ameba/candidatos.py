@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Catálogo de proyectos candidatos (inversión) con poda por dominancia
+--------------------------------------------------------------------
+1) carga_candidatos: unidades candidatas (candidate = True) de ThermalGenerator /
+   PvGenerator / WindGenerator con su costo de inversión por año desde gen_inv_cost.csv
+   (serie ancha anual, una columna por proyecto; si el proyecto no tiene columna se usa
+   gen_inv_cost de la tabla). Índice disperso (candidato, stage) sólo donde el proyecto está
+   disponible: start_time <= inicio del stage < end_time y con costo definido.
+   Costos ($/MW): cinv = gen_inv_cost * 1000 (overnight, como build_costs),
+   anual = cinv * FRC(r, lifetime) + fom_cost * 1000 (sólo informativo / orden de revisión),
+   cvar = vomc (o el de costos_combustible) en todos los stages (la capacidad opera hasta el final).
+2) poda_dominados: dentro de cada (barra, perfil), B se descarta si los candidatos ya
+   conservados que lo dominan suman al menos cap_util MW. A domina a B con los mismos términos
+   que cobra el LP: disponible en todos los stages de B con cinv <= en cada uno (se paga una vez,
+   al invertir), fom <= (cfix en cada stage siguiente), cvar <= en todos los stages desde el
+   primero de B y disponibilidad (af por bloque) >= en todos los bloques (empates: domina el
+   primero). Así, cambiar B por A en cualquier plan no sube el costo; con cap_util >= la
+   capacidad útil de la barra, B nunca sería elegido y la poda no cambia el óptimo.
+   capacidad_util_barras: punta de demanda de la barra + capacidad de exportación de sus líneas
+   (tope: punta del sistema). Es exacta para el LP con red (RED_DC); en el LP uninodal la red no
+   limita y la poda puede descartar un proyecto que sólo ese LP (sin evacuación) elegiría.
+   Los candidatos sin ningún stage disponible en el horizonte se descartan siempre.
+3) incorpora_candidatos / acota_candidatos: los candidatos que quedan entran como tecnologías
+   del LP (K0 = 0, knew = pmax sólo en sus stages) y K <= pmax (un proyecto se construye una vez).
+   Limitación: las familias x/K/p son densas (techs x stages / bloques), así que cada candidato
+   tiene columnas en todo el horizonte. acota_candidatos fija en 0 las que caen fuera de su
+   ventana (x fuera de sus stages; K y p antes del primero) y les quita los coeficientes
+   (quita_coef_fijas): no ocupan la matriz y HiGHS las elimina en el presolve, pero siguen
+   existiendo en c / cotas. El LP de Pyomo sólo recibe K <= pmax.
+Ejecutar:
+    python candidatos.py
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Mapping, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from backend_matricial import quita_coef_fijas
+from lector_caso import lee_serie_ancha, lee_tabla
+
+RUTA_BASE = Path(__file__).parent.parent.parent
+RUTA_COSTOS_INV = RUTA_BASE / "data" / "costos_inv" / "gen_inv_cost.csv"
+
+CLASES = {"ThermalGenerator": "termica", "PvGenerator": "solar", "WindGenerator": "eolica"}
+_COLUMNAS = ["name", "candidate", "busbar", "pmax", "gen_inv_cost", "fom_cost", "lifetime",
+             "forced_outage_rate", "vomc_avg", "start_time", "end_time"]
+
+
+def frc(r: float, n) -> np.ndarray:
+    """Factor de recuperación de capital r(1+r)^n / ((1+r)^n - 1) (1/n si r = 0)."""
+    n = np.maximum(np.asarray(n, dtype=np.float64), 1.0)
+    if r == 0:
+        return 1.0 / n
+    return r * (1 + r) ** n / ((1 + r) ** n - 1)
+
+
+@dataclass
+class CatalogoCandidatos:
+    tabla: pd.DataFrame            # un registro por candidato (índice = nombre): clase, barra, perfil, pmax, disp...
+    Y_list: List[int]
+    i_cand: np.ndarray             # int (nnz,) candidato de cada par disponible
+    i_stage: np.ndarray            # int (nnz,) índice en Y_list
+    cinv: np.ndarray               # (nnz,) $/MW overnight
+    anual: np.ndarray              # (nnz,) $/MW-año (inversión anualizada + fom)
+    cvar: np.ndarray               # (n, n_stages) $/MWh (todos los stages)
+    descartados: pd.DataFrame      # índice = nombre, columna 'motivo'
+
+    @property
+    def n(self) -> int:
+        return len(self.tabla)
+
+    def densa(self, valores: np.ndarray, relleno=np.nan) -> np.ndarray:
+        """(nnz,) -> (n, n_stages) con relleno en los stages no disponibles."""
+        out = np.full((self.n, len(self.Y_list)), relleno, dtype=np.float64)
+        out[self.i_cand, self.i_stage] = valores
+        return out
+
+    @property
+    def disponible(self) -> np.ndarray:
+        return self.densa(np.ones(len(self.i_cand)), 0.0) > 0
+
+    def subconjunto(self, conserva: np.ndarray, descartados: pd.DataFrame) -> "CatalogoCandidatos":
+        conserva = np.asarray(conserva, dtype=bool)
+        nuevo = np.cumsum(conserva) - 1
+        k = conserva[self.i_cand]
+        return CatalogoCandidatos(
+            tabla=self.tabla[conserva], Y_list=self.Y_list, i_cand=nuevo[self.i_cand[k]], i_stage=self.i_stage[k],
+            cinv=self.cinv[k], anual=self.anual[k], cvar=self.cvar[conserva],
+            descartados=pd.concat([self.descartados, descartados]),
+        )
+
+
+def carga_candidatos(rutas: Dict[str, Path], inicio_stages: Sequence, Y_list: Sequence[int],
+                     ruta_costos: Path = RUTA_COSTOS_INV, r: float = 0.08,
+                     cvar_stage: Optional[Dict[str, np.ndarray]] = None,
+                     escenario: Optional[str] = None) -> CatalogoCandidatos:
+    """
+    rutas: {"ThermalGenerator": ruta, "PvGenerator": ruta, "WindGenerator": ruta} (las ausentes se omiten).
+    inicio_stages: inicio (datetime) de cada stage de Y_list. cvar_stage: {nombre: (n_stages,)}
+    (p.ej. costos_combustible para térmicas); sin él, vomc_avg.
+    """
+    partes = []
+    for tabla, ruta in rutas.items():
+        if ruta is None or not Path(ruta).exists():
+            continue
+        df = lee_tabla(ruta, tabla, columnas=_COLUMNAS + (["zone"] if tabla != "ThermalGenerator" else []))
+        df = df[df["candidate"].fillna(False) & (df["pmax"].fillna(0.0) > 0)]
+        partes.append(pd.DataFrame({
+            "clase": CLASES[tabla], "barra": df["busbar"].astype(str).to_numpy(),
+            "perfil": df["zone"].fillna("").astype(str).to_numpy() if "zone" in df else "",
+            "pmax": df["pmax"].to_numpy(np.float64),
+            "disp": 1.0 - df["forced_outage_rate"].fillna(0.0).to_numpy(np.float64),
+            "inv_tabla": df["gen_inv_cost"].to_numpy(np.float64),
+            "fom": df["fom_cost"].fillna(0.0).to_numpy(np.float64),
+            "lifetime": df["lifetime"].fillna(25.0).to_numpy(np.float64),
+            "vomc": df["vomc_avg"].fillna(0.0).to_numpy(np.float64),
+            "start_time": df["start_time"].to_numpy(), "end_time": df["end_time"].to_numpy(),
+        }, index=pd.Index(df["name"].astype(str), name="candidato")))
+    tab = pd.concat(partes) if partes else pd.DataFrame()
+    tab = tab[~tab.index.duplicated()]
+    n, nY = len(tab), len(Y_list)
+
+    # costo de inversión por stage: serie anual (escalón) o el valor de la tabla
+    t = np.asarray(pd.to_datetime(pd.Series(inicio_stages)).to_numpy(), dtype="datetime64[ns]")
+    inv = np.repeat(tab["inv_tabla"].to_numpy()[:, None], nY, axis=1)
+    if ruta_costos is not None and Path(ruta_costos).exists():
+        serie = lee_serie_ancha(ruta_costos, escenario=escenario).sort_values("time", kind="stable")
+        cols = [c for c in tab.index if c in serie.columns]
+        if cols:
+            ts = serie["time"].to_numpy("datetime64[ns]")
+            fila = np.clip(np.searchsorted(ts, t, side="right") - 1, 0, len(ts) - 1)
+            pos = tab.index.get_indexer(cols)
+            inv[pos] = serie[cols].to_numpy(np.float64)[fila].T
+
+    ini = tab["start_time"].to_numpy("datetime64[ns]")
+    fin = tab["end_time"].to_numpy("datetime64[ns]")
+    disp = (ini[:, None] <= t[None, :]) & (t[None, :] < fin[:, None]) & np.isfinite(inv)
+    i_cand, i_stage = np.nonzero(disp)
+    cinv = inv[i_cand, i_stage] * 1000.0
+    fom = tab["fom"].to_numpy()[i_cand] * 1000.0
+    anual = cinv * frc(r, tab["lifetime"].to_numpy()[i_cand]) + fom
+    cv = np.repeat(tab["vomc"].to_numpy()[:, None], nY, axis=1)
+    for nombre, v in (cvar_stage or {}).items():
+        k = tab.index.get_indexer([nombre])[0]
+        if k >= 0:
+            cv[k] = v
+    cat = CatalogoCandidatos(tabla=tab.drop(columns=["inv_tabla"]), Y_list=list(Y_list),
+                             i_cand=i_cand.astype(np.int64), i_stage=i_stage.astype(np.int64),
+                             cinv=cinv, anual=anual, cvar=cv,
+                             descartados=pd.DataFrame({"motivo": pd.Series(dtype=str)}))
+    sin = ~disp.any(axis=1)
+    return cat.subconjunto(~sin, pd.DataFrame({"motivo": "sin stages disponibles"}, index=tab.index[sin]))
+
+
+def af_candidatos(cat: CatalogoCandidatos, n_bloques: int, perfiles=None,
+                  af_clase: Optional[Dict[str, np.ndarray]] = None) -> np.ndarray:
+    """(n, n_bloques) disponibilidad: disp * perfil (Profile_* propio, si no el de la clase, si no 1)."""
+    af = np.repeat(cat.tabla["disp"].to_numpy()[:, None], n_bloques, axis=1)
+    for k, (clase, perfil) in enumerate(zip(cat.tabla["clase"], cat.tabla["perfil"])):
+        propio = perfiles.fila(perfil) if perfiles is not None and perfil else None
+        if propio is not None:
+            af[k] *= np.clip(np.asarray(propio, dtype=np.float64), 0.0, 1.0)
+        elif af_clase is not None and clase in af_clase:
+            af[k] *= af_clase[clase]
+    return af
+
+
+def capacidad_util_barras(barras: Sequence[str], desde: np.ndarray, hasta: np.ndarray, fmax: np.ndarray,
+                          fmax_rev: np.ndarray, D_barra: np.ndarray, alpha: np.ndarray) -> pd.Series:
+    """
+    MW que una barra puede aprovechar: su demanda punta (D_barra (barras, bloques) MWh / alpha) más
+    lo que sus líneas pueden sacar (fmax en las que parten de ella, fmax_rev en las que llegan),
+    con tope en la punta del sistema.
+    """
+    a = np.asarray(alpha, dtype=np.float64)
+    mw = np.divide(D_barra, a[None, :], out=np.zeros_like(D_barra, dtype=np.float64), where=a[None, :] > 0)
+    sale = np.bincount(desde, weights=fmax, minlength=len(barras)) \
+        + np.bincount(hasta, weights=fmax_rev, minlength=len(barras))
+    return pd.Series(np.minimum(mw.max(axis=1) + sale, mw.sum(axis=0).max()), index=list(barras))
+
+
+def poda_dominados(cat: CatalogoCandidatos, af: np.ndarray,
+                   cap_util: Union[float, Mapping[str, float], pd.Series] = np.inf,
+                   tol: float = 1e-9) -> CatalogoCandidatos:
+    """
+    Descarta candidatos dominados (ver encabezado). cap_util en MW: uno para todas las barras o
+    {barra: MW} (capacidad_util_barras; las barras que falten no se podan).
+    """
+    disp = cat.disponible
+    anual = cat.densa(cat.anual, np.inf)
+    cinv = cat.densa(cat.cinv, np.inf)
+    fom = cat.tabla["fom"].to_numpy(np.float64)
+    cvar = cat.cvar
+    # stages en que pesa el cvar de cada candidato: desde su primer stage disponible
+    opera = np.cumsum(disp, axis=1) > 0
+    # orden de mérito aproximado: primero los baratos (sólo define el orden de revisión)
+    merito = np.nanmean(np.where(disp, anual, np.nan), axis=1) \
+        + 8760.0 * np.nanmean(np.where(disp, cvar, np.nan), axis=1) * af.mean(axis=1)
+    conserva = np.ones(cat.n, dtype=bool)
+    motivo: Dict[str, str] = {}
+    nombres = cat.tabla.index.to_numpy()
+    pmax = cat.tabla["pmax"].to_numpy()
+    for (barra, _), idx in cat.tabla.groupby(["barra", "perfil"], sort=False).indices.items():
+        if len(idx) < 2:
+            continue
+        cap = cap_util.get(barra, np.inf) if isinstance(cap_util, (Mapping, pd.Series)) else cap_util
+        idx = idx[np.lexsort((idx, merito[idx]))]
+        # D[a, b]: a domina a b (inversión en los stages de b, operación desde el primero)
+        sb, ob = disp[idx][None, :, :], opera[idx][None, :, :]
+        D = np.all(~sb | disp[idx][:, None, :], axis=2)
+        D &= np.all(~sb | (cinv[idx][:, None, :] <= cinv[idx][None, :, :] + tol), axis=2)
+        D &= fom[idx][:, None] <= fom[idx][None, :] + tol
+        D &= np.all(~ob | (cvar[idx][:, None, :] <= cvar[idx][None, :, :] + tol), axis=2)
+        D &= np.all(af[idx][:, None, :] >= af[idx][None, :, :] - tol, axis=2)
+        np.fill_diagonal(D, False)
+        for jb in range(len(idx)):
+            dom = [ja for ja in range(jb) if D[ja, jb] and conserva[idx[ja]]]
+            if dom and pmax[idx[dom]].sum() >= cap:
+                conserva[idx[jb]] = False
+                motivo[nombres[idx[jb]]] = "dominado por " + ", ".join(nombres[idx[dom]])
+    desc = pd.DataFrame({"motivo": pd.Series(motivo, dtype=str)})
+    return cat.subconjunto(conserva, desc)
+
+
+# ===== Integración al LP =====
+def incorpora_candidatos(cat: CatalogoCandidatos, af: np.ndarray, techs: List[str], Y_list: List[int],
+                         T_by_Y: Dict[int, List[int]], alpha, AF, K0, cinv, cfix, cvar, knew):
+    """
+    Agrega los candidatos como tecnologías: K0 = 0, knew = pmax en sus stages (0 fuera),
+    cfix = fom * 1000 * horas del stage / 8760. af: (n, n_bloques) en orden TY.
+    Devuelve techs, AF, K0, cinv, cfix, cvar, knew extendidos.
+    """
+    if list(Y_list) != list(cat.Y_list):
+        raise ValueError("incorpora_candidatos: el catálogo se armó para otros stages.")
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    iy = np.repeat(np.arange(len(Y_list)), [len(T_by_Y[y]) for y in Y_list])
+    horas = np.bincount(iy, weights=np.fromiter((alpha[k] for k in TY), dtype=np.float64, count=len(TY)))
+    AF, K0 = dict(AF), dict(K0)
+    cinv, cfix, cvar, knew = dict(cinv), dict(cfix), dict(cvar), dict(knew)
+    c_inv, c_var = cat.densa(cat.cinv, 0.0), cat.cvar
+    disp = cat.disponible
+    fom = cat.tabla["fom"].to_numpy() * 1000.0
+    for k, (nombre, pmax) in enumerate(zip(cat.tabla.index, cat.tabla["pmax"])):
+        AF[nombre] = dict(zip(TY, np.clip(af[k], 0.0, 1.0).tolist()))
+        K0[nombre] = 0.0
+        for j, y in enumerate(Y_list):
+            cinv[(nombre, y)] = float(c_inv[k, j])
+            cfix[(nombre, y)] = float(fom[k] * horas[j] / 8760.0)
+            cvar[(nombre, y)] = float(c_var[k, j])
+            knew[(nombre, y)] = float(pmax) if disp[k, j] else 0.0
+    return list(techs) + cat.tabla.index.tolist(), AF, K0, cinv, cfix, cvar, knew
+
+
+def acota_candidatos(lp, cat: CatalogoCandidatos):
+    """
+    K <= pmax de cada candidato en todos los stages y columnas fuera de su ventana fijas en 0 y
+    sin coeficientes: x fuera de sus stages, K y p antes del primero (las cotas del LP recibido
+    se modifican; devuelve la copia sin esos coeficientes).
+    """
+    pos = {g: i for i, g in enumerate(lp.techs)}
+    i = np.array([pos[g] for g in cat.tabla.index], dtype=np.int64)
+    disp = cat.disponible
+    vivo = np.cumsum(disp, axis=1) > 0                       # desde el primer stage disponible
+    x, K, p = lp.cols("x")[i], lp.cols("K")[i], lp.cols("p")[i]
+    lp.col_up[K] = np.minimum(lp.col_up[K], cat.tabla["pmax"].to_numpy()[:, None])
+    cero = np.r_[x[~disp], K[~vivo], p[~vivo[:, lp.param["iy"]]]]
+    lp.col_lo[cero], lp.col_up[cero] = 0.0, 0.0
+    return quita_coef_fijas(lp, cero)
+
+
+if __name__ == "__main__":
+    import time
+    import mvp_expansion as mx
+    from lector_caso import lee_calendario
+
+    stages, _ = lee_calendario(mx.STAGES_CSV, mx.BLOCKS_CSV)
+    Y_list = stages["s_id"].astype(int).tolist()
+    rutas = {"ThermalGenerator": mx.THERMAL_CSV, "PvGenerator": mx.PV_CSV, "WindGenerator": mx.WIND_CSV}
+    t0 = time.perf_counter()
+    cat = carga_candidatos(rutas, stages["start_time"], Y_list, r=mx.DISCOUNT_R)
+    print(f"catálogo en {1e3 * (time.perf_counter() - t0):.0f} ms")
+    af = af_candidatos(cat, 1)
+    for cap in (np.inf, 5000.0, 0.0):
+        t0 = time.perf_counter()
+        pod = poda_dominados(cat, af, cap_util=cap)
+        print(f"cap_util={cap:>8} MW: {cat.n} candidatos ({len(cat.i_cand)} pares stage) -> {pod.n} "
+              f"({len(pod.i_cand)} pares) en {1e3 * (time.perf_counter() - t0):.0f} ms")
+    print(pod.descartados["motivo"].str.split(" por ").str[0].value_counts().to_string())
@@ -2,6 +2,8 @@
 from pathlib import Path
 import pandas as pd
 
+from lector_caso import lee_tabla
+
 def load_hydro_connection(path: Path):
     """
     Devuelve:
@@ -16,8 +18,8 @@ def load_hydro_connection(path: Path):
       - arcs_spill_to_hg_d:  list[(Emb_u, HG_g, delay_h)]         # CON delay (para “futuro”)
       - arcs_turb_to_hg_d:   list[(Emb_u, HG_g, delay_h)]         # CON delay (para “futuro”)
     """
-    hc = pd.read_csv(path)
-    hc.columns = [c.strip().lower() for c in hc.columns]
+    hc = lee_tabla(path, "HydroConnection", columnas=["h_type", "ini", "end", "h_delay"])
+    hc["h_delay"] = hc["h_delay"].fillna(0.0)
 
     def s(x): return str(x).strip()
 
@@ -2,6 +2,8 @@
 from pathlib import Path
 import pandas as pd
 
+from lector_caso import lee_tabla
+
 def load_hydro_generator(path: Path, reservoirs_df: pd.DataFrame, kappa_default: float = 1.0):
     """
     Identifica generadores hidro ROR (sin almacenamiento).
@@ -12,8 +14,7 @@ def load_hydro_generator(path: Path, reservoirs_df: pd.DataFrame, kappa_default:
       - PmaxROR: dict HG_* -> MWh/h de potencia máxima *por hora*
       - kappa_ror: dict HG_* -> MWh/hm3 (eficiencia hidráulica)
     """
-    df = pd.read_csv(path)
-    df.columns = [c.strip().lower() for c in df.columns]
+    df = lee_tabla(path, "HydroGenerator")
 
     # catálogo de embalses (Emb_*)
     emb_names = set(reservoirs_df["name"].astype(str).tolist())
@@ -26,7 +27,7 @@ def load_hydro_generator(path: Path, reservoirs_df: pd.DataFrame, kappa_default:
     # Consideraremos ROR los HG_* que NO sean embalses (Dam no lista generadores)
     # y que sean "connected == true" (si existe)
     if "connected" in df.columns:
-        df = df[df["connected"].astype(str).str.lower().isin(["true", "1"])].copy()
+        df = df[df["connected"]].copy()
 
     # Pmax por hora (MW). En el bloque multiplicarás por horas del bloque si lo deseas acotar por potencia.
     PmaxROR = {}
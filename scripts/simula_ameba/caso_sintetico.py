@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Generador de casos sintéticos en formato AMEBA (CSV) de tamaño configurable
+----------------------------------------------------------------------------
+Escribe la misma estructura que lee mvp_expansion:
+  - demanda/: stages.csv, blocks.csv (todas las horas; bloque = tramo de la hora del día),
+    demand.csv (año base horario, L_<barra>) y factor.csv (Proj_<barra> por año)
+  - generacion/hidro_sys/: Dam, HydroConnection (cascadas de `profundidad` embalses que
+    terminan en una unidad ROR), HydroGroup
+  - generacion/: HydroGenerator (unidades ROR HG_*)
+  - generacion/recursos/inflows_qm3.csv: afluencias horarias (m3/s) por hidrología
+  - elec_sys/: Busbar, Branch (anillo + cuerdas), Load, System
+Los valores son aleatorios con semilla fija (mismo caso para los mismos parámetros).
+usa_caso(mx, rutas) apunta temporalmente las rutas CONFIG de mvp_expansion al caso.
+Ejecutar:
+    python caso_sintetico.py
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from lector_caso import format_time
+
+RUTA_BASE = Path(__file__).parent.parent.parent
+RUTA_CASOS = RUTA_BASE / "resultados" / "casos_sinteticos"
+PREFIJO = "SINTETICO"
+INICIO, FIN = "1970-01-01-00:00", "2060-01-01-00:00"
+
+
+@dataclass(frozen=True)
+class ParametrosCaso:
+    n_stages: int = 12            # stages mensuales
+    n_bloques: int = 24           # bloques por stage (tramos del día, <= 24)
+    n_embalses: int = 6
+    profundidad: int = 3          # embalses por cascada
+    n_ror: int = 10
+    n_barras: int = 4
+    n_hidrologias: int = 2
+    anio_inicio: int = 2025
+    semilla: int = 0
+
+    @property
+    def nombre(self) -> str:
+        return (f"s{self.n_stages}_b{self.n_bloques}_e{self.n_embalses}_p{self.profundidad}"
+                f"_r{self.n_ror}_n{self.n_barras}_h{self.n_hidrologias}_{self.semilla}")
+
+    @property
+    def hidrologias(self) -> List[str]:
+        return [f"H_{1960 + k}" for k in range(self.n_hidrologias)]
+
+
+def _escribe(df: pd.DataFrame, ruta: Path) -> Path:
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    for c in df.columns:
+        if df[c].dtype == bool:
+            df[c] = np.where(df[c], "true", "false")
+    df.to_csv(ruta, index=False, float_format="%.6g")
+    return ruta
+
+
+def _vigencia(n: int) -> dict:
+    return {"start_time": [INICIO] * n, "end_time": [FIN] * n}
+
+
+# ===== Calendario y demanda =====
+def _calendario(par: ParametrosCaso):
+    if not 1 <= par.n_bloques <= 24:
+        raise ValueError(f"caso sintético: n_bloques={par.n_bloques} fuera de 1..24.")
+    ini = pd.date_range(f"{par.anio_inicio}-01-01", periods=par.n_stages + 1, freq="MS")
+    stages = pd.DataFrame({"s_id": np.arange(1, par.n_stages + 1), "start_time": format_time(ini[:-1].values),
+                           "end_time": format_time(ini[1:].values), "num_blocks": par.n_bloques})
+    horas = pd.date_range(ini[0], ini[-1], freq="h", inclusive="left")
+    stage = np.searchsorted(ini.values, horas.values, side="right")
+    blocks = pd.DataFrame({"stage": stage, "block": horas.hour.values * par.n_bloques // 24 + 1,
+                           "time": format_time(horas.values)})
+    return stages, blocks, horas
+
+
+def _demanda(par: ParametrosCaso, rng, barras: List[str]):
+    anio_base = par.anio_inicio - 1
+    h = pd.date_range(f"{anio_base}-01-01", f"{par.anio_inicio}-01-01", freq="h", inclusive="left")
+    forma = (1.0 + 0.20 * np.sin(2 * np.pi * (h.hour.values - 6) / 24.0)
+             + 0.10 * np.cos(2 * np.pi * (h.dayofyear.values - 15) / 365.0))
+    base = rng.uniform(100.0, 1500.0, len(barras))
+    ruido = 1.0 + 0.03 * rng.standard_normal((len(h), len(barras)))
+    dem = pd.DataFrame(forma[:, None] * base[None, :] * ruido, columns=[f"L_{b}" for b in barras])
+    dem.insert(0, "scenario", f"demanda_{anio_base}")
+    dem.insert(0, "time", format_time(h.values))
+    n_anios = (par.n_stages - 1) // 12 + 1
+    crec = rng.uniform(0.01, 0.04, len(barras))
+    fac = pd.DataFrame((1.0 + crec[None, :]) ** np.arange(n_anios)[:, None], columns=[f"Proj_{b}" for b in barras])
+    fac.insert(0, "time", [f"{par.anio_inicio + k}-01-01-00:00" for k in range(n_anios)])
+    return dem, fac
+
+
+# ===== Hidro =====
+def _hidro(par: ParametrosCaso, rng, barras: List[str]):
+    emb = [f"Emb_C{c + 1}_{k + 1}" for c in range(-(-par.n_embalses // max(par.profundidad, 1)))
+           for k in range(max(par.profundidad, 1))][:par.n_embalses]
+    hg = [f"HG_R{i + 1}" for i in range(par.n_ror)]
+    vmax = rng.uniform(100.0, 1500.0, len(emb))
+    dam = pd.DataFrame({
+        "name": emb, **_vigencia(len(emb)), "report": True, "vmax": vmax, "vmin": 0.2 * vmax,
+        "vini": 0.6 * vmax, "vend": 0.6 * vmax, "scale": 1.0, "non_physical_inflow": False,
+        "non_physical_inflow_penalty": 0.0, "filt_avg": 0.0, "use_fcf": True, "cond_ovf": False,
+        "vol_ovf": vmax, "val_ovf": 0.0, "filt_poly": 0.0, "candidate": False,
+    })
+
+    arcos = []   # (h_type, ini, end)
+    arcos += [("inflow", f"Afl_{e[4:]}", e) for e in emb]
+    arcos += [("inflow", f"Afl_{g[3:]}", g) for g in hg]
+    cadenas: Dict[str, List[str]] = {}
+    for e in emb:
+        cadenas.setdefault(e.rsplit("_", 1)[0], []).append(e)
+    for j, cad in enumerate(cadenas.values()):
+        for u, d in zip(cad[:-1], cad[1:]):
+            arcos += [("turbinated", u, d), ("overflow", u, d)]
+        if hg:   # el último embalse de la cascada descarga en una unidad ROR
+            arcos += [("turbinated", cad[-1], hg[j % len(hg)]), ("overflow", cad[-1], hg[j % len(hg)])]
+    n = len(arcos)
+    conn = pd.DataFrame({
+        "name": [f"{t} {i} -> {e}" for t, i, e in arcos], **_vigencia(n), "report": True,
+        "h_type": [a[0] for a in arcos], "ini": [a[1] for a in arcos], "end": [a[2] for a in arcos],
+        "h_max_flow": 99999.0, "h_min_flow": 0.0, "h_ramp": 99999.0, "h_delay": 0.0,
+        "h_delayed_q": 0.0, "h_flow_penalty": 0.0,
+    })
+
+    gen = pd.DataFrame({
+        "name": [g[3:] for g in hg], **_vigencia(len(hg)), "report": True, "connected": True,
+        "busbar": [barras[i % len(barras)] for i in range(len(hg))], "hydro_group_name": hg,
+        "pmax": rng.uniform(20.0, 200.0, len(hg)), "pmin": 0.0, "vomc_avg": 0.0,
+        "eff": rng.uniform(0.8, 1.2, len(hg)), "candidate": False,
+    })
+    grupo = pd.DataFrame({"name": hg, **_vigencia(len(hg)), "report": True, "hg_sp_min": 0.0,
+                          "hg_sp_max": 99999.0})
+    return dam, conn, gen, grupo, emb, hg
+
+
+def _inflows(par: ParametrosCaso, rng, horas: pd.DatetimeIndex, afluentes: List[str]) -> pd.DataFrame:
+    """Afluencias horarias (m3/s): estacionalidad + factor por hidrología y afluente."""
+    est = 1.0 + 0.6 * np.cos(2 * np.pi * (horas.dayofyear.values - 200) / 365.0)
+    media = rng.uniform(5.0, 150.0, len(afluentes))
+    partes = []
+    for h in par.hidrologias:
+        f = rng.lognormal(0.0, 0.3, len(afluentes))
+        df = pd.DataFrame(est[:, None] * (media * f)[None, :], columns=afluentes)
+        df.insert(0, "scenario", h)
+        df.insert(0, "time", format_time(horas.values))
+        partes.append(df)
+    return pd.concat(partes, ignore_index=True)
+
+
+# ===== Red eléctrica =====
+def _red(par: ParametrosCaso, rng, barras: List[str]):
+    nb = len(barras)
+    pares = [(i, (i + 1) % nb) for i in range(nb)] if nb > 2 else [(0, 1)] if nb == 2 else []
+    pares += [(i, (i + nb // 2) % nb) for i in range(0, nb, 3) if nb >= 6]
+    pares = list(dict.fromkeys(tuple(sorted(p)) for p in pares if p[0] != p[1]))
+    fmax = rng.uniform(300.0, 1500.0, len(pares))
+    branch = pd.DataFrame({
+        "name": [f"L_{barras[i]}_{barras[j]}" for i, j in pares], **_vigencia(len(pares)), "report": True,
+        "connected": True, "busbari": [barras[i] for i, _ in pares], "busbarf": [barras[j] for _, j in pares],
+        "max_flow": fmax, "max_flow_reverse": fmax, "r": 0.005, "x": rng.uniform(0.01, 0.1, len(pares)),
+        "dc": True, "losses": False, "candidate": False, "voltage": 500.0,
+    })
+    busbar = pd.DataFrame({"name": barras, **_vigencia(nb), "report": True, "voltage": 500.0})
+    load = pd.DataFrame({"name": [f"L_{b}" for b in barras], **_vigencia(nb), "report": True, "busbar": barras,
+                         "connected": True, "projection_type": [f"Proj_{b}" for b in barras], "voll": 416.0})
+    system = pd.DataFrame({"name": ["GENERAL"], "sbase": [100.0], "busbar_ref": [barras[0]],
+                           "interest_rate": [0.08]})
+    return branch, busbar, load, system
+
+
+def genera_caso(par: ParametrosCaso, destino: Path = None) -> Dict[str, Path]:
+    """
+    Escribe el caso en destino (por defecto resultados/casos_sinteticos/<nombre>) y devuelve
+    {nombre de ruta CONFIG de mvp_expansion: ruta}. Si el caso ya existe no se reescribe.
+    """
+    destino = Path(destino) if destino is not None else RUTA_CASOS / par.nombre
+    hs, gen_dir, rec = destino / "generacion" / "hidro_sys", destino / "generacion", destino / "generacion" / "recursos"
+    tabla = lambda d, t: d / f"{PREFIJO}_{t}.csv"
+    rutas = {
+        "STAGES_CSV": destino / "demanda" / "stages.csv", "BLOCKS_CSV": destino / "demanda" / "blocks.csv",
+        "DEMANDA_BASE": destino / "demanda" / "demand.csv", "DEMANDA_FACTOR": destino / "demanda" / "factor.csv",
+        "RESERVOIRS_CSV": tabla(hs, "Dam"), "HYDRO_CONN": tabla(hs, "HydroConnection"),
+        "HYDRO_GROUP": tabla(hs, "HydroGroup"), "HYDRO_GENERATOR": tabla(gen_dir, "HydroGenerator"),
+        "RUTA_INFLOWS_QM3": rec / "inflows_qm3.csv", "PERFILES_CSV": rec / "profile_power.csv",
+        "BRANCH_CSV": tabla(destino / "elec_sys", "Branch"), "BUSBAR_CSV": tabla(destino / "elec_sys", "Busbar"),
+        "LOAD_CSV": tabla(destino / "elec_sys", "Load"), "SYSTEM_CSV": tabla(destino / "elec_sys", "System"),
+    }
+    marca = destino / "parametros.json"
+    if marca.exists():
+        return rutas
+
+    rng = np.random.default_rng(par.semilla)
+    barras = [f"B{i + 1}" for i in range(max(par.n_barras, 1))]
+    stages, blocks, horas = _calendario(par)
+    dem, fac = _demanda(par, rng, barras)
+    dam, conn, gen, grupo, emb, hg = _hidro(par, rng, barras)
+    afl = _inflows(par, rng, horas, [f"Afl_{e[4:]}" for e in emb] + [f"Afl_{g[3:]}" for g in hg])
+    branch, busbar, load, system = _red(par, rng, barras)
+
+    for df, clave in ((stages, "STAGES_CSV"), (blocks, "BLOCKS_CSV"), (dem, "DEMANDA_BASE"),
+                      (fac, "DEMANDA_FACTOR"), (dam, "RESERVOIRS_CSV"), (conn, "HYDRO_CONN"),
+                      (grupo, "HYDRO_GROUP"), (gen, "HYDRO_GENERATOR"), (afl, "RUTA_INFLOWS_QM3"),
+                      (branch, "BRANCH_CSV"), (busbar, "BUSBAR_CSV"), (load, "LOAD_CSV"),
+                      (system, "SYSTEM_CSV")):
+        _escribe(df, rutas[clave])
+    marca.write_text(pd.Series(asdict(par)).to_json(), encoding="utf-8")
+    return rutas
+
+
+@contextmanager
+def usa_caso(mx, rutas: Dict[str, Path], hidrologia: str = None):
+    """Apunta las rutas CONFIG del módulo mvp_expansion (mx) al caso mientras dura el bloque."""
+    cambios = dict(rutas)
+    if hidrologia is not None:
+        cambios["HIDROLOGIA"] = hidrologia
+    previo = {k: getattr(mx, k) for k in cambios}
+    for k, v in cambios.items():
+        setattr(mx, k, v)
+    try:
+        yield
+    finally:
+        for k, v in previo.items():
+            setattr(mx, k, v)
+
+
+if __name__ == "__main__":
+    par = ParametrosCaso()
+    rutas = genera_caso(par)
+    print(f"Caso {par.nombre} -> {rutas['STAGES_CSV'].parent.parent}")
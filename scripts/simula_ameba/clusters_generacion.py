@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Agrupamiento (clustering) de la flota de generación AMEBA
+---------------------------------------------------------
+Lee ThermalGenerator / PvGenerator / WindGenerator / ESS (unidades existentes: no candidatas y
+conectadas) y agrupa en clusters por:
+  - clase (termica, solar, eolica, ess), barra, familia de combustible y perfil (zone)
+  - costo: vomc_avg y heatrate_avg discretizados en escala logarítmica con tolerancia
+    relativa `tol` (dos unidades del mismo cluster difieren a lo más en un factor (1+tol)
+    en cada uno; el costo cero es un bin propio); tol=0 sólo agrupa costos idénticos
+Cada cluster suma pmax (y ess_emax) y pondera por pmax los parámetros (costos, tasas de
+falla, eficiencias). La capacidad por stage respeta start_time/end_time de cada unidad.
+El reporte de error compara el costo de cada unidad con el de su cluster.
+Ejecutar:
+    python clusters_generacion.py
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+
+from lector_caso import lee_tabla
+
+CLASES = {"ThermalGenerator": "termica", "PvGenerator": "solar", "WindGenerator": "eolica", "ESS": "ess"}
+CLAVES = ("clase", "barra", "combustible", "perfil")
+PONDERADAS = ("vomc_avg", "heatrate_avg", "forced_outage_rate", "fom_cost", "ess_effc", "ess_effd")
+
+# familia de combustible por patrón en fuel_name (el primer patrón que calza manda)
+_COMBUSTIBLES = [("geotermia", r"geo"), ("gas", r"gnl|_gn(?:_|$)|gas"), ("carbon", r"carbon|petcoke"),
+                 ("diesel", r"diesel|_die(?:_|$)|oil|glp"), ("biomasa", r"biomasa|biogas"),
+                 ("cogeneracion", r"cogeneracion")]
+
+
+def familia_combustible(fuel_name: pd.Series) -> pd.Series:
+    s = fuel_name.fillna("").astype(str).str.lower()
+    cond = [s.str.contains(p, regex=True) for _, p in _COMBUSTIBLES]
+    return pd.Series(np.select(cond, [f for f, _ in _COMBUSTIBLES], default="otro"), index=fuel_name.index)
+
+
+def carga_flota(rutas: Dict[str, Path], solo_existentes: bool = True) -> pd.DataFrame:
+    """
+    rutas: {"ThermalGenerator": ruta, "PvGenerator": ruta, ...} (las ausentes se omiten).
+    Devuelve una tabla única por unidad con columnas name, clase, barra, combustible, perfil,
+    pmax, start_time, end_time y los parámetros de PONDERADAS / ess_emax (0 donde no aplican).
+    """
+    partes = []
+    for tabla, ruta in rutas.items():
+        if ruta is None or not Path(ruta).exists():
+            continue
+        df = lee_tabla(ruta, tabla)
+        if solo_existentes:
+            df = df[~df["candidate"].fillna(False) & df["connected"].fillna(True)]
+        out = pd.DataFrame({
+            "name": df["name"].astype(str), "clase": CLASES[tabla], "barra": df["busbar"].astype(str),
+            "combustible": familia_combustible(df["fuel_name"]) if "fuel_name" in df else "",
+            "perfil": df["zone"].fillna("").astype(str) if "zone" in df else "",
+            "pmax": df["pmax"].fillna(0.0), "start_time": df["start_time"], "end_time": df["end_time"],
+        })
+        for c in PONDERADAS + ("ess_emax",):
+            out[c] = df[c].fillna(0.0) if c in df else 0.0
+        partes.append(out)
+    flota = pd.concat(partes, ignore_index=True)
+    return flota[flota["pmax"] > 0].reset_index(drop=True)
+
+
+def _bin_costo(v: np.ndarray, tol: float) -> np.ndarray:
+    """Bin logarítmico de v > 0: ancho log(1 + tol); v <= 0 va a un bin propio (-inf). tol <= 0 -> el valor mismo."""
+    v = np.maximum(np.asarray(v, dtype=np.float64), 0.0)
+    if tol <= 0:
+        return v
+    pos = v > 0
+    return np.where(pos, np.floor(np.log(np.where(pos, v, 1.0)) / np.log1p(tol)), -np.inf)
+
+
+@dataclass
+class ClustersFlota:
+    tabla: pd.DataFrame        # un registro por cluster (índice = nombre del cluster)
+    miembro: np.ndarray        # int (n_unidades,) cluster de cada unidad de la flota
+    flota: pd.DataFrame
+    tol: float
+
+    @property
+    def n_clusters(self) -> int:
+        return len(self.tabla)
+
+    def capacidad_por_stage(self, inicio_stages: Sequence) -> np.ndarray:
+        """(n_clusters, n_stages) MW en servicio al inicio de cada stage (start_time <= t < end_time)."""
+        t = np.asarray(pd.to_datetime(pd.Series(inicio_stages)).to_numpy(), dtype="datetime64[ns]")
+        ini = self.flota["start_time"].to_numpy("datetime64[ns]")
+        fin = self.flota["end_time"].to_numpy("datetime64[ns]")
+        activa = (ini[:, None] <= t[None, :]) & (t[None, :] < fin[:, None])       # (n_unidades, n_stages)
+        pm = self.flota["pmax"].to_numpy(np.float64)[:, None] * activa
+        cap = np.zeros((self.n_clusters, len(t)))
+        np.add.at(cap, self.miembro, pm)
+        return cap
+
+    def reporte_error(self) -> pd.DataFrame:
+        """
+        Por cluster: unidades, pmax y error de agregación de vomc_avg / heatrate_avg
+        (máximo relativo por unidad y medio ponderado por pmax). La fila 'TOTAL' resume la flota.
+        """
+        w = self.flota["pmax"].to_numpy(np.float64)
+        filas = {"n_unidades": np.bincount(self.miembro, minlength=self.n_clusters),
+                 "pmax": self.tabla["pmax"].to_numpy()}
+        tot = {"n_unidades": len(self.flota), "pmax": w.sum()}
+        for c in ("vomc_avg", "heatrate_avg"):
+            u = self.flota[c].to_numpy(np.float64)
+            k = self.tabla[c].to_numpy(np.float64)[self.miembro]
+            rel = np.abs(u - k) / np.maximum(np.abs(u), 1e-9)
+            rel[np.abs(u - k) <= 1e-12] = 0.0
+            mx = np.zeros(self.n_clusters)
+            np.maximum.at(mx, self.miembro, rel)
+            filas[f"err_max_{c}"] = mx
+            filas[f"err_medio_{c}"] = np.bincount(self.miembro, weights=w * rel, minlength=self.n_clusters) \
+                / np.maximum(filas["pmax"], 1e-12)
+            tot[f"err_max_{c}"] = rel.max(initial=0.0)
+            tot[f"err_medio_{c}"] = float(w @ rel) / max(w.sum(), 1e-12)
+        rep = pd.DataFrame(filas, index=self.tabla.index)
+        rep.loc["TOTAL"] = pd.Series(tot)
+        return rep
+
+
+def agrupa_flota(flota: pd.DataFrame, tol: float = 0.05, claves: Sequence[str] = CLAVES) -> ClustersFlota:
+    """Clusters por claves exactas + bins de costo (vomc_avg, heatrate_avg) con tolerancia tol."""
+    key = flota[list(claves)].assign(_bv=_bin_costo(flota["vomc_avg"], tol),
+                                     _bh=_bin_costo(flota["heatrate_avg"], tol))
+    miembro, _ = pd.MultiIndex.from_frame(key).factorize()
+    miembro = miembro.astype(np.int64)
+    n = int(miembro.max(initial=-1)) + 1
+
+    w = flota["pmax"].to_numpy(np.float64)
+    suma = lambda v: np.bincount(miembro, weights=np.asarray(v, dtype=np.float64), minlength=n)
+    pmax = suma(w)
+    tabla = pd.DataFrame({c: flota[c].to_numpy()[np.unique(miembro, return_index=True)[1]] for c in claves})
+    tabla["n_unidades"] = np.bincount(miembro, minlength=n)
+    tabla["pmax"] = pmax
+    tabla["ess_emax"] = suma(flota["ess_emax"])
+    for c in PONDERADAS:
+        tabla[c] = suma(w * flota[c].to_numpy(np.float64)) / np.maximum(pmax, 1e-12)
+    # nombre: clase_barra[_combustible]_k (k correlativo dentro de clase/barra/combustible)
+    base = tabla["clase"] + "_" + tabla["barra"] + np.where(tabla["combustible"] != "", "_" + tabla["combustible"], "")
+    tabla.index = pd.Index(base + "_" + (tabla.groupby(base).cumcount() + 1).astype(str), name="cluster")
+    return ClustersFlota(tabla=tabla, miembro=miembro, flota=flota.reset_index(drop=True), tol=tol)
+
+
+def clusters_caso(rutas: Dict[str, Path], tol: float = 0.05, claves: Sequence[str] = CLAVES) -> ClustersFlota:
+    return agrupa_flota(carga_flota(rutas), tol=tol, claves=claves)
+
+
+if __name__ == "__main__":
+    import mvp_expansion as mx
+
+    rutas = {"ThermalGenerator": mx.THERMAL_CSV, "PvGenerator": mx.PV_CSV,
+             "WindGenerator": mx.WIND_CSV, "ESS": mx.ESS_CSV}
+    flota = carga_flota(rutas)
+    for tol in (0.0, 0.05, 0.20, 1.0):
+        cl = agrupa_flota(flota, tol)
+        tot = cl.reporte_error().loc["TOTAL"]
+        print(f"tol={tol:4.2f}: {len(flota)} unidades -> {cl.n_clusters} clusters | "
+              f"err medio vomc={100 * tot['err_medio_vomc_avg']:.2f}% "
+              f"heatrate={100 * tot['err_medio_heatrate_avg']:.2f}% | "
+              f"err max vomc={100 * tot['err_max_vomc_avg']:.1f}%")
@@ -2,16 +2,16 @@
 import pandas as pd
 from pathlib import Path
 
-def build_inflows_df(ruta_wide: Path, escenario: str = "H_1960", units: str = "m3s") -> pd.DataFrame:
+from lector_caso import format_time, lee_serie_ancha
+
+def build_inflows_df(ruta_wide: Path, escenario: str = "H_1960", units: str = "m3s",
+                     time_str: bool = True) -> pd.DataFrame:
     """
     Construye un DataFrame de inflows directamente desde un archivo ancho de afluencias.
     No guarda archivos, solo devuelve el DataFrame con columnas ['time','name','inflow'].
+    time_str=False deja 'time' como datetime64 (evita el formateo a texto y su re-parseo).
     """
-    df = pd.read_csv(ruta_wide)
-    df.columns = [c.strip() for c in df.columns]
-
-    if "scenario" in df.columns:
-        df = df[df["scenario"] == escenario].copy()
+    df = lee_serie_ancha(ruta_wide, escenario=escenario)
 
     exclude = {"time", "scenario"}
     afl_cols = [c for c in df.columns if c not in exclude]
@@ -21,8 +21,6 @@ def build_inflows_df(ruta_wide: Path, escenario: str = "H_1960", units: str = "m
                 var_name="name", value_name="inflow_raw")
     )
 
-    long_df["time"] = pd.to_datetime(long_df["time"], format="%Y-%m-%d-%H:%M")
-
     # Conversión de unidades
     if units.lower() == "m3s":
         long_df["inflow"] = long_df["inflow_raw"] * 0.0036  # m³/s → hm³/h
@@ -30,6 +28,7 @@ def build_inflows_df(ruta_wide: Path, escenario: str = "H_1960", units: str = "m
         long_df["inflow"] = long_df["inflow_raw"]
 
     out = long_df[["time", "name", "inflow"]].sort_values(["time", "name"]).reset_index(drop=True)
-    out["time"] = out["time"].dt.strftime("%Y-%m-%d-%H:%M")
+    if time_str:
+        out["time"] = format_time(out["time"].to_numpy())
 
     return out
\ No newline at end of file
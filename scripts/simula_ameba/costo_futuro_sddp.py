@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""
+SDDP: función de costo futuro por stage sobre los embalses con use_fcf
+-----------------------------------------------------------------------
+Operación con capacidad dada (K por stage); el estado entre stages es el volumen final de
+los embalses con use_fcf = True. Los embalses sin FCF regulan dentro del stage
+(volumen final = vini en cada stage). En lugar de VolTerminal == vend, cada stage lleva
+una variable Alfa (costo futuro descontado) acotada por cortes:
+    Alfa_y >= a_k + b_k · V_fin[fcf]
+Espacio muestral: las hidrologías del archivo de inflows (independencia entre stages);
+cada stage abre todas las hidrologías en la pasada backward.
+  - forward : M escenarios muestreados en paralelo (un proceso por escenario); da los
+              estados de prueba y el costo simulado (cota superior estadística)
+  - backward: del último stage al segundo, en paralelo por estado de prueba; cada estado
+              resuelve el stage siguiente con todas las hidrologías y promedia Q y dQ/dV
+              (duales del 1er bloque de VolBalance) -> un corte para el stage anterior
+  - cota inferior: stage 1 desde vini, promedio sobre hidrologías
+Cada worker mantiene una SesionExpansion por stage (HiGHS en caliente) y sólo agrega los
+cortes nuevos y las afluencias de la hidrología que corresponda.
+Los cortes se guardan en CSV (stage, intercepto, un coeficiente por embalse) junto a un JSON
+con la clave de contenido del caso (calendario, demanda, costos, K, hidro, afluencias de todas
+las hidrologías, r, c_ens...): sólo se reutilizan en una corrida con la misma clave.
+agrega_fcf lleva los cortes de un stage a cualquier LP de build_lp que termine en él (Alfa +
+filas Corte en vez de VolTerminal); el horizonte rodante los usa al final de cada ventana.
+Ejecutar:
+    python costo_futuro_sddp.py
+"""
+from __future__ import annotations
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from backend_matricial import ModeloLP, _arr_ty, agrega_columnas, build_lp
+from cache_etapas import hash_valor
+from escenarios_hidrologicos import adjunta, inflows_por_bloque, libera, publica
+from sesion_persistente import SesionExpansion
+
+RUTA_CORTES = Path(__file__).parent.parent.parent / "resultados" / "fcf_cortes.csv"
+
+Cortes = Dict[int, Tuple[np.ndarray, np.ndarray]]     # j -> (intercepto (n,), coeficientes (n, nF))
+
+
+@dataclass
+class ResultadoSDDP:
+    estado: str                          # "convergido" | "max_iter"
+    cota_inferior: float
+    costo_simulado: float                # promedio forward (cota superior estadística)
+    ic95: float                          # semiancho del intervalo de confianza del costo simulado
+    Y_list: List[int]
+    embalses_fcf: List[str]
+    cortes: Cortes
+    historial: List[dict] = field(default_factory=list)
+
+
+# ===== Cortes en disco =====
+def clave_sddp(Y_list, T_by_Y, alpha, D, techs, AF, K, cvar, hydro, I_res, I_ror, **kw) -> str:
+    """Clave de contenido de un caso SDDP (mismos argumentos que resuelve_sddp; kw: r, c_ens...)."""
+    hydro_base = {k: v for k, v in hydro.items() if k not in ("I_nat", "I_nat_ror")}
+    K = np.asarray(K, dtype=np.float64) if isinstance(K, np.ndarray) else K
+    return hash_valor(("sddp", list(Y_list), T_by_Y, alpha, D, list(techs), AF, K, cvar, hydro_base,
+                       np.asarray(I_res, dtype=np.float64), np.asarray(I_ror, dtype=np.float64), kw))
+
+
+def _ruta_clave(ruta: Path) -> Path:
+    return Path(ruta).with_suffix(".json")
+
+
+def guarda_cortes(cortes: Cortes, Y_list: List[int], embalses_fcf: List[str], ruta: Path = RUTA_CORTES,
+                  clave: Optional[str] = None) -> Path:
+    partes = []
+    for j, (a, B) in sorted(cortes.items()):
+        if not len(a):
+            continue
+        df = pd.DataFrame(B, columns=embalses_fcf)
+        df.insert(0, "intercepto", a)
+        df.insert(0, "stage", Y_list[j])
+        partes.append(df)
+    ruta = Path(ruta)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    tabla = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=["stage", "intercepto"] + embalses_fcf)
+    tabla.to_csv(ruta, index=False, encoding="utf-8")
+    _ruta_clave(ruta).write_text(json.dumps({"clave": clave, "embalses_fcf": list(embalses_fcf)}), encoding="utf-8")
+    return ruta
+
+
+def clave_cortes(ruta: Path) -> Optional[str]:
+    """Clave del caso con que se calcularon los cortes (None si no quedó registrada)."""
+    meta = _ruta_clave(ruta)
+    return json.loads(meta.read_text(encoding="utf-8")).get("clave") if meta.exists() else None
+
+
+def carga_cortes(ruta: Path, Y_list: List[int], embalses_fcf: List[str], clave: Optional[str] = None) -> Cortes:
+    """
+    Cortes de una corrida anterior; stages ausentes del calendario actual se descartan.
+    clave: si se indica, los cortes deben haberse calculado con ese mismo caso (ValueError si no).
+    """
+    if clave is not None and clave_cortes(ruta) != clave:
+        raise ValueError(f"{Path(ruta).name}: los cortes son de otro caso (demanda, costos, K, hidro, "
+                         "afluencias o parámetros distintos); no se pueden reutilizar.")
+    tabla = pd.read_csv(ruta)
+    faltan = [e for e in embalses_fcf if e not in tabla.columns]
+    if faltan:
+        raise KeyError(f"{Path(ruta).name}: faltan coeficientes para los embalses {faltan}")
+    pos = {y: j for j, y in enumerate(Y_list)}
+    out: Cortes = {}
+    for y, sub in tabla.groupby("stage", sort=True):
+        if int(y) in pos:
+            out[pos[int(y)]] = (sub["intercepto"].to_numpy(dtype=np.float64),
+                                sub[embalses_fcf].to_numpy(dtype=np.float64))
+    return out
+
+
+def filas_corte(lp: ModeloLP, B: np.ndarray, fcf: np.ndarray) -> sparse.csr_matrix:
+    """Matriz (n_cortes x n_var) de  Alfa - B · V[fcf, último bloque]  (el LP ya tiene Alfa)."""
+    n = B.shape[0]
+    cols = np.r_[lp.cols("V")[fcf, -1], lp.cols("Alfa")]
+    vals = np.c_[-B, np.ones(n)].ravel()
+    f, j = np.repeat(np.arange(n), len(cols)), np.tile(cols, n)
+    nz = vals != 0.0
+    return sparse.csr_matrix((vals[nz], (f[nz], j[nz])), shape=(n, lp.n_var))
+
+
+def agrega_fcf(lp: ModeloLP, a: np.ndarray, B: np.ndarray, fcf: np.ndarray) -> ModeloLP:
+    """
+    Copia del LP con Alfa (costo futuro tras su último stage, en las unidades del objetivo) y
+    filas Corte:  Alfa - B · V[fcf, último bloque] >= a.  VolTerminal queda libre en los
+    embalses fcf (su valor lo da Alfa); en el resto no cambia.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    n = len(a)
+    B = np.asarray(B, dtype=np.float64).reshape(n, int(fcf.sum()))
+    lp = agrega_columnas(lp, "Alfa", [1.0], 0.0, np.inf)
+    M = filas_corte(lp, B, fcf)
+    row_lo, row_up = lp.row_lo.copy(), lp.row_up.copy()
+    term = lp.filas("VolTerminal")[fcf]
+    row_lo[term], row_up[term] = -np.inf, np.inf
+    return replace(lp, A=sparse.vstack([lp.A, M], format="csr"), row_lo=np.r_[row_lo, a],
+                   row_up=np.r_[row_up, np.full(n, np.inf)], fila={**lp.fila, "Corte": (lp.n_fil, (n,))})
+
+
+# ===== Worker =====
+_W: dict = {}
+
+
+def _init_worker(meta, base, threads_solver):
+    bloques, arrays = adjunta(meta)
+    _W.update(bloques=bloques, arrays=arrays, base=base, threads=threads_solver, sesiones={}, n_cortes={})
+
+
+def _sesion_stage(j: int) -> SesionExpansion:
+    ses = _W["sesiones"].get(j)
+    if ses is not None:
+        return ses
+    a = _W["arrays"]
+    (Y_list, T_by_Y, techs, cvar, hydro, fcf, kw, solver_name) = _W["base"]
+    y = Y_list[j]
+    b0, b1 = int(a["ini_y"][j]), int(a["ini_y"][j + 1])
+    cero = {(g, y): 0.0 for g in techs}
+    hyd = dict(hydro, I_nat=a["I_res"][0, :, b0:b1], I_nat_ror=a["I_ror"][0, :, b0:b1])
+    lp = build_lp([y], {y: T_by_Y[y]}, a["alpha"][b0:b1], a["D"][b0:b1], techs,
+                  {g: a["AF"][i, b0:b1] for i, g in enumerate(techs)}, dict(zip(techs, a["K"][:, j].tolist())),
+                  cero, cero, {(g, y): cvar[(g, y)] for g in techs}, cero, hyd, **kw)
+    # VolTerminal: libre en embalses con FCF (lo valoriza Alfa), vini en el resto
+    f = lp.filas("VolTerminal")
+    vini = np.array([float(hydro.get("vini", {}).get(r, 0.0)) for r in lp.R])
+    lp.row_lo[f] = lp.row_up[f] = vini
+    lp = agrega_fcf(lp, np.zeros(0), np.zeros((0, int(fcf.sum()))), fcf)
+    ses = _W["sesiones"][j] = SesionExpansion(lp, solver_name, threads=_W["threads"])
+    _W["n_cortes"][j] = 0
+    return ses
+
+
+def _sincroniza(j: int, cortes_j) -> SesionExpansion:
+    """Agrega a la sesión del stage j los cortes que aún no tiene."""
+    ses = _sesion_stage(j)
+    if cortes_j is None:
+        return ses
+    a, B = cortes_j
+    n0 = _W["n_cortes"][j]
+    if len(a) > n0:
+        lp = ses.lp
+        fcf = _W["base"][5]
+        ses.agrega_filas("Corte", filas_corte(lp, B[n0:], fcf), a[n0:], np.inf)
+        _W["n_cortes"][j] = len(a)
+    return ses
+
+
+def _resuelve_paso(ses: SesionExpansion, j: int, h: int, v_ini: np.ndarray):
+    a = _W["arrays"]
+    fcf = _W["base"][5]
+    b0, b1 = int(a["ini_y"][j]), int(a["ini_y"][j + 1])
+    R = ses.lp.R
+    ses.actualiza(I_nat=a["I_res"][h, :, b0:b1], I_nat_ror=a["I_ror"][h, :, b0:b1],
+                  vini={R[i]: float(v) for i, v in zip(np.flatnonzero(fcf), v_ini)})
+    res = ses.resuelve()
+    if res.estado != "Optimal":
+        raise RuntimeError(f"SDDP: stage {ses.lp.Y_list[0]} / hidrología {h} terminó en '{res.estado}'.")
+    return res
+
+
+def _forward(secuencia: np.ndarray, v0: np.ndarray, cortes: Cortes):
+    """Simula un escenario (hidrología por stage). Devuelve (estados (nY, nF), costo sin Alfa)."""
+    fcf = _W["base"][5]
+    v, costo, estados = v0, 0.0, []
+    for j, h in enumerate(secuencia.tolist()):
+        ses = _sincroniza(j, cortes.get(j))
+        res = _resuelve_paso(ses, j, h, v)
+        costo += res.objetivo - float(res.valor("Alfa")[0])
+        v = res.valor("V")[fcf, -1].copy()
+        estados.append(v)
+    return np.array(estados).reshape(len(secuencia), int(fcf.sum())), costo
+
+
+def _backward(j: int, v_hat: np.ndarray, cortes_j) -> Tuple[float, np.ndarray]:
+    """Resuelve el stage j desde v_hat con todas las hidrologías: (E[Q], E[dQ/dv])."""
+    fcf = _W["base"][5]
+    ses = _sincroniza(j, cortes_j)
+    n_hid = _W["arrays"]["I_res"].shape[0]
+    Q, pi = 0.0, np.zeros(int(fcf.sum()))
+    for h in range(n_hid):
+        res = _resuelve_paso(ses, j, h, v_hat)
+        Q += res.objetivo
+        pi += res.dual("VolBalance")[fcf, 0]
+    return Q / n_hid, pi / n_hid
+
+
+# ===== Orquestador =====
+def resuelve_sddp(Y_list, T_by_Y, alpha, D, techs, AF, K, cvar, hydro, I_res: np.ndarray, I_ror: np.ndarray,
+                  n_forward: int = 8, max_iter: int = 50, tol: float = 1e-3, semilla: int = 0,
+                  max_workers: Optional[int] = None, threads_solver: int = 1, solver_name: str = "appsi_highs",
+                  cortes_iniciales: Optional[Cortes] = None, **kw) -> ResultadoSDDP:
+    """
+    K: capacidad por stage, dict {g: K0} (sin expansión) o array (techs, stages) de un plan.
+    I_res (n_hid, R, TY) e I_ror (n_hid, ROR, TY): afluencias por bloque de cada hidrología.
+    Convergencia: (costo_simulado - cota_inferior) / costo_simulado <= tol, o cota inferior
+    dentro del IC 95% del costo simulado. kw: r, c_ens, bigm_slack, kappa_default.
+    """
+    if "highs" not in solver_name.lower():
+        raise ValueError(f"resuelve_sddp: solver '{solver_name}' no soportado (sólo HiGHS).")
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    nY, nTY, nG = len(Y_list), len(TY), len(techs)
+    R = list(hydro["R"])
+    fcf = np.array([bool(hydro.get("use_fcf", {}).get(r, True)) for r in R], dtype=bool)
+    embalses_fcf = [r for r, u in zip(R, fcf) if u]
+    v0 = np.array([float(hydro.get("vini", {}).get(r, 0.0)) for r in embalses_fcf])
+    n_hid = I_res.shape[0]
+
+    K_plan = (np.asarray(K, dtype=np.float64).reshape(nG, nY) if isinstance(K, np.ndarray)
+              else np.repeat(np.array([K[g] for g in techs], dtype=np.float64)[:, None], nY, axis=1))
+    arrays = {
+        "alpha": _arr_ty(alpha, TY), "D": _arr_ty(D, TY),
+        "AF": np.array([_arr_ty(AF[g], TY) for g in techs]).reshape(nG, nTY), "K": K_plan,
+        "I_res": np.asarray(I_res, dtype=np.float64), "I_ror": np.asarray(I_ror, dtype=np.float64),
+        "ini_y": np.cumsum([0] + [len(T_by_Y[y]) for y in Y_list]).astype(np.int64),
+    }
+    hydro_base = {k: v for k, v in hydro.items() if k not in ("I_nat", "I_nat_ror")}
+    base = (list(Y_list), T_by_Y, list(techs), cvar, hydro_base, fcf, kw, solver_name)
+
+    # pool de cortes: j -> listas de interceptos / coeficientes (el último stage no lleva cortes)
+    pool_a: Dict[int, List[float]] = {j: [] for j in range(nY)}
+    pool_b: Dict[int, List[np.ndarray]] = {j: [] for j in range(nY)}
+    for j, (a, B) in (cortes_iniciales or {}).items():
+        pool_a[j].extend(a.tolist())
+        pool_b[j].extend(list(B))
+    snapshot = lambda: {j: (np.asarray(pool_a[j]), np.asarray(pool_b[j]).reshape(-1, len(embalses_fcf)))
+                        for j in range(nY) if pool_a[j]}
+
+    rng = np.random.default_rng(semilla)
+    max_workers = max_workers or (os.cpu_count() or 1) // max(1, threads_solver) or 1
+    historial, estado = [], "max_iter"
+    LB, UB, ic = -np.inf, np.inf, np.inf
+    bloques, meta = publica(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(meta, base, threads_solver)) as pool:
+            for it in range(1, max_iter + 1):
+                t0 = time.perf_counter()
+                # forward
+                secuencias = rng.integers(n_hid, size=(n_forward, nY))
+                cortes = snapshot()
+                fw = list(pool.map(_forward, secuencias, [v0] * n_forward, [cortes] * n_forward))
+                estados = np.stack([e for e, _ in fw])                       # (M, nY, nF)
+                costos = np.array([c for _, c in fw])
+                UB = float(costos.mean())
+                ic = float(1.96 * costos.std(ddof=1) / np.sqrt(n_forward)) if n_forward > 1 else 0.0
+                t_fw = time.perf_counter() - t0
+
+                # backward
+                for j in range(nY - 1, 0, -1):
+                    c_j = snapshot().get(j)
+                    vh = estados[:, j - 1]
+                    out = list(pool.map(_backward, [j] * n_forward, vh, [c_j] * n_forward))
+                    for m, (Q, pi) in enumerate(out):
+                        pool_a[j - 1].append(Q - float(pi @ vh[m]))
+                        pool_b[j - 1].append(pi)
+                LB, _ = pool.submit(_backward, 0, v0, snapshot().get(0)).result()
+
+                gap = (UB - LB) / max(abs(UB), 1e-12)
+                historial.append({"iteracion": it, "LB": LB, "UB": UB, "ic95": ic, "gap": gap,
+                                  "t_forward": t_fw, "t_total": time.perf_counter() - t0})
+                print(f"[SDDP] it={it:3d}  LB={LB:,.0f}  UB={UB:,.0f} ± {ic:,.0f}  gap={100 * gap:.3f}%")
+                if it > 1 and (gap <= tol or LB >= UB - ic):
+                    estado = "convergido"
+                    break
+    finally:
+        libera(bloques)
+
+    return ResultadoSDDP(estado=estado, cota_inferior=LB, costo_simulado=UB, ic95=ic, Y_list=list(Y_list),
+                         embalses_fcf=embalses_fcf, cortes=snapshot(), historial=historial)
+
+
+def caso_sddp(ruta_inflows: Optional[Path] = None, hidrologias: Optional[List[str]] = None) -> Tuple[tuple, dict]:
+    """Caso desde mvp_expansion (capacidad existente K0, todas las hidrologías): (args, kw) de resuelve_sddp."""
+    import mvp_expansion as mx
+
+    inputs, ex = mx.load_inputs(False, escenario=None)
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro = mx.aggregate_stage_block(inputs, mx.TECHS, ex)
+    _, _, cvar, _ = mx.build_costs(mx.TECHS, Y_list)
+
+    R, ROR = list(hydro["R"]), list(hydro["ROR"])
+    arcos_inflow = list(ex.get("inflow_to_res", {}).items()) + list(ex.get("inflow_to_hg", {}).items())
+    nombres, cubo = inflows_por_bloque(ruta_inflows or mx.RUTA_INFLOWS_QM3, inputs.calendario,
+                                       arcos_inflow, R + ROR, hidrologias)
+    scale = inputs.reservoirs.drop_duplicates("name").set_index("name")["scale"].fillna(1.0)
+    escala = np.array([float(scale.get(r, 1.0)) for r in R])
+    args = (Y_list, T_by_Y, alpha, D, list(mx.TECHS), AF, K0, cvar, hydro,
+            cubo[:, :len(R)] * escala[None, :, None], cubo[:, len(R):])
+    return args, dict(r=mx.DISCOUNT_R, c_ens=mx.C_ENS, bigm_slack=mx.BIGM_SLACK, kappa_default=mx.KAPPA_DEFAULT)
+
+
+def cortes_vigentes(ruta_cortes: Path = RUTA_CORTES, ruta_inflows: Optional[Path] = None,
+                    hidrologias: Optional[List[str]] = None) -> Tuple[Cortes, List[str]]:
+    """Cortes en disco calculados para el caso actual de mvp_expansion: (cortes, embalses fcf)."""
+    if not Path(ruta_cortes).exists():
+        raise FileNotFoundError(f"{Path(ruta_cortes).name}: no hay cortes; corra costo_futuro_sddp.py.")
+    args, kw = caso_sddp(ruta_inflows, hidrologias)
+    hydro = args[8]
+    fcf = [r for r in hydro["R"] if hydro["use_fcf"].get(r, True)]
+    return carga_cortes(ruta_cortes, args[0], fcf, clave=clave_sddp(*args, **kw)), fcf
+
+
+def corre_sddp(ruta_inflows: Optional[Path] = None, hidrologias: Optional[List[str]] = None,
+               ruta_cortes: Optional[Path] = RUTA_CORTES, reutiliza_cortes: bool = True, **opciones) -> ResultadoSDDP:
+    """
+    Arma el caso desde mvp_expansion (capacidad existente K0) y corre SDDP sobre todas las hidrologías.
+    reutiliza_cortes: parte de los cortes en disco sólo si se calcularon con este mismo caso (clave).
+    """
+    import mvp_expansion as mx
+
+    args, kw = caso_sddp(ruta_inflows, hidrologias)
+    Y_list, hydro = args[0], args[8]
+    clave = clave_sddp(*args, **kw)
+
+    fcf = [r for r in hydro["R"] if hydro["use_fcf"].get(r, True)]
+    iniciales = None
+    if reutiliza_cortes and ruta_cortes is not None and Path(ruta_cortes).exists():
+        if clave_cortes(ruta_cortes) == clave:
+            iniciales = carga_cortes(ruta_cortes, Y_list, fcf, clave=clave)
+            print(f"[OK] {sum(len(a) for a, _ in iniciales.values())} cortes cargados de {Path(ruta_cortes).name}")
+        else:
+            print(f"[AVISO] {Path(ruta_cortes).name} es de otro caso (clave distinta): se parte sin cortes.")
+
+    opciones.setdefault("solver_name", mx.SOLVER_NAME)
+    res = resuelve_sddp(*args, cortes_iniciales=iniciales, **kw, **opciones)
+    if ruta_cortes is not None:
+        guarda_cortes(res.cortes, Y_list, res.embalses_fcf, ruta_cortes, clave=clave)
+    return res
+
+
+if __name__ == "__main__":
+    res = corre_sddp()
+    print(f"[OK] SDDP {res.estado}: LB={res.cota_inferior:,.0f} $ | "
+          f"costo simulado={res.costo_simulado:,.0f} ± {res.ic95:,.0f} $ | {len(res.historial)} iteraciones")
+    print(f"[OK] Cortes guardados en {RUTA_CORTES}")
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Costos variables reales (combustible + VOMC) por unidad o cluster, stage y bloque
+----------------------------------------------------------------------------------
+1) fuel_price.csv (ancho: time, scenario, Fuel_*) se lleva al calendario: cada hora toma el
+   último precio publicado (escalón) y el precio del bloque es la media de sus horas, para
+   todos los combustibles a la vez con una matriz dispersa (bloques x filas de precio):
+       P_blk = (W @ precios) / alpha
+2) ThermalGenerator (fuel_name, heatrate_avg, vomc_avg): en una sola operación vectorizada
+       cvar[u, b] = vomc[u] + heatrate[u] * P_blk[combustible(u), b]
+   (unidades sin combustible en fuel_price: sólo vomc)
+3) El tensor float32 (unidad x stage x bloque) se guarda como np.memmap con clave
+   hash(ThermalGenerator) + hash(fuel_price) + hash(calendario) + escenario.
+4) tensor_clusters: media ponderada por pmax de las unidades de cada cluster (matriz dispersa
+   clusters x unidades); las unidades no térmicas aportan su vomc.
+Para el LP: por_bloque (unidad x bloque en orden TY) entra como costo de p en cada bloque
+(build_lp / build_model cvar_ty); por_stage (media del stage ponderada por horas del bloque) queda
+como cvar por stage para lo que no resuelve por bloque (Benders, SDDP, periodos representativos).
+Ejecutar:
+    python costos_combustible.py
+"""
+from __future__ import annotations
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from scipy import sparse
+
+from calendario import Calendario
+from lector_caso import lee_serie_ancha, lee_tabla
+from perfiles_generacion import hash_archivo, hash_calendario
+
+RUTA_BASE = Path(__file__).parent.parent.parent
+RUTA_FUEL = RUTA_BASE / "data" / "generacion" / "recursos" / "fuel_price.csv"
+RUTA_CACHE = RUTA_BASE / "resultados" / "cache_costos"
+
+
+@dataclass
+class TensorCostos:
+    nombres: List[str]
+    Y_list: List[int]
+    valores: np.ndarray       # float32 (n, n_stages, max bloques por stage); NaN en bloques inexistentes
+    clave: str
+
+    @property
+    def pos(self) -> Dict[str, int]:
+        return {n: i for i, n in enumerate(self.nombres)}
+
+    def por_stage(self, cal: Calendario) -> np.ndarray:
+        """(n, n_stages) costo medio del stage ponderado por las horas de cada bloque."""
+        a = _a_tensor(cal, cal.alpha.astype(np.float32), fill=0.0)            # (n_stages, nT)
+        v = np.nan_to_num(np.asarray(self.valores, dtype=np.float64))
+        return (v * a[None]).sum(axis=2) / np.maximum(a.sum(axis=1), 1e-12)[None, :]
+
+    def por_bloque(self, cal: Calendario) -> np.ndarray:
+        """(n, n_bloques) costo de cada bloque en el orden TY del calendario."""
+        i_y = np.searchsorted(np.asarray(cal.Y_list), cal.stage)
+        v = np.asarray(self.valores, dtype=np.float64)[:, i_y, cal.block.astype(np.int64) - 1]
+        return np.nan_to_num(v)
+
+    def cvar_ty(self, cal: Calendario) -> Dict[str, np.ndarray]:
+        """{nombre: (n_bloques,) costo por bloque} para build_lp / build_model (cvar_ty)."""
+        return dict(zip(self.nombres, self.por_bloque(cal)))
+
+    def cvar_dict(self, cal: Calendario) -> Dict[tuple, float]:
+        """{(nombre, stage): costo} para build_costs / build_lp."""
+        m = self.por_stage(cal)
+        return {(g, y): float(m[i, j]) for i, g in enumerate(self.nombres) for j, y in enumerate(self.Y_list)}
+
+
+def _a_tensor(cal: Calendario, v: np.ndarray, fill=np.nan) -> np.ndarray:
+    """(..., n_bloques) en orden TY -> (..., n_stages, max bloques) por (stage, block)."""
+    i_y = np.searchsorted(np.asarray(cal.Y_list), cal.stage)
+    i_t = cal.block.astype(np.int64) - 1
+    nT = int(i_t.max()) + 1 if len(i_t) else 0
+    out = np.full(v.shape[:-1] + (len(cal.Y_list), nT), fill, dtype=np.float32)
+    out[..., i_y, i_t] = v
+    return out
+
+
+def precios_por_bloque(ruta_fuel: Path, cal: Calendario, escenario: Optional[str] = None):
+    """(nombres Fuel_*, P float64 (n_combustibles, n_bloques)) precio medio de cada bloque."""
+    df = lee_serie_ancha(ruta_fuel, prefijo="Fuel_", escenario=escenario)
+    if "scenario" in df.columns and escenario is None and df["scenario"].nunique() > 1:
+        raise ValueError(f"{Path(ruta_fuel).name}: varios escenarios de precio, indique uno.")
+    df = df.sort_values("time", kind="stable")
+    nombres = [c for c in df.columns if c not in ("time", "scenario")]
+    t = df["time"].to_numpy("datetime64[ns]")
+    # escalón: último precio con time <= hora (antes del primero: el primero)
+    fila = np.clip(np.searchsorted(t, cal.tiempo, side="right") - 1, 0, len(t) - 1)
+    W = sparse.csr_matrix((np.ones(cal.n_horas), (cal.idx, fila)), shape=(cal.n_bloques, len(t)))
+    horas = np.asarray(W.sum(axis=1)).ravel()
+    P = W @ np.nan_to_num(df[nombres].to_numpy(np.float64))
+    P = np.divide(P, horas[:, None], out=np.zeros_like(P), where=horas[:, None] > 0)
+    return nombres, P.T
+
+
+def _guarda(dir_cache: Path, clave: str, nombres: List[str], Y_list, arr: np.ndarray):
+    dir_cache.mkdir(parents=True, exist_ok=True)
+    mm = np.memmap(dir_cache / f"{clave}.f32", dtype=np.float32, mode="w+", shape=arr.shape)
+    mm[:] = arr
+    mm.flush()
+    del mm
+    (dir_cache / f"{clave}.json").write_text(json.dumps({"nombres": nombres, "Y_list": [int(y) for y in Y_list],
+                                                          "shape": list(arr.shape)}))
+
+
+def _abre(dir_cache: Path, clave: str) -> Optional[TensorCostos]:
+    f_val, f_meta = dir_cache / f"{clave}.f32", dir_cache / f"{clave}.json"
+    if not (f_val.exists() and f_meta.exists()):
+        return None
+    meta = json.loads(f_meta.read_text())
+    valores = np.memmap(f_val, dtype=np.float32, mode="r", shape=tuple(meta["shape"]))
+    return TensorCostos(nombres=meta["nombres"], Y_list=meta["Y_list"], valores=valores, clave=clave)
+
+
+def tensor_costos_unidades(ruta_termica: Path, cal: Calendario, ruta_fuel: Path = RUTA_FUEL,
+                           escenario: Optional[str] = None, dir_cache: Path = RUTA_CACHE) -> TensorCostos:
+    """Tensor (unidad térmica x stage x bloque) de vomc + heatrate * precio; memmap por hash."""
+    dir_cache = Path(dir_cache)
+    clave = "cvar_" + "_".join((hash_archivo(ruta_termica)[:12], hash_archivo(ruta_fuel)[:12],
+                                hash_calendario(cal)[:12])) + (f"_{escenario}" if escenario else "")
+    tc = _abre(dir_cache, clave)
+    if tc is not None:
+        return tc
+    u = lee_tabla(ruta_termica, "ThermalGenerator", columnas=["name", "fuel_name", "heatrate_avg", "vomc_avg"])
+    nombres_f, P = precios_por_bloque(ruta_fuel, cal, escenario)
+    pos_f = {f: i for i, f in enumerate(nombres_f)}
+    i_f = u["fuel_name"].map(pos_f).fillna(-1).astype(np.int64).to_numpy()
+    hr = u["heatrate_avg"].fillna(0.0).to_numpy(np.float64)
+    vomc = u["vomc_avg"].fillna(0.0).to_numpy(np.float64)
+    P0 = np.vstack([P, np.zeros((1, P.shape[1]))])                # fila extra: sin combustible
+    cvar = vomc[:, None] + hr[:, None] * P0[i_f]                  # (unidades, bloques)
+    arr = _a_tensor(cal, cvar.astype(np.float32))
+    _guarda(dir_cache, clave, u["name"].astype(str).tolist(), cal.Y_list, arr)
+    return _abre(dir_cache, clave)
+
+
+def tensor_clusters(tc: TensorCostos, cl, dir_cache: Path = RUTA_CACHE) -> TensorCostos:
+    """Tensor (cluster x stage x bloque): media ponderada por pmax de sus unidades."""
+    flota = cl.flota
+    h = hashlib.blake2b(digest_size=8)
+    for a in (cl.miembro.astype(np.int64), flota["pmax"].to_numpy(np.float64)):
+        h.update(np.ascontiguousarray(a).tobytes())
+    h.update("|".join(cl.tabla.index).encode())
+    clave = f"{tc.clave}_cl{h.hexdigest()}"
+    dir_cache = Path(dir_cache)
+    out = _abre(dir_cache, clave)
+    if out is not None:
+        return out
+    n_u, (_, nY, nT) = len(flota), tc.valores.shape
+    fila = flota["name"].map(tc.pos).where(flota["clase"] == "termica")
+    tiene = fila.notna().to_numpy()
+    U = np.empty((n_u, nY * nT), dtype=np.float32)
+    U[:] = flota["vomc_avg"].to_numpy(np.float32)[:, None]                    # no térmicas: vomc
+    U[tiene] = np.asarray(tc.valores).reshape(len(tc.nombres), -1)[fila[tiene].astype(int).to_numpy()]
+    w = flota["pmax"].to_numpy(np.float64)
+    W = sparse.csr_matrix((w, (cl.miembro, np.arange(n_u))), shape=(cl.n_clusters, n_u))
+    suma = np.asarray(W.sum(axis=1)).ravel()
+    C = (W @ np.nan_to_num(U.astype(np.float64))) / np.maximum(suma, 1e-12)[:, None]
+    C = C.reshape(cl.n_clusters, nY, nT).astype(np.float32)
+    if len(tc.nombres):                                                       # bloques inexistentes
+        C[:, np.isnan(np.asarray(tc.valores[0]))] = np.nan
+    _guarda(dir_cache, clave, cl.tabla.index.astype(str).tolist(), tc.Y_list, C)
+    return _abre(dir_cache, clave)
+
+
+if __name__ == "__main__":
+    from lector_caso import lee_calendario
+    stages, blocks = lee_calendario(RUTA_BASE / "data" / "demanda" / "stages.csv",
+                                    RUTA_BASE / "data" / "demanda" / "blocks.csv")
+    cal = Calendario.desde_tablas(stages, blocks)
+    termica = RUTA_BASE / "data" / "generacion" / "PNCP 2 - 2025 ESC-C  - PET 2024 V2_ThermalGenerator.csv"
+    for intento in ("frío", "caché"):
+        t0 = time.perf_counter()
+        tc = tensor_costos_unidades(termica, cal)
+        print(f"[{intento}] {tc.valores.shape} en {1e3 * (time.perf_counter() - t0):.1f} ms -> {tc.clave}")
+    m = tc.por_stage(cal)
+    print(f"costo medio del primer stage: min={np.nanmin(m[:, 0]):.1f} máx={np.nanmax(m[:, 0]):.1f} $/MWh")
+    b = tc.por_bloque(cal)
+    v = np.asarray(tc.valores, dtype=np.float64)
+    print(f"dispersión intra-stage (máx - mín por bloque): hasta {np.nanmax(np.nanmax(v, 2) - np.nanmin(v, 2)):.1f} $/MWh "
+          f"| {b.shape[1]} bloques")
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Costos marginales horarios y valores del agua desde los duales por bloque
+--------------------------------------------------------------------------
+1) Duales por (stage, block) en una sola lectura de la solución:
+     - backend matricial: dual_fila de HiGHS (ya traído en bloque por resultado_highs)
+     - Pyomo: el Suffix 'dual' (un diccionario; una pasada por bloque, no por hora)
+2) Conversión a valores del stage: el objetivo está descontado (df del stage), así que
+       cmg[b]        =  dual(Balance)[b]    / df[stage(b)]     $/MWh  (Balance en MWh del bloque)
+       valor_agua[r,b] = -dual(VolBalance)[r,b] / df[stage(b)]   $/hm3  (más afluencia -> menor costo)
+3) Bloque -> hora con el índice precalculado del Calendario (cal.idx): un único gather
+       cmg_hora = cmg[cal.idx],   valor_agua_hora = valor_agua[:, cal.idx]
+   Todas las horas de un bloque comparten su costo marginal (el bloque es la unidad de despacho).
+4) Salida: Parquet comprimido (zstd), una fila por hora: time, stage, block, cmg y una columna
+   va_<embalse> por embalse (float32). Una curva horaria es una columna del archivo.
+Ejecutar:
+    python costos_marginales.py
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from calendario import Calendario
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAY_ARROW = True
+except ImportError:
+    HAY_ARROW = False
+
+RUTA_BASE = Path(__file__).parent.parent.parent
+RUTA_MARGINALES = RUTA_BASE / "resultados" / "marginales"
+
+
+@dataclass
+class MarginalesBloque:
+    TY: List[tuple]
+    cmg: np.ndarray               # (n_bloques,) $/MWh
+    embalses: List[str]
+    valor_agua: np.ndarray        # (n_embalses, n_bloques) $/hm3
+
+
+@dataclass
+class MarginalesHorarios:
+    tiempo: np.ndarray            # datetime64[ns] (n_horas,)
+    stage: np.ndarray             # int32 (n_horas,)
+    block: np.ndarray             # int32 (n_horas,)
+    cmg: np.ndarray               # float32 (n_horas,) $/MWh
+    embalses: List[str]
+    valor_agua: np.ndarray        # float32 (n_embalses, n_horas) $/hm3
+
+    def tabla(self) -> pd.DataFrame:
+        df = pd.DataFrame({"time": self.tiempo, "stage": self.stage, "block": self.block, "cmg": self.cmg})
+        for i, r in enumerate(self.embalses):
+            df[f"va_{r}"] = self.valor_agua[i]
+        return df
+
+
+def _deshace_descuento(df_stage: np.ndarray, iy: np.ndarray) -> np.ndarray:
+    d = np.asarray(df_stage, dtype=np.float64)[iy]
+    return np.where(d > 0, d, 1.0)
+
+
+def marginales_lp(res) -> MarginalesBloque:
+    """Desde un ResultadoLP (build_lp sobre el calendario completo)."""
+    lp = res.lp
+    if "Balance" not in lp.fila or not len(res.dual_fila):
+        raise ValueError("marginales_lp: la solución no trae duales de Balance.")
+    d = _deshace_descuento(lp.param["df"], lp.param["iy"])
+    bal = res.dual("Balance")
+    if bal.ndim != 1:
+        raise ValueError("marginales_lp: Balance por barra (red DC) no soportado; use el LP uninodal.")
+    va = -res.dual("VolBalance") / d[None, :] if "VolBalance" in lp.fila else np.zeros((0, len(d)))
+    return MarginalesBloque(TY=list(lp.TY), cmg=bal / d, embalses=list(lp.R), valor_agua=va)
+
+
+def marginales_pyomo(m) -> MarginalesBloque:
+    """Desde un modelo Pyomo resuelto con Suffix 'dual' (build_model)."""
+    dual = getattr(m, "dual", None)
+    if dual is None:
+        raise ValueError("marginales_pyomo: el modelo no tiene Suffix 'dual'.")
+    TY = list(m.TY)
+    R = list(m.R)
+    Y = list(m.Y)
+    iy = np.searchsorted(np.asarray(Y), np.fromiter((y for y, _ in TY), dtype=np.int64, count=len(TY)))
+    d = _deshace_descuento(np.array([m.df[y] for y in Y], dtype=np.float64), iy)
+    bal = np.fromiter((dual.get(m.Balance[k], np.nan) for k in TY), dtype=np.float64, count=len(TY))
+    va = np.array([[dual.get(m.VolBalance[r, y, t], np.nan) for (y, t) in TY] for r in R],
+                  dtype=np.float64).reshape(len(R), len(TY))
+    return MarginalesBloque(TY=TY, cmg=bal / d, embalses=R, valor_agua=-va / d[None, :])
+
+
+def a_horas(mb: MarginalesBloque, cal: Calendario) -> MarginalesHorarios:
+    """Gather bloque -> hora con cal.idx (el orden TY del LP es el del Calendario)."""
+    if len(mb.TY) != cal.n_bloques or (len(mb.TY) and tuple(mb.TY[0]) != (int(cal.stage[0]), int(cal.block[0]))):
+        raise ValueError(f"a_horas: el LP tiene {len(mb.TY)} bloques y el calendario {cal.n_bloques} "
+                         "(¿periodos representativos o ventanas? use el LP del calendario completo).")
+    idx = cal.idx
+    return MarginalesHorarios(
+        tiempo=cal.tiempo, stage=cal.stage[idx], block=cal.block[idx],
+        cmg=mb.cmg.astype(np.float32)[idx], embalses=mb.embalses,
+        valor_agua=mb.valor_agua.astype(np.float32)[:, idx],
+    )
+
+
+def escribe_marginales(mh: MarginalesHorarios, nombre: str, ruta: Path = RUTA_MARGINALES,
+                       compresion: str = "zstd") -> Path:
+    """resultados/marginales/<nombre>.parquet (una fila por hora, columnas cmg y va_<embalse>)."""
+    if not HAY_ARROW:
+        raise ImportError("costos_marginales: escribir Parquet requiere el paquete pyarrow.")
+    ruta = Path(ruta)
+    ruta.mkdir(parents=True, exist_ok=True)
+    cols = {"time": pa.array(mh.tiempo), "stage": pa.array(mh.stage), "block": pa.array(mh.block),
+            "cmg": pa.array(mh.cmg)}
+    cols.update({f"va_{r}": pa.array(mh.valor_agua[i]) for i, r in enumerate(mh.embalses)})
+    salida = ruta / f"{nombre}.parquet"
+    pq.write_table(pa.table(cols), salida, compression=compresion)
+    return salida
+
+
+def lee_marginales(nombre: str, columnas: Optional[Sequence[str]] = None, ruta: Path = RUTA_MARGINALES) -> pd.DataFrame:
+    """Lee sólo las columnas pedidas (p.ej. ["time", "cmg"])."""
+    if not HAY_ARROW:
+        raise ImportError("costos_marginales: leer Parquet requiere el paquete pyarrow.")
+    return pq.read_table(Path(ruta) / f"{nombre}.parquet", columns=list(columnas) if columnas else None).to_pandas()
+
+
+if __name__ == "__main__":
+    import time
+    import mvp_expansion as mx
+
+    inputs, ex = mx.load_inputs(False)
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro = mx.aggregate_stage_block(inputs, mx.TECHS, ex)
+    cinv, cfix, cvar, knew = mx.build_costs(mx.TECHS, Y_list)
+    lp = mx.build_lp(Y_list, T_by_Y, alpha, D, list(mx.TECHS), AF, K0, cinv, cfix, cvar, knew, hydro,
+                     r=mx.DISCOUNT_R, c_ens=mx.C_ENS, bigm_slack=mx.BIGM_SLACK, kappa_default=mx.KAPPA_DEFAULT)
+    res = mx.resuelve_lp(lp, mx.SOLVER_NAME)
+    t0 = time.perf_counter()
+    mh = a_horas(marginales_lp(res), inputs.calendario)
+    salida = escribe_marginales(mh, "marginales")
+    print(f"{len(mh.tiempo):,} horas x {1 + len(mh.embalses)} series en {time.perf_counter() - t0:.3f} s -> {salida} "
+          f"({salida.stat().st_size / 2**20:.1f} MB) | cmg medio={np.mean(mh.cmg):,.1f} $/MWh")
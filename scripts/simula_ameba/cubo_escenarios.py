@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Cubos horarios por escenario en disco (escenario x hora x entidad, float32, memmap)
+------------------------------------------------------------------------------------
+Formato (resultados/cache_cubos/<tipo>_<clave>/):
+  - valores.f32 : float32 C-contiguo (n_escenarios, n_horas, n_entidades); un escenario es un
+                  bloque contiguo del archivo y cualquier rebanada se abre sin copiar
+  - tiempo.npy  : datetime64[ns] (n_horas,) horas del cubo, ordenadas
+  - meta.json   : escenarios, entidades, forma, unidad y archivos de origen
+La clave es el hash de los archivos de origen (+ opciones): si cambian, se reconvierte.
+La escritura va a una carpeta temporal que se renombra al final (un cubo a medias nunca se abre).
+Constructores:
+  - cubo_inflows : archivo ancho de afluencias (Afl_*, todas las hidrologías), m3/s -> hm3/h;
+                   se lee por lotes de columnas para acotar la memoria de la conversión
+  - cubo_demanda : proyecta_demanda escribiendo directo en el memmap (por barra o total)
+  - cubo_perfiles: serie ancha Profile_* (todos los escenarios)
+Agregación a bloques (agrega): suma segmentada por tramos de horas, con una matriz opcional
+entidad -> destino (p.ej. Afl_* -> embalse). La memoria es O(tramo + destinos x bloques),
+independiente de cuántos escenarios tenga el cubo.
+Ejecutar:
+    python cubo_escenarios.py
+"""
+from __future__ import annotations
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from calendario import Calendario
+from lector_caso import lee_serie_ancha
+from perfiles_generacion import hash_archivo
+
+RUTA_BASE = Path(__file__).parent.parent.parent
+RUTA_CACHE = RUTA_BASE / "resultados" / "cache_cubos"
+M3S_A_HM3H = 0.0036   # m³/s -> hm³/h
+TRAMO_HORAS = 8760    # horas por tramo al agregar
+LOTE_COLUMNAS = 64    # columnas por lectura al convertir series anchas
+
+
+@dataclass
+class CuboEscenarios:
+    ruta: Path
+    escenarios: List[str]
+    entidades: List[str]
+    tiempo: np.ndarray        # datetime64[ns] (n_horas,)
+    valores: np.ndarray       # float32 (n_escenarios, n_horas, n_entidades), np.memmap de sólo lectura
+    unidad: str = ""
+
+    @property
+    def forma(self):
+        return self.valores.shape
+
+    def indice(self, escenario) -> int:
+        """Posición del escenario (nombre o entero; None: el primero)."""
+        if escenario is None:
+            return 0
+        if isinstance(escenario, (int, np.integer)):
+            return int(escenario)
+        try:
+            return self.escenarios.index(str(escenario))
+        except ValueError:
+            raise KeyError(f"{self.ruta.name}: escenario '{escenario}' inexistente "
+                           f"({len(self.escenarios)} disponibles)") from None
+
+    def escenario(self, escenario=None) -> np.ndarray:
+        """Vista (n_horas, n_entidades) del escenario, sin copiar."""
+        return self.valores[self.indice(escenario)]
+
+    def columnas(self, nombres: Sequence[str]) -> np.ndarray:
+        pos = {n: i for i, n in enumerate(self.entidades)}
+        return np.array([pos.get(n, -1) for n in nombres], dtype=np.int64)
+
+    def agrega(self, bloque_hora: np.ndarray, n_bloques: int, escenario=None, W=None,
+               tramo: int = TRAMO_HORAS) -> np.ndarray:
+        """
+        Suma por bloque del escenario: (n_destinos, n_bloques) con W (n_entidades, n_destinos)
+        densa o dispersa, o (n_entidades, n_bloques) sin W. bloque_hora: id de bloque de cada
+        hora del cubo (-1 fuera del calendario). NaN no suma. Se recorre por tramos de horas.
+        """
+        X = self.escenario(escenario)
+        n_h, n_e = X.shape
+        if W is not None:
+            W = sparse.csr_matrix(W, dtype=np.float64)
+        n_d = n_e if W is None else W.shape[1]
+        out = np.zeros((n_bloques, n_d))
+        b = np.asarray(bloque_hora, dtype=np.int64)
+        for i0 in range(0, n_h, tramo):
+            bb = b[i0:i0 + tramo]
+            ok = np.flatnonzero(bb >= 0)
+            if not len(ok):
+                continue
+            v = np.nan_to_num(np.asarray(X[i0 + ok[0]: i0 + ok[-1] + 1], dtype=np.float64))[ok - ok[0]]
+            if W is not None:
+                v = np.asarray(W.T @ v.T).T if W.nnz else np.zeros((len(ok), n_d))
+            S = sparse.csr_matrix((np.ones(len(ok)), (bb[ok], np.arange(len(ok)))), shape=(n_bloques, len(ok)))
+            out += S @ v
+        return out.T
+
+    def agrega_calendario(self, cal: Calendario, escenario=None, W=None) -> np.ndarray:
+        return self.agrega(cal.bloque_de(self.tiempo), cal.n_bloques, escenario, W)
+
+
+# ===== Escritura / apertura =====
+def abre_cubo(ruta: Path) -> Optional[CuboEscenarios]:
+    ruta = Path(ruta)
+    f_meta = ruta / "meta.json"
+    if not f_meta.exists():
+        return None
+    meta = json.loads(f_meta.read_text())
+    valores = np.memmap(ruta / "valores.f32", dtype=np.float32, mode="r", shape=tuple(meta["forma"]))
+    return CuboEscenarios(ruta=ruta, escenarios=meta["escenarios"], entidades=meta["entidades"],
+                          tiempo=np.load(ruta / "tiempo.npy"), valores=valores, unidad=meta.get("unidad", ""))
+
+
+class _Escritor:
+    """Carpeta temporal con el memmap de escritura; cierra renombrando a la carpeta final."""
+
+    def __init__(self, ruta: Path):
+        self.ruta = Path(ruta)
+        self.tmp = self.ruta.with_name(f".{self.ruta.name}.{os.getpid()}.tmp")
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        self.tmp.mkdir(parents=True)
+        self.mm = None
+
+    def reserva(self, forma, dtype=np.float32) -> np.ndarray:
+        self.mm = np.memmap(self.tmp / "valores.f32", dtype=np.float32, mode="w+", shape=tuple(forma))
+        self.mm[:] = np.nan
+        return self.mm
+
+    def cierra(self, escenarios, entidades, tiempo, unidad: str, origen: Sequence[Path]) -> CuboEscenarios:
+        self.mm.flush()
+        forma = list(self.mm.shape)
+        del self.mm
+        np.save(self.tmp / "tiempo.npy", np.asarray(tiempo, dtype="datetime64[ns]"))
+        (self.tmp / "meta.json").write_text(json.dumps({
+            "escenarios": [str(e) for e in escenarios], "entidades": [str(e) for e in entidades],
+            "forma": forma, "unidad": unidad, "origen": [Path(o).name for o in origen]}))
+        shutil.rmtree(self.ruta, ignore_errors=True)
+        os.replace(self.tmp, self.ruta)
+        return abre_cubo(self.ruta)
+
+
+def _ruta(dir_cache: Path, tipo: str, *partes) -> Path:
+    return Path(dir_cache) / f"{tipo}_{'_'.join(str(p)[:16] for p in partes)}"
+
+
+def cubo_serie_ancha(ruta_csv: Path, tipo: str, prefijo: Optional[str] = None, factor: float = 1.0,
+                     unidad: str = "", dir_cache: Path = RUTA_CACHE, lote: int = LOTE_COLUMNAS) -> CuboEscenarios:
+    """Serie ancha (time, [scenario], columnas) -> cubo; las horas faltantes de un escenario quedan NaN."""
+    ruta = _ruta(dir_cache, tipo, hash_archivo(ruta_csv), prefijo or "", factor)
+    cubo = abre_cubo(ruta)
+    if cubo is not None:
+        return cubo
+    ids = lee_serie_ancha(ruta_csv, columnas=[])
+    cols = [c.strip() for c in pd.read_csv(ruta_csv, nrows=0).columns if c.strip() not in ("time", "scenario")]
+    if prefijo is not None:
+        cols = [c for c in cols if c.startswith(prefijo)]
+    esc = ids["scenario"].astype(str).to_numpy() if "scenario" in ids.columns else np.full(len(ids), "")
+    cod_esc, escenarios = pd.factorize(esc)
+    t = ids["time"].to_numpy("datetime64[ns]")
+    tiempo = np.unique(t)
+    fila = np.searchsorted(tiempo, t)
+    esc_ = _Escritor(ruta)
+    mm = esc_.reserva((len(escenarios), len(tiempo), len(cols)))
+    for j0 in range(0, len(cols), lote):
+        sub = cols[j0:j0 + lote]
+        v = lee_serie_ancha(ruta_csv, columnas=sub, float_dtype="float32")[sub].to_numpy(np.float32)
+        if factor != 1.0:
+            v *= np.float32(factor)
+        mm[cod_esc, fila, j0:j0 + len(sub)] = v
+    return esc_.cierra(escenarios, cols, tiempo, unidad, [ruta_csv])
+
+
+def cubo_inflows(ruta_wide: Path, units: str = "m3s", dir_cache: Path = RUTA_CACHE) -> CuboEscenarios:
+    """Afluencias de todas las hidrologías (hm3/h)."""
+    factor = M3S_A_HM3H if units.lower() == "m3s" else 1.0
+    return cubo_serie_ancha(ruta_wide, "inflows", factor=factor, unidad="hm3/h", dir_cache=dir_cache)
+
+
+def cubo_perfiles(ruta: Path, dir_cache: Path = RUTA_CACHE) -> CuboEscenarios:
+    """Perfiles Profile_* de todos los escenarios (p.u.)."""
+    return cubo_serie_ancha(ruta, "perfiles", prefijo="Profile_", unidad="p.u.", dir_cache=dir_cache)
+
+
+def cubo_demanda(ruta_demanda_base: Path, ruta_factor: Path, por_barra: bool = False,
+                 dir_cache: Path = RUTA_CACHE) -> CuboEscenarios:
+    """Demanda proyectada (MW) de todos los escenarios: por barra o total (entidad 'MW_total')."""
+    from demanda_proyectada import proyecta_demanda
+
+    ruta = _ruta(dir_cache, "demanda", hash_archivo(ruta_demanda_base), hash_archivo(ruta_factor),
+                 "barra" if por_barra else "total")
+    cubo = abre_cubo(ruta)
+    if cubo is not None:
+        return cubo
+    esc_ = _Escritor(ruta)
+    reserva: Callable = lambda forma, dtype: esc_.reserva(forma)[...] if len(forma) == 3 \
+        else esc_.reserva(tuple(forma) + (1,))[..., 0]
+    proy = proyecta_demanda(ruta_demanda_base, ruta_factor, por_barra=por_barra, reserva=reserva)
+    return esc_.cierra(proy.escenarios, proy.barras if por_barra else ["MW_total"], proy.tiempo, "MW",
+                       [ruta_demanda_base, ruta_factor])
+
+
+def matriz_destinos(cubo: CuboEscenarios, arcos, destinos: Sequence[str]) -> sparse.csr_matrix:
+    """(n_entidades, n_destinos) con 1 en cada arco entidad -> destino (varias entidades por destino)."""
+    pos_d = {d: i for i, d in enumerate(destinos)}
+    pos_e = {e: i for i, e in enumerate(cubo.entidades)}
+    arcos = [(pos_e[a], pos_d[d]) for a, d in arcos if a in pos_e and d in pos_d]
+    arcos = list(dict.fromkeys(arcos))
+    i, j = (np.array(x, dtype=np.int64) for x in zip(*arcos)) if arcos else (np.empty(0, np.int64),) * 2
+    return sparse.csr_matrix((np.ones(len(i)), (i, j)), shape=(len(cubo.entidades), len(destinos)))
+
+
+if __name__ == "__main__":
+    import resource
+    import time
+    import mvp_expansion as mx
+    from lector_caso import lee_calendario
+
+    stages, blocks = lee_calendario(mx.STAGES_CSV, mx.BLOCKS_CSV)
+    cal = Calendario.desde_tablas(stages, blocks)
+    for nombre, crea in (("demanda", lambda: cubo_demanda(mx.DEMANDA_BASE, mx.DEMANDA_FACTOR)),
+                         ("perfiles", lambda: cubo_perfiles(mx.PERFILES_CSV)),
+                         ("inflows", lambda: cubo_inflows(mx.RUTA_INFLOWS_QM3))):
+        try:
+            t0 = time.perf_counter()
+            cubo = crea()
+            t1 = time.perf_counter()
+            agg = cubo.agrega_calendario(cal)
+            t2 = time.perf_counter()
+        except FileNotFoundError as e:
+            print(f"[{nombre}] sin archivo: {e}")
+            continue
+        print(f"[{nombre}] {cubo.forma} ({cubo.valores.nbytes / 2**20:,.0f} MB en disco) abierto en "
+              f"{t1 - t0:.2f} s, agregado a {agg.shape} en {t2 - t1:.2f} s")
+    print(f"RSS pico: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.0f} MB")
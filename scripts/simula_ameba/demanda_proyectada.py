@@ -1,105 +1,143 @@
 # -*- coding: utf-8 -*-
+import numpy as np
 import pandas as pd
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable, List, Optional
 
-#def project_demanda(ruta_base: Path):
-def project_demanda(ruta_demanda_base: Path,ruta_factor: Path, registro: bool ):
-    """
-    Ejecuta la proyección de demanda con la misma lógica del script compartido.
-    Devuelve (ruta_out, dataframe_out) donde ruta_out es el CSV escrito.
-    """
-    # ================================
-    # Cargar datos
-    # ================================
-
+from lector_caso import format_time, lee_serie_ancha
 
-    demanda_base = pd.read_csv(ruta_demanda_base, sep=",", encoding="utf-8")
-    factor       = pd.read_csv(ruta_factor, sep=",", encoding="utf-8")
+RUTA_SALIDA = Path(__file__).parent.parent.parent / "resultados" / "demanda_proyectada_ameba.csv"
 
-    # ================================
-    # Normalización de columnas y tipos
-    # ================================
-    demanda_base["anio_base"] = demanda_base["time"].str.split("-").str[0].astype(int)
-    factor["anio"]            = factor["time"].str.split("-").str[0].astype(int)
 
-    # Limpia prefijos
-    demanda_base.columns = demanda_base.columns.str.replace(r"^L_", "", regex=True)
-    factor.columns       = factor.columns.str.replace(r"^Proj_", "", regex=True)
+@dataclass
+class ProyeccionDemanda:
+    tiempo: np.ndarray        # datetime64[ns] (n_horas,) horas proyectadas, ordenadas
+    anio: np.ndarray          # int (n_horas,) año objetivo de cada hora
+    barras: List[str]         # barras (sin prefijo L_/Proj_), orden alfabético
+    escenarios: List[str]     # valores de la columna 'scenario' de demand.csv
+    valores: np.ndarray       # (n_esc, n_horas, n_barras) por barra, o (n_esc, n_horas) agregada
 
-    # Parseo de tiempo del año base
-    demanda_base["time_dt"] = pd.to_datetime(demanda_base["time"], format="%Y-%m-%d-%H:%M")
+    @property
+    def por_barra(self) -> bool:
+        return self.valores.ndim == 3
 
-    # Identifica columnas de barras
-    cols_excluir_demanda = {"time", "scenario", "anio_base", "time_dt"}
-    bar_cols_demanda = [c for c in demanda_base.columns if c not in cols_excluir_demanda]
 
-    cols_excluir_factor = {"time", "anio"}
-    bar_cols_factor = [c for c in factor.columns if c not in cols_excluir_factor]
+def proyecta_demanda(ruta_demanda_base: Path, ruta_factor: Path, por_barra: bool = True,
+                     dtype=np.float64, reserva: Optional[Callable] = None) -> ProyeccionDemanda:
+    """
+    Proyección demanda_base (hora x barra) * factor (año x barra) por broadcasting,
+    para todos los escenarios de demand.csv en una sola pasada.
+      - el 29-feb del año base se descarta en años objetivo no bisiestos (máscara de calendario)
+      - por_barra=False suma barras con un producto matricial (no arma el cubo año x hora x barra)
+      - reserva(forma, dtype): arreglo de salida provisto por el llamador (p.ej. un memmap de
+        cubo_escenarios); por defecto np.empty
+    No genera timestamps de texto.
+    """
+    demanda_base = lee_serie_ancha(ruta_demanda_base)
+    factor       = lee_serie_ancha(ruta_factor)
 
-    # Intersección de barras
-    barras = sorted(set(bar_cols_demanda).intersection(set(bar_cols_factor)))
+    # Barras comunes (limpia prefijos L_ / Proj_)
+    col_dem = {c[2:] if c.startswith("L_") else c: c for c in demanda_base.columns if c not in ("time", "scenario")}
+    col_fac = {c[5:] if c.startswith("Proj_") else c: c for c in factor.columns if c not in ("time", "scenario")}
+    barras = sorted(set(col_dem).intersection(col_fac))
     if not barras:
         raise ValueError("No hay barras comunes entre demanda_base y factor.")
 
-    # ================================
-    # Formato largo para cruzar por barra
-    # ================================
-    base_long = (
-        demanda_base[["time_dt", "anio_base"] + barras]
-        .melt(id_vars=["time_dt", "anio_base"], var_name="barra", value_name="demanda_base")
-    )
-
-    factors_long = (
-        factor[["anio"] + barras]
-        .melt(id_vars=["anio"], var_name="barra", value_name="factor")
-    )
-
-    # ================================
-    # Cruce (replica cada hora del año base para todos los años del factor)
-    # ================================
-    df = base_long.merge(factors_long, on="barra", how="inner")
-
-    # ================================
-    # Construir el timestamp proyectado
-    # ================================
-    stamp_tail = df["time_dt"].dt.strftime("%m-%d-%H:%M")
-    df["time_proj_str"] = df["anio"].astype(str) + "-" + stamp_tail
-    df["time_proj"] = pd.to_datetime(df["time_proj_str"], format="%Y-%m-%d-%H:%M", errors="coerce")
-
-    # Descarta fechas inválidas (29-feb no bisiesto)
-    df = df.dropna(subset=["time_proj"]).copy()
-
-    # ================================
-    # Proyección: demanda_base * factor
-    # ================================
-    df["demanda_proj"] = df["demanda_base"] * df["factor"]
-
-    # ================================
-    # Tabla ancha final
-    # ================================
-    out_wide = (
-        df.pivot_table(index="time_proj", columns="barra", values="demanda_proj", aggfunc="first")
-        .sort_index()
-        .reset_index()
-    )
-
-    # Año objetivo y columna time
-    out_wide["anio_objetivo"] = out_wide["time_proj"].dt.year
-    out_wide["time"] = out_wide["time_proj"].dt.strftime("%Y-%m-%d-%H:%M")
-
-    # Reordenar columnas
-    cols_finales = ["time", "anio_objetivo"] + [c for c in out_wide.columns if c not in {"time", "anio_objetivo", "time_proj"}]
-    out_wide = out_wide[cols_finales]
-    out_wide = out_wide.drop(columns={"anio_objetivo"})
-
-    # Guardar CSV consolidado
-    ruta_base = Path(__file__).parent.parent.parent
-    ruta_out = ruta_base / "resultados" / "demanda_proyectada_ameba.csv"
+    # Factor: una fila por año objetivo (la primera si hubiera varias)
+    anios, i_fac = np.unique(factor["time"].dt.year.to_numpy(), return_index=True)
+    F = factor[[col_fac[b] for b in barras]].to_numpy(dtype=np.float64)[i_fac]        # (n_anios, n_barras)
+
+    # Escenarios del año base
+    if "scenario" in demanda_base.columns:
+        esc_col = demanda_base["scenario"].astype(str).to_numpy()
+    else:
+        esc_col = np.full(len(demanda_base), "", dtype=object)
+    escenarios = list(pd.unique(esc_col))
+
+    bases, t_base = [], None
+    for e in escenarios:
+        sub = demanda_base[esc_col == e].sort_values("time", kind="stable")
+        t_e = sub["time"].to_numpy(dtype="datetime64[ns]")
+        if t_base is None:
+            t_base = t_e
+        elif not np.array_equal(t_base, t_e):
+            raise ValueError(f"El escenario '{e}' no tiene las mismas horas base que '{escenarios[0]}'.")
+        bases.append(sub[[col_dem[b] for b in barras]].to_numpy(dtype=np.float64))      # (n_h, n_barras)
+
+    # Calendario proyectado: mismo mes/día/hora del año base en cada año objetivo
+    tb = pd.DatetimeIndex(t_base)
+    mes, dia = tb.month.to_numpy(), tb.day.to_numpy()
+    minuto = (tb.hour * 60 + tb.minute).to_numpy()
+    meses = ((anios[:, None] - 1970) * 12 + (mes[None, :] - 1)).astype("timedelta64[M]")
+    mes0 = np.datetime64("1970-01", "M") + meses                                         # (n_anios, n_h)
+    fecha = mes0.astype("datetime64[D]") + (dia[None, :] - 1).astype("timedelta64[D]")
+    valido = (fecha.astype("datetime64[M]") == mes0).ravel()                             # 29-feb no bisiesto
+    tiempo = (fecha.astype("datetime64[m]") + minuto[None, :].astype("timedelta64[m]")).ravel()[valido]
+    anio = np.repeat(anios, len(t_base))[valido]
+
+    n_ht = int(valido.sum())
+    reserva = reserva or np.empty
+    if por_barra:
+        valores = reserva((len(escenarios), n_ht, len(barras)), dtype)
+        for i, B in enumerate(bases):
+            cubo = B[None, :, :] * F[:, None, :]                                          # (n_anios, n_h, n_barras)
+            valores[i] = cubo.reshape(-1, len(barras))[valido]
+    else:
+        valores = reserva((len(escenarios), n_ht), dtype)
+        for i, B in enumerate(bases):
+            valores[i] = (np.nan_to_num(B) @ F.T).T.ravel()[valido]                      # (n_anios*n_h,)
+
+    return ProyeccionDemanda(tiempo=tiempo.astype("datetime64[ns]"), anio=anio, barras=barras,
+                             escenarios=escenarios, valores=valores)
+
+
+def _tabla_ancha(proy: ProyeccionDemanda, sl: slice = slice(None), escenario: Optional[int] = None) -> pd.DataFrame:
+    """Tabla ancha (time, [scenario], barras...) para un rango de horas."""
+    esc = range(len(proy.escenarios)) if escenario is None else [escenario]
+    partes = []
+    for i in esc:
+        df = pd.DataFrame(proy.valores[i, sl], columns=pd.Index(proy.barras, name="barra"))
+        if escenario is None and len(proy.escenarios) > 1:
+            df.insert(0, "scenario", proy.escenarios[i])
+        df.insert(0, "time", format_time(proy.tiempo[sl]))
+        partes.append(df)
+    return pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+
+
+def escribe_demanda_csv(proy: ProyeccionDemanda, ruta_out: Path = RUTA_SALIDA) -> Path:
+    """Escribe el CSV consolidado por tramos (escenario, año), sin armar la tabla completa."""
+    if not proy.por_barra:
+        raise ValueError("escribe_demanda_csv requiere la proyección por barra.")
+    ruta_out = Path(ruta_out)
     ruta_out.parent.mkdir(parents=True, exist_ok=True)
-    if registro == True:
-        out_wide.to_csv(ruta_out, index=False, encoding="utf-8")
+    cortes = np.flatnonzero(np.diff(proy.anio)) + 1
+    tramos = np.split(np.arange(len(proy.anio)), cortes)
+    multi = len(proy.escenarios) > 1
+    with open(ruta_out, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(["time"] + (["scenario"] if multi else []) + proy.barras) + "\n")
+        for i in range(len(proy.escenarios)):
+            for tr in tramos:
+                if not len(tr):
+                    continue
+                df = _tabla_ancha(proy, slice(tr[0], tr[-1] + 1), escenario=i)
+                if multi:
+                    df.insert(1, "scenario", proy.escenarios[i])
+                df.to_csv(f, index=False, header=False)
+    return ruta_out
+
 
-    return out_wide
+#def project_demanda(ruta_base: Path):
+def project_demanda(ruta_demanda_base: Path,ruta_factor: Path, registro: bool ):
+    """
+    Ejecuta la proyección de demanda con la misma lógica del script compartido.
+    Devuelve el dataframe ancho (time, barras...); si registro=True además escribe
+    resultados/demanda_proyectada_ameba.csv. Con varios escenarios agrega la columna 'scenario'.
+    """
+    proy = proyecta_demanda(ruta_demanda_base, ruta_factor, por_barra=True)
+    if registro == True:
+        escribe_demanda_csv(proy, RUTA_SALIDA)
+    return _tabla_ancha(proy)
 
 if __name__ == "__main__":
     base = Path(__file__).parent.parent.parent
@@ -107,4 +145,4 @@ if __name__ == "__main__":
     ruta_factor  = base / "data" / "demanda" / "factor.csv"
     out_wide = project_demanda(ruta_demanda, ruta_factor, registro=True)
     print(out_wide.head())
-    print(f"[OK] Archivo generado")
\ No newline at end of file
+    print(f"[OK] Archivo generado")
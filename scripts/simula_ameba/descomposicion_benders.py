@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""
+Descomposición de Benders: inversión (maestro) / operación por stage (subproblemas)
+------------------------------------------------------------------------------------
+Maestro (HiGHS persistente, se le agregan cortes con addRow):
+    min  sum_y df_y (cinv x + cfix K)  +  sum_y theta_y      (multi-corte)
+                                       +  theta              (corte único)
+    s.a. CapEvol, x <= kbar, vmin <= Vb[r,y] <= vmax, Vb[:, último] = vend, theta >= 0
+  Vb[r,y] = volumen del embalse r al final del stage y (frontera entre stages).
+Subproblema y (mismo LP de build_lp con un solo stage, K fijo vía K0 y kbar = 0):
+  despacho, balance hídrico, ROR y ENS de los bloques del stage; vini = Vb[:, y-1],
+  V del último bloque = Vb[:, y] con desvíos penalizados (recurso completo).
+  Q_y y sus subgradientes salen de los duales de CapEvol (K), VolBalance del 1er bloque
+  (vini) y VolTerminal (volumen final).
+Los subproblemas se resuelven en paralelo (pool de procesos, arrays comunes en memoria
+compartida); cada worker mantiene una SesionExpansion por stage, así cada iteración sólo
+empuja K0/vini/vend y re-resuelve en caliente.
+Convergencia: LB = objetivo del maestro, UB = costo de inversión + sum Q_y en el punto
+de prueba; se detiene cuando (UB - LB) / |UB| <= tol.
+"""
+from __future__ import annotations
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+from scipy import sparse
+
+from backend_matricial import (HAY_HIGHSPY, ModeloLP, _arr_ety, _arr_ty, agrega_columnas, build_lp,
+                               depura_formulacion)
+from escenarios_hidrologicos import adjunta, libera, publica
+from sesion_persistente import SesionExpansion
+
+if HAY_HIGHSPY:
+    import highspy
+
+
+@dataclass
+class ResultadoBenders:
+    estado: str                          # "convergido" | "max_iter"
+    objetivo: float                      # UB (costo del mejor plan encontrado)
+    cota_inferior: float
+    Y_list: List[int]
+    techs: List[str]
+    x: np.ndarray                        # (techs, stages)
+    K: np.ndarray                        # (techs, stages)
+    Vb: np.ndarray                       # (embalses, stages) volumen al final de cada stage
+    historial: List[dict] = field(default_factory=list)
+
+    @property
+    def gap(self) -> float:
+        return (self.objetivo - self.cota_inferior) / max(abs(self.objetivo), 1e-12)
+
+
+# ===== Subproblema =====
+def agrega_desvio_terminal(lp: ModeloLP, penalizacion: float) -> ModeloLP:
+    """Agrega la familia 'Desvio' (2R,): V_fin + d+ - d- = vend, con costo df * penalizacion."""
+    off, (nR,) = lp.fila["VolTerminal"]
+    filas = off + np.tile(np.arange(nR), 2)
+    coef = np.r_[np.ones(nR), -np.ones(nR)]
+    return agrega_columnas(lp, "Desvio", np.full(2 * nR, lp.param["df"][0] * penalizacion), 0.0, np.inf,
+                           filas=(filas, np.arange(2 * nR)), coef=coef)
+
+
+_W: dict = {}
+
+
+def _init_worker(meta, base, threads_solver):
+    bloques, arrays = adjunta(meta)
+    _W.update(bloques=bloques, arrays=arrays, base=base, threads=threads_solver, sesiones={})
+
+
+def _sesion_stage(j: int) -> SesionExpansion:
+    ses = _W["sesiones"].get(j)
+    if ses is not None:
+        return ses
+    a = _W["arrays"]
+    (Y_list, T_by_Y, techs, cvar, hydro, kw, penalizacion, solver_name, cotas) = _W["base"]
+    y = Y_list[j]
+    b0, b1 = int(a["ini_y"][j]), int(a["ini_y"][j + 1])
+    cero = {(g, y): 0.0 for g in techs}
+    hyd = dict(hydro, I_nat=a["I_res"][:, b0:b1], I_nat_ror=a["I_ror"][:, b0:b1])
+    lp = build_lp([y], {y: T_by_Y[y]}, a["alpha"][b0:b1], a["D"][b0:b1], techs,
+                  {g: a["AF"][i, b0:b1] for i, g in enumerate(techs)}, dict.fromkeys(techs, 0.0),
+                  cero, cero, {(g, y): cvar[(g, y)] for g in techs}, cero, hyd, **kw)
+    if cotas:
+        lp, _ = depura_formulacion(lp)
+    ses = _W["sesiones"][j] = SesionExpansion(agrega_desvio_terminal(lp, penalizacion), solver_name,
+                                              threads=_W["threads"])
+    return ses
+
+
+def _resuelve_stages(trabajo: list) -> list:
+    """trabajo: [(j, K_y (G,), v_ini (R,), v_fin (R,))] -> [(j, Q, dQ/dK, dQ/dv_ini, dQ/dv_fin)]"""
+    out = []
+    for j, K_y, v_ini, v_fin in trabajo:
+        ses = _sesion_stage(j)
+        lp = ses.lp
+        ses.actualiza(K0=np.asarray(K_y), vini=np.asarray(v_ini), vend=np.asarray(v_fin))
+        res = ses.resuelve()
+        if res.estado != "Optimal":
+            raise RuntimeError(f"Benders: subproblema del stage {lp.Y_list[0]} terminó en '{res.estado}'.")
+        dK = res.dual("CapEvol")[:, 0]
+        dv0 = res.dual("VolBalance")[:, 0] if len(lp.R) else np.zeros(0)
+        dv1 = res.dual("VolTerminal")
+        out.append((j, res.objetivo, dK, dv0, dv1))
+    return out
+
+
+# ===== Maestro =====
+class _Maestro:
+    def __init__(self, Y_list, techs, R, K0, cinv, cfix, Knew_bar, vmin, vmax, vend, r, multicorte, threads,
+                 escala: float = 1e-6):
+        nG, nY, nR = len(techs), len(Y_list), len(R)
+        self.escala = escala      # el maestro trabaja en millones de $ (mejor condicionamiento)
+        self.nG, self.nY, self.nR = nG, nY, nR
+        self.n_theta = nY if multicorte else 1
+        df = np.array([1.0 / ((1.0 + r) ** (y - 1)) for y in Y_list])
+        mat = lambda d: np.array([[d[(g, y)] for y in Y_list] for g in techs], dtype=np.float64).reshape(nG, nY)
+
+        # columnas: x (G,Y) | K (G,Y) | Vb (R,Y) | theta
+        self.ox, self.oK, self.oV = 0, nG * nY, 2 * nG * nY
+        self.oT = self.oV + nR * nY
+        n = self.oT + self.n_theta
+        c = np.r_[(df * mat(cinv)).ravel(), (df * mat(cfix)).ravel(), np.zeros(nR * nY), np.ones(self.n_theta)]
+        c[:self.oV] *= escala
+        lo, up = np.zeros(n), np.full(n, np.inf)
+        up[:nG * nY] = mat(Knew_bar).ravel()
+        vlo = np.repeat(vmin[:, None], nY, axis=1)
+        vup = np.repeat(vmax[:, None], nY, axis=1)
+        if nY:
+            vlo[:, -1] = vup[:, -1] = vend
+        lo[self.oV:self.oT], up[self.oV:self.oT] = vlo.ravel(), vup.ravel()
+
+        # CapEvol: K[g,y] - K[g,y-1] - x[g,y] = K0 (y = 0) / 0
+        g, y = np.divmod(np.arange(nG * nY), nY)
+        I = np.r_[np.arange(nG * nY), np.arange(nG * nY), np.flatnonzero(y > 0)]
+        J = np.r_[self.oK + np.arange(nG * nY), self.ox + np.arange(nG * nY),
+                  self.oK + np.flatnonzero(y > 0) - 1]
+        V = np.r_[np.ones(nG * nY), -np.ones(nG * nY), -np.ones(int((y > 0).sum()))]
+        A = sparse.csc_matrix((V, (I, J)), shape=(nG * nY, n))
+        rhs = np.where(y == 0, np.asarray([K0[t] for t in techs], dtype=np.float64)[g], 0.0)
+
+        lp = highspy.HighsLp()
+        lp.num_col_, lp.num_row_ = n, nG * nY
+        lp.col_cost_, lp.col_lower_, lp.col_upper_ = c, lo, up
+        lp.row_lower_, lp.row_upper_ = rhs, rhs
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_, lp.a_matrix_.index_, lp.a_matrix_.value_ = A.indptr, A.indices, A.data
+        self.h = highspy.Highs()
+        self.h.setOptionValue("output_flag", False)
+        if threads is not None:
+            self.h.setOptionValue("threads", int(threads))
+        self.h.passModel(lp)
+        self.c_inv = c[:self.oV] / escala
+
+    def resuelve(self):
+        self.h.run()
+        estado = self.h.modelStatusToString(self.h.getModelStatus())
+        if estado != "Optimal":
+            # la base acumulada con muchos cortes puede quedar mal condicionada: se resuelve en frío
+            self.h.clearSolver()
+            self.h.run()
+            estado = self.h.modelStatusToString(self.h.getModelStatus())
+        if estado != "Optimal":
+            raise RuntimeError(f"Benders: el maestro terminó en '{estado}'.")
+        z = np.asarray(self.h.getSolution().col_value)
+        x = z[self.ox:self.oK].reshape(self.nG, self.nY)
+        K = z[self.oK:self.oV].reshape(self.nG, self.nY)
+        Vb = z[self.oV:self.oT].reshape(self.nR, self.nY)
+        obj = float(self.h.getInfo().objective_function_value) / self.escala
+        return obj, x, K, Vb, float(self.c_inv @ z[:self.oV])
+
+    def agrega_cortes(self, cortes: list, K: np.ndarray, Vb: np.ndarray):
+        """cortes: [(j, Q, dK, dv0, dv1)]; multi-corte: uno por stage, corte único: la suma."""
+        filas = []
+        for j, Q, dK, dv0, dv1 in cortes:
+            cols = [self.oK + np.arange(self.nG) * self.nY + j, self.oV + np.arange(self.nR) * self.nY + j]
+            coef = [-dK, -dv1]
+            pto = Q - dK @ K[:, j] - dv1 @ Vb[:, j]
+            if j > 0:
+                cols.append(self.oV + np.arange(self.nR) * self.nY + j - 1)
+                coef.append(-dv0)
+                pto -= dv0 @ Vb[:, j - 1]
+            filas.append((j, np.concatenate(cols), np.concatenate(coef), pto))
+
+        if self.n_theta == 1:
+            cols = np.concatenate([f[1] for f in filas])
+            coef = np.concatenate([f[2] for f in filas])
+            M = sparse.csr_matrix((coef, (np.zeros_like(cols), cols)), shape=(1, self.oT)).tocoo()
+            filas = [(0, M.col, M.data, sum(f[3] for f in filas))]
+
+        for j, cols, coef, pto in filas:
+            keep = coef != 0.0
+            idx = np.r_[cols[keep], self.oT + j].astype(np.int32)
+            val = np.r_[coef[keep] * self.escala, 1.0]
+            self.h.addRow(pto * self.escala, np.inf, len(idx), idx, val)
+
+
+# ===== Orquestador =====
+def resuelve_benders(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, Knew_bar, hydro,
+                     r: float = 0.08, multicorte: bool = True, tol: float = 1e-4, max_iter: int = 100,
+                     max_workers: Optional[int] = None, threads_solver: int = 1,
+                     solver_name: str = "appsi_highs", penalizacion_vol: Optional[float] = None,
+                     cotas: bool = False, **kw) -> ResultadoBenders:
+    """
+    Misma firma que build_lp más las opciones de Benders. kw: c_ens, bigm_slack, kappa_default.
+    penalizacion_vol: $/hm3 por desvío del volumen de frontera (por defecto una cota del valor
+    del agua: 10 * c_ens * (1 + sum kappa + sum kappa_ror), de modo que el desvío sea 0 en el óptimo).
+    cotas=True: subproblemas armados con depura_formulacion (filas de una variable como cotas).
+    """
+    if "highs" not in solver_name.lower():
+        raise ValueError(f"resuelve_benders: solver '{solver_name}' no soportado (sólo HiGHS).")
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    nY, nTY, nG = len(Y_list), len(TY), len(techs)
+    R, ROR = list(hydro["R"]), list(hydro.get("ROR", []))
+    kappa_default = kw.get("kappa_default", 1.0)
+    hv = lambda key, ents, default: np.array([float(hydro.get(key, {}).get(e, default)) for e in ents])
+    vmin, vmax, vini, vend = hv("vmin", R, 0.0), hv("vmax", R, 0.0), hv("vini", R, 0.0), hv("vend", R, 0.0)
+    if penalizacion_vol is None:
+        kap = hv("kappa", R, kappa_default).sum() + hv("kappa_ror", ROR, kappa_default).sum()
+        penalizacion_vol = 10.0 * kw.get("c_ens", 4000.0) * (1.0 + kap)
+
+    arrays = {
+        "alpha": _arr_ty(alpha, TY), "D": _arr_ty(D, TY),
+        "AF": np.array([_arr_ty(AF[g], TY) for g in techs]).reshape(nG, nTY),
+        "I_res": _arr_ety(hydro["I_nat"], R, TY), "I_ror": _arr_ety(hydro.get("I_nat_ror", {}), ROR, TY),
+        "ini_y": np.cumsum([0] + [len(T_by_Y[y]) for y in Y_list]).astype(np.int64),
+    }
+    hydro_base = {k: v for k, v in hydro.items() if k not in ("I_nat", "I_nat_ror")}
+    base = (list(Y_list), T_by_Y, list(techs), cvar, hydro_base, dict(kw, r=r), penalizacion_vol, solver_name,
+            cotas)
+
+    maestro = _Maestro(Y_list, techs, R, K0, cinv, cfix, Knew_bar, vmin, vmax, vend, r, multicorte,
+                       threads_solver)
+    max_workers = max_workers or max(1, (os.cpu_count() or 1) // max(1, threads_solver))
+    n_lotes = min(nY, 4 * max_workers)
+    lotes = [l for l in np.array_split(np.arange(nY), n_lotes) if len(l)]
+
+    # punto de prueba inicial: sin inversión, volúmenes en su valor inicial
+    K = np.repeat(np.asarray([K0[g] for g in techs], dtype=np.float64)[:, None], nY, axis=1)
+    x = np.zeros((nG, nY))
+    Vb = np.clip(np.repeat(vini[:, None], nY, axis=1), vmin[:, None], vmax[:, None])
+    if nY:
+        Vb[:, -1] = vend
+    c_inv_ptr = maestro.c_inv @ np.r_[x.ravel(), K.ravel()]
+
+    LB, UB, mejor, historial, estado = -np.inf, np.inf, None, [], "max_iter"
+    bloques, meta = publica(arrays)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(meta, base, threads_solver)) as pool:
+            for it in range(1, max_iter + 1):
+                t0 = time.perf_counter()
+                trabajo = [[(int(j), K[:, j], vini if j == 0 else Vb[:, j - 1], Vb[:, j]) for j in lote]
+                           for lote in lotes]
+                cortes = [c for parte in pool.map(_resuelve_stages, trabajo) for c in parte]
+                t_sub = time.perf_counter() - t0
+
+                ub = c_inv_ptr + sum(cq[1] for cq in cortes)
+                if ub < UB:
+                    UB, mejor = ub, (x.copy(), K.copy(), Vb.copy())
+                maestro.agrega_cortes(cortes, K, Vb)
+                LB, x, K, Vb, c_inv_ptr = maestro.resuelve()
+                gap = (UB - LB) / max(abs(UB), 1e-12)
+                historial.append({"iteracion": it, "LB": LB, "UB": UB, "gap": gap,
+                                  "t_sub": t_sub, "t_total": time.perf_counter() - t0})
+                print(f"[Benders] it={it:3d}  LB={LB:,.0f}  UB={UB:,.0f}  gap={100 * gap:.4f}%")
+                if gap <= tol:
+                    estado = "convergido"
+                    break
+    finally:
+        libera(bloques)
+
+    x, K, Vb = mejor
+    return ResultadoBenders(estado=estado, objetivo=UB, cota_inferior=LB, Y_list=list(Y_list),
+                            techs=list(techs), x=x, K=K, Vb=Vb, historial=historial)
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+Corrida de expansión para todas las hidrologías del archivo de inflows
+-----------------------------------------------------------------------
+1) Lee el archivo ancho de inflows UNA vez y agrega todas las hidrologías a bloques
+   en una sola pasada (producto Afl_* -> destino + un bincount por (hidrología, destino, bloque)).
+2) Publica en memoria compartida (sólo lectura) los arrays comunes: alpha, demanda por bloque
+   e inflows por bloque de todas las hidrologías. Los workers se adjuntan sin copiar.
+   Con mvp_expansion.CUBOS las afluencias no pasan por memoria: cada worker agrega su
+   hidrología directo desde el cubo memmap (cubo_escenarios), por tramos de horas, de modo
+   que la memoria no crece con el número de hidrologías.
+3) Despacha una resolución (backend matricial + HiGHS) por hidrología a un pool de procesos,
+   con tope de hilos del solver por worker.
+4) Junta en una tabla: costo total, K, x y ENS por stage para cada hidrología.
+Ejecutar:
+    python escenarios_hidrologicos.py
+"""
+from __future__ import annotations
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from calendario import Calendario
+from lector_caso import lee_serie_ancha
+from backend_matricial import build_lp, resuelve_lp
+from cubo_escenarios import abre_cubo, cubo_inflows, matriz_destinos
+
+M3S_A_HM3H = 0.0036   # m³/s -> hm³/h
+
+
+def inflows_por_bloque(ruta_wide: Path, cal: Calendario, arcos_inflow: List[Tuple[str, str]],
+                       destinos: List[str], hidrologias: Optional[List[str]] = None,
+                       units: str = "m3s") -> Tuple[List[str], np.ndarray]:
+    """
+    Agrega todas las hidrologías a bloques en una pasada.
+      - arcos_inflow: pares (Afl_*, destino) de HydroConnection (destino Emb_* o HG_*)
+    Devuelve (hidrologias, cubo) con cubo (n_hid, n_destinos, n_bloques) en hm3 por bloque.
+    """
+    df = lee_serie_ancha(ruta_wide)
+    pos_dst = {d: i for i, d in enumerate(destinos)}
+    arcos = [(a, d) for (a, d) in arcos_inflow if d in pos_dst and a in df.columns]
+    afl = list(dict.fromkeys(a for a, _ in arcos))
+
+    esc = df["scenario"].astype(str).to_numpy() if "scenario" in df.columns else np.full(len(df), "")
+    cod_esc, nombres = pd.factorize(esc)
+    nombres = [str(n) for n in nombres]
+    if hidrologias is not None:
+        faltan = [h for h in hidrologias if h not in nombres]
+        if faltan:
+            raise KeyError(f"Hidrologías inexistentes en {Path(ruta_wide).name}: {faltan}")
+        remap = np.array([hidrologias.index(n) if n in hidrologias else -1 for n in nombres])
+        cod_esc, nombres = remap[cod_esc], list(hidrologias)
+
+    # Afl_* -> destino como matriz (n_afl, n_dst): varias afluencias pueden llegar al mismo destino
+    pos_afl = {a: i for i, a in enumerate(afl)}
+    W = np.zeros((len(afl), len(destinos)))
+    W[[pos_afl[a] for a, _ in arcos], [pos_dst[d] for _, d in arcos]] = 1.0
+    q = np.nan_to_num(df[afl].to_numpy(dtype=np.float64)) @ W                    # (n_filas, n_dst)
+    if units.lower() == "m3s":
+        q *= M3S_A_HM3H
+
+    b = cal.bloque_de(df["time"].to_numpy())
+    ok = (b >= 0) & (cod_esc >= 0)
+    nb, nd, ne = cal.n_bloques, len(destinos), len(nombres)
+    ids = (cod_esc[ok, None] * nd + np.arange(nd)[None, :]) * nb + b[ok, None]
+    cubo = np.bincount(ids.ravel(), weights=q[ok].ravel(), minlength=ne * nd * nb)
+    return nombres, cubo.reshape(ne, nd, nb)
+
+
+# ===== Memoria compartida =====
+def publica(arrays: Dict[str, np.ndarray]):
+    """Copia cada array a un bloque de memoria compartida. Devuelve (bloques, meta)."""
+    bloques, meta = [], {}
+    for k, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        shm = shared_memory.SharedMemory(create=True, size=max(a.nbytes, 1))
+        np.ndarray(a.shape, dtype=a.dtype, buffer=shm.buf)[...] = a
+        bloques.append(shm)
+        meta[k] = (shm.name, a.shape, a.dtype.str)
+    return bloques, meta
+
+
+def adjunta(meta) -> Tuple[list, Dict[str, np.ndarray]]:
+    """Vistas de sólo lectura sobre los bloques publicados (sin copiar)."""
+    bloques, arrays = [], {}
+    for k, (nombre, shape, dtype) in meta.items():
+        # los workers del pool comparten el resource_tracker del padre: sólo el padre hace unlink
+        shm = shared_memory.SharedMemory(name=nombre)
+        a = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        a.flags.writeable = False
+        bloques.append(shm)
+        arrays[k] = a
+    return bloques, arrays
+
+
+def libera(bloques):
+    for shm in bloques:
+        shm.close()
+        shm.unlink()
+
+
+# ===== Worker =====
+_W: dict = {}
+
+
+def _init_worker(meta, base, threads_solver):
+    bloques, arrays = adjunta(meta)
+    _W.update(bloques=bloques, arrays=arrays, base=base, threads=threads_solver)
+
+
+def _inflows_cubo(nombre: str):
+    """(I_res, I_ror) por bloque de una hidrología, leídos del cubo memmap."""
+    ruta, W, escala, n_res = _W["base"][-1]
+    if "cubo" not in _W:
+        _W["cubo"] = abre_cubo(ruta)
+    I = _W["cubo"].agrega(_W["arrays"]["bloque_hora"], len(_W["arrays"]["alpha"]), nombre, W)
+    return I[:n_res] * escala[:, None], I[n_res:]
+
+
+def _resuelve_hidrologia(i: int, nombre: str) -> pd.DataFrame:
+    a, base = _W["arrays"], _W["base"]
+    (Y_list, T_by_Y, AF, K0, techs, cinv, cfix, cvar, knew, hydro, kw, solver_name, cubo) = base
+    I_res, I_ror = (a["I_res"][i], a["I_ror"][i]) if cubo is None else _inflows_cubo(nombre)
+    hydro = dict(hydro, I_nat=I_res, I_nat_ror=I_ror)
+    lp = build_lp(Y_list, T_by_Y, a["alpha"], a["D"], techs, AF, K0,
+                  cinv, cfix, cvar, knew, hydro, **kw)
+    res = resuelve_lp(lp, solver_name, threads=_W["threads"])
+    return resumen_resultado(res, nombre, a["iy"])
+
+
+def resumen_resultado(res, hidrologia: str, iy: np.ndarray) -> pd.DataFrame:
+    """Una fila por stage: costo total, ENS (MWh), K_<tec> y x_<tec> (MW)."""
+    lp = res.lp
+    ens = np.bincount(iy, weights=res.valor("ens"), minlength=len(lp.Y_list))
+    out = pd.DataFrame({"hidrologia": hidrologia, "stage": lp.Y_list,
+                        "estado": res.estado, "costo_total": res.objetivo, "ens_MWh": ens})
+    K, x = res.valor("K"), res.valor("x")
+    for j, g in enumerate(lp.techs):
+        out[f"K_{g}"] = K[j]
+        out[f"x_{g}"] = x[j]
+    return out
+
+
+# ===== Orquestador =====
+def corre_hidrologias(ruta_inflows: Optional[Path] = None, hidrologias: Optional[List[str]] = None,
+                      max_workers: Optional[int] = None, threads_solver: int = 1,
+                      solver_name: Optional[str] = None) -> pd.DataFrame:
+    """
+    Resuelve la expansión para cada hidrología del archivo de inflows en paralelo.
+      - max_workers: procesos (por defecto núcleos // threads_solver)
+      - threads_solver: hilos de HiGHS por worker
+    """
+    import mvp_expansion as mx
+
+    ruta_inflows = ruta_inflows or mx.RUTA_INFLOWS_QM3
+    solver_name = solver_name or mx.SOLVER_NAME
+    if "highs" not in solver_name.lower():
+        raise ValueError(f"corre_hidrologias: solver '{solver_name}' no soportado (sólo HiGHS).")
+
+    # Base común (sin inflows): calendario, demanda, catálogo/topología hidro, costos
+    inputs, ex = mx.load_inputs(False, escenario=None)
+    cal = inputs.calendario
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro = mx.aggregate_stage_block(inputs, mx.TECHS, ex)
+    cinv, cfix, cvar, knew = mx.build_costs(mx.TECHS, Y_list)
+
+    R, ROR = list(hydro["R"]), list(hydro["ROR"])
+    arcos_inflow = list(ex.get("inflow_to_res", {}).items()) + list(ex.get("inflow_to_hg", {}).items())
+    scale = inputs.reservoirs.drop_duplicates("name").set_index("name")["scale"].fillna(1.0)
+    escala = np.array([float(scale.get(r, 1.0)) for r in R])
+    arrays = {
+        "alpha": cal.alpha, "D": np.fromiter((D[k] for k in cal.TY), float, count=cal.n_bloques),
+        "iy": np.searchsorted(np.asarray(Y_list), cal.stage).astype(np.int64),
+    }
+    if mx.CUBOS:
+        cubo = cubo_inflows(ruta_inflows)
+        nombres = list(hidrologias) if hidrologias is not None else list(cubo.escenarios)
+        for n in nombres:
+            cubo.indice(n)
+        arrays["bloque_hora"] = cal.bloque_de(cubo.tiempo)
+        datos_cubo = (cubo.ruta, matriz_destinos(cubo, arcos_inflow, R + ROR), escala, len(R))
+    else:
+        nombres, cubo = inflows_por_bloque(ruta_inflows, cal, arcos_inflow, R + ROR, hidrologias)
+        arrays.update(I_res=cubo[:, :len(R)] * escala[None, :, None], I_ror=cubo[:, len(R):])
+        datos_cubo = None
+    hydro_base = {k: v for k, v in hydro.items() if k not in ("I_nat", "I_nat_ror")}
+    kw = dict(r=mx.DISCOUNT_R, c_ens=mx.C_ENS, bigm_slack=mx.BIGM_SLACK, kappa_default=mx.KAPPA_DEFAULT)
+    base = (Y_list, T_by_Y, AF, K0, mx.TECHS, cinv, cfix, cvar, knew, hydro_base, kw, solver_name, datos_cubo)
+
+    max_workers = max_workers or max(1, (os.cpu_count() or 1) // max(1, threads_solver))
+    bloques, meta = publica(arrays)
+    partes = []
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(meta, base, threads_solver)) as pool:
+            futs = {pool.submit(_resuelve_hidrologia, i, n): n for i, n in enumerate(nombres)}
+            for fut in as_completed(futs):
+                partes.append(fut.result())
+                print(f"[OK] hidrología {futs[fut]}")
+    finally:
+        libera(bloques)
+
+    out = pd.concat(partes, ignore_index=True)
+    return out.sort_values(["hidrologia", "stage"], kind="stable").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    ruta_base = Path(__file__).parent.parent.parent
+    tabla = corre_hidrologias()
+    ruta_out = ruta_base / "resultados" / "expansion_por_hidrologia.csv"
+    ruta_out.parent.mkdir(parents=True, exist_ok=True)
+    tabla.to_csv(ruta_out, index=False, encoding="utf-8")
+    print(tabla.groupby("hidrologia")["costo_total"].first())
+    print(f"[OK] Archivo generado: {ruta_out}")
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Horizonte rodante para la expansión
+------------------------------------
+En lugar de un único LP con todos los stages, resuelve ventanas solapadas de N stages:
+  - ventana k: stages [s, s+N); se fijan ("comprometen") los primeros N - solape stages
+    (la última ventana compromete todo lo que resta)
+  - V al final del último bloque comprometido -> vini de la ventana siguiente
+  - K del último stage comprometido           -> K0 de la ventana siguiente
+  - VolTerminal sólo se impone en la última ventana
+Cada ventana se arma con stages relativos 1..N (el descuento dentro de la ventana es el
+mismo para todas), así todas las ventanas de igual tamaño comparten estructura y se
+resuelven con una única SesionExpansion (HiGHS persistente, re-solve en caliente):
+entre ventanas sólo se empujan costos, cotas y los coeficientes alpha/AF que cambian.
+El costo de cada ventana se lleva a valor presente con el factor de descuento de su
+primer stage. La memoria queda acotada por el tamaño de la ventana.
+Con cortes SDDP (costo_futuro_sddp) cada ventana lleva Alfa y las filas Corte del stage en
+que termina: el agua de los embalses fcf al final de la ventana se valoriza con el costo
+futuro en vez de quedar libre (sin valor). Los cortes están en valor presente absoluto y
+se llevan a la ventana dividiéndolos por el factor de descuento de su primer stage.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from backend_matricial import _arr_ety, _arr_ty, _costo_p, build_lp, depura_formulacion, resuelve_lp
+from costo_futuro_sddp import Cortes, agrega_fcf
+from sesion_persistente import SesionExpansion
+
+
+@dataclass
+class ResultadoRodante:
+    estado: str
+    objetivo: float                      # costo total (valor presente) del plan encadenado
+    Y_list: List[int]
+    techs: List[str]
+    valores: Dict[str, np.ndarray]       # familia -> (entidades, stages) o (entidades, bloques)
+    ventanas: List[dict] = field(default_factory=list)
+    objetivo_monolitico: Optional[float] = None
+
+    def valor(self, familia: str) -> np.ndarray:
+        return self.valores[familia]
+
+    @property
+    def gap(self) -> Optional[float]:
+        """(rodante - monolítico) / |monolítico|; el rodante nunca es mejor que el óptimo."""
+        if self.objetivo_monolitico is None:
+            return None
+        return (self.objetivo - self.objetivo_monolitico) / max(abs(self.objetivo_monolitico), 1e-12)
+
+
+def ventanas_de(n_stages: int, ventana: int, solape: int) -> List[tuple]:
+    """[(inicio, fin, n_comprometidos)] en índices de stage; paso = ventana - solape."""
+    if ventana < 1 or not 0 <= solape < ventana:
+        raise ValueError(f"ventanas_de: se requiere ventana >= 1 y 0 <= solape < ventana "
+                         f"(ventana={ventana}, solape={solape}).")
+    paso, out, s = ventana - solape, [], 0
+    while s < n_stages:
+        fin = min(s + ventana, n_stages)
+        out.append((s, fin, fin - s if fin == n_stages else paso))
+        s += out[-1][2]
+    return out
+
+
+def _etapa_columnas(lp) -> np.ndarray:
+    """Stage relativo (0..nY-1) de cada columna del LP."""
+    etapa = np.empty(lp.n_var, dtype=np.int64)
+    iy = lp.param["iy"]
+    for fam, (off, shape) in lp.var.items():
+        n = int(np.prod(shape))
+        j = np.arange(n) % shape[-1]
+        etapa[off: off + n] = j if fam in ("x", "K") else iy[j]
+    if "Alfa" in lp.var:                    # costo futuro tras la ventana: nunca se compromete
+        etapa[lp.cols("Alfa")] = len(lp.Y_list)
+    return etapa
+
+
+def resuelve_rodante(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, Knew_bar, hydro,
+                     ventana: int = 24, solape: int = 6, r: float = 0.08, solver_name: str = "appsi_highs",
+                     threads: Optional[int] = None, compara: bool = False, cotas: bool = False,
+                     cortes: Optional[Cortes] = None, embalses_fcf: Optional[List[str]] = None,
+                     cvar_ty: Optional[Dict[str, np.ndarray]] = None, **kw) -> ResultadoRodante:
+    """
+    Misma firma que build_lp más ventana/solape (en stages). kw: c_ens, bigm_slack, kappa_default.
+    cotas=True: cada ventana se arma con depura_formulacion (filas de una variable como cotas).
+    cortes/embalses_fcf: cortes SDDP por índice de stage en Y_list (carga_cortes) para valorizar
+    el volumen final de cada ventana.
+    cvar_ty: costo variable por bloque {g: (TY,)} como en build_lp (cada ventana toma sus bloques).
+    compara=True resuelve además el LP monolítico e informa el gap (requiere su memoria).
+    """
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    nY, nTY, nG = len(Y_list), len(TY), len(techs)
+    R, ROR = list(hydro["R"]), list(hydro.get("ROR", []))
+    ini_y = np.cumsum([0] + [len(T_by_Y[y]) for y in Y_list])       # primer bloque de cada stage
+
+    # series completas alineadas (TY,) / (entidad, TY) / (techs, stages)
+    a_f, d_f = _arr_ty(alpha, TY), _arr_ty(D, TY)
+    af_f = np.array([_arr_ty(AF[g], TY) for g in techs]).reshape(nG, nTY)
+    I_f = _arr_ety(hydro["I_nat"], R, TY)
+    Ir_f = _arr_ety(hydro.get("I_nat_ror", {}), ROR, TY)
+    mat = lambda d: np.array([[d[(g, y)] for y in Y_list] for g in techs], dtype=np.float64).reshape(nG, nY)
+    ci, cf, cv, kb = mat(cinv), mat(cfix), mat(cvar), mat(Knew_bar)
+    cv_ty = _costo_p(cv, np.repeat(np.arange(nY), np.diff(ini_y)), techs, TY, cvar_ty)   # (techs, TY)
+    df_abs = np.array([1.0 / ((1.0 + r) ** (y - 1)) for y in Y_list])
+    vend = {e: float(hydro.get("vend", {}).get(e, 0.0)) for e in R}
+
+    # estado que se traspasa
+    k0 = {g: float(K0[g]) for g in techs}
+    v0 = {e: float(hydro.get("vini", {}).get(e, 0.0)) for e in R}
+
+    fcf = np.isin(R, embalses_fcf or [])
+    n_cortes = max((len(a) for a, _ in (cortes or {}).values()), default=0)
+    if n_cortes and not fcf.any():
+        raise ValueError("resuelve_rodante: hay cortes pero ningún embalse de embalses_fcf está en hydro['R'].")
+    if n_cortes:
+        # columnas de cada corte, en el orden de embalses_fcf
+        orden = np.array([list(embalses_fcf).index(e) for e in np.asarray(R)[fcf]])
+
+    sesiones: Dict[tuple, SesionExpansion] = {}
+    valores: Dict[str, np.ndarray] = {}
+    ventanas, objetivo, estado = [], 0.0, "Optimal"
+
+    for (s, e, n_fix) in ventanas_de(nY, ventana, solape):
+        b0, b1 = ini_y[s], ini_y[e]
+        bl = slice(b0, b1)
+        ys = Y_list[s:e]
+        # stages relativos: df_abs[s] * df_rel = df_abs, y ventanas iguales comparten estructura
+        Y_rel = [y - ys[0] + 1 for y in ys]
+        T_rel = {yr: list(T_by_Y[y]) for yr, y in zip(Y_rel, ys)}
+        firma = tuple((yr, len(T_rel[yr])) for yr in Y_rel)
+        ult = e == nY
+        term_lo = np.array([vend[x] for x in R]) if ult else -np.inf
+        term_up = np.array([vend[x] for x in R]) if ult else np.inf
+
+        ses = sesiones.get(firma)
+        if ses is None:
+            rel = lambda M: {(g, yr): float(M[j, s + i]) for j, g in enumerate(techs) for i, yr in enumerate(Y_rel)}
+            hyd = dict(hydro, I_nat=I_f[:, bl], I_nat_ror=Ir_f[:, bl], vini=v0)
+            lp = build_lp(Y_rel, T_rel, a_f[bl], d_f[bl], techs,
+                          {g: af_f[j, bl] for j, g in enumerate(techs)}, k0,
+                          rel(ci), rel(cf), rel(cv), rel(kb), hyd, r=r, **kw)
+            if cotas:
+                lp, _ = depura_formulacion(lp)
+            if n_cortes:
+                lp = agrega_fcf(lp, np.full(n_cortes, -np.inf), np.zeros((n_cortes, int(fcf.sum()))), fcf)
+            ses = sesiones[firma] = SesionExpansion(lp, solver_name, threads=threads)
+        ses.actualiza(alpha=a_f[bl], AF=af_f[:, bl], D=d_f[bl], I_nat=I_f[:, bl], I_nat_ror=Ir_f[:, bl],
+                      cinv=ci[:, s:e], cfix=cf[:, s:e], cvar_ty=cv_ty[:, bl], kbar=kb[:, s:e],
+                      K0=k0, vini=v0, filas={"VolTerminal": (term_lo, term_up)})
+        if n_cortes:
+            # cortes del último stage de la ventana (relleno: filas inactivas), en $ de la ventana
+            a, B = cortes.get(e - 1, (np.zeros(0), np.zeros((0, len(orden)))))
+            lo = np.full(n_cortes, -np.inf)
+            coef = np.zeros((n_cortes, int(fcf.sum())))
+            lo[:len(a)] = np.asarray(a) / df_abs[s]
+            coef[:len(a)] = -np.asarray(B)[:, orden] / df_abs[s]
+            if len(a) and ult:
+                term_lo, term_up = np.where(fcf, -np.inf, term_lo), np.where(fcf, np.inf, term_up)
+                ses.actualiza(filas={"VolTerminal": (term_lo, term_up)})
+            ses.actualiza(filas={"Corte": (lo, np.inf)})
+            ses.actualiza_coeficientes("Corte", ses.lp.cols("V")[fcf, -1], coef)
+        res = ses.resuelve()
+        estado = res.estado if res.estado != "Optimal" else estado
+
+        # costo comprometido (valor presente) y traspaso de estado
+        lp = ses.lp
+        etapa = _etapa_columnas(lp)
+        fijo = etapa < n_fix
+        objetivo += df_abs[s] * float(lp.c[fijo] @ res.x[fijo])
+        bf = ini_y[s + n_fix] - b0                                        # bloques comprometidos
+        for fam in lp.var:
+            if fam == "Alfa":
+                continue
+            val = res.valor(fam)
+            if fam in ("x", "K"):
+                parte, tot = val[..., :n_fix], nY
+            else:
+                parte, tot = val[..., :bf], nTY
+            if fam not in valores:
+                valores[fam] = np.zeros(val.shape[:-1] + (tot,))
+            ini = s if fam in ("x", "K") else b0
+            valores[fam][..., ini: ini + parte.shape[-1]] = parte
+        k0 = dict(zip(techs, res.valor("K")[:, n_fix - 1].tolist()))
+        if R:
+            v0 = dict(zip(R, res.valor("V")[:, bf - 1].tolist()))
+        ventanas.append({"stage_ini": Y_list[s], "stage_fin": Y_list[e - 1], "comprometidos": n_fix,
+                         "estado": res.estado, **res.info})
+
+    out = ResultadoRodante(estado=estado, objetivo=objetivo, Y_list=list(Y_list), techs=list(techs),
+                           valores=valores,
+                           ventanas=ventanas)
+    if compara:
+        mono = resuelve_lp(build_lp(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar,
+                                    Knew_bar, hydro, r=r, cvar_ty=cvar_ty, **kw), solver_name, threads=threads)
+        out.objetivo_monolitico = mono.objetivo
+    return out
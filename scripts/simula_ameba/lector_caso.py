@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Lector columnar tipado para las tablas CSV de un caso AMEBA
+------------------------------------------------------------
+- ESQUEMAS: columnas declaradas (y su tipo) por tabla AMEBA (Dam, HydroConnection, ...)
+- lee_tabla: lee sólo las columnas pedidas, con dtypes fijos y normalizando nombres
+- lee_serie_ancha: series ancho (time, scenario, col_1..col_n) como float + time datetime
+- lee_calendario: stages.csv + blocks.csv tipados
+- parse_time: parseo vectorizado del formato fijo AMEBA '%Y-%m-%d-%H:%M'
+
+Si pyarrow está instalado se usa su lector CSV multihilo (motor="pyarrow");
+si no, se usa el motor C de pandas. Ambos producen los mismos tipos.
+"""
+from __future__ import annotations
+import csv
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (sólo para saber si el motor está disponible)
+    HAY_ARROW = True
+except ImportError:
+    HAY_ARROW = False
+
+FORMATO_TIEMPO = "%Y-%m-%d-%H:%M"
+
+# Tipos: "str", "float", "int", "bool", "time" (texto AMEBA -> datetime64)
+_COMUNES = {"name": "str", "start_time": "time", "end_time": "time"}
+_GENERADOR = {**_COMUNES, "connected": "bool", "busbar": "str", "pmax": "float", "pmin": "float",
+              "vomc_avg": "float", "candidate": "bool"}
+
+ESQUEMAS: Dict[str, Dict[str, str]] = {
+    # ---- calendario ----
+    "stages": {"s_id": "int", "start_time": "time", "end_time": "time", "num_blocks": "int"},
+    "blocks": {"stage": "int", "block": "int", "time": "time"},
+    # ---- hidro ----
+    "Dam": {**_COMUNES, "vmax": "float", "vmin": "float", "vini": "float", "vend": "float",
+            "scale": "float", "non_physical_inflow": "bool", "non_physical_inflow_penalty": "float",
+            "filt_avg": "float", "use_fcf": "bool", "cond_ovf": "bool", "vol_ovf": "float",
+            "val_ovf": "float", "filt_poly": "float", "candidate": "bool"},
+    "HydroConnection": {**_COMUNES, "h_type": "str", "ini": "str", "end": "str",
+                        "h_max_flow": "float", "h_min_flow": "float", "h_ramp": "float",
+                        "h_delay": "float", "h_delayed_q": "float", "h_flow_penalty": "float"},
+    "HydroGenerator": {**_GENERADOR, "hydro_group_name": "str", "eff": "float"},
+    "HydroGroup": {**_COMUNES, "hg_sp_min": "float", "hg_sp_max": "float"},
+    "HydroNode": {**_COMUNES, "formulate_bal": "bool"},
+    # ---- generación ----
+    "ThermalGenerator": {**_GENERADOR, "heatrate_avg": "float", "fuel_name": "str",
+                         "forced_outage_rate": "float", "fom_cost": "float", "gen_inv_cost": "float",
+                         "lifetime": "float"},
+    "PvGenerator": {**_GENERADOR, "zone": "str", "forced_outage_rate": "float", "fom_cost": "float",
+                    "gen_inv_cost": "float", "lifetime": "float"},
+    "WindGenerator": {**_GENERADOR, "zone": "str", "forced_outage_rate": "float", "fom_cost": "float",
+                      "gen_inv_cost": "float", "lifetime": "float"},
+    "ESS": {**_GENERADOR, "ess_pmaxc": "float", "ess_emax": "float", "ess_emin": "float",
+            "ess_eini": "float", "ess_effc": "float", "ess_effd": "float",
+            "forced_outage_rate": "float", "fom_cost": "float", "gen_inv_cost": "float",
+            "lifetime": "float"},
+    # ---- recursos ----
+    "Fuel": {**_COMUNES, "fuel_type": "str", "fuel_price": "float"},
+    "Inflow": {**_COMUNES, "inflows_qm3": "float"},
+    "Profile": {**_COMUNES, "power": "float"},
+    "Irrigation": {**_COMUNES, "irrigations_qm3": "float", "voli": "float"},
+    # ---- sistema eléctrico ----
+    "Branch": {**_COMUNES, "connected": "bool", "busbari": "str", "busbarf": "str",
+               "max_flow": "float", "max_flow_reverse": "float", "r": "float", "x": "float",
+               "dc": "bool", "losses": "bool", "candidate": "bool", "voltage": "float"},
+    "Busbar": {**_COMUNES, "voltage": "float"},
+    "Load": {**_COMUNES, "busbar": "str", "connected": "bool", "projection_type": "str",
+             "voll": "float"},
+    "LoadProjection": {**_COMUNES, "factor": "float"},
+    "System": {"name": "str", "sbase": "float", "busbar_ref": "str", "interest_rate": "float"},
+}
+
+
+# ===== Tiempo =====
+_T_MAX = np.datetime64(pd.Timestamp.max.floor("min").to_datetime64(), "m")
+
+
+def parse_time(values) -> np.ndarray:
+    """
+    Parseo vectorizado del formato fijo 'AAAA-MM-DD-HH:MM' (sin pasar por strptime).
+    Devuelve datetime64[ns]; valores vacíos o mal formados quedan como NaT.
+    """
+    arr = np.asarray(values)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        return arr.astype("datetime64[ns]")
+    arr = arr.astype(object)
+    n = arr.shape[0]
+    if n == 0:
+        return np.empty(0, dtype="datetime64[ns]")
+    try:
+        # 17 bytes: el byte 16 en cero confirma largo exacto 16 (NaN/None -> b'nan'/b'None')
+        b = arr.astype("S17").view(np.uint8).reshape(n, 17).astype(np.int32)
+    except UnicodeEncodeError:
+        return pd.to_datetime(pd.Series(arr), format=FORMATO_TIEMPO, errors="coerce").to_numpy()
+
+    ok = (b[:, 16] == 0) & (b[:, 4] == 45) & (b[:, 7] == 45) & (b[:, 10] == 45) & (b[:, 13] == 58)
+    b = b - 48
+    dig = b[:, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15]]
+    ok &= ((dig >= 0) & (dig <= 9)).all(axis=1)
+
+    anio = dig[:, 0] * 1000 + dig[:, 1] * 100 + dig[:, 2] * 10 + dig[:, 3]
+    mes  = dig[:, 4] * 10 + dig[:, 5]
+    dia  = dig[:, 6] * 10 + dig[:, 7]
+    hora = dig[:, 8] * 10 + dig[:, 9]
+    minu = dig[:, 10] * 10 + dig[:, 11]
+    ok &= (mes >= 1) & (mes <= 12) & (dia >= 1) & (dia <= 31) & (hora <= 23) & (minu <= 59)
+
+    meses = ((anio - 1970) * 12 + (mes - 1)).astype("timedelta64[M]")
+    fecha = (np.datetime64("1970-01", "M") + meses).astype("datetime64[D]") + (dia - 1).astype("timedelta64[D]")
+    # día fuera del mes (p.ej. 29-feb no bisiesto) -> NaT, igual que errors="coerce"
+    ok &= fecha.astype("datetime64[M]") == (np.datetime64("1970-01", "M") + meses)
+    t = fecha.astype("datetime64[m]") + (hora * 60 + minu).astype("timedelta64[m]")
+    t[~ok] = np.datetime64("NaT")
+    # fechas "sin término" (p.ej. 3000-01-01) no caben en datetime64[ns]: se saturan al máximo
+    t[ok & (t > _T_MAX)] = _T_MAX
+    return t.astype("datetime64[ns]")
+
+
+def format_time(times) -> np.ndarray:
+    """Inverso de parse_time: datetime64 -> texto 'AAAA-MM-DD-HH:MM' (vectorizado)."""
+    t = np.asarray(times, dtype="datetime64[m]")
+    iso = np.datetime_as_string(t, unit="m")          # 'AAAA-MM-DDTHH:MM'
+    return np.char.replace(iso, "T", "-").astype(object)
+
+
+# ===== Lectura =====
+def _cabecera(path: Path, encoding: str) -> List[str]:
+    with open(path, newline="", encoding=encoding, errors="replace") as f:
+        return next(csv.reader(f))
+
+
+def tabla_de_archivo(path: Path) -> Optional[str]:
+    """Infiere la tabla AMEBA desde el nombre ('..._Dam.csv' -> 'Dam')."""
+    stem = Path(path).stem
+    tabla = stem.rsplit("_", 1)[-1]
+    return tabla if tabla in ESQUEMAS else None
+
+
+def _motor(motor: str) -> str:
+    if motor == "auto":
+        return "pyarrow" if HAY_ARROW else "c"
+    if motor == "pyarrow" and not HAY_ARROW:
+        raise ImportError("motor='pyarrow' requiere el paquete pyarrow.")
+    return motor
+
+
+def _read_csv(path: Path, usecols: List[str], dtype: Dict[str, str], motor: str, encoding: str) -> pd.DataFrame:
+    kw = dict(usecols=usecols, dtype=dtype, engine=_motor(motor))
+    try:
+        return pd.read_csv(path, encoding=encoding, **kw)
+    except UnicodeDecodeError:
+        # algunas tablas AMEBA (p.ej. ESS) traen nombres en latin-1
+        return pd.read_csv(path, encoding="latin-1", **kw)
+
+
+def _a_bool(s: pd.Series) -> pd.Series:
+    if s.dtype == bool:
+        return s
+    return s.astype(str).str.strip().str.lower().isin(["true", "1", "1.0"])
+
+
+def lee_tabla(path: Path, tabla: Optional[str] = None, columnas: Optional[Iterable[str]] = None,
+              motor: str = "auto", encoding: str = "utf-8") -> pd.DataFrame:
+    """
+    Lee una tabla AMEBA con el esquema declarado en ESQUEMAS.
+      - columnas=None -> todas las columnas del esquema presentes en el archivo
+      - nombres de columnas normalizados (strip + lower), igual que los cargadores previos
+      - columnas 'time' parseadas con parse_time, 'bool' como bool, 'float' como float64
+    Columnas pedidas que no estén en el esquema se leen como texto.
+    """
+    path = Path(path)
+    tabla = tabla or tabla_de_archivo(path)
+    esquema = ESQUEMAS.get(tabla, {}) if tabla else {}
+
+    reales = {c.strip().lower(): c for c in _cabecera(path, encoding)}
+    pedidas = [c.lower() for c in columnas] if columnas is not None else list(esquema) or list(reales)
+    faltan = [c for c in pedidas if c not in reales]
+    if columnas is not None and faltan:
+        raise KeyError(f"{path.name}: columnas inexistentes {faltan}")
+    pedidas = [c for c in pedidas if c in reales]
+
+    tipos = {c: esquema.get(c, "str") for c in pedidas}
+    dtype = {reales[c]: ("float64" if t in ("float", "int") else "str")
+             for c, t in tipos.items() if t != "bool"}
+    df = _read_csv(path, [reales[c] for c in pedidas], dtype, motor, encoding)
+    df.columns = [c.strip().lower() for c in df.columns]
+    df = df[pedidas]
+
+    for c, t in tipos.items():
+        if t == "time":
+            df[c] = parse_time(df[c].to_numpy())
+        elif t == "bool":
+            df[c] = _a_bool(df[c])
+        elif t == "int" and df[c].notna().all():
+            df[c] = df[c].astype(np.int64)
+        elif t == "str":
+            df[c] = df[c].astype(object).where(df[c].notna(), None)
+            df[c] = df[c].map(lambda v: v.strip() if isinstance(v, str) else v)
+    return df
+
+
+def lee_serie_ancha(path: Path, columnas: Optional[Iterable[str]] = None, escenario: Optional[str] = None,
+                    prefijo: Optional[str] = None, float_dtype: str = "float64",
+                    motor: str = "auto", encoding: str = "utf-8") -> pd.DataFrame:
+    """
+    Lee una serie ancha AMEBA (time, [scenario], col_1..col_n): demand.csv, factor.csv,
+    fuel_price.csv, inflows, gen_inv_cost.csv...
+      - columnas / prefijo: restringen las columnas de valores leídas
+      - escenario: filtra la columna 'scenario' (si existe)
+    Devuelve DataFrame con 'time' (datetime64), 'scenario' (si existe) y valores float.
+    """
+    path = Path(path)
+    cab = [c.strip() for c in _cabecera(path, encoding)]
+    ids = [c for c in ("time", "scenario") if c in cab]
+    vals = [c for c in cab if c not in ids]
+    if columnas is not None:
+        pedidas = list(columnas)
+        faltan = [c for c in pedidas if c not in vals]
+        if faltan:
+            raise KeyError(f"{path.name}: columnas inexistentes {faltan}")
+        vals = pedidas
+    if prefijo is not None:
+        vals = [c for c in vals if c.startswith(prefijo)]
+
+    dtype = {c: float_dtype for c in vals}
+    dtype.update({c: "str" for c in ids})
+    df = _read_csv(path, ids + vals, dtype, motor, encoding)
+    df.columns = [c.strip() for c in df.columns]
+    df = df[ids + vals]
+
+    if escenario is not None and "scenario" in df.columns:
+        df = df[df["scenario"] == escenario].reset_index(drop=True)
+    if "time" in df.columns:
+        df["time"] = parse_time(df["time"].to_numpy())
+    return df
+
+
+def lee_calendario(stages_csv: Path, blocks_csv: Path, motor: str = "auto"):
+    """stages.csv y blocks.csv tipados (s_id/stage/block enteros, tiempos datetime64)."""
+    stages = lee_tabla(stages_csv, "stages", motor=motor)
+    blocks = lee_tabla(blocks_csv, "blocks", motor=motor)
+    return stages, blocks
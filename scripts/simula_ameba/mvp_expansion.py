@@ -15,11 +15,12 @@ Ejecutar:
 from __future__ import annotations
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Optional
 
+import numpy as np
 import pandas as pd
 from pyomo.environ import (
-    ConcreteModel, Set, Param, Var, NonNegativeReals, Objective, Constraint, minimize, value
+    ConcreteModel, Set, Param, Var, NonNegativeReals, Objective, Constraint, Suffix, minimize, value
 )
 from pyomo.opt import SolverFactory
 
@@ -37,12 +38,44 @@ HYDRO_CONN        = RUTA_BASE / "data" / "generacion" / "hidro_sys" / "PNCP 2 -
 HYDRO_GENERATOR   = RUTA_BASE / "data" / "generacion" /  "PNCP 2 - 2025 ESC-C  - PET 2024 V2_HydroGenerator.csv"
 HYDRO_GROUP       = RUTA_BASE / "data" / "generacion" / "hidro_sys" / "PNCP 2 - 2025 ESC-C  - PET 2024 V2_HydroGroup.csv"
 
+# RED (modo RED_DC)
+BRANCH_CSV  = RUTA_BASE / "data" / "elec_sys" / "PNCP 2 - 2025 ESC-C  - PET 2024 V2_Branch.csv"
+BUSBAR_CSV  = RUTA_BASE / "data" / "elec_sys" / "PNCP 2 - 2025 ESC-C  - PET 2024 V2_Busbar.csv"
+LOAD_CSV    = RUTA_BASE / "data" / "elec_sys" / "PNCP 2 - 2025 ESC-C  - PET 2024 V2_Load.csv"
+SYSTEM_CSV  = RUTA_BASE / "data" / "elec_sys" / "PNCP 2 - 2025 ESC-C  - PET 2024 V2_System.csv"
+THERMAL_CSV = RUTA_BASE / "data" / "generacion" / "PNCP 2 - 2025 ESC-C  - PET 2024 V2_ThermalGenerator.csv"
+PV_CSV      = RUTA_BASE / "data" / "generacion" / "PNCP 2 - 2025 ESC-C  - PET 2024 V2_PvGenerator.csv"
+WIND_CSV    = RUTA_BASE / "data" / "generacion" / "PNCP 2 - 2025 ESC-C  - PET 2024 V2_WindGenerator.csv"
+ESS_CSV     = RUTA_BASE / "data" / "generacion" / "PNCP 2 - 2025 ESC-C  - PET 2024 V2_ESS.csv"
+PERFILES_CSV = RUTA_BASE / "data" / "generacion" / "recursos" / "profile_power.csv"   # horario ancho Profile_*
+FUEL_PRICE_CSV = RUTA_BASE / "data" / "generacion" / "recursos" / "fuel_price.csv"   # mensual ancho Fuel_*
+GEN_INV_COST_CSV = RUTA_BASE / "data" / "costos_inv" / "gen_inv_cost.csv"         # anual ancho, $/kW por proyecto
+
 # módulos externos
-from demanda_proyectada import project_demanda
+from demanda_proyectada import escribe_demanda_csv, proyecta_demanda
 from construye_inflows_qm3 import build_inflows_df
 from carga_hydroconnection import load_hydro_connection
 from carga_hydrogenerator import load_hydro_generator
 from carga_hydrogroup import load_hydrogroup
+from lector_caso import lee_calendario, lee_tabla
+from calendario import Calendario
+from backend_matricial import (_arr_ty, arcos_con_retardo, build_lp, depura_formulacion, resuelve_lp, resultado_highs,
+                               solver_highs)
+from horizonte_rodante import resuelve_rodante
+from costo_futuro_sddp import cortes_vigentes
+from descomposicion_benders import resuelve_benders
+from red_dc import carga_red, demanda_por_barra, resuelve_con_red
+from clusters_generacion import ClustersFlota, clusters_caso
+from perfiles_generacion import PerfilesBloque, af_flota, carga_perfiles_bloque
+from periodos_representativos import build_lp_reducido, compara_solucion, distorsion, reduce_periodos
+from resultados_parquet import escribe_parquet, tablas_pyomo, tablas_resultado
+from perfilador import PERFIL, captura_log_highs, tamano_lp, tamano_pyomo
+from cache_etapas import AlmacenArtefactos, GrafoEtapas
+from costos_combustible import tensor_clusters, tensor_costos_unidades
+from cubo_escenarios import CuboEscenarios, cubo_demanda, cubo_inflows, matriz_destinos
+from costos_marginales import a_horas, escribe_marginales, marginales_lp, marginales_pyomo
+from candidatos import (acota_candidatos, af_candidatos, capacidad_util_barras, carga_candidatos, incorpora_candidatos,
+                        poda_dominados)
 
 # ===== CONFIG =====
 TECHS         = ["cc_gas", "eolica", "solar"]     # térmicas/renovables "no-hidro"
@@ -50,6 +83,37 @@ DISCOUNT_R    = 0.08
 SOLVER_NAME   = "appsi_highs"                     # HiGHS
 BIGM_SLACK    = 1e9                               # para bloquear Slack si no se permite
 KAPPA_DEFAULT = 1.0                               # MWh/hm3 (conv turbinado -> energía)
+C_ENS         = 4000.0                            # $/MWh energía no suministrada
+HIDROLOGIA    = "H_1960"                          # escenario del archivo de inflows (None: sin inflows)
+BACKEND       = "pyomo"                           # "pyomo" (depuración) | "matricial" (CSR -> highspy)
+MODO          = "monolitico"                      # "monolitico" | "rodante" (ventanas) | "benders" (backend matricial)
+VENTANA_STAGES = 24                               # stages por ventana (modo rodante)
+SOLAPE_STAGES  = 6                                # stages de solape entre ventanas (no se comprometen)
+COMPARA_MONOLITICO = False                        # modo rodante / periodos: resolver también el LP completo e informar gap
+VALOR_AGUA_FCF     = False                        # modo rodante: volumen final de cada ventana valorizado con los cortes SDDP (resultados/fcf_cortes.csv)
+BENDERS_MULTICORTE = True                         # un corte por stage (True) o un corte agregado (False)
+BENDERS_TOL        = 1e-4                         # gap relativo (UB - LB) / UB de convergencia
+BENDERS_MAX_ITER   = 100
+BENDERS_WORKERS    = None                         # procesos para los subproblemas (None: núcleos)
+RED_DC             = False                        # monolítico matricial con red DC multibarra (PTDF + límites perezosos)
+CLUSTERS           = False                        # flota existente real (clusters de unidades AMEBA) en vez de K0 fijo
+CLUSTER_TOL        = 0.05                         # tolerancia relativa de costo dentro de un cluster
+PERIODOS_REP       = None                         # n° de periodos representativos (None: calendario completo)
+METODO_REP         = "jerarquico"                 # "jerarquico" (tramos cronológicos) | "kmedoides"
+GUARDA_PARQUET     = False                        # primales y duales a resultados/parquet (por run_id y stage)
+MARGINALES         = False                        # costo marginal y valores del agua horarios -> resultados/marginales/<run_id>.parquet
+RUN_ID             = None                         # id de la corrida en el almacén (None: hidrología + fecha)
+PERFILAR           = False                        # reporte JSON por fase (tiempo, CPU, RSS, tamaño del modelo, HiGHS)
+RETARDO_TOL        = 0.01                         # poda relativa de la matriz de transferencia de retardos hidro
+COTAS_PRIMERO      = True                         # filas de una variable como cotas, Slack fijo sin big-M, sin GenCap dominada
+COSTOS_COMBUSTIBLE = True                         # clusters: cvar = vomc + heatrate * precio (fuel_price.csv) en vez de sólo vomc
+                                                  # (por bloque en monolítico/rodante/red; media del stage en Benders y periodos)
+ESCENARIO_COMBUSTIBLE = None                      # columna scenario de fuel_price.csv (None: la única)
+CUBOS              = False                        # demanda e inflows desde cubos memmap escenario x hora x entidad (resultados/cache_cubos)
+CANDIDATOS         = False                        # proyectos candidatos reales (gen_inv_cost.csv) podados por dominancia (monolítico)
+CACHE_ETAPAS       = False                        # artefactos por etapa en resultados/cache_etapas (clave: hash de entradas + config)
+CACHE_LIMITE_MB    = 2048                         # tope del almacén de la caché (desalojo LRU)
+CACHE_VERSION      = 1                            # subir si cambia algo que la clave no ve (código de este archivo fuera de las funciones de cada etapa)
 
 def build_costs(techs: List[str], Y_list: List[int]):
     cinv, cfix, cvar, knew = {}, {}, {}, {}
@@ -77,49 +141,63 @@ def build_costs(techs: List[str], Y_list: List[int]):
                 knew[(g, y)] = 300.0
     return cinv, cfix, cvar, knew
 
-# ===== Util =====
-def parse_time(s: str):
-    return pd.to_datetime(s, format="%Y-%m-%d-%H:%M")
-
 @dataclass
 class InputData:
     stages: pd.DataFrame
     blocks: pd.DataFrame
-    demand_total: pd.DataFrame  # columnas: time, MW_total (datetime, float)
+    demand_total: Optional[pd.DataFrame]  # columnas: time, MW_total (datetime, float); None con CUBOS
     reservoirs: pd.DataFrame    # catálogo de embalses
     inflows: pd.DataFrame       # columnas: time, name, inflow (hm3/h), time como datetime
-
-def load_inputs(registro: bool=False):
-    # 1) Demanda proyectada (por timestamp y barra) -> sumatoria barras
-    demanda_df = project_demanda(DEMANDA_BASE, DEMANDA_FACTOR, registro)
-    all_cols = [c for c in demanda_df.columns if c != "time"]
-    demanda_df["MW_total"] = demanda_df[all_cols].sum(axis=1, skipna=True)
-    demanda_total = demanda_df[["time", "MW_total"]].copy()
-    demanda_total["time"] = parse_time(demanda_total["time"])
-
-    # 2) Calendario
-    stages = pd.read_csv(STAGES_CSV)
-    blocks = pd.read_csv(BLOCKS_CSV)
-    stages.columns = [c.strip().lower() for c in stages.columns]
-    blocks.columns = [c.strip().lower() for c in blocks.columns]
-    for col in ["start_time", "end_time"]:
-        stages[col] = parse_time(stages[col])
-    blocks["time"] = parse_time(blocks["time"])
-
-    # 3) Hidro: catálogo + inflows
-    reservoirs = pd.read_csv(RESERVOIRS_CSV)
-    inflows = build_inflows_df(RUTA_INFLOWS_QM3, escenario="H_1960", units="m3s")
-    inflows["time"] = parse_time(inflows["time"])
-
-    # 4) Red hidro (HydroConnection)
+    calendario: Optional[Calendario] = None   # índice hora -> (stage, block), se arma una vez
+    perfiles: Optional[PerfilesBloque] = None # factores de planta por bloque de los Profile_* (si hay archivo)
+    cubo_demanda: Optional[CuboEscenarios] = None   # CUBOS: demanda total (reemplaza demand_total)
+    cubo_inflows: Optional[CuboEscenarios] = None   # CUBOS: afluencias de todas las hidrologías (reemplaza inflows)
+    hidrologia: Optional[str] = None                # escenario de cubo_inflows
+
+def carga_demanda(registro: bool = False) -> pd.DataFrame:
+    """Demanda proyectada -> sumatoria barras (directo en arrays, sin tabla ancha de texto)."""
+    if registro:
+        proy = proyecta_demanda(DEMANDA_BASE, DEMANDA_FACTOR, por_barra=True)
+        escribe_demanda_csv(proy)
+        mw_total = np.nansum(proy.valores[0], axis=1)
+    else:
+        proy = proyecta_demanda(DEMANDA_BASE, DEMANDA_FACTOR, por_barra=False)
+        mw_total = proy.valores[0]
+    return pd.DataFrame({"time": proy.tiempo, "MW_total": mw_total})
+
+def carga_calendario():
+    """Calendario (tipado: enteros + datetime64): stages, blocks, Calendario."""
+    stages, blocks = lee_calendario(STAGES_CSV, BLOCKS_CSV)
+    return stages, blocks, Calendario.desde_tablas(stages, blocks)
+
+def carga_inflows(escenario: Optional[str]) -> pd.DataFrame:
+    if escenario is not None:
+        return build_inflows_df(RUTA_INFLOWS_QM3, escenario=escenario, units="m3s", time_str=False)
+    # p.ej. corridas multi-hidrología: los inflows se agregan aparte
+    return pd.DataFrame({"time": pd.Series(dtype="datetime64[ns]"),
+                         "name": pd.Series(dtype=object), "inflow": pd.Series(dtype=float)})
+
+def carga_cubos(escenario: Optional[str]):
+    """Cubos memmap de demanda total y (con hidrología) de inflows; nada queda en tablas largas."""
+    dem = cubo_demanda(DEMANDA_BASE, DEMANDA_FACTOR, por_barra=False)
+    infl = cubo_inflows(RUTA_INFLOWS_QM3) if escenario is not None else None
+    if infl is not None:
+        infl.indice(escenario)          # falla temprano si la hidrología no está en el archivo
+    return dem, infl, escenario
+
+def carga_topologia_hidro():
+    """Catálogo de embalses + red hidro, generadores ROR y límites HydroGroup: (reservoirs, extras)."""
+    reservoirs = lee_tabla(RESERVOIRS_CSV, "Dam")
+
+    # Red hidro (HydroConnection)
     (inflow_to_res, inflow_to_hg,
      arcs_spill_res, arcs_turb_res, arcs_spill_to_hg, arcs_turb_to_hg,
      arcs_spill_res_d, arcs_turb_res_d, arcs_spill_to_hg_d, arcs_turb_to_hg_d) = load_hydro_connection(HYDRO_CONN)
 
-    # 5) Generadores hidro (HydroGenerator) -> ROR, PmaxROR, kappa_ror
+    # Generadores hidro (HydroGenerator) -> ROR, PmaxROR, kappa_ror
     ROR, PmaxROR, kappa_ror = load_hydro_generator(HYDRO_GENERATOR, reservoirs, kappa_default=KAPPA_DEFAULT)
 
-    # 6) Límites HydroGroup (min/max en MW)
+    # Límites HydroGroup (min/max en MW)
     hg_df = load_hydrogroup(HYDRO_GROUP)  # DF: name,start_time,end_time,hg_sp_min,hg_sp_max
     hg_sp_min = {row["name"]: float(row["hg_sp_min"]) for _, row in hg_df.iterrows()}
     hg_sp_max = {row["name"]: float(row["hg_sp_max"]) for _, row in hg_df.iterrows()}
@@ -127,12 +205,12 @@ def load_inputs(registro: bool=False):
     input_extras = dict(
         inflow_to_res=inflow_to_res,
         inflow_to_hg=inflow_to_hg,
-        arcs_spill_res=arcs_spill_res,           # SIN delay por ahora
+        arcs_spill_res=arcs_spill_res,           # SIN delay
         arcs_turb_res=arcs_turb_res,
         arcs_spill_to_hg=arcs_spill_to_hg,
         arcs_turb_to_hg=arcs_turb_to_hg,
 
-        # (con delay para futuro)
+        # con delay (h_delay): los que usa el modelo
         arcs_spill_res_d=arcs_spill_res_d,
         arcs_turb_res_d=arcs_turb_res_d,
         arcs_spill_to_hg_d=arcs_spill_to_hg_d,
@@ -144,89 +222,118 @@ def load_inputs(registro: bool=False):
         # HydroGroup (MW)
         hg_sp_min=hg_sp_min, hg_sp_max=hg_sp_max,
     )
-
+    return reservoirs, input_extras
+
+def arma_inputs(demanda_total, calendario_t, inflows, topologia, cubos=None):
+    """InputData + extras a partir de las piezas (perfiles desde su propia caché; cubos: carga_cubos)."""
+    stages, blocks, calendario = calendario_t
+    reservoirs, input_extras = topologia
+    with PERFIL.fase("perfiles"):
+        perfiles = carga_perfiles_bloque(calendario, PERFILES_CSV)   # memmap + caché por hash; None sin archivo
+    cubo_dem, cubo_infl, hidrologia = cubos or (None, None, None)
     return InputData(
         stages=stages, blocks=blocks, demand_total=demanda_total,
-        reservoirs=reservoirs, inflows=inflows
+        reservoirs=reservoirs, inflows=inflows, calendario=calendario, perfiles=perfiles,
+        cubo_demanda=cubo_dem, cubo_inflows=cubo_infl, hidrologia=hidrologia
     ), input_extras
 
+def load_inputs(registro: bool=False, escenario: Optional[str]=HIDROLOGIA):
+    if CUBOS and not registro:
+        # 1) + 3) Demanda e inflows como cubos en disco (se agregan a bloques leyendo por tramos)
+        with PERFIL.fase("cubos"):
+            cubos = carga_cubos(escenario)
+        with PERFIL.fase("calendario"):
+            calendario_t = carga_calendario()
+        return arma_inputs(None, calendario_t, carga_inflows(None), carga_topologia_hidro(), cubos)
+
+    # 1) Demanda proyectada
+    with PERFIL.fase("proyecta_demanda"):
+        demanda_total = carga_demanda(registro)
+
+    # 2) Calendario
+    with PERFIL.fase("calendario"):
+        calendario_t = carga_calendario()
+
+    # 3) Inflows
+    with PERFIL.fase("inflows"):
+        inflows = carga_inflows(escenario)
+
+    # 4) Hidro: catálogo, red, generadores ROR y HydroGroup
+    topologia = carga_topologia_hidro()
+
+    return arma_inputs(demanda_total, calendario_t, inflows, topologia)
+
 
 def aggregate_stage_block(inputs: InputData, techs: List[str], ex: dict):
     """
     Agrega calendario a bloques, demanda y parámetros hidro (Embalses + ROR).
+    Usa el índice hora -> bloque del Calendario: cada serie horaria se suma con un bincount.
     Devuelve: Y_list, T_by_Y, alpha, D, AF, K0, hydro
     """
-    stages = inputs.stages.copy()
-    blocks = inputs.blocks.copy()
+    cal = inputs.calendario or Calendario.desde_tablas(inputs.stages, inputs.blocks)
 
     # === Conjuntos Y y T_by_Y ===
-    Y_list = list(stages["s_id"].astype(int).sort_values().unique())
-    T_by_Y: Dict[int, List[int]] = {}
-    for y in Y_list:
-        t_list = sorted(blocks.loc[blocks["stage"] == y, "block"].unique().tolist())
-        if not t_list:
-            nb = int(stages.loc[stages["s_id"] == y, "num_blocks"].iloc[0])
-            t_list = list(range(1, nb + 1))
-        T_by_Y[y] = t_list
+    Y_list = cal.Y_list
+    T_by_Y: Dict[int, List[int]] = cal.T_by_Y
 
     # === Horas por bloque (alpha) ===
-    alpha: Dict[tuple, float] = {}
-    for y in Y_list:
-        for t in T_by_Y[y]:
-            alpha[(y, t)] = float(len(blocks[(blocks["stage"] == y) & (blocks["block"] == t)]))
+    alpha: Dict[tuple, float] = cal.a_dict(cal.alpha)
 
     # === Demanda por bloque (SUMA) ===
-    D: Dict[tuple, float] = {}
-    merged_D = blocks.merge(inputs.demand_total, how="left", on="time")
-    grpD = merged_D.groupby(["stage", "block"], as_index=False)["MW_total"].sum()
-    for _, r in grpD.iterrows():
-        D[(int(r["stage"]), int(r["block"]))] = float(r["MW_total"])
+    if inputs.cubo_demanda is not None:
+        D: Dict[tuple, float] = cal.a_dict(inputs.cubo_demanda.agrega_calendario(cal)[0])
+    else:
+        dem = inputs.demand_total
+        D = cal.a_dict(cal.agrega(dem["time"].to_numpy(), dem["MW_total"].to_numpy()))
 
     # === Embalses: parámetros ===
-    reservoirs_df = inputs.reservoirs.copy()
-    R_names = reservoirs_df["name"].astype(str).tolist()
-
-    def _take_num(name: str, col: str, default: float = 0.0) -> float:
-        sub = reservoirs_df.loc[reservoirs_df["name"] == name, col]
-        return float(sub.iloc[0]) if len(sub) and pd.notna(sub.iloc[0]) else float(default)
-
-    vmax   = {r: _take_num(r, "vmax") for r in R_names}
-    vmin   = {r: _take_num(r, "vmin") for r in R_names}
-    vini   = {r: _take_num(r, "vini") for r in R_names}
-    vend   = {r: _take_num(r, "vend") for r in R_names}
-    scale  = {r: _take_num(r, "scale", 1.0) for r in R_names}
-    val_ovf= {r: _take_num(r, "val_ovf", 0.0) for r in R_names}
-
-    non_phys, non_phys_pen = {}, {}
-    for r in R_names:
-        raw_np  = reservoirs_df.loc[reservoirs_df["name"] == r, "non_physical_inflow"]
-        raw_pen = reservoirs_df.loc[reservoirs_df["name"] == r, "non_physical_inflow_penalty"]
-        non_phys[r]     = bool(raw_np.iloc[0]) if len(raw_np) and pd.notna(raw_np.iloc[0]) else False
-        non_phys_pen[r] = float(raw_pen.iloc[0]) if len(raw_pen) and pd.notna(raw_pen.iloc[0]) else 0.0
+    res = (inputs.reservoirs.assign(name=inputs.reservoirs["name"].astype(str))
+           .drop_duplicates("name").set_index("name"))
+    R_names = res.index.tolist()
+
+    def _col_num(col: str, default: float = 0.0) -> Dict[str, float]:
+        if col not in res.columns:
+            return {r: float(default) for r in R_names}
+        return pd.to_numeric(res[col], errors="coerce").fillna(default).astype(float).to_dict()
+
+    vmax   = _col_num("vmax")
+    vmin   = _col_num("vmin")
+    vini   = _col_num("vini")
+    vend   = _col_num("vend")
+    scale  = _col_num("scale", 1.0)
+    val_ovf= _col_num("val_ovf", 0.0)
+
+    non_phys     = res["non_physical_inflow"].fillna(False).astype(bool).to_dict()
+    use_fcf      = (res["use_fcf"].fillna(False).astype(bool).to_dict() if "use_fcf" in res.columns
+                    else {r: True for r in R_names})   # embalses con función de costo futuro (SDDP)
+    non_phys_pen = _col_num("non_physical_inflow_penalty", 0.0)
 
     kappa = {r: KAPPA_DEFAULT for r in R_names}
 
-    # === Inflows por bloque hacia Embalses (Afl_* -> Emb_*) ===
+    # === Inflows por bloque hacia Embalses (Afl_* -> Emb_*) y HG ROR (Afl_* -> HG_*) ===
+    # Un solo bincount: grupos 0..nE-1 embalses destino, nE.. HG destino
     inflow_to_res = ex.get("inflow_to_res", {}) or ex.get("inflow_to_reservoir", {})
-    merged_I = blocks.merge(inputs.inflows, how="left", on="time")
-    merged_I["reservoir_dst"] = merged_I["name"].map(inflow_to_res)
-    merged_I = merged_I[merged_I["reservoir_dst"].notna()].copy()
-    grpI = merged_I.groupby(["reservoir_dst", "stage", "block"], as_index=False)["inflow"].sum()
-    I_nat: Dict[tuple, float] = {}
-    for _, r in grpI.iterrows():
-        rr, yy, tt = str(r["reservoir_dst"]), int(r["stage"]), int(r["block"])
-        I_nat[(rr, yy, tt)] = float(r["inflow"]) * scale.get(rr, 1.0)
-
-    # === Inflows por bloque hacia HG ROR (Afl_* -> HG_*) ===
     inflow_to_hg = ex.get("inflow_to_hg", {})
-    merged_I_hg = blocks.merge(inputs.inflows, how="left", on="time")
-    merged_I_hg["hg_dst"] = merged_I_hg["name"].map(inflow_to_hg)
-    merged_I_hg = merged_I_hg[merged_I_hg["hg_dst"].notna()].copy()
-    grpI_hg = merged_I_hg.groupby(["hg_dst", "stage", "block"], as_index=False)["inflow"].sum()
-    I_nat_ror: Dict[tuple, float] = {}
-    for _, r in grpI_hg.iterrows():
-        gg, yy, tt = str(r["hg_dst"]), int(r["stage"]), int(r["block"])
-        I_nat_ror[(gg, yy, tt)] = float(r["inflow"])  # hm3/h sumado por horas del bloque
+    dst_res = sorted(set(inflow_to_res.values()))
+    dst_hg  = sorted(set(inflow_to_hg.values()))
+    cod_dst = {**{e: i for i, e in enumerate(dst_res)},
+               **{g: len(dst_res) + i for i, g in enumerate(dst_hg)}}
+    cod_afl = {a: cod_dst[e] for a, e in inflow_to_res.items()}
+    cod_afl.update({a: cod_dst[g] for a, g in inflow_to_hg.items()})
+
+    if inputs.cubo_inflows is not None:
+        cubo = inputs.cubo_inflows
+        W = matriz_destinos(cubo, list(inflow_to_res.items()) + list(inflow_to_hg.items()), dst_res + dst_hg)
+        I_blk = cubo.agrega_calendario(cal, inputs.hidrologia, W)
+    else:
+        infl = inputs.inflows
+        cod_nom, nombres = pd.factorize(infl["name"])
+        grupo = np.array([cod_afl.get(n, -1) for n in nombres], dtype=np.int64)[cod_nom]
+        I_blk = cal.agrega(infl["time"].to_numpy(), infl["inflow"].to_numpy(),
+                           grupo=grupo, n_grupos=len(cod_dst))
+    esc = np.array([scale.get(e, 1.0) for e in dst_res])[:, None]
+    I_nat: Dict[tuple, float] = cal.a_dict(I_blk[:len(dst_res)] * esc, dst_res)
+    I_nat_ror: Dict[tuple, float] = cal.a_dict(I_blk[len(dst_res):], dst_hg)  # hm3/h sumado por horas del bloque
 
     # === Arcos filtrados ===
     # Emb→Emb
@@ -235,16 +342,24 @@ def aggregate_stage_block(inputs: InputData, techs: List[str], ex: dict):
     # Emb→HG (origen debe ser Emb_*)
     arcs_spill_to_hg = [(u, gg) for (u, gg) in (ex.get("arcs_spill_to_hg") or []) if u in R_names]
     arcs_turb_to_hg  = [(u, gg) for (u, gg) in (ex.get("arcs_turb_to_hg")  or []) if u in R_names]
-
-    # === Perfiles no-hidro (placeholder) ===
-    AF: Dict[str, Dict[tuple, float]] = {g: {} for g in techs}
+    # Con retardo (u, d, h_delay): mismo filtro; retardo > 0 -> matriz de transferencia bloque -> bloque
+    arcs_d = {fam: [(u, d, float(h)) for (u, d, h) in (ex.get(f"{fam}_d") or [])
+                    if u in R_names and (d in R_names or fam.endswith("_to_hg"))]
+              for fam in ("arcs_spill_res", "arcs_turb_res", "arcs_spill_to_hg", "arcs_turb_to_hg")}
+    retardos = {h: cal.transferencia(h, tol=RETARDO_TOL)
+                for h in sorted({h for arcos in arcs_d.values() for (_, _, h) in arcos if h > 0})}
+
+    # === Perfiles no-hidro: media de la flota existente (Profile_*), o placeholder sin archivo ===
+    t_blk = cal.block.astype(np.int64)
+    pb = inputs.perfiles
+    flota_eol = af_flota(pb, WIND_CSV, "WindGenerator") if pb is not None else None
+    flota_sol = af_flota(pb, PV_CSV, "PvGenerator") if pb is not None else None
+    AF: Dict[str, Dict[tuple, float]] = {}
     for g in techs:
-        for y in Y_list:
-            for t in T_by_Y[y]:
-                if "eol" in g:   val = 0.40 + 0.05*((t % 4) - 1)
-                elif "sol" in g: val = [0.10, 0.50, 0.60, 0.15][(t-1) % 4]
-                else:            val = 1.0
-                AF[g][(y, t)] = float(max(0.0, min(1.0, val)))
+        if "eol" in g:   val = flota_eol if flota_eol is not None else 0.40 + 0.05*((t_blk % 4) - 1)
+        elif "sol" in g: val = flota_sol if flota_sol is not None else np.array([0.10, 0.50, 0.60, 0.15])[(t_blk-1) % 4]
+        else:            val = np.ones(cal.n_bloques)
+        AF[g] = cal.a_dict(np.clip(val, 0.0, 1.0))
 
     # === Capacidad existente (no-hidro) ===
     K0: Dict[str, float] = {}
@@ -266,7 +381,7 @@ def aggregate_stage_block(inputs: InputData, techs: List[str], ex: dict):
         "R": R_names,
         "vmax": vmax, "vmin": vmin, "vini": vini, "vend": vend,
         "kappa": kappa, "val_ovf": val_ovf,
-        "non_phys": non_phys, "non_phys_pen": non_phys_pen,
+        "non_phys": non_phys, "non_phys_pen": non_phys_pen, "use_fcf": use_fcf,
         "I_nat": I_nat,
         "arcs_spill_res": arcs_spill_res, "arcs_turb_res": arcs_turb_res,
         # ROR
@@ -276,6 +391,9 @@ def aggregate_stage_block(inputs: InputData, techs: List[str], ex: dict):
         "I_nat_ror": I_nat_ror,
         "arcs_spill_to_hg": arcs_spill_to_hg,
         "arcs_turb_to_hg": arcs_turb_to_hg,
+        # Retardos: listas *_d y T[b_destino, b_origen] por retardo (h)
+        **{f"{fam}_d": arcos for fam, arcos in arcs_d.items()},
+        "retardos": retardos,
         # HydroGroup (MW)
         "hg_sp_min": hg_sp_min,
         "hg_sp_max": hg_sp_max,
@@ -284,9 +402,119 @@ def aggregate_stage_block(inputs: InputData, techs: List[str], ex: dict):
     return Y_list, T_by_Y, alpha, D, AF, K0, hydro
 
 
+def incorpora_clusters(cl: ClustersFlota, inicio_stages, techs: List[str], Y_list: List[int],
+                       T_by_Y: Dict[int, List[int]], AF, K0, cinv, cfix, cvar, knew,
+                       perfiles: Optional[PerfilesBloque] = None,
+                       cvar_clusters: Optional[Dict[str, np.ndarray]] = None):
+    """
+    Reemplaza la capacidad existente fija de `techs` (K0 -> 0; siguen como candidatas) por los
+    clusters de la flota real (sin inversión). Cada cluster entra con K0 = su pmax máxima y
+    la capacidad en servicio de cada stage (altas/bajas de unidades) va en AF:
+      AF = (1 - forced_outage_rate) * perfil * cap(stage) / cap_max
+    Perfil: 1 en térmicas; en solar/eólica el Profile_* del cluster (zone) si está en `perfiles`,
+    si no, el de la tecnología agregada.
+    Los ESS no entran (el LP no tiene almacenamiento de baterías).
+    cvar_clusters: {cluster: costo variable por stage} (costos_combustible); sin él, vomc.
+    Devuelve techs, AF, K0, cinv, cfix, cvar, knew extendidos.
+    """
+    tab = cl.tabla[cl.tabla["clase"] != "ess"]
+    cap = cl.capacidad_por_stage(inicio_stages)[(cl.tabla["clase"] != "ess").to_numpy()]
+    cap_max = cap.max(axis=1)
+    vivo = cap_max > 0
+    tab, cap, cap_max = tab[vivo], cap[vivo], cap_max[vivo]
+
+    AF, K0 = dict(AF), {g: 0.0 for g in techs}
+    cinv, cfix, cvar, knew = dict(cinv), dict(cfix), dict(cvar), dict(knew)
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    iy = np.repeat(np.arange(len(Y_list)), [len(T_by_Y[y]) for y in Y_list])
+    disp = 1.0 - tab["forced_outage_rate"].to_numpy(np.float64)
+    af = disp[:, None] * (cap / cap_max[:, None])[:, iy]                         # (clusters, TY)
+    # perfil de la tecnología agregada homónima (si el cluster no tiene Profile_* propio)
+    por_clase = {clase: np.array([AF[g][yt] for yt in TY]) for clase, clave in (("solar", "sol"), ("eolica", "eol"))
+                 for g in techs if clave in g}
+    for k, (nombre, clase, perfil, vomc) in enumerate(zip(tab.index, tab["clase"], tab["perfil"], tab["vomc_avg"])):
+        propio = perfiles.fila(perfil) if perfiles is not None else None
+        if propio is not None:
+            af[k] *= np.clip(np.asarray(propio, dtype=np.float64), 0.0, 1.0)
+        elif clase in por_clase:
+            af[k] *= por_clase[clase]
+        AF[nombre] = dict(zip(TY, af[k].tolist()))
+        K0[nombre] = float(cap_max[k])
+        for y in Y_list:
+            cinv[(nombre, y)], cfix[(nombre, y)], knew[(nombre, y)] = 0.0, 0.0, 0.0
+        cv = cvar_clusters.get(nombre) if cvar_clusters is not None else None
+        for j, y in enumerate(Y_list):
+            cvar[(nombre, y)] = float(vomc) if cv is None else float(cv[j])
+    return list(techs) + tab.index.tolist(), AF, K0, cinv, cfix, cvar, knew
+
+
+def candidatos_caso(inputs: InputData, Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew):
+    """
+    Catálogo de candidatos reales (térmicas, solares y eólicas con candidate = True) con costo de
+    inversión por año de gen_inv_cost.csv, podado por dominancia con cap_util por barra
+    (capacidad_util_barras: punta de la barra + exportación de sus líneas, red de BRANCH_CSV) y
+    agregado como tecnologías del LP.
+    Térmicas: cvar con combustible (costos_combustible) si COSTOS_COMBUSTIBLE: la media del stage en
+    cvar y el costo por bloque en cvar_ty (sólo candidatos con precio de combustible).
+    Devuelve cat, cvar_ty, techs, AF, K0, cinv, cfix, cvar, knew.
+    """
+    rutas = {"ThermalGenerator": THERMAL_CSV, "PvGenerator": PV_CSV, "WindGenerator": WIND_CSV}
+    cvar_stage, cvar_ty = None, {}
+    if COSTOS_COMBUSTIBLE and FUEL_PRICE_CSV.exists():
+        tc = tensor_costos_unidades(THERMAL_CSV, inputs.calendario, FUEL_PRICE_CSV, ESCENARIO_COMBUSTIBLE)
+        cvar_stage = dict(zip(tc.nombres, tc.por_stage(inputs.calendario)))
+        cvar_ty = tc.cvar_ty(inputs.calendario)
+    inicio = inputs.stages.set_index("s_id")["start_time"].reindex(Y_list).to_numpy()
+    cat = carga_candidatos(rutas, inicio, Y_list, GEN_INV_COST_CSV, r=DISCOUNT_R, cvar_stage=cvar_stage)
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    por_clase = {clase: np.array([AF[g][yt] for yt in TY]) for clase, clave in (("solar", "sol"), ("eolica", "eol"))
+                 for g in techs if clave in g}
+    af = af_candidatos(cat, len(TY), inputs.perfiles, por_clase)
+    red = carga_red(BRANCH_CSV, BUSBAR_CSV, SYSTEM_CSV, inicio)
+    D_barra = demanda_por_barra(proyecta_demanda(DEMANDA_BASE, DEMANDA_FACTOR, por_barra=True),
+                                inputs.calendario, LOAD_CSV, red.barras)
+    cap_util = capacidad_util_barras(red.barras, red.desde, red.hasta, red.fmax, red.fmax_rev, D_barra,
+                                     inputs.calendario.alpha)
+    nombres, pares = cat.tabla.index, len(cat.i_cand)
+    cat = poda_dominados(cat, af, cap_util=cap_util)
+    af = af[nombres.get_indexer(cat.tabla.index)]
+    print(f"[candidatos] {cat.n + len(cat.descartados)} proyectos ({pares} pares stage) -> {cat.n} "
+          f"({len(cat.i_cand)} pares) | "
+          f"descartados: {cat.descartados['motivo'].str.split(' por ').str[0].value_counts().to_dict()}")
+    cvar_ty = {g: cvar_ty[g] for g in cat.tabla.index if g in cvar_ty}
+    return (cat, cvar_ty) + incorpora_candidatos(cat, af, techs, Y_list, T_by_Y, alpha, AF, K0, cinv, cfix, cvar, knew)
+
+
 # ===== Modelo =====
+def entradas_hidro(hydro, familias, destinos, TY):
+    """
+    Entradas por arcos a cada destino y bloque, con retardo:
+        {(destino, (y,t)): [(variable, origen, (y',t'), peso)]}
+    retardo 0 -> mismo bloque con peso 1; retardo > 0 -> columnas de hydro["retardos"][h].
+    """
+    R, destinos = set(hydro["R"]), set(destinos)
+    ent: Dict[tuple, list] = {}
+    for fam, var in familias:
+        for arcos, T in arcos_con_retardo(hydro, fam, len(TY)):
+            for (u, d) in dict.fromkeys((u, d) for (u, d) in arcos if u in R and d in destinos):
+                if T is None:
+                    for k in TY:
+                        ent.setdefault((d, k), []).append((var, u, k, 1.0))
+                    continue
+                Tc = T.tocoo()
+                for i, j, w in zip(Tc.row.tolist(), Tc.col.tolist(), Tc.data.tolist()):
+                    ent.setdefault((d, TY[i]), []).append((var, u, TY[j], w))
+    return ent
+
+
 def build_model(Y_list, T_by_Y, alpha, D, techs, AF, K0,
-                cinv, cfix, cvar, Knew_bar, hydro, r=DISCOUNT_R):
+                cinv, cfix, cvar, Knew_bar, hydro, r=DISCOUNT_R, cotas=False, cvar_ty=None):
+    """
+    cotas=True: formulación con cotas primero (misma que backend_matricial.depura_formulacion):
+    VolMin/VolMax, InvestCap, SlackAllow y ROR_Capacity/MinHG/MaxHG como cotas de variable
+    (Slack fijo en 0 si no se permite, sin big-M) y sin GenCap cuando af <= 1.
+    cvar_ty: {g: costo variable por bloque (TY,)}; reemplaza cvar[(g, y)] en el costo de p.
+    """
     m = ConcreteModel(name="Expansion_1Z_StagesBlocks_Hydro")
 
     # --- Conjuntos de tiempo/tecnologías ---
@@ -304,9 +532,13 @@ def build_model(Y_list, T_by_Y, alpha, D, techs, AF, K0,
     m.cinv = Param(m.G, m.Y, initialize=lambda m,g,y: cinv[(g,y)], within=NonNegativeReals)
     m.cfix = Param(m.G, m.Y, initialize=lambda m,g,y: cfix[(g,y)], within=NonNegativeReals)
     m.cvar = Param(m.G, m.Y, initialize=lambda m,g,y: cvar[(g,y)], within=NonNegativeReals)
+    pos_ty = {k: i for i, k in enumerate(TY)}
+    cvar_ty = {g: _arr_ty(v, TY) for g, v in (cvar_ty or {}).items()}
+    m.cvar_ty = Param(m.G, m.TY, within=NonNegativeReals,
+                      initialize=lambda m,g,y,t: float(cvar_ty[g][pos_ty[(y,t)]]) if g in cvar_ty else cvar[(g,y)])
     m.af   = Param(m.G, m.TY, initialize=lambda m,g,y,t: AF[g][(y,t)], within=NonNegativeReals)
     m.kbar = Param(m.G, m.Y, initialize=lambda m,g,y: Knew_bar[(g,y)], within=NonNegativeReals)
-    m.C_ENS = Param(initialize=4000.0)
+    m.C_ENS = Param(initialize=C_ENS)
 
     # ==========================
     #       HIDRO: Embalses
@@ -329,9 +561,8 @@ def build_model(Y_list, T_by_Y, alpha, D, techs, AF, K0,
         within=NonNegativeReals
     )
 
-    # Arcos Emb->Emb (sin delay)
-    m.ArcSpillRes = Set(dimen=2, initialize=hydro.get("arcs_spill_res", []))
-    m.ArcTurbRes  = Set(dimen=2, initialize=hydro.get("arcs_turb_res",  []))
+    # Arcos Emb->Emb (con retardo si hay listas *_d)
+    ent_res = entradas_hidro(hydro, (("arcs_spill_res", "Spill"), ("arcs_turb_res", "Turb")), hydro["R"], TY)
 
     # ==========================
     #   HIDRO: Unidades ROR (HG)
@@ -347,9 +578,9 @@ def build_model(Y_list, T_by_Y, alpha, D, techs, AF, K0,
         within=NonNegativeReals
     )
 
-    # Arcos Emb->HG (sin delay)
-    m.ArcTurbToHG  = Set(dimen=2, initialize=hydro.get("arcs_turb_to_hg", []))   # (Emb, HG)
-    m.ArcSpillToHG = Set(dimen=2, initialize=hydro.get("arcs_spill_to_hg", []))  # (Emb, HG)
+    # Arcos Emb->HG (con retardo si hay listas *_d)
+    ent_hg = entradas_hidro(hydro, (("arcs_turb_to_hg", "Turb"), ("arcs_spill_to_hg", "Spill")),
+                            hydro.get("ROR", []), TY)
 
     # Límites HydroGroup (MW) por HG → se multiplican por horas del bloque
     m.hg_sp_min = Param(m.ROR, initialize=lambda m,g: float(hydro.get("hg_sp_min", {}).get(g, 0.0)))
@@ -359,20 +590,27 @@ def build_model(Y_list, T_by_Y, alpha, D, techs, AF, K0,
     #         Variables
     # ==========================
     # No-hidro
-    m.x   = Var(m.G, m.Y, within=NonNegativeReals)     # inversión (MW)
+    # cotas=True: límites simples como cotas (en vez de restricciones)
+    cota = lambda regla: regla if cotas else None
+    m.x   = Var(m.G, m.Y, within=NonNegativeReals,     # inversión (MW)
+                bounds=cota(lambda m,g,y: (0.0, m.kbar[g,y])))
     m.K   = Var(m.G, m.Y, within=NonNegativeReals)     # capacidad (MW)
     m.p   = Var(m.G, m.TY, within=NonNegativeReals)    # energía (MWh/bloque)
     m.ens = Var(m.TY,      within=NonNegativeReals)    # energía (MWh/bloque)
 
     # Embalses
-    m.V     = Var(m.R, m.TY, within=NonNegativeReals)  # volumen (hm3)
+    m.V     = Var(m.R, m.TY, within=NonNegativeReals,  # volumen (hm3)
+                  bounds=cota(lambda m,r,y,t: (m.vmin[r], m.vmax[r])))
     m.Turb  = Var(m.R, m.TY, within=NonNegativeReals)  # turbinado (hm3/bloque)
     m.Spill = Var(m.R, m.TY, within=NonNegativeReals)  # derrame (hm3/bloque)
-    m.Slack = Var(m.R, m.TY, within=NonNegativeReals)  # afluencia no física (hm3/bloque)
+    m.Slack = Var(m.R, m.TY, within=NonNegativeReals,  # afluencia no física (hm3/bloque)
+                  bounds=cota(lambda m,r,y,t: (0.0, None if m.allow_slack[r] else 0.0)))
     m.Ph    = Var(m.R, m.TY, within=NonNegativeReals)  # energía hidro de embalses (MWh/bloque)
 
     # ROR (energía MWh/bloque)
-    m.P_ror = Var(m.ROR, m.TY, within=NonNegativeReals)
+    m.P_ror = Var(m.ROR, m.TY, within=NonNegativeReals,
+                  bounds=cota(lambda m,g,y,t: (m.hg_sp_min[g] * m.alpha[(y,t)],
+                                               min(m.PmaxROR[g], m.hg_sp_max[g]) * m.alpha[(y,t)])))
 
     # ==========================
     #       Restricciones
@@ -386,15 +624,21 @@ def build_model(Y_list, T_by_Y, alpha, D, techs, AF, K0,
     m.CapEvol = Constraint(m.G, m.Y, rule=cap_evol)
 
     # Límite de inversión anual
-    m.InvestCap = Constraint(m.G, m.Y, rule=lambda m,g,y: m.x[g,y] <= m.kbar[g,y])
+    if not cotas:
+        m.InvestCap = Constraint(m.G, m.Y, rule=lambda m,g,y: m.x[g,y] <= m.kbar[g,y])
 
-    # Límite de energía no-hidro por bloque
-    m.GenCap   = Constraint(m.G, m.TY, rule=lambda m,g,y,t: m.p[g,(y,t)] <= m.K[g,y] * m.alpha[(y,t)])
+    # Límite de energía no-hidro por bloque (GenCap dominada por GenAvail si af <= 1)
+    if not cotas or any(AF[g][k] > 1.0 for g in techs for k in TY):
+        m.GenCap = Constraint(m.G, m.TY, rule=lambda m,g,y,t: m.p[g,(y,t)] <= m.K[g,y] * m.alpha[(y,t)])
     m.GenAvail = Constraint(m.G, m.TY, rule=lambda m,g,y,t: m.p[g,(y,t)] <= m.af[g,(y,t)] * m.K[g,y] * m.alpha[(y,t)])
 
     # Embalses: conversión energía
     m.HydroConv = Constraint(m.R, m.TY, rule=lambda m,r,y,t: m.Ph[r,(y,t)] == m.kappa[r] * m.Turb[r,(y,t)])
 
+    # Entradas (hm3/bloque) que llegan a un destino en (y,t) desde los bloques de origen
+    def entradas(ent, d, y, t):
+        return sum(w * getattr(m, var)[u, k] for (var, u, k, w) in ent.get((d, (y, t)), []))
+
     # Embalses: balance de volumen por bloque
     def vol_bal(m, r, y, t):
         if t == min(T_by_Y[y]):
@@ -406,50 +650,49 @@ def build_model(Y_list, T_by_Y, alpha, D, techs, AF, K0,
         else:
             Vprev = m.V[r, (y, t-1)]
 
-        # Ingresos desde otros embalses (derrame/turbinado) que lleguen a r
-        spill_in = sum(m.Spill[ru, (y,t)] for (ru, rd) in m.ArcSpillRes if rd == r)
-        turb_in  = sum(m.Turb[ru, (y,t)]  for (ru, rd) in m.ArcTurbRes  if rd == r)
-
-        return m.V[r,(y,t)] == Vprev + m.I_nat[r,(y,t)] + spill_in + turb_in \
+        # Ingresos desde otros embalses (derrame/turbinado) que lleguen a r (con su retardo)
+        return m.V[r,(y,t)] == Vprev + m.I_nat[r,(y,t)] + entradas(ent_res, r, y, t) \
                                - m.Turb[r,(y,t)] - m.Spill[r,(y,t)] + m.Slack[r,(y,t)]
     m.VolBalance = Constraint(m.R, m.TY, rule=vol_bal)
 
     # Embalses: cotas y terminal
-    m.VolMin = Constraint(m.R, m.TY, rule=lambda m,r,y,t: m.V[r,(y,t)] >= m.vmin[r])
-    m.VolMax = Constraint(m.R, m.TY, rule=lambda m,r,y,t: m.V[r,(y,t)] <= m.vmax[r])
+    if not cotas:
+        m.VolMin = Constraint(m.R, m.TY, rule=lambda m,r,y,t: m.V[r,(y,t)] >= m.vmin[r])
+        m.VolMax = Constraint(m.R, m.TY, rule=lambda m,r,y,t: m.V[r,(y,t)] <= m.vmax[r])
 
     last_y = max(Y_list)
     last_t = max(T_by_Y[last_y])
     m.VolTerminal = Constraint(m.R, rule=lambda m,r: m.V[r,(last_y, last_t)] == m.vend[r])
 
     # Embalses: bloquear Slack si no se permite
-    m.SlackAllow = Constraint(m.R, m.TY, rule=lambda m,r,y,t: m.Slack[r,(y,t)] <= m.allow_slack[r] * BIGM_SLACK)
+    if not cotas:
+        m.SlackAllow = Constraint(m.R, m.TY, rule=lambda m,r,y,t: m.Slack[r,(y,t)] <= m.allow_slack[r] * BIGM_SLACK)
 
     # -------------- ROR --------------
     # (i) Límite de potencia por bloque (MW * horas → MWh/bloque)
-    m.ROR_Capacity = Constraint(
-        m.ROR, m.TY,
-        rule=lambda m,g,y,t: m.P_ror[g,(y,t)] <= m.PmaxROR[g] * m.alpha[(y,t)]
-    )
+    if not cotas:
+        m.ROR_Capacity = Constraint(
+            m.ROR, m.TY,
+            rule=lambda m,g,y,t: m.P_ror[g,(y,t)] <= m.PmaxROR[g] * m.alpha[(y,t)]
+        )
 
     # (ii) Límite hídrico (energía ≤ κ * (agua disponible))
     def ror_water_limit(m, g, y, t):
-        # Agua turbinada/derramada desde embalses que llega a este HG en el mismo bloque
-        turb_from_res  = sum(m.Turb[r,(y,t)]  for (r, gg) in m.ArcTurbToHG  if gg == g)
-        spill_from_res = sum(m.Spill[r,(y,t)] for (r, gg) in m.ArcSpillToHG if gg == g)
-        water_available = turb_from_res + spill_from_res + m.I_nat_ror[g,(y,t)]  # hm3/bloque
+        # Agua turbinada/derramada desde embalses que llega a este HG (con su retardo)
+        water_available = entradas(ent_hg, g, y, t) + m.I_nat_ror[g,(y,t)]  # hm3/bloque
         return m.P_ror[g,(y,t)] <= m.kappa_ror[g] * water_available
     m.ROR_Water = Constraint(m.ROR, m.TY, rule=ror_water_limit)
 
     # (iii) Límites HydroGroup (MW) → energía por bloque (MWh)
-    m.ROR_MinHG = Constraint(
-        m.ROR, m.TY,
-        rule=lambda m,g,y,t: m.P_ror[g,(y,t)] >= m.hg_sp_min[g] * m.alpha[(y,t)]
-    )
-    m.ROR_MaxHG = Constraint(
-        m.ROR, m.TY,
-        rule=lambda m,g,y,t: m.P_ror[g,(y,t)] <= m.hg_sp_max[g] * m.alpha[(y,t)]
-    )
+    if not cotas:
+        m.ROR_MinHG = Constraint(
+            m.ROR, m.TY,
+            rule=lambda m,g,y,t: m.P_ror[g,(y,t)] >= m.hg_sp_min[g] * m.alpha[(y,t)]
+        )
+        m.ROR_MaxHG = Constraint(
+            m.ROR, m.TY,
+            rule=lambda m,g,y,t: m.P_ror[g,(y,t)] <= m.hg_sp_max[g] * m.alpha[(y,t)]
+        )
 
     # --- Balance de energía por bloque (MWh) ---
     def balance(m, y, t):
@@ -467,7 +710,7 @@ def build_model(Y_list, T_by_Y, alpha, D, techs, AF, K0,
                       for g in m.G for y in m.Y)
 
         oper_no_hidro = sum(m.df[y] * (
-                                sum(m.cvar[g,y]*m.p[g,(y,t)] for g in m.G) +
+                                sum(m.cvar_ty[g,y,t]*m.p[g,(y,t)] for g in m.G) +
                                 m.C_ENS*m.ens[(y,t)]
                             ) for (y,t) in m.TY)
 
@@ -481,46 +724,361 @@ def build_model(Y_list, T_by_Y, alpha, D, techs, AF, K0,
     m.TotalCost = Objective(rule=obj_rule, sense=minimize)
     return m
 
-def main():
-    inputs, ex = load_inputs(False)
-    Y_list, T_by_Y, alpha, D, AF, K0, hydro = aggregate_stage_block(inputs, TECHS, ex)
-    cinv, cfix, cvar, knew = build_costs(TECHS, Y_list)
-    m = build_model(Y_list, T_by_Y, alpha, D, TECHS, AF, K0, cinv, cfix, cvar, knew, hydro)
+def imprime_resultados_lp(res, T_by_Y):
+    """Mismo reporte que main() a partir de la solución del backend matricial (arrays).
+    Acepta también el ResultadoRodante del modo por ventanas."""
+    lp = getattr(res, "lp", res)
+    iy = np.repeat(np.arange(len(lp.Y_list)), [len(T_by_Y[y]) for y in lp.Y_list])
+    por_stage = lambda a: np.add.reduceat(a, np.r_[0, np.flatnonzero(np.diff(iy)) + 1], axis=-1) \
+        if a.shape[-1] else a
+    K, x = res.valor("K"), res.valor("x")
+    ens, p = por_stage(res.valor("ens")), por_stage(res.valor("p"))
+    g_emb = por_stage(res.valor("Ph").sum(axis=0))
+    g_ror = por_stage(res.valor("P_ror").sum(axis=0))
 
-    opt = SolverFactory(SOLVER_NAME)
-    if not (opt and opt.available(exception_flag=False)):
-        print(f"Solver '{SOLVER_NAME}' no disponible. Instala highspy (HiGHS) o usa CBC/GLPK.")
-        return
+    print("=== Resultado de optimización ===")
+    print(f"Costo total: {res.objetivo:,.0f} $")
+
+    print("\n-- Capacidad instalada por stage (MW) --")
+    for j, y in enumerate(lp.Y_list):
+        print(f"Stage {int(y)}:", {g: round(float(K[i, j]),2) for i, g in enumerate(lp.techs)})
+
+    print("\n-- Inversión nueva por stage (MW) --")
+    for j, y in enumerate(lp.Y_list):
+        print(f"Stage {int(y)}:", {g: round(float(x[i, j]),2) for i, g in enumerate(lp.techs)})
+
+    print("\n-- ENS total por stage (MWh) --")
+    for j, y in enumerate(lp.Y_list):
+        print(f"Stage {int(y)}: {ens[j]:,.1f}")
+
+    print("\n-- Generación no-hidro por tecno y stage (MWh) --")
+    for j, y in enumerate(lp.Y_list):
+        for i, g in enumerate(lp.techs):
+            print(f"Stage {int(y)} - {g}: {p[i, j]:,.1f}")
 
-    opt.solve(m, tee=False)
+    print("\n-- Generación hidro (Embalses+ROR) por stage (MWh) --")
+    for j, y in enumerate(lp.Y_list):
+        print(f"Stage {int(y)}: Emb={g_emb[j]:,.1f} | ROR={g_ror[j]:,.1f} | Total={g_emb[j]+g_ror[j]:,.1f}")
+
+def imprime_resultados_tablas(tablas, objetivo, Y_list, techs):
+    """Mismo reporte que imprime_resultados_lp desde las tablas (entidad, stage, block, valor)."""
+    tot = lambda fam: tablas[fam].groupby(["entidad", "stage"], observed=True)["valor"].sum()
+    K = tablas["K"].set_index(["entidad", "stage"])["valor"]
+    x = tablas["x"].set_index(["entidad", "stage"])["valor"]
+    p = tot("p")
+    ens = tablas["ens"].groupby("stage")["valor"].sum()
+    g_emb = tablas["Ph"].groupby("stage")["valor"].sum()
+    g_ror = tablas["P_ror"].groupby("stage")["valor"].sum()
+    de = lambda serie, y: float(serie.get(y, 0.0))
 
     print("=== Resultado de optimización ===")
-    print(f"Costo total: {value(m.TotalCost):,.0f} $")
+    print(f"Costo total: {objetivo:,.0f} $")
 
     print("\n-- Capacidad instalada por stage (MW) --")
-    for y in m.Y:
-        print(f"Stage {int(y)}:", {g: round(value(m.K[g,y]),2) for g in m.G})
+    for y in Y_list:
+        print(f"Stage {int(y)}:", {g: round(de(K, (g, y)),2) for g in techs})
 
     print("\n-- Inversión nueva por stage (MW) --")
-    for y in m.Y:
-        print(f"Stage {int(y)}:", {g: round(value(m.x[g,y]),2) for g in m.G})
+    for y in Y_list:
+        print(f"Stage {int(y)}:", {g: round(de(x, (g, y)),2) for g in techs})
 
     print("\n-- ENS total por stage (MWh) --")
-    for y in m.Y:
-        ens_MWh = sum(value(m.ens[(y,t)]) for t in T_by_Y[y])
-        print(f"Stage {int(y)}: {ens_MWh:,.1f}")
+    for y in Y_list:
+        print(f"Stage {int(y)}: {de(ens, y):,.1f}")
 
     print("\n-- Generación no-hidro por tecno y stage (MWh) --")
-    for y in m.Y:
-        for g in m.G:
-            gen_MWh = sum(value(m.p[g,(y,t)]) for t in T_by_Y[y])
-            print(f"Stage {int(y)} - {g}: {gen_MWh:,.1f}")
+    for y in Y_list:
+        for g in techs:
+            print(f"Stage {int(y)} - {g}: {de(p, (g, y)):,.1f}")
 
     print("\n-- Generación hidro (Embalses+ROR) por stage (MWh) --")
-    for y in m.Y:
-        gen_emb = sum(sum(value(m.Ph[r,(y,t)]) for r in m.R) for t in T_by_Y[y])
-        gen_ror = sum(sum(value(m.P_ror[g,(y,t)]) for g in m.ROR) for t in T_by_Y[y])
-        print(f"Stage {int(y)}: Emb={gen_emb:,.1f} | ROR={gen_ror:,.1f} | Total={gen_emb+gen_ror:,.1f}")
+    for y in Y_list:
+        e, r = de(g_emb, y), de(g_ror, y)
+        print(f"Stage {int(y)}: Emb={e:,.1f} | ROR={r:,.1f} | Total={e+r:,.1f}")
+
+def id_corrida() -> str:
+    """RUN_ID o hidrología + fecha."""
+    return RUN_ID or f"{HIDROLOGIA or 'sin_hidro'}_{pd.Timestamp.now():%Y%m%d-%H%M%S}"
+
+def guarda_resultados(tablas):
+    """Escribe las tablas en el almacén Parquet si GUARDA_PARQUET (run_id: id_corrida)."""
+    if not GUARDA_PARQUET:
+        return
+    run_id = id_corrida()
+    with PERFIL.fase("guarda_parquet"):
+        ruta = escribe_parquet(tablas, run_id, extra={"escenario": HIDROLOGIA or ""})
+    print(f"[resultados] {len(tablas)} familias -> {ruta} (run_id={run_id})")
+
+def guarda_marginales(solucion, cal: Calendario):
+    """Si MARGINALES: duales de Balance / VolBalance (ResultadoLP o modelo Pyomo) -> Parquet horario."""
+    if not MARGINALES:
+        return
+    with PERFIL.fase("marginales"):
+        mb = marginales_lp(solucion) if hasattr(solucion, "dual_fila") else marginales_pyomo(solucion)
+        mh = a_horas(mb, cal)
+        salida = escribe_marginales(mh, id_corrida())
+    print(f"[marginales] {len(mh.tiempo):,} horas, cmg medio={float(np.nanmean(mh.cmg)):,.1f} $/MWh, "
+          f"{len(mh.embalses)} valores del agua -> {salida}")
+
+def grafo_pipeline(escenario: Optional[str] = HIDROLOGIA) -> GrafoEtapas:
+    """
+    DAG de etapas cacheadas: demanda, calendario, inflows, topologia_hidro -> entradas (en
+    memoria) -> agregacion -> costos -> lp. Cada etapa declara archivos, config, módulos y las
+    funciones de este archivo que usa (su código fuente entra en la clave).
+    """
+    mod = lambda *n: [Path(__file__).with_name(f"{x}.py") for x in n]
+    g = GrafoEtapas(AlmacenArtefactos(limite_mb=CACHE_LIMITE_MB))
+    g.etapa("demanda", carga_demanda, archivos=[DEMANDA_BASE, DEMANDA_FACTOR],
+            config={"v": CACHE_VERSION}, codigo=mod("demanda_proyectada"))
+    g.etapa("calendario", carga_calendario, archivos=[STAGES_CSV, BLOCKS_CSV],
+            config={"v": CACHE_VERSION}, codigo=mod("lector_caso", "calendario"))
+    g.etapa("inflows", lambda: carga_inflows(escenario),
+            archivos=[RUTA_INFLOWS_QM3] if escenario is not None else [],
+            config={"v": CACHE_VERSION, "escenario": escenario}, codigo=mod("construye_inflows_qm3"))
+    g.etapa("topologia_hidro", carga_topologia_hidro,
+            archivos=[RESERVOIRS_CSV, HYDRO_CONN, HYDRO_GENERATOR, HYDRO_GROUP],
+            config={"v": CACHE_VERSION, "kappa": KAPPA_DEFAULT},
+            codigo=mod("lector_caso", "carga_hydroconnection", "carga_hydrogenerator", "carga_hydrogroup"))
+    g.etapa("entradas", arma_inputs, deps=["demanda", "calendario", "inflows", "topologia_hidro"],
+            archivos=[PERFILES_CSV], persiste=False)
+    g.etapa("agregacion", lambda e: aggregate_stage_block(e[0], TECHS, e[1]), deps=["entradas"],
+            archivos=[WIND_CSV, PV_CSV],
+            config={"v": CACHE_VERSION, "techs": list(TECHS), "retardo_tol": RETARDO_TOL, "kappa": KAPPA_DEFAULT},
+            codigo=mod("calendario", "perfiles_generacion"), fuentes=[aggregate_stage_block])
+    g.etapa("costos", lambda cal: build_costs(TECHS, cal[2].Y_list), deps=["calendario"],
+            config={"v": CACHE_VERSION, "techs": list(TECHS)}, fuentes=[build_costs])
+    g.etapa("lp", lambda agr, cos: depura_lp(build_lp(*agr[:4], list(TECHS), *agr[4:6], *cos, agr[6],
+                                                      r=DISCOUNT_R, c_ens=C_ENS, bigm_slack=BIGM_SLACK,
+                                                      kappa_default=KAPPA_DEFAULT)),
+            deps=["agregacion", "costos"],
+            config={"v": CACHE_VERSION, "r": DISCOUNT_R, "c_ens": C_ENS, "bigm": BIGM_SLACK,
+                    "kappa": KAPPA_DEFAULT, "cotas": COTAS_PRIMERO},
+            codigo=mod("backend_matricial"), fuentes=[depura_lp])
+    return g
+
+def depura_lp(lp, nombre: str = "lp"):
+    """Pasada de cotas (COTAS_PRIMERO): informa filas y no-ceros eliminados."""
+    if not COTAS_PRIMERO:
+        return lp
+    with PERFIL.fase("cotas"):
+        lp, rep = depura_formulacion(lp)
+    print(f"[cotas] {nombre}: filas {rep['filas_antes']:,} -> {rep['filas_despues']:,} "
+          f"(-{rep['filas_eliminadas']:,}) | no-ceros {rep['nnz_antes']:,} -> {rep['nnz_despues']:,} "
+          f"(-{rep['nnz_eliminados']:,}) | {', '.join(rep['familias'])}")
+    if PERFIL.activo:
+        PERFIL.modelo(f"{nombre}_cotas", rep)
+    return lp
+
+def resuelve_lp_perfilado(lp, nombre: str = "lp"):
+    """resuelve_lp con la traducción a HiGHS y el solve como fases separadas del perfilador."""
+    if "highs" not in SOLVER_NAME.lower():
+        return resuelve_lp(lp, SOLVER_NAME)
+    with PERFIL.fase("traduccion_highs"):
+        h = solver_highs(lp)
+    log = captura_log_highs(h) if PERFIL.activo else None
+    with PERFIL.fase("solve"):
+        h.run()
+    if PERFIL.activo:
+        PERFIL.modelo(nombre, tamano_lp(lp))
+        PERFIL.highs(nombre, h, log)
+    return resultado_highs(h, lp)
+
+def main():
+    PERFIL.reinicia(activo=PERFILAR, backend=BACKEND, modo=MODO, hidrologia=HIDROLOGIA, clusters=CLUSTERS,
+                    red_dc=RED_DC, periodos_rep=PERIODOS_REP)
+    try:
+        _main()
+    finally:
+        if PERFILAR:
+            print("\n" + PERFIL.resumen())
+            print(f"[perfil] reporte -> {PERFIL.escribe()}")
+
+def _main():
+    grafo = grafo_pipeline(HIDROLOGIA) if CACHE_ETAPAS else None
+    if grafo is not None:     # sólo se calculan (o leen) las etapas que hacen falta
+        with PERFIL.fase("cache_etapas"):
+            Y_list, T_by_Y, alpha, D, AF, K0, hydro = grafo.valor("agregacion")
+            cinv, cfix, cvar, knew = grafo.valor("costos")
+        entradas = lambda: grafo.valor("entradas")[0]
+        print(f"[cache] {grafo.resumen()}")
+    else:
+        with PERFIL.fase("load_inputs"):
+            inputs, ex = load_inputs(False)
+        with PERFIL.fase("aggregate_stage_block"):
+            Y_list, T_by_Y, alpha, D, AF, K0, hydro = aggregate_stage_block(inputs, TECHS, ex)
+        with PERFIL.fase("build_costs"):
+            cinv, cfix, cvar, knew = build_costs(TECHS, Y_list)
+        entradas = lambda: inputs
+    PERFIL.meta.update(n_stages=len(Y_list), n_bloques=len(alpha), n_embalses=len(hydro["R"]),
+                       n_ror=len(hydro.get("ROR", [])))
+    techs, barras_tech, cvar_ty = list(TECHS), {}, {}
+    if CLUSTERS:
+        with PERFIL.fase("clusters"):
+            cl = clusters_caso({"ThermalGenerator": THERMAL_CSV, "PvGenerator": PV_CSV,
+                                "WindGenerator": WIND_CSV, "ESS": ESS_CSV}, tol=CLUSTER_TOL)
+        tot = cl.reporte_error().loc["TOTAL"]
+        print(f"[clusters] {len(cl.flota)} unidades -> {cl.n_clusters} clusters (tol={CLUSTER_TOL}) | "
+              f"error medio vomc={100 * tot['err_medio_vomc_avg']:.2f}% heatrate={100 * tot['err_medio_heatrate_avg']:.2f}%")
+        inputs = entradas()
+        cvar_cl = None
+        if COSTOS_COMBUSTIBLE and FUEL_PRICE_CSV.exists():
+            with PERFIL.fase("costos_combustible"):
+                tc = tensor_clusters(tensor_costos_unidades(THERMAL_CSV, inputs.calendario, FUEL_PRICE_CSV,
+                                                            ESCENARIO_COMBUSTIBLE), cl)
+                cvar_cl = dict(zip(tc.nombres, tc.por_stage(inputs.calendario)))
+                cvar_ty.update(tc.cvar_ty(inputs.calendario))
+        inicio = inputs.stages.set_index("s_id")["start_time"].reindex(Y_list).to_numpy()
+        techs, AF, K0, cinv, cfix, cvar, knew = incorpora_clusters(cl, inicio, techs, Y_list, T_by_Y,
+                                                                   AF, K0, cinv, cfix, cvar, knew, inputs.perfiles,
+                                                                   cvar_clusters=cvar_cl)
+        barras_tech = cl.tabla["barra"].to_dict()
+    cat = None
+    if CANDIDATOS:
+        if MODO != "monolitico":
+            raise ValueError("CANDIDATOS: sólo en MODO 'monolitico' (K <= pmax del proyecto no llega a ventanas ni Benders).")
+        with PERFIL.fase("candidatos"):
+            cat, cvar_cand, techs, AF, K0, cinv, cfix, cvar, knew = candidatos_caso(
+                entradas(), Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew)
+        cvar_ty.update(cvar_cand)
+        barras_tech.update(cat.tabla["barra"].to_dict())
+    acota = (lambda lp: acota_candidatos(lp, cat)) if cat is not None else (lambda lp: lp)
+
+    if VALOR_AGUA_FCF and MODO != "rodante":
+        raise ValueError("VALOR_AGUA_FCF: sólo en MODO 'rodante' (en un LP sobre todo el horizonte del SDDP "
+                         "no hay cortes tras el último stage; ahí rige VolTerminal).")
+    if MODO == "rodante":
+        cortes, embalses_fcf = None, None
+        if VALOR_AGUA_FCF:
+            with PERFIL.fase("cortes_fcf"):
+                cortes, embalses_fcf = cortes_vigentes()
+            print(f"[fcf] {sum(len(a) for a, _ in cortes.values())} cortes SDDP sobre {len(embalses_fcf)} embalses")
+        with PERFIL.fase("solve"):
+            res = resuelve_rodante(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew, hydro,
+                                   ventana=VENTANA_STAGES, solape=SOLAPE_STAGES, r=DISCOUNT_R,
+                                   solver_name=SOLVER_NAME, compara=COMPARA_MONOLITICO, cotas=COTAS_PRIMERO,
+                                   cortes=cortes, embalses_fcf=embalses_fcf, cvar_ty=cvar_ty,
+                                   c_ens=C_ENS, bigm_slack=BIGM_SLACK, kappa_default=KAPPA_DEFAULT)
+        with PERFIL.fase("impresion"):
+            imprime_resultados_lp(res, T_by_Y)
+        guarda_resultados(tablas_resultado(res, T_by_Y, hydro["R"], hydro.get("ROR", [])))
+        print(f"\n[rodante] {len(res.ventanas)} ventanas de {VENTANA_STAGES} stages (solape {SOLAPE_STAGES}), "
+              f"estado={res.estado}")
+        if res.gap is not None:
+            print(f"[rodante] monolítico={res.objetivo_monolitico:,.0f} $ | gap={100 * res.gap:.4f}%")
+        return
+
+    if MODO == "benders":
+        with PERFIL.fase("solve"):
+            res = resuelve_benders(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew, hydro,
+                                   r=DISCOUNT_R, multicorte=BENDERS_MULTICORTE, tol=BENDERS_TOL,
+                                   max_iter=BENDERS_MAX_ITER, max_workers=BENDERS_WORKERS,
+                                   solver_name=SOLVER_NAME, cotas=COTAS_PRIMERO, c_ens=C_ENS,
+                                   bigm_slack=BIGM_SLACK, kappa_default=KAPPA_DEFAULT)
+        print("=== Resultado de optimización (Benders) ===")
+        print(f"Costo total: {res.objetivo:,.0f} $ | LB={res.cota_inferior:,.0f} $ | "
+              f"gap={100 * res.gap:.4f}% | {res.estado} en {len(res.historial)} iteraciones")
+        print("\n-- Capacidad instalada por stage (MW) --")
+        for j, y in enumerate(res.Y_list):
+            print(f"Stage {int(y)}:", {g: round(float(res.K[i, j]), 2) for i, g in enumerate(res.techs)})
+        print("\n-- Inversión nueva por stage (MW) --")
+        for j, y in enumerate(res.Y_list):
+            print(f"Stage {int(y)}:", {g: round(float(res.x[i, j]), 2) for i, g in enumerate(res.techs)})
+        return
+
+    if RED_DC:
+        with PERFIL.fase("build_lp"):
+            lp = build_lp(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew, hydro,
+                          r=DISCOUNT_R, c_ens=C_ENS, bigm_slack=BIGM_SLACK, kappa_default=KAPPA_DEFAULT,
+                          cvar_ty=cvar_ty)
+        lp = depura_lp(acota(lp), "lp_red")
+        with PERFIL.fase("proyecta_demanda_barra"):
+            proy = proyecta_demanda(DEMANDA_BASE, DEMANDA_FACTOR, por_barra=True)
+        with PERFIL.fase("solve"):
+            inputs = entradas()
+            out = resuelve_con_red(lp, inputs.stages, inputs.calendario, proy, BRANCH_CSV, BUSBAR_CSV,
+                                   SYSTEM_CSV, LOAD_CSV, THERMAL_CSV, PV_CSV, WIND_CSV, HYDRO_GENERATOR,
+                                   solver_name=SOLVER_NAME, barras_tech=barras_tech)
+        if PERFIL.activo:
+            PERFIL.modelo("lp_red", tamano_lp(out.res.lp))
+        with PERFIL.fase("impresion"):
+            imprime_resultados_lp(out.res, T_by_Y)
+        guarda_resultados(tablas_resultado(out.res))
+        print(f"\n[red] {out.limites_activos} límites de flujo en el LP tras {len(out.historial)} rondas")
+        return
+
+    if PERIODOS_REP:
+        per = reduce_periodos(Y_list, T_by_Y, alpha, D, techs, AF, hydro, PERIODOS_REP, METODO_REP)
+        dis = distorsion(per, Y_list, T_by_Y, alpha, D, techs, AF, hydro, knew)
+        print(f"[periodos] {len(Y_list)} stages -> {per.k} periodos ({METODO_REP}) | error demanda="
+              f"{100 * dis.loc['demanda', 'error_rel']:+.2f}% | error máx. por serie="
+              f"{100 * dis['error_rel'].abs().max():.2f}% ({dis['error_rel'].abs().idxmax()})")
+        if not COMPARA_MONOLITICO:
+            print("[periodos] AVISO: el error de las series no acota el del objetivo ni el de las capacidades "
+                  "(COMPARA_MONOLITICO=True los mide contra el LP completo)")
+        with PERFIL.fase("build_lp"):
+            lp = build_lp_reducido(per, Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew, hydro,
+                                   r=DISCOUNT_R, c_ens=C_ENS, bigm_slack=BIGM_SLACK, kappa_default=KAPPA_DEFAULT)
+        res = resuelve_lp_perfilado(depura_lp(acota(lp), "lp_periodos"), "lp_periodos")
+        with PERFIL.fase("impresion"):
+            imprime_resultados_lp(res, T_by_Y)
+        guarda_resultados(tablas_resultado(res))
+        if COMPARA_MONOLITICO:
+            completo = resuelve_lp_perfilado(depura_lp(acota(build_lp(
+                Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew, hydro, r=DISCOUNT_R, c_ens=C_ENS,
+                bigm_slack=BIGM_SLACK, kappa_default=KAPPA_DEFAULT, cvar_ty=cvar_ty))), "lp_completo")
+            print("[periodos] reducido vs LP completo:")
+            print(compara_solucion(per, res, completo).to_string(float_format=lambda v: f"{v:,.4g}"))
+        return
+
+    if BACKEND == "matricial":
+        if grafo is not None and not (CLUSTERS or CANDIDATOS):     # LP ya depurado, desde la caché si no cambió nada
+            with PERFIL.fase("cache_etapas"):
+                lp = grafo.valor("lp")
+            print(f"[cache] lp:{grafo.registro[-1]['origen']}")
+        else:
+            with PERFIL.fase("build_lp"):
+                lp = build_lp(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew, hydro,
+                              r=DISCOUNT_R, c_ens=C_ENS, bigm_slack=BIGM_SLACK, kappa_default=KAPPA_DEFAULT,
+                              cvar_ty=cvar_ty)
+            lp = depura_lp(acota(lp))
+        res = resuelve_lp_perfilado(lp)
+        with PERFIL.fase("impresion"):
+            imprime_resultados_lp(res, T_by_Y)
+        guarda_resultados(tablas_resultado(res))
+        guarda_marginales(res, entradas().calendario)
+        return
+
+    with PERFIL.fase("build_model"):
+        m = build_model(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, knew, hydro,
+                        cotas=COTAS_PRIMERO, cvar_ty=cvar_ty)
+        if cat is not None:       # un proyecto se construye una sola vez: K <= pmax
+            for g, pmax in cat.tabla["pmax"].items():
+                for y in Y_list:
+                    m.K[g, y].setub(float(pmax))
+
+    opt = SolverFactory(SOLVER_NAME)
+    if not (opt and opt.available(exception_flag=False)):
+        print(f"Solver '{SOLVER_NAME}' no disponible. Instala highspy (HiGHS) o usa CBC/GLPK.")
+        return
+
+    if GUARDA_PARQUET or MARGINALES:
+        m.dual = Suffix(direction=Suffix.IMPORT)
+    if hasattr(opt, "set_instance"):      # appsi: la traducción Pyomo -> HiGHS es una fase aparte
+        with PERFIL.fase("traduccion_highs"):
+            opt.set_instance(m)
+    h = getattr(opt, "_solver_model", None)
+    log = captura_log_highs(h) if PERFIL.activo and h is not None else None
+    with PERFIL.fase("solve"):
+        opt.solve(m, tee=False)
+    if PERFIL.activo:
+        PERFIL.modelo("pyomo", tamano_pyomo(m, opt))
+        PERFIL.highs("pyomo", h, log)
+    with PERFIL.fase("extraccion"):
+        tablas = tablas_pyomo(m)
+    with PERFIL.fase("impresion"):
+        imprime_resultados_tablas(tablas, value(m.TotalCost), Y_list, techs)
+    guarda_resultados(tablas)
+    guarda_marginales(m, entradas().calendario)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
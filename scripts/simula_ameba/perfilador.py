@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Perfilador de fases del pipeline de expansión
+----------------------------------------------
+Por fase (anidables: "load_inputs/proyecta_demanda"):
+  - tiempo de pared, tiempo de CPU del proceso y RSS pico (y su aumento dentro de la fase)
+Por modelo:
+  - n° de variables, restricciones y no-ceros por familia (ModeloLP o modelo Pyomo ya
+    traducido a HiGHS)
+  - estadísticas de HiGHS: iteraciones, estado, tamaño antes/después del presolve (del log,
+    capturado con captura_log_highs antes de resolver)
+El reporte es un JSON (una corrida por archivo) para seguir regresiones en el tiempo.
+Inactivo (por defecto) cada fase es un contexto vacío.
+Uso:
+    from perfilador import PERFIL
+    PERFIL.reinicia(activo=True)
+    with PERFIL.fase("build_model"):
+        ...
+    PERFIL.escribe(ruta)
+"""
+from __future__ import annotations
+import json
+import os
+import platform
+import re
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import resource
+    HAY_RESOURCE = True
+except ImportError:      # Windows
+    HAY_RESOURCE = False
+
+try:
+    import psutil
+    HAY_PSUTIL = True
+except ImportError:
+    HAY_PSUTIL = False
+
+RUTA_BASE = Path(__file__).parent.parent.parent
+RUTA_PERFIL = RUTA_BASE / "resultados" / "perfil"
+
+
+def rss_pico_mb() -> Optional[float]:
+    """RSS máximo del proceso hasta ahora (MB); None si la plataforma no lo expone."""
+    if HAY_RESOURCE:
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return kb / 1024.0 / (1024.0 if sys.platform == "darwin" else 1.0)   # macOS: bytes
+    if HAY_PSUTIL:
+        mi = psutil.Process().memory_info()
+        return getattr(mi, "peak_wset", mi.rss) / 2**20
+    return None
+
+
+def rss_mb() -> Optional[float]:
+    """RSS actual del proceso (MB)."""
+    if HAY_PSUTIL:
+        return psutil.Process().memory_info().rss / 2**20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# ===== Tamaño de modelos =====
+def _por_familia(filas_fam: Dict[str, np.ndarray], nnz_fila: np.ndarray) -> Dict[str, dict]:
+    return {fam: {"filas": int(len(f)), "nnz": int(nnz_fila[f].sum())} for fam, f in filas_fam.items()}
+
+
+def tamano_lp(lp) -> dict:
+    """Variables por familia y filas / no-ceros por familia de restricción de un ModeloLP."""
+    nnz_fila = np.diff(lp.A.indptr)
+    return {
+        "variables": {fam: int(np.prod(shape)) for fam, (_, shape) in lp.var.items()},
+        "restricciones": _por_familia({fam: lp.filas(fam).ravel() for fam in lp.fila}, nnz_fila),
+        "total": {"variables": int(lp.n_var), "restricciones": int(lp.n_fil), "nnz": int(lp.A.nnz)},
+    }
+
+
+def tamano_pyomo(m, opt=None) -> dict:
+    """
+    Variables / restricciones por componente de un modelo Pyomo. Si opt es un solver appsi de
+    HiGHS con la instancia cargada, los no-ceros por familia salen de la matriz ya traducida.
+    """
+    from pyomo.environ import Constraint, Var
+
+    out = {"variables": {v.local_name: len(v) for v in m.component_objects(Var, active=True)},
+           "restricciones": {c.local_name: {"filas": len(c)} for c in m.component_objects(Constraint, active=True)}}
+    h = getattr(opt, "_solver_model", None)
+    mapa = getattr(opt, "_pyomo_con_to_solver_con_map", None)
+    if h is not None and mapa:
+        a = h.getLp().a_matrix_
+        idx = np.asarray(a.index_, dtype=np.int64)
+        nnz_fila = np.bincount(idx, minlength=h.getNumRow()) if a.format_ == a.format_.kColwise \
+            else np.diff(np.asarray(a.start_, dtype=np.int64))
+        filas: Dict[str, List[int]] = {}
+        for con, fila in mapa.items():
+            filas.setdefault(con.parent_component().local_name, []).append(int(fila))
+        for fam, f in _por_familia({k: np.asarray(v) for k, v in filas.items()}, nnz_fila).items():
+            out["restricciones"].setdefault(fam, {}).update(f)
+        out["total"] = {"variables": int(h.getNumCol()), "restricciones": int(h.getNumRow()),
+                        "nnz": int(h.getNumNz())}
+    return out
+
+
+_RE_PRESOLVE = re.compile(r"Presolve reductions: rows (\d+)\((-?\d+)\); columns (\d+)\((-?\d+)\); "
+                          r"(?:nonzeros|elements) (\d+)\((-?\d+)\)")
+
+
+def captura_log_highs(h) -> List[str]:
+    """Suscribe al log de HiGHS (sin consola) antes de run(); devuelve la lista que se irá llenando."""
+    mensajes: List[str] = []
+    h.setOptionValue("output_flag", True)
+    h.setOptionValue("log_to_console", False)
+    h.cbLogging.subscribe(lambda e: mensajes.append(e.message))
+    return mensajes
+
+
+def estadisticas_highs(h, log: Optional[List[str]] = None) -> dict:
+    """Estado, iteraciones, objetivo y tiempo de HiGHS; reducciones del presolve si se capturó el log."""
+    info = h.getInfo()
+    out = {
+        "estado": h.modelStatusToString(h.getModelStatus()),
+        "objetivo": float(info.objective_function_value),
+        "iteraciones_simplex": int(info.simplex_iteration_count),
+        "iteraciones_ipm": int(info.ipm_iteration_count),
+        "iteraciones_crossover": int(info.crossover_iteration_count),
+        "tiempo_highs_s": float(h.getRunTime()),
+        "original": {"columnas": int(h.getNumCol()), "filas": int(h.getNumRow()), "nnz": int(h.getNumNz())},
+        "presolve": {"estado": str(h.getModelPresolveStatus()).rsplit(".", 1)[-1]},
+    }
+    texto = "".join(log or [])
+    r = _RE_PRESOLVE.search(texto)
+    if r:
+        f, df_, c, dc, n, dn = map(int, r.groups())
+        out["presolve"].update(filas=f, columnas=c, nnz=n,
+                               filas_eliminadas=-df_, columnas_eliminadas=-dc, nnz_eliminados=-dn)
+    elif "reduced to empty" in texto.lower():
+        out["presolve"].update(filas=0, columnas=0, nnz=0)
+    return out
+
+
+# ===== Perfilador =====
+class Perfilador:
+    def __init__(self, activo: bool = False):
+        self.reinicia(activo)
+
+    def reinicia(self, activo: bool = True, **meta):
+        self.activo = activo
+        self.fases: List[dict] = []
+        self.modelos: Dict[str, dict] = {}
+        self.solver: Dict[str, dict] = {}
+        self.meta: Dict[str, object] = dict(meta)
+        self._pila: List[str] = []
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def fase(self, nombre: str):
+        if not self.activo:
+            yield
+            return
+        self._pila.append(nombre)
+        ruta = "/".join(self._pila)
+        pico0 = rss_pico_mb()
+        t0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            pared, cpu = time.perf_counter() - t0, time.process_time() - c0
+            pico, actual = rss_pico_mb(), rss_mb()
+            self.fases.append({
+                "fase": ruta, "nivel": len(self._pila) - 1, "inicio_s": round(t0 - self._t0, 6),
+                "pared_s": round(pared, 6), "cpu_s": round(cpu, 6),
+                "rss_pico_mb": None if pico is None else round(pico, 1),
+                "aumento_pico_mb": None if pico is None or pico0 is None else round(pico - pico0, 1),
+                "rss_fin_mb": None if actual is None else round(actual, 1),
+            })
+            self._pila.pop()
+
+    def modelo(self, nombre: str, tamano: dict):
+        if self.activo:
+            self.modelos[nombre] = tamano
+
+    def highs(self, nombre: str, h, log: Optional[List[str]] = None):
+        if self.activo and h is not None:
+            self.solver[nombre] = estadisticas_highs(h, log)
+
+    def reporte(self) -> dict:
+        return {
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "entorno": {"python": platform.python_version(), "plataforma": platform.platform(),
+                        "numpy": np.__version__, "cpus": os.cpu_count()},
+            "meta": self.meta,
+            "total_s": round(time.perf_counter() - self._t0, 6),
+            "rss_pico_mb": rss_pico_mb(),
+            "fases": self.fases,
+            "modelos": self.modelos,
+            "solver": self.solver,
+        }
+
+    def escribe(self, ruta: Optional[Path] = None) -> Path:
+        """JSON del reporte; por defecto resultados/perfil/perfil_<fecha-hora>.json."""
+        ruta = Path(ruta) if ruta is not None else RUTA_PERFIL / f"perfil_{time.strftime('%Y%m%d-%H%M%S')}.json"
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta.write_text(json.dumps(self.reporte(), indent=2, ensure_ascii=False, default=str), encoding="utf-8")
+        return ruta
+
+    def resumen(self) -> str:
+        """Tabla corta (fases de primer nivel) para consola."""
+        filas = [f"{'fase':<28}{'pared s':>10}{'cpu s':>10}{'pico MB':>10}"]
+        for f in self.fases:
+            if f["nivel"] == 0:
+                pico = "-" if f["rss_pico_mb"] is None else f"{f['rss_pico_mb']:.0f}"
+                filas.append(f"{f['fase']:<28}{f['pared_s']:>10.3f}{f['cpu_s']:>10.3f}{pico:>10}")
+        return "\n".join(filas)
+
+
+PERFIL = Perfilador(activo=False)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Perfiles de generación (Profile_*) -> factores de planta por bloque
+--------------------------------------------------------------------
+1) La serie horaria ancha de perfiles (time, [scenario], Profile_1..Profile_n) se convierte
+   UNA vez a un arreglo float32 (hora x perfil) en disco y se abre con np.memmap; la clave
+   es el hash del contenido del archivo (si el archivo cambia, se reconvierte).
+2) Factores de planta por bloque de todos los perfiles en una sola reducción:
+       AF = (W @ P) / alpha,   W (bloques x horas del perfil) dispersa con el conteo de horas
+   Si la serie no cubre el horizonte (p.ej. un año tipo), cada hora del calendario toma la
+   hora homónima (mes, día, hora) del perfil; el 29-feb usa el 28-feb.
+3) El resultado (perfil x bloque) se guarda en caché con clave hash(perfiles) + hash(calendario).
+Ejecutar:
+    python perfiles_generacion.py
+"""
+from __future__ import annotations
+import hashlib
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from calendario import Calendario
+from lector_caso import lee_serie_ancha, lee_tabla
+
+RUTA_BASE = Path(__file__).parent.parent.parent
+RUTA_PERFILES = RUTA_BASE / "data" / "generacion" / "recursos" / "profile_power.csv"
+RUTA_CACHE = RUTA_BASE / "resultados" / "cache_perfiles"
+
+
+def hash_archivo(path: Path, bloque: int = 1 << 20) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for trozo in iter(lambda: f.read(bloque), b""):
+            h.update(trozo)
+    return h.hexdigest()
+
+
+def hash_calendario(cal: Calendario) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for a in (cal.tiempo.view(np.int64), cal.idx, cal.stage, cal.block):
+        h.update(np.ascontiguousarray(a).tobytes())
+    return h.hexdigest()
+
+
+@dataclass
+class PerfilesHorarios:
+    tiempo: np.ndarray        # datetime64[ns] (n_horas,)
+    nombres: List[str]
+    valores: np.ndarray       # float32 (n_horas, n_perfiles), np.memmap de sólo lectura
+    clave: str                # hash del archivo de origen
+
+
+def perfiles_memmap(ruta: Path = RUTA_PERFILES, dir_cache: Path = RUTA_CACHE,
+                    escenario: Optional[str] = None) -> PerfilesHorarios:
+    """Abre (o crea la primera vez) el memmap float32 hora x perfil del archivo de perfiles."""
+    ruta, dir_cache = Path(ruta), Path(dir_cache)
+    clave = hash_archivo(ruta) + (f"_{escenario}" if escenario else "")
+    f_val, f_meta, f_t = (dir_cache / f"{clave}{ext}" for ext in (".f32", ".json", "_time.npy"))
+    if not (f_val.exists() and f_meta.exists() and f_t.exists()):
+        df = lee_serie_ancha(ruta, prefijo="Profile_", escenario=escenario, float_dtype="float32")
+        df = df.sort_values("time", kind="stable")
+        nombres = [c for c in df.columns if c not in ("time", "scenario")]
+        dir_cache.mkdir(parents=True, exist_ok=True)
+        mm = np.memmap(f_val, dtype=np.float32, mode="w+", shape=(len(df), len(nombres)))
+        mm[:] = df[nombres].to_numpy(np.float32)
+        mm.flush()
+        del mm
+        np.save(f_t, df["time"].to_numpy("datetime64[ns]"))
+        f_meta.write_text(json.dumps({"nombres": nombres, "n_horas": len(df), "origen": ruta.name}))
+    meta = json.loads(f_meta.read_text())
+    valores = np.memmap(f_val, dtype=np.float32, mode="r", shape=(meta["n_horas"], len(meta["nombres"])))
+    return PerfilesHorarios(tiempo=np.load(f_t), nombres=meta["nombres"], valores=valores, clave=clave)
+
+
+def _clave_anual(t: np.ndarray) -> np.ndarray:
+    """mes*10000 + día*100 + hora; el 29-feb se lleva al 28-feb."""
+    s = pd.DatetimeIndex(t)
+    dia = np.where((s.month == 2) & (s.day == 29), 28, s.day)
+    return (s.month * 10000 + dia * 100 + s.hour).to_numpy(np.int64)
+
+
+def fila_de_hora(perf: PerfilesHorarios, cal: Calendario) -> np.ndarray:
+    """Fila del perfil para cada hora del calendario (-1 si no hay dato)."""
+    t = np.asarray(perf.tiempo, dtype="datetime64[ns]")
+    if not len(t):
+        return np.full(cal.n_horas, -1, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(t, cal.tiempo), len(t) - 1)
+    exacta = np.where(t[pos] == cal.tiempo, pos, -1)
+    if (exacta >= 0).all():
+        return exacta
+    # año tipo: primera ocurrencia de cada (mes, día, hora) en el perfil
+    k_p = _clave_anual(t)
+    k_u, primera = np.unique(k_p, return_index=True)
+    k_c = _clave_anual(cal.tiempo)
+    j = np.minimum(np.searchsorted(k_u, k_c), len(k_u) - 1)
+    anual = np.where(k_u[j] == k_c, primera[j], -1)
+    return np.where(exacta >= 0, exacta, anual)
+
+
+@dataclass
+class PerfilesBloque:
+    nombres: List[str]
+    af: np.ndarray            # float32 (n_perfiles, n_bloques) factor de planta medio del bloque
+    pos: Dict[str, int] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.pos = {n: i for i, n in enumerate(self.nombres)}
+
+    def fila(self, nombre: str) -> Optional[np.ndarray]:
+        i = self.pos.get(nombre)
+        return None if i is None else self.af[i]
+
+
+def perfiles_por_bloque(perf: PerfilesHorarios, cal: Calendario, dir_cache: Path = RUTA_CACHE,
+                        columnas: int = 128) -> PerfilesBloque:
+    """Promedio por bloque de todos los perfiles: una matriz dispersa (bloques x horas) @ memmap."""
+    dir_cache = Path(dir_cache)
+    f = dir_cache / f"af_{perf.clave}_{hash_calendario(cal)}.npy"
+    if f.exists():
+        return PerfilesBloque(nombres=list(perf.nombres), af=np.load(f, mmap_mode="r"))
+    fila = fila_de_hora(perf, cal)
+    ok = fila >= 0
+    W = sparse.csr_matrix((np.ones(int(ok.sum()), dtype=np.float32), (cal.idx[ok], fila[ok])),
+                          shape=(cal.n_bloques, perf.valores.shape[0]))
+    horas = np.asarray(W.sum(axis=1)).ravel()
+    k = perf.valores.shape[1]
+    suma = np.empty((cal.n_bloques, k), dtype=np.float32)                          # (bloques, perfiles)
+    for j in range(0, k, columnas):   # por tramos de columnas: no se copia el memmap completo
+        suma[:, j: j + columnas] = W @ np.nan_to_num(perf.valores[:, j: j + columnas])
+    af = np.divide(suma, horas[:, None], out=np.zeros_like(suma), where=horas[:, None] > 0)
+    af = np.clip(af.T, 0.0, 1.0).astype(np.float32)
+    dir_cache.mkdir(parents=True, exist_ok=True)
+    np.save(f, af)
+    return PerfilesBloque(nombres=list(perf.nombres), af=af)
+
+
+def af_flota(pb: PerfilesBloque, ruta_gen: Path, tabla: str) -> Optional[np.ndarray]:
+    """
+    (n_bloques,) perfil medio de la flota existente de una tabla (PvGenerator / WindGenerator),
+    ponderado por pmax de cada unidad según su zone. None si ninguna unidad tiene perfil.
+    """
+    g = lee_tabla(ruta_gen, tabla, columnas=["name", "connected", "candidate", "zone", "pmax"])
+    g = g[g["connected"].fillna(True) & ~g["candidate"].fillna(False)]
+    i = g["zone"].map(pb.pos)
+    ok = i.notna().to_numpy()
+    if not ok.any():
+        return None
+    w = g["pmax"].fillna(0.0).to_numpy(np.float64)[ok]
+    return (w @ np.asarray(pb.af, dtype=np.float64)[i[ok].astype(int).to_numpy()]) / max(w.sum(), 1e-12)
+
+
+def carga_perfiles_bloque(cal: Calendario, ruta: Path = RUTA_PERFILES,
+                          dir_cache: Path = RUTA_CACHE) -> Optional[PerfilesBloque]:
+    """Perfiles por bloque del caso; None si no existe el archivo de perfiles horarios."""
+    if not Path(ruta).exists():
+        return None
+    return perfiles_por_bloque(perfiles_memmap(ruta, dir_cache), cal, dir_cache)
+
+
+if __name__ == "__main__":
+    import time
+    import mvp_expansion as mx
+    from lector_caso import lee_calendario
+
+    stages, blocks = lee_calendario(mx.STAGES_CSV, mx.BLOCKS_CSV)
+    cal = Calendario.desde_tablas(stages, blocks)
+    if not RUTA_PERFILES.exists():
+        print(f"No existe {RUTA_PERFILES}")
+    else:
+        for intento in ("frío", "caché"):
+            t0 = time.perf_counter()
+            pb = carga_perfiles_bloque(cal)
+            print(f"[{intento}] {len(pb.nombres)} perfiles x {cal.n_bloques} bloques en "
+                  f"{time.perf_counter() - t0:.3f} s")
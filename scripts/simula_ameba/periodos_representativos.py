@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Reducción del calendario a periodos representativos
+----------------------------------------------------
+Agrupa stages con atributos conjuntos por stage:
+  - demanda por bloque, factores de planta por bloque de cada tecnología
+  - inflows totales del stage por embalse y por HG_* (ROR)
+(cada grupo de atributos estandarizado y con el mismo peso total).
+Métodos:
+  - "jerarquico": aglomerativo de Ward con enlace sólo entre stages contiguos (preserva la
+    cronología; cada periodo es un tramo de stages consecutivos, el balance de embalses
+    sigue encadenado tramo a tramo)
+  - "kmedoides": k-medoides (Voronoi) sobre todos los stages; los representantes se
+    encadenan en orden cronológico de su medoide (aproximación para los embalses)
+El LP reducido usa un stage por periodo: los datos del stage medoide escalados por el peso
+(n° de stages del periodo) en lugar de alpha (alpha, D, inflows). Los costos de operación y
+fijos de cada periodo se corrigen por  sum(df de sus stages) / (peso * df del representante).
+La inversión respeta la cronología: lo acumulado hasta el periodo j no supera la suma de kbar
+hasta el stage que lo etiqueta (inicio), así un periodo no adelanta la inversión de stages
+posteriores.
+El informe de distorsión compara los totales de energía por serie y el tope de inversión
+(original vs reducido); no acota el error del objetivo ni de las capacidades, que
+compara_solucion mide contra el LP completo.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backend_matricial import ModeloLP, _arr_ety, _arr_ty, build_lp
+
+# familias del LP indexadas por bloque (costos de operación)
+_OPERACION = ("p", "ens", "Spill", "Slack")
+
+
+@dataclass
+class PeriodosRepresentativos:
+    metodo: str
+    Y_list: List[int]              # stages originales
+    grupo: np.ndarray              # int (n_stages,) periodo de cada stage
+    medoide: np.ndarray            # int (k,) índice (en Y_list) del stage representante de cada periodo
+    peso: np.ndarray               # float (k,) n° de stages del periodo
+
+    @property
+    def k(self) -> int:
+        return len(self.medoide)
+
+    @property
+    def inicio(self) -> np.ndarray:
+        """Stage (índice) que etiqueta cada periodo: primero del tramo (jerárquico) o el medoide."""
+        if self.metodo == "jerarquico":
+            return np.searchsorted(self.grupo, np.arange(self.k))
+        return self.medoide
+
+    @property
+    def Y_rep(self) -> List[int]:
+        return [self.Y_list[int(i)] for i in self.inicio]
+
+
+# ===== Atributos =====
+def _por_stage(arr_ty: np.ndarray, nY: int) -> np.ndarray:
+    """(..., TY) -> (..., nY, nT)."""
+    return arr_ty.reshape(arr_ty.shape[:-1] + (nY, -1))
+
+
+def atributos(Y_list, T_by_Y, alpha, D, techs, AF, hydro) -> np.ndarray:
+    """(n_stages, n_atributos) estandarizados; cada grupo (demanda, perfiles, inflows) pesa igual."""
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    nY = len(Y_list)
+    if len({len(T_by_Y[y]) for y in Y_list}) > 1:
+        raise ValueError("periodos representativos: todos los stages deben tener el mismo n° de bloques.")
+    grupos = [_por_stage(_arr_ty(D, TY), nY)]
+    grupos += [_por_stage(_arr_ty(AF[g], TY), nY) for g in techs]
+    R, ROR = list(hydro["R"]), list(hydro.get("ROR", []))
+    if R:
+        grupos.append(_por_stage(_arr_ety(hydro["I_nat"], R, TY), nY).sum(axis=-1).T)
+    if ROR:
+        grupos.append(_por_stage(_arr_ety(hydro.get("I_nat_ror", {}), ROR, TY), nY).sum(axis=-1).T)
+    cols = []
+    for X in grupos:
+        X = X.reshape(nY, -1)
+        sd = X.std(axis=0)
+        Z = np.divide(X - X.mean(axis=0), sd, out=np.zeros_like(X), where=sd > 0)
+        cols.append(Z / np.sqrt(max(Z.shape[1], 1)))
+    return np.hstack(cols)
+
+
+# ===== Métodos =====
+def jerarquico_cronologico(X: np.ndarray, k: int) -> np.ndarray:
+    """Ward aglomerativo con enlace sólo entre tramos contiguos. Devuelve el tramo de cada stage."""
+    n = X.shape[0]
+    ini = list(range(n))                              # inicio de cada tramo
+    cnt = [1.0] * n
+    suma = [X[i].copy() for i in range(n)]
+    costo = lambda i: cnt[i] * cnt[i + 1] / (cnt[i] + cnt[i + 1]) * \
+        float(np.sum((suma[i] / cnt[i] - suma[i + 1] / cnt[i + 1]) ** 2))
+    c = [costo(i) for i in range(n - 1)]
+    while len(ini) > k:
+        i = int(np.argmin(c))                         # fusiona tramo i con i+1
+        cnt[i] += cnt.pop(i + 1)
+        suma[i] = suma[i] + suma.pop(i + 1)
+        ini.pop(i + 1)
+        c.pop(i)
+        if i < len(c):
+            c[i] = costo(i)
+        if i > 0:
+            c[i - 1] = costo(i - 1)
+    grupo = np.zeros(n, dtype=np.int64)
+    for j, s in enumerate(ini):
+        grupo[s:] = j
+    return grupo
+
+
+def kmedoides(X: np.ndarray, k: int, semilla: int = 0, max_iter: int = 100) -> Tuple[np.ndarray, np.ndarray]:
+    """k-medoides (iteración de Voronoi, inicio k-medoids++). Devuelve (grupo, medoides)."""
+    n = X.shape[0]
+    Dm = np.sqrt(((X[:, None, :] - X[None, :, :]) ** 2).sum(axis=-1))
+    rng = np.random.default_rng(semilla)
+    med = [int(rng.integers(n))]
+    for _ in range(1, k):
+        d = Dm[:, med].min(axis=1) ** 2
+        med.append(int(rng.choice(n, p=d / d.sum())) if d.sum() > 0 else int(rng.integers(n)))
+    med = np.array(med)
+    for _ in range(max_iter):
+        grupo = Dm[:, med].argmin(axis=1)
+        nuevo = med.copy()
+        for j in range(k):
+            m = np.flatnonzero(grupo == j)
+            if len(m):
+                nuevo[j] = m[Dm[np.ix_(m, m)].sum(axis=1).argmin()]
+        if np.array_equal(nuevo, med):
+            break
+        med = nuevo
+    # periodos ordenados cronológicamente por su medoide
+    orden = np.argsort(med)
+    grupo = np.argsort(orden)[Dm[:, med].argmin(axis=1)]
+    return grupo, med[orden]
+
+
+def reduce_periodos(Y_list, T_by_Y, alpha, D, techs, AF, hydro, k: int,
+                    metodo: str = "jerarquico", semilla: int = 0) -> PeriodosRepresentativos:
+    if not 1 <= k <= len(Y_list):
+        raise ValueError(f"reduce_periodos: k={k} fuera de 1..{len(Y_list)}.")
+    X = atributos(Y_list, T_by_Y, alpha, D, techs, AF, hydro)
+    if metodo == "jerarquico":
+        grupo = jerarquico_cronologico(X, k)
+        medoide = np.empty(k, dtype=np.int64)
+        for j in range(k):
+            m = np.flatnonzero(grupo == j)
+            medoide[j] = m[((X[m] - X[m].mean(axis=0)) ** 2).sum(axis=1).argmin()]
+    elif metodo == "kmedoides":
+        grupo, medoide = kmedoides(X, k, semilla)
+    else:
+        raise ValueError(f"reduce_periodos: método '{metodo}' desconocido (jerarquico | kmedoides).")
+    peso = np.bincount(grupo, minlength=k).astype(np.float64)
+    return PeriodosRepresentativos(metodo=metodo, Y_list=list(Y_list), grupo=grupo, medoide=medoide, peso=peso)
+
+
+# ===== Caso reducido =====
+def caso_reducido(per: PeriodosRepresentativos, Y_list, T_by_Y, alpha, D, techs, AF, K0,
+                  cinv, cfix, cvar, Knew_bar, hydro):
+    """Mismos argumentos de build_lp, sobre los periodos representativos (datos del medoide x peso)."""
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    Yr = per.Y_rep
+    T_r = {yr: list(T_by_Y[Y_list[int(m)]]) for yr, m in zip(Yr, per.medoide)}
+    nT = len(next(iter(T_r.values())))
+    sel = (per.medoide[:, None] * nT + np.arange(nT)[None, :]).ravel()       # bloques del medoide
+    w = np.repeat(per.peso, nT)
+    R, ROR = list(hydro["R"]), list(hydro.get("ROR", []))
+
+    a_r = _arr_ty(alpha, TY)[sel] * w
+    d_r = _arr_ty(D, TY)[sel] * w
+    af_r = {g: _arr_ty(AF[g], TY)[sel] for g in techs}
+    por_y = lambda d: {(g, yr): d[(g, Y_list[int(m)])] for g in techs for yr, m in zip(Yr, per.medoide)}
+    # costo de inversión: del stage que etiqueta el periodo
+    del_inicio = lambda d: {(g, yr): d[(g, yr)] for g in techs for yr in Yr}
+    tope = tope_inversion(per, Y_list, techs, Knew_bar)
+    hyd = dict(hydro, I_nat=_arr_ety(hydro["I_nat"], R, TY)[:, sel] * w,
+               I_nat_ror=_arr_ety(hydro.get("I_nat_ror", {}), ROR, TY)[:, sel] * w)
+    return (Yr, T_r, a_r, d_r, list(techs), af_r, dict(K0), del_inicio(cinv), por_y(cfix),
+            por_y(cvar), {(g, yr): float(tope[i, j]) for i, g in enumerate(techs) for j, yr in enumerate(Yr)}, hyd)
+
+
+def tope_inversion(per: PeriodosRepresentativos, Y_list, techs, Knew_bar) -> np.ndarray:
+    """
+    (techs, k) tope de inversión de cada periodo: incremento de la suma acumulada de kbar hasta
+    el stage que etiqueta el periodo (la inversión acumulada nunca supera la cronológica).
+    """
+    kb = np.array([[Knew_bar[(g, y)] for y in Y_list] for g in techs], dtype=np.float64).reshape(len(techs), -1)
+    acum = np.cumsum(kb, axis=1)[:, per.inicio]
+    return np.diff(acum, axis=1, prepend=0.0)
+
+
+def build_lp_reducido(per: PeriodosRepresentativos, Y_list, T_by_Y, alpha, D, techs, AF, K0,
+                      cinv, cfix, cvar, Knew_bar, hydro, r: float = 0.08, **kw) -> ModeloLP:
+    """
+    LP sobre periodos representativos. Costos de operación (p, ens, Spill, Slack) y fijos (K)
+    del periodo j multiplicados por  rho_j = sum_{s en j} df_s / (peso_j * df_rep_j).
+    """
+    args = caso_reducido(per, Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar, Knew_bar, hydro)
+    lp = build_lp(*args, r=r, **kw)
+    df_s = np.array([1.0 / ((1.0 + r) ** (y - 1)) for y in Y_list])
+    rho = np.bincount(per.grupo, weights=df_s, minlength=per.k) / (per.peso * lp.param["df"])
+    iy = lp.param["iy"]
+    for fam in _OPERACION:
+        if fam in lp.var:
+            cols = lp.cols(fam)
+            lp.c[cols] *= rho[iy] if cols.ndim == 1 else rho[iy][None, :]
+    lp.c[lp.cols("K")] *= (rho * per.peso)[None, :]
+    lp.param["peso"] = per.peso
+    return lp
+
+
+def distorsion(per: PeriodosRepresentativos, Y_list, T_by_Y, alpha, D, techs, AF, hydro,
+               Knew_bar=None) -> pd.DataFrame:
+    """
+    Totales de energía por serie: original vs reducido (sum_j peso_j * serie del medoide) y, con
+    Knew_bar, el tope de inversión total por tecnología (tope_<g>).
+    Son errores de datos: el objetivo y las capacidades pueden desviarse bastante más (compara_solucion).
+    """
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    nY = len(Y_list)
+    a = _por_stage(_arr_ty(alpha, TY), nY)
+    series = {"demanda": _por_stage(_arr_ty(D, TY), nY)}
+    series.update({f"energia_disp_{g}": _por_stage(_arr_ty(AF[g], TY), nY) * a for g in techs})
+    R, ROR = list(hydro["R"]), list(hydro.get("ROR", []))
+    for nombres, clave in ((R, "I_nat"), (ROR, "I_nat_ror")):
+        if nombres:
+            I = _por_stage(_arr_ety(hydro.get(clave, {}), nombres, TY), nY)
+            series.update({f"inflow_{e}": I[i] for i, e in enumerate(nombres)})
+    filas = []
+    for nombre, S in series.items():
+        por_stage = S.sum(axis=-1)
+        orig, red = float(por_stage.sum()), float(per.peso @ por_stage[per.medoide])
+        filas.append({"serie": nombre, "total_original": orig, "total_reducido": red,
+                      "error_rel": (red - orig) / abs(orig) if orig else 0.0})
+    if Knew_bar is not None:
+        red = tope_inversion(per, Y_list, techs, Knew_bar).sum(axis=1)
+        for g, tr in zip(techs, red):
+            orig = float(sum(Knew_bar[(g, y)] for y in Y_list))
+            filas.append({"serie": f"tope_{g}", "total_original": orig, "total_reducido": float(tr),
+                          "error_rel": (tr - orig) / abs(orig) if orig else 0.0})
+    return pd.DataFrame(filas).set_index("serie")
+
+
+def compara_solucion(per: PeriodosRepresentativos, res_reducido, res_completo) -> pd.DataFrame:
+    """
+    Error del modelo reducido contra el LP completo: objetivo, capacidad final (K del último
+    periodo vs último stage) e inversión total por tecnología y energía no suministrada.
+    """
+    lp = res_completo.lp
+    filas = [("objetivo", res_completo.objetivo, res_reducido.objetivo),
+             ("ens", float(res_completo.valor("ens").sum()),
+              float(res_reducido.valor("ens") @ np.repeat(per.peso, res_reducido.lp.param["iy"].size // per.k)))]
+    for i, g in enumerate(lp.techs):
+        filas.append((f"K_final_{g}", float(res_completo.valor("K")[i, -1]), float(res_reducido.valor("K")[i, -1])))
+        filas.append((f"inversion_{g}", float(res_completo.valor("x")[i].sum()), float(res_reducido.valor("x")[i].sum())))
+    df = pd.DataFrame(filas, columns=["magnitud", "completo", "reducido"]).set_index("magnitud")
+    df["error_rel"] = (df["reducido"] - df["completo"]) / df["completo"].abs().where(df["completo"] != 0)
+    return df.fillna({"error_rel": 0.0})
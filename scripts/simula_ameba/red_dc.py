@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Red DC multibarra con PTDF dispersa y límites de flujo perezosos
+-----------------------------------------------------------------
+- Branch/Busbar/System -> topologías: cada stage usa las líneas conectadas vigentes en su
+  start_time; una PTDF (dispersa) por topología distinta, calculada una sola vez desde las
+  reactancias:  PTDF = diag(1/x) A B_red^-1,  B = A' diag(1/x) A  (sin la barra de referencia).
+- Inyecciones por barra: las tecnologías agregadas del MVP (cc_gas, eólica, solar) se reparten
+  en barras según la pmax de ThermalGenerator / WindGenerator / PvGenerator; embalses y HG_*
+  según la barra de su HydroGenerator. La ENS pasa a ser por barra (ens = sum ens_barra).
+- El LP parte sin límites de flujo. Se resuelve, se calculan los flujos de todas las
+  (línea, bloque) en una pasada vectorizada, se agregan sólo los límites violados y se
+  re-resuelve en caliente (SesionExpansion) hasta que no queden violaciones.
+"""
+from __future__ import annotations
+import re
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import splu
+
+from backend_matricial import ModeloLP, ResultadoLP, agrega_columnas
+from lector_caso import lee_tabla
+from sesion_persistente import SesionExpansion
+
+
+@dataclass
+class RedDC:
+    barras: List[str]
+    lineas: List[str]
+    desde: np.ndarray                  # int (n_lineas,)
+    hasta: np.ndarray                  # int (n_lineas,)
+    fmax: np.ndarray                   # MW sentido desde -> hasta
+    fmax_rev: np.ndarray               # MW sentido hasta -> desde
+    ptdf: List[sparse.csr_matrix]      # una (n_lineas, n_barras) por topología; filas 0 = línea inactiva
+    topologia: np.ndarray              # int (n_stages,) topología de cada stage (orden de Y_list)
+    ref: str
+    aisladas: List[List[str]]          # por topología: barras fuera de la isla de la referencia
+
+    @property
+    def n_barras(self) -> int:
+        return len(self.barras)
+
+    @property
+    def n_lineas(self) -> int:
+        return len(self.lineas)
+
+
+def ptdf_dc(n_barras: int, desde: np.ndarray, hasta: np.ndarray, x: np.ndarray, ref: int,
+            umbral: float = 1e-8) -> sparse.csr_matrix:
+    """PTDF (n_lineas, n_barras) de una red conexa; la columna de la barra de referencia es 0."""
+    nl = len(desde)
+    A = sparse.csr_matrix((np.r_[np.ones(nl), -np.ones(nl)], (np.r_[np.arange(nl), np.arange(nl)],
+                                                              np.r_[desde, hasta])), shape=(nl, n_barras))
+    Bf = sparse.diags(1.0 / x) @ A                                        # (nl, nb)
+    B = (A.T @ Bf).tocsc()
+    resto = np.flatnonzero(np.arange(n_barras) != ref)
+    lu = splu(B[resto][:, resto].tocsc())
+    X = lu.solve(np.eye(len(resto)))                                      # B_red^-1 (denso, nb chico)
+    P = np.zeros((nl, n_barras))
+    P[:, resto] = Bf[:, resto] @ X
+    P[np.abs(P) < umbral] = 0.0
+    return sparse.csr_matrix(P)
+
+
+def carga_red(ruta_branch: Path, ruta_busbar: Path, ruta_system: Optional[Path],
+              inicio_stages: Sequence) -> RedDC:
+    """
+    inicio_stages: start_time de cada stage (orden de Y_list). Las líneas candidatas (el MVP no
+    expande transmisión), con connected=False, autolazos o fuera de vigencia en el inicio del
+    stage no participan de esa topología. La PTDF cubre la isla de la barra de referencia; las
+    barras aisladas quedan con columna nula (su inyección sólo entra al balance global).
+    """
+    barras = lee_tabla(ruta_busbar, "Busbar")["name"].astype(str).tolist()
+    pos = {b: i for i, b in enumerate(barras)}
+    br = lee_tabla(ruta_branch, "Branch")
+    br = br[br["busbari"].isin(pos) & br["busbarf"].isin(pos) & (br["busbari"] != br["busbarf"])
+            & ~br["candidate"].fillna(False).astype(bool)]
+    br = br.reset_index(drop=True)
+    desde = br["busbari"].map(pos).to_numpy(np.int64)
+    hasta = br["busbarf"].map(pos).to_numpy(np.int64)
+    x = br["x"].to_numpy(np.float64)
+    fmax = br["max_flow"].fillna(np.inf).to_numpy(np.float64)
+    fmax_rev = br["max_flow_reverse"].fillna(br["max_flow"]).fillna(np.inf).to_numpy(np.float64)
+
+    ref = barras[0]
+    if ruta_system is not None and Path(ruta_system).exists():
+        sis = lee_tabla(ruta_system, "System")
+        if len(sis) and str(sis["busbar_ref"].iloc[0]) in pos:
+            ref = str(sis["busbar_ref"].iloc[0])
+
+    # topología vigente en el inicio de cada stage
+    t = np.asarray(pd.to_datetime(pd.Series(inicio_stages)).to_numpy(), dtype="datetime64[ns]")
+    ini = br["start_time"].to_numpy("datetime64[ns]")
+    fin = br["end_time"].to_numpy("datetime64[ns]")
+    activa = (br["connected"].fillna(True).to_numpy(bool)[None, :] & (x[None, :] > 0)
+              & (ini[None, :] <= t[:, None]) & (t[:, None] < fin[None, :]))  # (n_stages, n_lineas)
+    patrones, topologia = np.unique(activa, axis=0, return_inverse=True)
+
+    ptdf, aisladas = [], []
+    for pat in patrones:
+        l = np.flatnonzero(pat)
+        G = sparse.coo_matrix((np.ones(len(l)), (desde[l], hasta[l])), shape=(len(barras),) * 2)
+        _, isla = connected_components(G, directed=False)
+        en = np.flatnonzero(isla == isla[pos[ref]])                         # isla de la referencia
+        l = l[np.isin(desde[l], en)]
+        loc = np.full(len(barras), -1)
+        loc[en] = np.arange(len(en))
+        P = ptdf_dc(len(en), loc[desde[l]], loc[hasta[l]], x[l], loc[pos[ref]]).tocoo()
+        ptdf.append(sparse.csr_matrix((P.data, (l[P.row], en[P.col])), shape=(len(br), len(barras))))
+        aisladas.append([barras[i] for i in np.flatnonzero(isla != isla[pos[ref]])])
+
+    return RedDC(barras=barras, lineas=br["name"].astype(str).tolist(), desde=desde, hasta=hasta,
+                 fmax=fmax, fmax_rev=fmax_rev, ptdf=ptdf, topologia=topologia.ravel().astype(np.int64),
+                 ref=ref, aisladas=aisladas)
+
+
+# ===== Reparto de inyecciones por barra =====
+def participaciones(entidades: List[str], filas: pd.DataFrame, barras: List[str], ref: str) -> np.ndarray:
+    """
+    filas: columnas (entidad, barra, peso). Devuelve S (n_entidades, n_barras) con filas que
+    suman 1; una entidad sin barra conocida inyecta en la barra de referencia.
+    """
+    pos_e = {e: i for i, e in enumerate(entidades)}
+    pos_b = {b: i for i, b in enumerate(barras)}
+    f = filas[filas["entidad"].isin(pos_e) & filas["barra"].isin(pos_b)]
+    S = np.zeros((len(entidades), len(barras)))
+    np.add.at(S, (f["entidad"].map(pos_e).to_numpy(), f["barra"].map(pos_b).to_numpy()),
+              f["peso"].clip(lower=0.0).to_numpy(np.float64))
+    tot = S.sum(axis=1)
+    sin = tot <= 0
+    S[sin, pos_b[ref]] = 1.0
+    tot[sin] = 1.0
+    return S / tot[:, None]
+
+
+def _norma(s: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", s.lower())
+
+
+def participaciones_caso(red: RedDC, techs: List[str], R: List[str], ROR: List[str],
+                         ruta_thermal: Path, ruta_pv: Path, ruta_wind: Path,
+                         ruta_hydro_gen: Path, barras_tech: Optional[Dict[str, str]] = None) -> Dict[str, np.ndarray]:
+    """
+    S por familia de generación del LP: {"p": (techs, barras), "Ph": (R, barras), "P_ror": (ROR, barras)}.
+    barras_tech: barra fija de techs ya localizadas (p.ej. clusters de la flota existente).
+    """
+    def flota(ruta, tabla):
+        g = lee_tabla(ruta, tabla, columnas=["name", "connected", "busbar", "pmax"])
+        g = g[g["connected"].fillna(True)]
+        return pd.DataFrame({"barra": g["busbar"].astype(str), "peso": g["pmax"].fillna(0.0)})
+
+    barras_tech = barras_tech or {}
+    partes = [pd.DataFrame({"entidad": list(barras_tech), "barra": list(barras_tech.values()), "peso": 1.0})]
+    for g in techs:   # mismo criterio por nombre que aggregate_stage_block
+        if g in barras_tech: continue
+        elif "cc_gas" in g:  src = flota(ruta_thermal, "ThermalGenerator")
+        elif "eol" in g:   src = flota(ruta_wind, "WindGenerator")
+        elif "sol" in g:   src = flota(ruta_pv, "PvGenerator")
+        else:              continue
+        partes.append(src.assign(entidad=g))
+    filas_g = pd.concat(partes, ignore_index=True)
+
+    hg = lee_tabla(ruta_hydro_gen, "HydroGenerator", columnas=["name", "connected", "busbar", "pmax",
+                                                               "hydro_group_name"])
+    hg = hg[hg["connected"].fillna(True)]
+    filas_h = pd.DataFrame({"entidad": hg["hydro_group_name"].astype(str), "barra": hg["busbar"].astype(str),
+                            "peso": hg["pmax"].fillna(0.0)})
+
+    # embalse -> HG_* homónimo (exacto; si no, el de mayor pmax que contiene el nombre)
+    grupos = filas_h.groupby("entidad")["peso"].sum()
+    clave = {g: _norma(g[3:] if g.startswith("HG_") else g) for g in grupos.index}
+    mapa = {}
+    for r in R:
+        k = _norma(r[4:] if r.startswith("Emb_") else r)
+        exactos = [g for g, c in clave.items() if c == k]
+        cand = exactos or [g for g, c in clave.items() if k and k in c]
+        if cand:
+            mapa[r] = max(cand, key=lambda g: grupos[g])
+    filas_r = filas_h.merge(pd.DataFrame({"entidad_r": list(mapa), "entidad": list(mapa.values())}), on="entidad")
+    filas_r = filas_r.drop(columns="entidad").rename(columns={"entidad_r": "entidad"})
+    sin = [r for r in R if r not in mapa]
+    if sin:
+        print(f"[WARN] embalses sin HydroGenerator asociado (inyectan en {red.ref}): {sin}")
+
+    return {"p": participaciones(techs, filas_g, red.barras, red.ref),
+            "Ph": participaciones(R, filas_r, red.barras, red.ref),
+            "P_ror": participaciones(ROR, filas_h, red.barras, red.ref)}
+
+
+def demanda_por_barra(proy, cal, ruta_load: Path, barras: List[str]) -> np.ndarray:
+    """(n_barras, n_bloques) MWh por bloque; ProyeccionDemanda por barra -> barra de Load.csv."""
+    load = lee_tabla(ruta_load, "Load", columnas=["name", "busbar"])
+    a_barra = dict(zip(load["name"].astype(str), load["busbar"].astype(str)))
+    pos = {b: i for i, b in enumerate(barras)}
+    destino = np.array([pos.get(a_barra.get("L_" + b, b), -1) for b in proy.barras])
+    if (destino < 0).any():
+        faltan = [b for b, d in zip(proy.barras, destino) if d < 0]
+        raise KeyError(f"demanda_por_barra: barras de demanda sin Busbar: {faltan}")
+    por_dem = cal.agrega(proy.tiempo, proy.valores[0])                        # (n_dem, n_bloques)
+    D = np.zeros((len(barras), cal.n_bloques))
+    np.add.at(D, destino, por_dem)
+    return D
+
+
+# ===== LP con red =====
+def _filas_vacias(lp: ModeloLP, familia: str, n: int, lo=0.0, up=0.0) -> ModeloLP:
+    """Copia del LP con n filas vacías nuevas (familia) al final."""
+    return replace(lp, A=sparse.vstack([lp.A, sparse.csr_matrix((n, lp.n_var))], format="csr"),
+                   row_lo=np.r_[lp.row_lo, np.broadcast_to(lo, (n,))],
+                   row_up=np.r_[lp.row_up, np.broadcast_to(up, (n,))],
+                   fila={**lp.fila, familia: (lp.n_fil, (n,))})
+
+
+def agrega_ens_barra(lp: ModeloLP, D_barra: np.ndarray) -> ModeloLP:
+    """Agrega ens_barra (barras*TY,) con ens_barra <= demanda y la fila ENS_Barra: ens - sum ens_barra = 0."""
+    nB, nTY = D_barra.shape
+    off_f = lp.n_fil
+    cols_ens = lp.cols("ens")
+    lp = _filas_vacias(lp, "ENS_Barra", nTY)
+    j = np.arange(nB * nTY)
+    lp = agrega_columnas(lp, "ens_barra", np.zeros(nB * nTY), 0.0, D_barra.ravel(),
+                         filas=(off_f + j % nTY, j), coef=-np.ones(nB * nTY))
+    lp.A = (lp.A + sparse.csr_matrix((np.ones(nTY), (off_f + np.arange(nTY), cols_ens)),
+                                     shape=lp.A.shape)).tocsr()
+    return lp
+
+
+@dataclass
+class ResultadoRed:
+    res: ResultadoLP
+    flujos: np.ndarray                  # (n_lineas, n_bloques) MWh por bloque (flujo medio = / alpha)
+    limites_activos: int
+    historial: List[dict] = field(default_factory=list)
+
+
+class ModeloRed:
+    """LP con red: inyecciones por barra, coeficientes de flujo por topología y lazo perezoso."""
+
+    FAMILIAS = ("p", "Ph", "P_ror", "ens_barra")
+
+    def __init__(self, lp: ModeloLP, red: RedDC, S: Dict[str, np.ndarray], D_barra: np.ndarray,
+                 solver_name: str = "appsi_highs", threads: Optional[int] = None):
+        self.red = red
+        self.lp = agrega_ens_barra(lp, D_barra)
+        self.S = {**S, "ens_barra": np.eye(red.n_barras)}
+        self.D = D_barra
+        iy = self.lp.param["iy"]
+        self.topo_bloque = red.topologia[iy]                                    # (n_bloques,)
+        self.alpha = self.lp.param["alpha"]
+        # coeficientes de flujo por topología y familia: (n_topo, n_lineas, n_entidades)
+        self.M = {f: np.stack([P @ self.S[f].T for P in red.ptdf]) for f in self.FAMILIAS}
+        self.ses = SesionExpansion(self.lp, solver_name, threads=threads)
+        # flujo que induce la demanda (PTDF·D): desplaza las cotas de las filas FlowLim
+        self.flujo_demanda = self._por_topologia(D_barra)
+        self.activos = np.zeros((red.n_lineas, len(self.alpha)), dtype=bool)
+
+    def inyecciones(self, res: ResultadoLP) -> np.ndarray:
+        """(n_barras, n_bloques) generación - demanda + ENS por barra."""
+        nTY = self.D.shape[1]
+        inj = -self.D.copy()
+        for f in self.FAMILIAS:
+            v = res.valor(f).reshape(-1, nTY)
+            inj += self.S[f].T @ v
+        return inj
+
+    def _por_topologia(self, inj: np.ndarray) -> np.ndarray:
+        """(n_barras, n_bloques) -> (n_lineas, n_bloques), cada bloque con la PTDF de su topología."""
+        F = np.zeros((self.red.n_lineas, inj.shape[1]))
+        for k, P in enumerate(self.red.ptdf):
+            b = np.flatnonzero(self.topo_bloque == k)
+            F[:, b] = P @ inj[:, b]
+        return F
+
+    def flujos(self, res: ResultadoLP) -> np.ndarray:
+        return self._por_topologia(self.inyecciones(res))
+
+    def _agrega_limites(self, l: np.ndarray, t: np.ndarray):
+        """Filas FlowLim para los pares (línea, bloque): -fmax_rev a <= PTDF·(S x - D) <= fmax a."""
+        k = self.topo_bloque[t]
+        nTY = self.D.shape[1]
+        n = len(l)
+        I, J, V = [], [], []
+        for f in self.FAMILIAS:
+            cols = self.lp.cols(f).reshape(-1, nTY)[:, t].T                   # (n, n_ent)
+            coef = self.M[f][k, l, :]                                          # (n, n_ent)
+            I.append(np.repeat(np.arange(n), cols.shape[1]))
+            J.append(cols.ravel())
+            V.append(coef.ravel())
+        I, J, V = np.concatenate(I), np.concatenate(J), np.concatenate(V)
+        nz = V != 0.0
+        A = sparse.csr_matrix((V[nz], (I[nz], J[nz])), shape=(n, self.lp.n_var))
+        carga = self.flujo_demanda[l, t]
+        a = self.alpha[t]
+        self.ses.agrega_filas("FlowLim", A, -self.red.fmax_rev[l] * a + carga, self.red.fmax[l] * a + carga)
+        self.activos[l, t] = True
+
+    def resuelve(self, tol: float = 1e-6, max_rondas: int = 50) -> ResultadoRed:
+        historial = []
+        for ronda in range(1, max_rondas + 1):
+            res = self.ses.resuelve()
+            if res.estado != "Optimal":
+                raise RuntimeError(f"Red DC: el LP terminó en '{res.estado}' (ronda {ronda}).")
+            F = self.flujos(res)
+            lim_up = self.red.fmax[:, None] * self.alpha[None, :]
+            lim_lo = -self.red.fmax_rev[:, None] * self.alpha[None, :]
+            holgura = tol * np.maximum(1.0, np.abs(lim_up))
+            viol = ((F > lim_up + holgura) | (F < lim_lo - holgura)) & ~self.activos
+            l, t = np.nonzero(viol)
+            historial.append({"ronda": ronda, "objetivo": res.objetivo, "violaciones": len(l),
+                              "limites": int(self.activos.sum()), **res.info})
+            print(f"[Red] ronda {ronda}: costo={res.objetivo:,.0f}  violaciones={len(l)}  "
+                  f"límites en el LP={int(self.activos.sum())}")
+            if not len(l):
+                return ResultadoRed(res=res, flujos=F, limites_activos=int(self.activos.sum()),
+                                    historial=historial)
+            self._agrega_limites(l, t)
+        raise RuntimeError(f"Red DC: quedan violaciones tras {max_rondas} rondas.")
+
+
+def resuelve_con_red(lp: ModeloLP, stages: pd.DataFrame, cal, proy, ruta_branch: Path, ruta_busbar: Path,
+                     ruta_system: Optional[Path], ruta_load: Path, ruta_thermal: Path, ruta_pv: Path,
+                     ruta_wind: Path, ruta_hydro_gen: Path, solver_name: str = "appsi_highs",
+                     threads: Optional[int] = None, max_rondas: int = 50,
+                     barras_tech: Optional[Dict[str, str]] = None) -> ResultadoRed:
+    """
+    lp: LP uninodal de build_lp; stages: tabla de lee_calendario; proy: ProyeccionDemanda por barra.
+    Arma la red, las participaciones y la demanda por barra, y corre el lazo perezoso.
+    """
+    ini = stages.set_index("s_id")["start_time"].reindex(lp.Y_list)
+    red = carga_red(ruta_branch, ruta_busbar, ruta_system, ini.to_numpy())
+    S = participaciones_caso(red, lp.techs, lp.R, lp.ROR, ruta_thermal, ruta_pv, ruta_wind, ruta_hydro_gen,
+                             barras_tech)
+    D_barra = demanda_por_barra(proy, cal, ruta_load, red.barras)
+    con_carga = {b for b, d in zip(red.barras, D_barra.sum(axis=1)) if d > 0}
+    for k, ais in enumerate(red.aisladas):
+        if con_carga.intersection(ais):
+            y = [lp.Y_list[i] for i in np.flatnonzero(red.topologia == k)]
+            print(f"[WARN] stages {y[0]}..{y[-1]}: barras con demanda fuera de la isla de {red.ref} "
+                  f"(sin límites de flujo): {sorted(con_carga.intersection(ais))}")
+    print(f"[Red] {red.n_barras} barras, {red.n_lineas} líneas, {len(red.ptdf)} topologías "
+          f"(ref {red.ref}); nnz PTDF={sum(P.nnz for P in red.ptdf)}")
+    return ModeloRed(lp, red, S, D_barra, solver_name, threads=threads).resuelve(max_rondas=max_rondas)
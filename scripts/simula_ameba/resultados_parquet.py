@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Extracción masiva de resultados a un almacén columnar (Parquet)
+----------------------------------------------------------------
+- tablas_resultado: primales (y duales) del backend matricial / rodante directamente desde los
+  arreglos de la solución -> DataFrames ordenados (entidad, stage, block, valor), sin value()
+- tablas_pyomo: lo mismo desde un modelo Pyomo resuelto (extract_values por componente; duales
+  si el modelo tiene un Suffix 'dual')
+- escribe_parquet: una carpeta por familia, particionada por run_id y stage (hive)
+- AlmacenResultados: lectura con poda de particiones y totales por stage (pyarrow)
+Convenciones de las tablas:
+  - familias por stage (x, K, CapEvol...) usan block = 0
+  - familias sin eje de tiempo (VolTerminal, Alfa...) usan stage = 0 y block = 0
+  - familias sin catálogo de entidades usan entidad = "" (ens, Balance) o el índice ("0", "1"...)
+  - duales con prefijo "dual_" (dual_Balance, dual_VolBalance...)
+"""
+from __future__ import annotations
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    HAY_ARROW = True
+except ImportError:
+    HAY_ARROW = False
+
+RUTA_BASE = Path(__file__).parent.parent.parent
+RUTA_RESULTADOS = RUTA_BASE / "resultados" / "parquet"
+
+# catálogo de entidades por familia (primal o restricción) del LP de expansión
+_POR_TECNOLOGIA = ("x", "K", "p", "CapEvol", "InvestCap", "GenCap", "GenAvail")
+_POR_EMBALSE = ("V", "Turb", "Spill", "Slack", "Ph", "HydroConv", "VolBalance", "VolMin", "VolMax",
+                "VolTerminal", "SlackAllow")
+_POR_ROR = ("P_ror", "ROR_Capacity", "ROR_Water", "ROR_MinHG", "ROR_MaxHG")
+# eje de tiempo por familia (como horizonte_rodante._etapa_columnas): por stage o sin tiempo;
+# el resto es por bloque (TY) si su último eje lo permite
+_POR_STAGE = ("x", "K", "CapEvol", "InvestCap")
+_SIN_TIEMPO = ("VolTerminal", "Alfa", "Corte", "Desvio")
+
+
+def _requiere_arrow():
+    if not HAY_ARROW:
+        raise ImportError("resultados_parquet: escribir/leer Parquet requiere el paquete pyarrow.")
+
+
+def _eje_tiempo(fam: Optional[str], a: np.ndarray, nTY: int) -> str:
+    """'stage', 'bloque' o 'ninguno' según el nombre de la familia (ver _POR_STAGE / _SIN_TIEMPO)."""
+    if fam in _POR_STAGE:
+        return "stage"
+    if fam in _SIN_TIEMPO or a.ndim == 0:
+        return "ninguno"
+    return "bloque" if a.shape[-1] == nTY and nTY else "ninguno"
+
+
+def tabla_familia(arr: np.ndarray, TY: Sequence[tuple], Y_list: Sequence[int],
+                  entidades: Optional[Sequence[str]] = None, familia: Optional[str] = None) -> pd.DataFrame:
+    """
+    Arreglo (..., tiempo) -> DataFrame (entidad, stage, block, valor). El último eje es Y_list
+    (familias de _POR_STAGE), TY (bloques) o ninguno; los ejes previos se aplanan como entidad.
+    Sin familia, un último eje de largo len(TY) se toma como bloques.
+    """
+    a = np.asarray(arr, dtype=np.float64)
+    nTY, nY = len(TY), len(Y_list)
+    eje = _eje_tiempo(familia, a, nTY)
+    if eje == "stage":
+        if a.ndim == 0 or a.shape[-1] != nY:
+            raise ValueError(f"tabla_familia: '{familia}' es por stage y su último eje ({a.shape}) no mide {nY}.")
+        st, bl = np.asarray(Y_list, dtype=np.int32), np.zeros(nY, dtype=np.int32)
+    elif eje == "bloque":
+        st = np.fromiter((y for y, _ in TY), dtype=np.int32, count=nTY)
+        bl = np.fromiter((t for _, t in TY), dtype=np.int32, count=nTY)
+    else:
+        a = a.reshape(a.shape + (1,))
+        st, bl = np.zeros(1, dtype=np.int32), np.zeros(1, dtype=np.int32)
+    nt = a.shape[-1]
+    a = a.reshape(-1, nt)
+    ne = a.shape[0]
+    if entidades is None:
+        entidades = [""] if ne == 1 else [str(i) for i in range(ne)]
+    elif len(entidades) != ne or len(set(entidades)) != ne:
+        raise ValueError(f"tabla_familia: '{familia}' tiene {ne} entidades y el catálogo {len(entidades)} "
+                         f"({len(set(entidades))} distintas).")
+    return pd.DataFrame({
+        "entidad": pd.Categorical.from_codes(np.repeat(np.arange(ne), nt), categories=list(entidades)),
+        "stage": np.tile(st, ne),
+        "block": np.tile(bl, ne),
+        "valor": a.ravel(),
+    })
+
+
+def _catalogo(fam: str, techs, R, ROR) -> Optional[List[str]]:
+    """Entidades de la familia (None: sin catálogo o no entregado, se usa el índice)."""
+    if fam in _POR_TECNOLOGIA:
+        cat = techs
+    elif fam in _POR_EMBALSE:
+        cat = R
+    elif fam in _POR_ROR:
+        cat = ROR
+    else:
+        return None
+    return list(cat) if len(cat) else None
+
+
+def tablas_resultado(res, T_by_Y=None, R: Sequence[str] = (), ROR: Sequence[str] = (),
+                     duales: bool = True) -> Dict[str, pd.DataFrame]:
+    """
+    {familia: DataFrame} desde un ResultadoLP (catálogos del propio LP) o un ResultadoRodante
+    (requiere T_by_Y y, para las familias hidro, R / ROR). Duales sólo para ResultadoLP.
+    """
+    lp = getattr(res, "lp", None)
+    if lp is not None:
+        Y_list, TY, techs, R, ROR = lp.Y_list, lp.TY, lp.techs, lp.R, lp.ROR
+        familias = list(lp.var)
+    else:
+        Y_list, techs = res.Y_list, res.techs
+        TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+        familias = list(res.valores)
+    out = {fam: tabla_familia(res.valor(fam), TY, Y_list, _catalogo(fam, techs, R, ROR), fam) for fam in familias}
+    if duales and lp is not None and getattr(res, "dual_fila", None) is not None and len(res.dual_fila):
+        for fam in lp.fila:
+            out[f"dual_{fam}"] = tabla_familia(res.dual(fam), TY, Y_list, _catalogo(fam, techs, R, ROR), fam)
+    return out
+
+
+def _indices_pyomo(claves: List):
+    """Índices Pyomo aplanados (g,y,t) / (r,y,t) / (y,t) / (g,y) / (r,) -> (entidad, stage, block)."""
+    if not claves:
+        return [], np.empty(0, np.int32), np.empty(0, np.int32)
+    k = [c if isinstance(c, tuple) else (c,) for c in claves]
+    # la entidad es el primer elemento si no es numérico
+    con_entidad = not isinstance(k[0][0], (int, np.integer))
+    ent = [str(c[0]) for c in k] if con_entidad else [""] * len(k)
+    resto = [c[1:] for c in k] if con_entidad else k
+    ceros = np.zeros(len(k), np.int32)
+    st = np.array([c[0] for c in resto], dtype=np.int32) if len(resto[0]) >= 1 else ceros
+    bl = np.array([c[1] for c in resto], dtype=np.int32) if len(resto[0]) >= 2 else ceros
+    return ent, st, bl
+
+
+def tablas_pyomo(m, duales: bool = True) -> Dict[str, pd.DataFrame]:
+    """{familia: DataFrame} de un modelo Pyomo resuelto (un extract_values por Var)."""
+    from pyomo.environ import Constraint, Var
+
+    out: Dict[str, pd.DataFrame] = {}
+
+    def _tabla(claves, valores):
+        ent, st, bl = _indices_pyomo(claves)
+        return pd.DataFrame({"entidad": pd.Categorical(ent), "stage": st, "block": bl,
+                             "valor": np.asarray(valores, dtype=np.float64)})
+
+    for v in m.component_objects(Var, active=True):
+        vals = v.extract_values()
+        out[v.local_name] = _tabla(list(vals), [np.nan if x is None else x for x in vals.values()])
+    dual = getattr(m, "dual", None)
+    if duales and dual is not None:
+        for c in m.component_objects(Constraint, active=True):
+            claves = list(c.keys())
+            out[f"dual_{c.local_name}"] = _tabla(claves, [dual.get(c[k], np.nan) for k in claves])
+    return out
+
+
+def escribe_parquet(tablas: Dict[str, pd.DataFrame], run_id: str, ruta: Path = RUTA_RESULTADOS,
+                    extra: Optional[Dict[str, object]] = None) -> Path:
+    """
+    Escribe cada familia en ruta/<familia>/run_id=<run_id>/stage=<s>/*.parquet (reemplaza las
+    particiones de la misma corrida). extra: columnas constantes adicionales (p.ej. escenario).
+    """
+    _requiere_arrow()
+    ruta = Path(ruta)
+    for fam, df in tablas.items():
+        tbl = pa.Table.from_pandas(df, preserve_index=False)
+        tbl = tbl.append_column("run_id", pa.array(np.full(len(df), str(run_id), dtype=object), pa.string()))
+        for k, v in (extra or {}).items():
+            tbl = tbl.append_column(k, pa.array([v] * len(df)))
+        pq.write_to_dataset(tbl, root_path=str(ruta / fam), partition_cols=["run_id", "stage"],
+                            existing_data_behavior="delete_matching")
+    return ruta
+
+
+class AlmacenResultados:
+    """Consultas sobre el almacén Parquet (poda por run_id / stage antes de leer)."""
+
+    def __init__(self, ruta: Path = RUTA_RESULTADOS):
+        _requiere_arrow()
+        self.ruta = Path(ruta)
+
+    def familias(self) -> List[str]:
+        return sorted(p.name for p in self.ruta.iterdir() if p.is_dir()) if self.ruta.exists() else []
+
+    def _dataset(self, familia: str):
+        part = ds.partitioning(pa.schema([("run_id", pa.string()), ("stage", pa.int32())]), flavor="hive")
+        return ds.dataset(str(self.ruta / familia), format="parquet", partitioning=part)
+
+    def runs(self, familia: str) -> List[str]:
+        return sorted(p.name.split("=", 1)[1] for p in (self.ruta / familia).glob("run_id=*"))
+
+    def _filtro(self, run_id, stages, entidades):
+        f = None
+        for campo, v in (("run_id", run_id), ("stage", stages), ("entidad", entidades)):
+            if v is None:
+                continue
+            v = [v] if isinstance(v, (str, int, np.integer)) else list(v)
+            if campo == "run_id":
+                v = [str(x) for x in v]
+            e = pc.field(campo).isin(v)
+            f = e if f is None else f & e
+        return f
+
+    def tabla(self, familia: str, run_id=None, stages: Optional[Iterable[int]] = None,
+              entidades: Optional[Iterable[str]] = None, columnas: Optional[List[str]] = None):
+        """pyarrow.Table filtrada (run_id / stages / entidades)."""
+        return self._dataset(familia).to_table(columns=columnas,
+                                               filter=self._filtro(run_id, stages, entidades))
+
+    def lee(self, familia: str, run_id=None, stages=None, entidades=None, columnas=None) -> pd.DataFrame:
+        df = self.tabla(familia, run_id, stages, entidades, columnas).to_pandas()
+        orden = [c for c in ("run_id", "entidad", "stage", "block") if c in df.columns]
+        return df.sort_values(orden, kind="stable").reset_index(drop=True) if orden else df
+
+    def totales_stage(self, familia: str, run_id=None, stages=None, por_entidad: bool = False) -> pd.DataFrame:
+        """Suma de 'valor' por (run_id, stage[, entidad]) agregada en pyarrow."""
+        claves = ["run_id", "stage"] + (["entidad"] if por_entidad else [])
+        tbl = self.tabla(familia, run_id, stages, columnas=claves + ["valor"])
+        if por_entidad:      # la entidad se guarda como diccionario (categórica)
+            tbl = tbl.set_column(tbl.schema.get_field_index("entidad"), "entidad",
+                                 pc.cast(tbl["entidad"], pa.string()))
+        agg = tbl.group_by(claves).aggregate([("valor", "sum")]).to_pandas()
+        agg = agg.rename(columns={"valor_sum": "valor"})
+        return agg.sort_values(claves, kind="stable").reset_index(drop=True)
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""
+Sesión de re-solve persistente sobre HiGHS
+-------------------------------------------
+Arma el LP una vez (backend matricial) y mantiene viva la instancia de HiGHS
+(la misma que envuelve 'appsi_highs'). Cada cambio de parámetros se traduce a índices
+de columnas/filas y sólo se empujan al solver los coeficientes que cambiaron:
+  - I_nat / I_nat_ror  -> lado derecho de VolBalance / ROR_Water
+  - D                  -> lado derecho de Balance
+  - cvar, cinv, cfix   -> costos de p, x, K (descontados con df)
+  - cvar_ty            -> costo de p por bloque (techs, TY) o {g: (TY,)}
+  - c_ens              -> costo de ens
+  - kbar, vmin, vmax, vend, cotas de filas / columnas
+  - K0, vini           -> condiciones iniciales (CapEvol / VolBalance del 1er bloque)
+  - alpha, AF          -> coeficientes de GenCap / GenAvail y cotas ROR por horas del bloque
+HiGHS conserva la base anterior, por lo que cada re-solve parte en caliente.
+La sesión trabaja sobre una copia del LP recibido (la matriz A se comparte: sólo se reemplaza,
+nunca se escribe): el ModeloLP del llamador sigue describiendo el modelo armado y ses.lp el vigente.
+Sobre un LP depurado (depura_formulacion) las familias convertidas en cotas (InvestCap, VolMin,
+VolMax, ROR_*) se actualizan como cotas de columna y GenCap, si se eliminó por dominada, se omite.
+Uso:
+    ses = SesionExpansion(build_lp(...))
+    r0 = ses.resuelve()
+    ses.actualiza(D={(1, 1): 5.0e5}, cvar={("cc_gas", 3): 70.0})
+    r1 = ses.resuelve()
+"""
+from __future__ import annotations
+from dataclasses import replace
+from typing import Dict, Optional, Union
+
+import numpy as np
+
+from scipy import sparse
+
+from backend_matricial import ModeloLP, ResultadoLP, cotas_columnas, resultado_highs, solver_highs
+
+Delta = Union[dict, np.ndarray, None]
+
+
+def _copia_lp(lp: ModeloLP) -> ModeloLP:
+    """Copia de lo que la sesión modifica en su lugar: c, cotas, param (y sus filas convertidas en cotas)."""
+    param = dict(lp.param)
+    if "filas_cota" in param:
+        param["filas_cota"] = {f: dict(fc, lo=fc["lo"].copy(), up=fc["up"].copy())
+                               for f, fc in param["filas_cota"].items()}
+    if "cota_base" in param:
+        param["cota_base"] = tuple(a.copy() for a in param["cota_base"])
+    return replace(lp, c=lp.c.copy(), row_lo=lp.row_lo.copy(), row_up=lp.row_up.copy(),
+                   col_lo=lp.col_lo.copy(), col_up=lp.col_up.copy(), var=dict(lp.var), fila=dict(lp.fila),
+                   param=param)
+
+
+class SesionExpansion:
+    def __init__(self, lp: ModeloLP, solver_name: str = "appsi_highs", threads: Optional[int] = None,
+                 tee: bool = False):
+        if "highs" not in solver_name.lower():
+            raise ValueError(f"SesionExpansion: solver '{solver_name}' no soportado (sólo HiGHS).")
+        self.lp = lp = _copia_lp(lp)
+        self.h = solver_highs(lp, threads=threads, tee=tee)
+        self._pos_ty = {k: i for i, k in enumerate(lp.TY)}
+        self._pos_y = {y: i for i, y in enumerate(lp.Y_list)}
+        self._pos_g = {g: i for i, g in enumerate(lp.techs)}
+        self._pos_r = {r: i for i, r in enumerate(lp.R)}
+        self._pos_h = {g: i for i, g in enumerate(lp.ROR)}
+        self.n_cambios = {"costos": 0, "filas": 0, "columnas": 0, "coeficientes": 0}
+        self.historial = []
+
+    # ---------- traducción de deltas a índices ----------
+    @staticmethod
+    def _idx(delta: Delta, shape: tuple, pos_a: dict, pos_b: Optional[dict] = None):
+        """
+        dict -> (índices planos en la familia, valores); un array completo se toma tal cual.
+        Llaves: {a: v} si pos_b es None (a puede ser (y,t)), o {(a, *b): v} con b -> pos_b.
+        """
+        if isinstance(delta, np.ndarray):
+            v = np.asarray(delta, dtype=np.float64).reshape(shape)
+            return np.arange(v.size), v.ravel()
+        idx, val = [], []
+        for key, v in delta.items():
+            if pos_b is None:
+                i = pos_a[key]
+            else:
+                b = key[1:] if len(key) > 2 else key[1]
+                i = pos_a[key[0]] * shape[-1] + pos_b[b]
+            idx.append(i)
+            val.append(float(v))
+        return np.asarray(idx, dtype=np.int64), np.asarray(val, dtype=np.float64)
+
+    def _costos_stage(self, familia: str, delta: Delta):
+        """cinv / cfix por (g, y): costo de x / K = df[y] * c."""
+        off, shape = self.lp.var[familia]
+        i, v = self._idx(delta, shape, self._pos_g, self._pos_y)
+        self._empuja_costos(off + i, v * self.lp.param["df"][i % shape[1]])
+
+    def _costos_bloque(self, delta: Delta):
+        """cvar por (g, y): se aplica a todos los bloques del stage, costo de p = df[y] * cvar."""
+        off, (nG, nTY) = self.lp.var["p"]
+        nY = len(self.lp.Y_list)
+        i, v = self._idx(delta, (nG, nY), self._pos_g, self._pos_y)
+        if not len(i):
+            return
+        iy, df = self.lp.param["iy"], self.lp.param["df"]
+        C = np.full((nG, nY), np.nan)
+        C.ravel()[i] = v
+        g, t = np.nonzero(~np.isnan(C[:, iy]))
+        self._empuja_costos(off + g * nTY + t, df[iy[t]] * C[g, iy[t]])
+
+    def _empuja_costos(self, cols: np.ndarray, vals: np.ndarray):
+        cambia = self.lp.c[cols] != vals
+        cols, vals = cols[cambia], vals[cambia]
+        if len(cols):
+            self.lp.c[cols] = vals
+            self.h.changeColsCost(len(cols), cols.astype(np.int32), vals)
+            self.n_cambios["costos"] += len(cols)
+
+    def _empuja_filas(self, filas: np.ndarray, lo: Optional[np.ndarray], up: Optional[np.ndarray]):
+        lo = self.lp.row_lo[filas] if lo is None else lo
+        up = self.lp.row_up[filas] if up is None else up
+        cambia = (self.lp.row_lo[filas] != lo) | (self.lp.row_up[filas] != up)
+        filas, lo, up = filas[cambia], lo[cambia], up[cambia]
+        if len(filas):
+            self.lp.row_lo[filas], self.lp.row_up[filas] = lo, up
+            self.h.changeRowsBounds(len(filas), filas.astype(np.int32), lo, up)
+            self.n_cambios["filas"] += len(filas)
+
+    def _empuja_columnas(self, cols: np.ndarray, lo: np.ndarray, up: np.ndarray):
+        lp = self.lp
+        cambia = (lp.col_lo[cols] != lo) | (lp.col_up[cols] != up)
+        cols, lo, up = cols[cambia], lo[cambia], up[cambia]
+        sin_coef = lp.param.get("cols_sin_coef")
+        if sin_coef is not None and len(cols) and np.isin(cols, sin_coef).any():
+            raise ValueError("SesionExpansion: columnas sin coeficientes (quita_coef_fijas) no pueden dejar de ser 0.")
+        if len(cols):
+            lp.col_lo[cols], lp.col_up[cols] = lo, up
+            self.h.changeColsBounds(len(cols), cols.astype(np.int32), lo, up)
+            self.n_cambios["columnas"] += len(cols)
+
+    def _empuja_familia(self, familia: str, i: np.ndarray, lo: Optional[np.ndarray], up: Optional[np.ndarray]):
+        """
+        Filas i (índice plano en la familia): en la matriz si la familia sigue en el LP, o en las
+        cotas de sus columnas si depura_formulacion la convirtió (se recombinan todas las filas
+        convertidas que acotan esas columnas).
+        """
+        lp = self.lp
+        if familia in lp.fila:
+            self._empuja_filas(lp.fila[familia][0] + i, lo, up)
+            return
+        fc = lp.param.get("filas_cota", {}).get(familia)
+        if fc is None:
+            raise KeyError(f"SesionExpansion: la familia de filas '{familia}' no está en el LP.")
+        if lo is not None:
+            fc["lo"][i] = lo
+        if up is not None:
+            fc["up"][i] = up
+        cols = np.unique(fc["col"][i])
+        cols = cols[cols >= 0]
+        self._empuja_columnas(cols, *cotas_columnas(lp, cols))
+
+    def _forma_fila(self, familia: str) -> tuple:
+        if familia in self.lp.fila:
+            return self.lp.fila[familia][1]
+        return self.lp.param.get("filas_cota", {})[familia]["forma"]
+
+    def _empuja_coef(self, filas: np.ndarray, cols: np.ndarray, vals: np.ndarray):
+        A = self.lp.A
+        viejo = np.asarray(A[filas, cols]).ravel()
+        cambia = viejo != vals
+        filas, cols, vals, viejo = filas[cambia], cols[cambia], vals[cambia], viejo[cambia]
+        if len(filas):
+            # mantiene lp.A en sincronía (una suma dispersa; admite coeficientes nuevos)
+            self.lp.A = (A + sparse.csr_matrix((vals - viejo, (filas, cols)), shape=A.shape)).tocsr()
+            for r, c, v in zip(filas.tolist(), cols.tolist(), vals.tolist()):
+                self.h.changeCoeff(r, c, v)
+            self.n_cambios["coeficientes"] += len(filas)
+
+    def _filas(self, familia: str, delta: Delta, pos_a: dict, pos_b: Optional[dict]):
+        off, shape = self.lp.fila[familia]
+        i, v = self._idx(delta, shape, pos_a, pos_b)
+        return off + i, i, v
+
+    def _todas(self, familia: str) -> np.ndarray:
+        return np.arange(int(np.prod(self._forma_fila(familia))))
+
+    def _costos_p(self, delta):
+        """cvar por bloque: (techs, TY) completo o {g: (TY,)}; costo de p = df[y] * c."""
+        off, (nG, nTY) = self.lp.var["p"]
+        iy, df = self.lp.param["iy"], self.lp.param["df"]
+        if isinstance(delta, np.ndarray):
+            g = np.arange(nG)
+            C = np.asarray(delta, dtype=np.float64).reshape(nG, nTY)
+        else:
+            g = np.array([self._pos_g[k] for k in delta], dtype=np.int64)
+            C = np.array([np.asarray(v, dtype=np.float64) for v in delta.values()]).reshape(len(g), nTY)
+        self._empuja_costos((off + g[:, None] * nTY + np.arange(nTY)).ravel(), (df[iy][None, :] * C).ravel())
+
+    # ---------- API ----------
+    def actualiza(self, I_nat: Delta = None, I_nat_ror: Delta = None, D: Delta = None,
+                  cvar: Delta = None, cinv: Delta = None, cfix: Delta = None, cvar_ty: Delta = None,
+                  c_ens: Optional[float] = None, kbar: Delta = None, vmin: Delta = None,
+                  vmax: Delta = None, vend: Delta = None, K0: Delta = None, vini: Delta = None,
+                  alpha: Optional[np.ndarray] = None, AF: Optional[np.ndarray] = None,
+                  filas: Optional[Dict[str, tuple]] = None,
+                  cotas: Optional[Dict[str, tuple]] = None) -> "SesionExpansion":
+        """
+        Aplica deltas de parámetros. Cada delta es un dict con las mismas llaves que
+        aggregate_stage_block/build_costs ({(r,y,t): v}, {(y,t): v}, {(g,y): v}, {r: v})
+        o un array completo alineado con la familia. K0 {g: v}, vini {r: v}.
+        alpha (TY,) y AF (techs, TY) van como arrays completos; cvar_ty (techs, TY) o {g: (TY,)}
+        fija el costo de p bloque a bloque (se aplica después de cvar).
+        filas: {familia_fila: (lo, up)}, cotas: {familia_var: (lo, up)} (escalares o arrays).
+        """
+        lp, par = self.lp, self.lp.param
+
+        if cinv is not None:
+            self._costos_stage("x", cinv)
+        if cfix is not None:
+            self._costos_stage("K", cfix)
+        if cvar is not None:
+            self._costos_bloque(cvar)
+        if cvar_ty is not None:
+            self._costos_p(cvar_ty)
+        if c_ens is not None:
+            off, (n,) = lp.var["ens"]
+            self._empuja_costos(off + np.arange(n), par["df"][par["iy"]] * float(c_ens))
+            par["c_ens"] = np.array([float(c_ens)])
+
+        if K0 is not None:
+            off, (nG, nY) = lp.fila["CapEvol"]
+            i, v = self._idx(K0, (nG,), self._pos_g)
+            self._empuja_filas(off + i * nY, v, v)
+            par["k0"] = par["k0"].copy()
+            par["k0"][i] = v
+        if vini is not None:
+            off, (nR, nTY) = lp.fila["VolBalance"]
+            i, v = self._idx(vini, (nR,), self._pos_r)
+            f = off + i * nTY
+            rhs = lp.row_lo[f] - par["vini"][i] + v
+            self._empuja_filas(f, rhs, rhs)
+            par["vini"] = par["vini"].copy()
+            par["vini"][i] = v
+        if alpha is not None or AF is not None:
+            a = par["alpha"] if alpha is None else np.asarray(alpha, dtype=np.float64)
+            af = par["af"] if AF is None else np.asarray(AF, dtype=np.float64).reshape(par["af"].shape)
+            if "GenCap" not in lp.fila and np.any(af > 1.0 + 1e-9):
+                raise ValueError("SesionExpansion: GenCap se eliminó por dominada (af <= 1); "
+                                 "con AF > 1 use el LP sin depurar.")
+            K = lp.cols("K")[:, par["iy"]]
+            for fam, coef in (("GenCap", -np.broadcast_to(a, K.shape)), ("GenAvail", -af * a[None, :])):
+                if fam in lp.fila:
+                    self._empuja_coef(lp.filas(fam).ravel(), K.ravel(), coef.ravel())
+            if alpha is not None and len(lp.ROR):
+                self._empuja_familia("ROR_Capacity", self._todas("ROR_Capacity"), None,
+                                     (par["pmax_ror"][:, None] * a[None, :]).ravel())
+                self._empuja_familia("ROR_MinHG", self._todas("ROR_MinHG"),
+                                     (par["hg_min"][:, None] * a[None, :]).ravel(), None)
+                self._empuja_familia("ROR_MaxHG", self._todas("ROR_MaxHG"), None,
+                                     (par["hg_max"][:, None] * a[None, :]).ravel())
+            par["alpha"], par["af"] = a, af
+        if D is not None:
+            f, _, v = self._filas("Balance", D, self._pos_ty, None)
+            self._empuja_filas(f, v, v)
+        if I_nat is not None:
+            f, i, v = self._filas("VolBalance", I_nat, self._pos_r, self._pos_ty)
+            v = v + np.where(i % len(lp.TY) == 0, par["vini"][i // len(lp.TY)], 0.0)
+            self._empuja_filas(f, v, v)
+        if I_nat_ror is not None:
+            f, i, v = self._filas("ROR_Water", I_nat_ror, self._pos_h, self._pos_ty)
+            self._empuja_filas(f, None, par["kappa_ror"][i // len(lp.TY)] * v)
+        if kbar is not None:
+            i, v = self._idx(kbar, self._forma_fila("InvestCap"), self._pos_g, self._pos_y)
+            self._empuja_familia("InvestCap", i, None, v)
+        if vend is not None:
+            f, _, v = self._filas("VolTerminal", vend, self._pos_r, None)
+            self._empuja_filas(f, v, v)
+        for fam, delta, lado in (("VolMin", vmin, "lo"), ("VolMax", vmax, "up")):
+            if delta is None:
+                continue
+            nR, nTY = self._forma_fila(fam)
+            i, v = self._idx(delta, (nR,), self._pos_r)
+            f = (i[:, None] * nTY + np.arange(nTY)[None, :]).ravel()
+            v = np.repeat(v, nTY)
+            self._empuja_familia(fam, f, v if lado == "lo" else None, v if lado == "up" else None)
+
+        for fam, (lo, up) in (filas or {}).items():
+            f = self._todas(fam)
+            self._empuja_familia(fam, f, np.broadcast_to(np.asarray(lo, dtype=np.float64), f.shape),
+                                 np.broadcast_to(np.asarray(up, dtype=np.float64), f.shape))
+
+        for fam, (lo, up) in (cotas or {}).items():
+            cols = lp.cols(fam).ravel()
+            lo = np.broadcast_to(np.asarray(lo, dtype=np.float64), cols.shape)
+            up = np.broadcast_to(np.asarray(up, dtype=np.float64), cols.shape)
+            if "cota_base" in par:
+                # LP depurado: la cota pedida es la base; las filas convertidas siguen acotando
+                par["cota_base"][0][cols], par["cota_base"][1][cols] = lo, up
+                cols = np.unique(cols)
+                lo, up = cotas_columnas(lp, cols)
+            self._empuja_columnas(cols, lo, up)
+        return self
+
+    def actualiza_coeficientes(self, familia: str, cols: np.ndarray, valores: np.ndarray) -> "SesionExpansion":
+        """Coeficientes A[filas de la familia, cols]; valores (n_filas, len(cols)) (p.ej. cortes que cambian)."""
+        f = self.lp.filas(familia).ravel()
+        cols = np.asarray(cols, dtype=np.int64)
+        self._empuja_coef(np.repeat(f, len(cols)), np.tile(cols, len(f)),
+                          np.asarray(valores, dtype=np.float64).reshape(len(f), len(cols)).ravel())
+        return self
+
+    def agrega_filas(self, familia: str, A_nueva: sparse.spmatrix, lo, up) -> np.ndarray:
+        """
+        Agrega filas al final del LP y del solver (p.ej. cortes). Una familia puede crecer
+        en llamadas sucesivas mientras sea la última del LP. Devuelve los índices de las filas nuevas.
+        """
+        lp = self.lp
+        A_nueva = sparse.csr_matrix(A_nueva, shape=(A_nueva.shape[0], lp.n_var))
+        n = A_nueva.shape[0]
+        lo = np.broadcast_to(np.asarray(lo, dtype=np.float64), (n,)).copy()
+        up = np.broadcast_to(np.asarray(up, dtype=np.float64), (n,)).copy()
+        off = lp.n_fil
+        if familia in lp.fila:
+            off0, (n0,) = lp.fila[familia]
+            if off0 + n0 != off:
+                raise ValueError(f"agrega_filas: la familia '{familia}' no es la última del LP.")
+            lp.fila[familia] = (off0, (n0 + n,))
+        else:
+            lp.fila[familia] = (off, (n,))
+        if n:
+            lp.A = sparse.vstack([lp.A, A_nueva], format="csr")
+            lp.row_lo, lp.row_up = np.r_[lp.row_lo, lo], np.r_[lp.row_up, up]
+            self.h.addRows(n, lo, up, A_nueva.nnz, A_nueva.indptr[:-1].astype(np.int32),
+                           A_nueva.indices.astype(np.int32), A_nueva.data)
+            self.n_cambios["filas"] += n
+        return off + np.arange(n)
+
+    def resuelve(self) -> ResultadoLP:
+        """Re-solve en caliente (HiGHS parte desde la base de la resolución anterior)."""
+        self.h.run()
+        res = resultado_highs(self.h, self.lp)
+        self.historial.append({"objetivo": res.objetivo, **res.info, **self.n_cambios})
+        self.n_cambios = dict.fromkeys(self.n_cambios, 0)
+        return res
+
+
+if __name__ == "__main__":
+    import mvp_expansion as mx
+    from backend_matricial import build_lp
+
+    inputs, ex = mx.load_inputs(False)
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro = mx.aggregate_stage_block(inputs, mx.TECHS, ex)
+    cinv, cfix, cvar, knew = mx.build_costs(mx.TECHS, Y_list)
+    ses = SesionExpansion(build_lp(Y_list, T_by_Y, alpha, D, mx.TECHS, AF, K0, cinv, cfix, cvar, knew, hydro,
+                                   r=mx.DISCOUNT_R, c_ens=mx.C_ENS, bigm_slack=mx.BIGM_SLACK,
+                                   kappa_default=mx.KAPPA_DEFAULT), mx.SOLVER_NAME)
+    for f in (1.00, 1.05, 1.10):
+        ses.actualiza(D={k: v * f for k, v in D.items()})
+        res = ses.resuelve()
+        print(f"[OK] demanda x{f:.2f}: {res.estado} obj={res.objetivo:,.0f} "
+              f"iter={ses.historial[-1]['iteraciones_simplex']:.0f}")
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Fixtures comunes: módulos de scripts/simula_ameba en el path y un caso sintético pequeño."""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts" / "simula_ameba"))
+
+import mvp_expansion as mx  # noqa: E402
+from caso_sintetico import ParametrosCaso, genera_caso, usa_caso  # noqa: E402
+
+
+def pytest_addoption(parser):
+    parser.addoption("--slow", action="store_true", help="corre también las pruebas lentas (datos entregados)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: prueba lenta sobre el caso entregado (sólo con --slow)")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--slow"):
+        return
+    salta = pytest.mark.skip(reason="prueba lenta: usar --slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(salta)
+
+
+@pytest.fixture(scope="session")
+def caso(tmp_path_factory):
+    """Caso sintético 6 stages x 4 bloques escrito en un directorio temporal."""
+    par = ParametrosCaso(n_stages=6, n_bloques=4, n_embalses=3, n_ror=4, n_barras=2, n_hidrologias=1)
+    return par, genera_caso(par, tmp_path_factory.mktemp("caso") / par.nombre)
+
+
+@pytest.fixture(scope="session")
+def entradas_caso(caso):
+    """(Y_list, T_by_Y, alpha, D, AF, K0, hydro, cinv, cfix, cvar, knew) del caso sintético."""
+    par, rutas = caso
+    with usa_caso(mx, rutas, hidrologia=par.hidrologias[0]):
+        inputs, ex = mx.load_inputs(False, par.hidrologias[0])
+        Y_list, T_by_Y, alpha, D, AF, K0, hydro = mx.aggregate_stage_block(inputs, mx.TECHS, ex)
+    return (Y_list, T_by_Y, alpha, D, AF, K0, hydro) + tuple(mx.build_costs(mx.TECHS, Y_list))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Pyomo y el backend matricial (con y sin cotas primero) llegan al mismo costo total."""
+import numpy as np
+import pytest
+from pyomo.environ import value
+from pyomo.opt import SolverFactory
+
+import mvp_expansion as mx
+from backend_matricial import (build_lp, compara_backends, depura_formulacion, quita_coef_fijas, recorta_stages,
+                               resuelve_lp)
+from horizonte_rodante import resuelve_rodante
+from sesion_persistente import SesionExpansion
+
+
+def test_mismo_objetivo(entradas_caso):
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro, cinv, cfix, cvar, knew = entradas_caso
+    args = (Y_list, T_by_Y, alpha, D, list(mx.TECHS), AF, K0, cinv, cfix, cvar, knew, hydro)
+
+    objetivos = {}
+    for nombre, cotas in (("pyomo", False), ("pyomo_cotas", True)):
+        m = mx.build_model(*args, cotas=cotas)
+        SolverFactory(mx.SOLVER_NAME).solve(m, tee=False)
+        objetivos[nombre] = float(value(m.TotalCost))
+    lp = build_lp(*args)
+    objetivos["matricial"] = resuelve_lp(lp).objetivo
+    objetivos["matricial_cotas"] = resuelve_lp(depura_formulacion(lp)[0]).objetivo
+
+    ref = objetivos["pyomo"]
+    assert ref > 0
+    for nombre, obj in objetivos.items():
+        assert np.isclose(obj, ref, rtol=1e-6), f"{nombre}={obj:,.2f} vs pyomo={ref:,.2f}"
+
+
+def test_cvar_por_bloque(entradas_caso):
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro, cinv, cfix, cvar, knew = entradas_caso
+    args = (Y_list, T_by_Y, alpha, D, list(mx.TECHS), AF, K0, cinv, cfix, cvar, knew, hydro)
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    g = "cc_gas"
+    # combustible más caro en los bloques de punta (bloque 1) que en el resto del stage
+    cvar_ty = {g: np.array([cvar[(g, y)] * (2.0 if t == 1 else 0.5) for (y, t) in TY])}
+
+    m = mx.build_model(*args, cvar_ty=cvar_ty)
+    SolverFactory(mx.SOLVER_NAME).solve(m, tee=False)
+    obj_pyomo = float(value(m.TotalCost))
+    obj_lp = resuelve_lp(build_lp(*args, cvar_ty=cvar_ty)).objetivo
+    rod = resuelve_rodante(*args, ventana=len(Y_list), solape=0, cvar_ty=cvar_ty)
+
+    assert np.isclose(obj_lp, obj_pyomo, rtol=1e-6)
+    assert np.isclose(rod.objetivo, obj_lp, rtol=1e-6)
+    assert not np.isclose(obj_lp, resuelve_lp(build_lp(*args)).objetivo, rtol=1e-6)
+
+
+def test_quita_coef_fijas(entradas_caso):
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro, cinv, cfix, cvar, knew = entradas_caso
+    lp = build_lp(Y_list, T_by_Y, alpha, D, list(mx.TECHS), AF, K0, cinv, cfix, cvar, knew, hydro)
+    # inversión y despacho de una tecnología cerrados en los primeros stages
+    j = lp.techs.index("cc_gas")
+    cero = np.r_[lp.cols("x")[j, :2], lp.cols("K")[j, :2], lp.cols("p")[j, np.asarray(lp.param["iy"]) < 2]]
+    lp.col_lo[cero], lp.col_up[cero] = 0.0, 0.0
+    ralo = quita_coef_fijas(lp, cero)
+
+    assert ralo.A.nnz < lp.A.nnz and ralo.A[:, cero].nnz == 0
+    assert np.isclose(resuelve_lp(ralo).objetivo, resuelve_lp(lp).objetivo, rtol=1e-9)
+    ses = SesionExpansion(ralo)
+    with pytest.raises(ValueError):
+        ses._empuja_columnas(cero[:1], np.zeros(1), np.ones(1))
+
+
+@pytest.mark.slow
+def test_paridad_caso_entregado():
+    try:
+        inputs, ex = mx.load_inputs(False, escenario=None)
+    except FileNotFoundError as e:
+        pytest.skip(f"caso entregado incompleto: {e}")
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro = mx.aggregate_stage_block(inputs, mx.TECHS, ex)
+    Y_list, T_by_Y, alpha, D = recorta_stages(Y_list, T_by_Y, alpha, D, 12)
+    obj_p, obj_m = compara_backends(Y_list, T_by_Y, alpha, D, mx.TECHS, AF, K0, *mx.build_costs(mx.TECHS, Y_list),
+                                    hydro)
+    assert obj_p > 0 and np.isclose(obj_p, obj_m, rtol=1e-6)
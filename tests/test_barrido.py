@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Barrido de sensibilidad: kappa_default llega al LP y la base pasa de un caso al siguiente."""
+import pickle
+
+import numpy as np
+
+import barrido_sensibilidad as bs
+import mvp_expansion as mx
+from escenarios_hidrologicos import libera, publica
+
+
+def _arrays_base(entradas_caso):
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro, cinv, cfix, cvar, knew = entradas_caso
+    TY = [(y, t) for y in Y_list for t in T_by_Y[y]]
+    arrays = {"alpha": np.array([alpha[k] for k in TY]), "D": np.array([D[k] for k in TY])}
+    base = (Y_list, T_by_Y, AF, K0, list(mx.TECHS), cinv, cfix, cvar, knew, hydro, None,
+            dict(bigm_slack=mx.BIGM_SLACK, kappa_default=mx.KAPPA_DEFAULT))
+    valores = dict(r=mx.DISCOUNT_R, c_ens=mx.C_ENS, kappa_default=mx.KAPPA_DEFAULT,
+                   esc_cinv=1.0, esc_cvar=1.0, pend_cinv=1.0, pend_cvar=1.0)
+    return arrays, base, valores
+
+
+def _en_worker(arrays, base, tibio, corre):
+    bloques, meta = publica(arrays)
+    try:
+        bs._init_worker(meta, base, 1, tibio)
+        return corre()
+    finally:
+        for shm in bs._W.pop("bloques"):
+            shm.close()
+        libera(bloques)
+
+
+def test_kappa_cambia_objetivo(entradas_caso):
+    arrays, base, valores = _arrays_base(entradas_caso)
+    puntos = bs.EspecBarrido(rejilla={"kappa_default": [0.5, mx.KAPPA_DEFAULT, 2.0]}).puntos(valores)
+    costos = _en_worker(arrays, base, False,
+                        lambda: [bs._resuelve_caso(p)[0]["costo_total"] for p in puntos.to_dict("records")])
+    # más energía por hm3 turbinado abarata la operación
+    assert costos[0] > costos[1] > costos[2]
+
+
+def test_base_del_vecino(entradas_caso):
+    arrays, base, valores = _arrays_base(entradas_caso)
+    p1, p2 = bs.EspecBarrido(rejilla={"c_ens": [valores["c_ens"], 1.1 * valores["c_ens"]]}
+                             ).puntos(valores).to_dict("records")
+
+    def cadena():
+        f1, b1 = bs._resuelve_caso(p1)
+        f2, b2 = bs._resuelve_caso(p2, b1)
+        return f1, b1, f2, bs._resuelve_caso(p2)[0]
+
+    f1, b1, tibio, frio = _en_worker(arrays, base, True, cadena)
+    # la base viaja como arreglos (picklable) y el siguiente caso arranca de ella
+    pickle.loads(pickle.dumps(b1))
+    assert not f1["tibio"] and tibio["tibio"] and not frio["tibio"]
+    assert np.isclose(tibio["costo_total"], frio["costo_total"], rtol=1e-7)
+    assert tibio["iteraciones"] <= frio["iteraciones"]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""La clave de una etapa cambia si cambia el código de la función que la calcula."""
+import mvp_expansion as mx
+from cache_etapas import AlmacenArtefactos
+from caso_sintetico import usa_caso
+
+
+def _costos_dobles(techs, Y_list):
+    cinv, cfix, cvar, knew = _costos_originales(techs, Y_list)
+    return cinv, cfix, {k: 2.0 * v for k, v in cvar.items()}, knew
+
+
+_costos_originales = mx.build_costs
+
+
+def test_cambio_de_funcion_invalida_la_etapa(caso, tmp_path, monkeypatch):
+    par, rutas = caso
+    monkeypatch.setattr(mx, "AlmacenArtefactos", lambda **kw: AlmacenArtefactos(tmp_path / "cache", **kw))
+    with usa_caso(mx, rutas, hidrologia=par.hidrologias[0]):
+        g = mx.grafo_pipeline(par.hidrologias[0])
+        cvar = g.valor("costos")[2]
+        assert g.registro[-1]["origen"] == "calculo"
+
+        g = mx.grafo_pipeline(par.hidrologias[0])
+        assert g.valor("costos")[2] == cvar
+        assert g.registro[-1]["origen"] == "cache"
+
+        monkeypatch.setattr(mx, "build_costs", _costos_dobles)
+        g = mx.grafo_pipeline(par.hidrologias[0])
+        cvar2 = g.valor("costos")[2]
+        assert g.registro[-1]["origen"] == "calculo"
+        assert all(cvar2[k] == 2.0 * v for k, v in cvar.items())
+        # la etapa previa, que no usa build_costs, sigue saliendo de la caché
+        assert [r["origen"] for r in g.registro if r["etapa"] == "calendario"] == ["cache"]
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""SesionExpansion sobre un LP depurado: los deltas llegan a las cotas de columna convertidas."""
+import numpy as np
+
+import mvp_expansion as mx
+from backend_matricial import build_lp, depura_formulacion, resuelve_lp
+from sesion_persistente import SesionExpansion
+
+
+def test_actualiza_lp_depurado(entradas_caso):
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro, cinv, cfix, cvar, knew = entradas_caso
+    techs = list(mx.TECHS)
+    arma = lambda alpha, D, knew, hydro: build_lp(Y_list, T_by_Y, alpha, D, techs, AF, K0, cinv, cfix, cvar,
+                                                  knew, hydro)
+
+    lp, rep = depura_formulacion(arma(alpha, D, knew, hydro))
+    assert {"InvestCap", "VolMax", "ROR_Capacity"} <= set(rep["familias"])
+    ses = SesionExpansion(lp)
+    ses.resuelve()
+
+    # deltas sobre familias convertidas en cotas (InvestCap, VolMax, ROR_* vía alpha) y sobre Balance
+    alpha2 = {k: 0.9 * v for k, v in alpha.items()}
+    D2 = {k: 1.05 * v for k, v in D.items()}
+    knew2 = {k: 0.5 * v for k, v in knew.items()}
+    vmax2 = {r: 0.8 * hydro["vmax"][r] for r in hydro["R"]}
+    ses.actualiza(alpha=np.array([alpha2[k] for k in lp.TY]), D=D2, kbar=knew2, vmax=vmax2)
+    res = ses.resuelve()
+
+    ref = resuelve_lp(arma(alpha2, D2, knew2, dict(hydro, vmax=vmax2)))
+    assert res.estado == ref.estado == "Optimal"
+    assert np.isclose(res.objetivo, ref.objetivo, rtol=1e-6)
+    assert ses.historial[-1]["columnas"] > 0
+
+
+def test_no_modifica_lp_del_llamador(entradas_caso):
+    Y_list, T_by_Y, alpha, D, AF, K0, hydro, cinv, cfix, cvar, knew = entradas_caso
+    lp, _ = depura_formulacion(build_lp(Y_list, T_by_Y, alpha, D, list(mx.TECHS), AF, K0, cinv, cfix, cvar,
+                                        knew, hydro))
+    antes = {k: getattr(lp, k).copy() for k in ("c", "row_lo", "row_up", "col_lo", "col_up")}
+    ses = SesionExpansion(lp)
+    ses.actualiza(D={k: 1.05 * v for k, v in D.items()}, kbar={k: 0.5 * v for k, v in knew.items()},
+                  cvar={k: 2.0 * v for k, v in cvar.items()})
+    assert ses.n_cambios["costos"] > 0 and ses.n_cambios["columnas"] > 0
+    for k, v in antes.items():
+        assert np.array_equal(getattr(lp, k), v), k
+    assert not np.array_equal(ses.lp.c, lp.c)